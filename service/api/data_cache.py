@@ -17,6 +17,8 @@
 
 import functools
 
+from learner.brains import spec_validator
+
 _MAX_CACHE = 512
 
 
@@ -34,6 +36,22 @@ def get_brain_spec(data_store, project_id, brain_id):
   return get_brain(data_store, project_id, brain_id).brain_spec
 
 
+@functools.lru_cache(maxsize=_MAX_CACHE)
+def get_brain_spec_validator(data_store, project_id, brain_id):
+  """Get a cached validator compiled from a brain's brain_spec.
+
+  Args:
+    data_store: data_store.DataStore to read from if the brain is not cached.
+    project_id: Project ID associated with the requested brain spec.
+    brain_id: Brain ID associated with the requested brain spec.
+
+  Returns:
+    spec_validator.BrainSpecValidator instance.
+  """
+  return spec_validator.BrainSpecValidator(
+      get_brain_spec(data_store, project_id, brain_id))
+
+
 @functools.lru_cache(maxsize=_MAX_CACHE)
 def get_brain(data_store, project_id, brain_id):
   """Get cached brain or read brain from data_store.
@@ -19,6 +19,7 @@ from unittest import mock
 
 from absl.testing import absltest
 from api import data_cache
+from learner.brains import spec_validator
 
 import common.generate_protos  # pylint: disable=unused-import
 import data_store_pb2
@@ -52,6 +53,21 @@ class DataCacheTest(absltest.TestCase):
     get_brain.assert_called_once_with(
         mock_ds, 'test_project_id', 'test_brain_id')
 
+  @mock.patch.object(spec_validator, 'BrainSpecValidator')
+  @mock.patch.object(data_cache, 'get_brain_spec')
+  def test_get_brain_spec_validator(self, get_brain_spec, brain_spec_validator):
+    mock_ds = mock.Mock()
+    # Call twice.
+    for _ in range(2):
+      self.assertEqual(
+          data_cache.get_brain_spec_validator(
+              mock_ds, 'test_project_id', 'test_brain_id'),
+          brain_spec_validator.return_value)
+    # The spec is only compiled once.
+    get_brain_spec.assert_called_once_with(
+        mock_ds, 'test_project_id', 'test_brain_id')
+    brain_spec_validator.assert_called_once_with(get_brain_spec.return_value)
+
   def test_get_session_type(self):
     mock_ds = mock.Mock()
     mock_ds.read_by_proto_ids.return_value = mock.Mock()
@@ -0,0 +1,346 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Lint as: python3
+"""Processes stored episode chunks in the background.
+
+In write-behind mode SubmitEpisodeChunks replies once the chunks are stored.
+The work derived from the chunks, e.g. updating the session and starting
+assignments, is submitted to an EpisodeIngestion which does it on background
+threads. Chunks of a session are processed by the same thread in the order
+they were submitted, though processing doesn't depend on the order since
+chunks that failed to be processed are recovered later.
+
+Each submission is recorded in the ingestion log before its chunks are
+stored:
+
+  ingestion_log/<timestamp_micros>_<uuid>/entry
+
+The log entry lists the chunks and is removed once they are processed. The
+process that submitted the chunks holds the lock of the entry's directory
+until the entry is processed. Entries that are not removed, e.g. because
+processing failed or the process crashed, are processed again, reading the
+chunks that were stored from the data store, once they are older than the
+recovery delay and their lock is released or expired. The lock is held while
+the entry is recovered, so several processes that share the log don't recover
+the same entry. Processing chunks is idempotent so an entry may be processed
+more than once.
+
+The session info returned by SubmitEpisodeChunks is cached per session and
+refreshed whenever chunks of the session are processed.
+"""
+
+import collections
+import json
+import queue
+import threading
+import time
+import uuid
+
+from absl import logging
+from data_store import file_system
+from data_store import resource_id
+from data_store import resource_store
+
+# Directory of the ingestion log.
+INGESTION_LOG_DIRECTORY = 'ingestion_log'
+
+# Name of the file of a log entry in the entry's directory.
+_ENTRY_FILENAME = 'entry'
+
+# Seconds after which log entries that were not removed are processed again.
+_DEFAULT_RECOVERY_SECONDS = 5 * 60
+
+# Maximum number of sessions whose session info is cached.
+_MAX_CACHED_SESSIONS = 1024
+
+
+class _Task:
+  """Chunks of a session to process."""
+
+  def __init__(self, log_path, lock, session_resource_id, chunks,
+               timestamp_micros):
+    self.log_path = log_path
+    # Lock of the log entry held until the task is processed.
+    self.lock = lock
+    self.session_resource_id = session_resource_id
+    self.chunks = chunks
+    self.timestamp_micros = timestamp_micros
+
+
+class EpisodeIngestion:
+  """Does the work derived from stored episode chunks in the background."""
+
+  def __init__(self, fs, data_store, process_chunks, get_session_info,
+               num_workers=1, recovery_seconds=_DEFAULT_RECOVERY_SECONDS):
+    """Starts the background threads.
+
+    Args:
+      fs: FileSystem object that stores the ingestion log.
+      data_store: data_store.DataStore object to read the chunks of recovered
+        log entries from.
+      process_chunks: Callable that takes the resource id of a session, a list
+        of data_store_pb2.EpisodeChunk sorted by chunk ID and the time they
+        were stored at in microseconds, does the derived work and returns the
+        session_pb2.SessionInfo of the session.
+      get_session_info: Callable that takes the resource id of a session and
+        returns its session_pb2.SessionInfo, used when the session info of a
+        session isn't cached.
+      num_workers: Number of threads that process chunks.
+      recovery_seconds: Seconds after which log entries that were not removed
+        are processed again.
+    """
+    if num_workers < 1:
+      raise ValueError(
+          f'num_workers must be at least 1, got {num_workers}.')
+    self._fs = fs
+    self._data_store = data_store
+    self._process_chunks = process_chunks
+    self._get_session_info = get_session_info
+    self._recovery_seconds = recovery_seconds
+    # Session info by session resource id in least recently used order.
+    self._session_infos = collections.OrderedDict()
+    self._lock = threading.Lock()
+    self._stop_event = threading.Event()
+    self._queues = [queue.Queue() for _ in range(num_workers)]
+    self._threads = [
+        threading.Thread(target=self._process_queue, args=(q,), daemon=True)
+        for q in self._queues]
+    self._threads.append(
+        threading.Thread(target=self._recover_periodically, daemon=True))
+    for thread in self._threads:
+      thread.start()
+
+  def stop(self):
+    """Stops the background threads once the queued chunks are processed."""
+    if self._stop_event.is_set():
+      return
+    self._stop_event.set()
+    for q in self._queues:
+      q.put(None)
+    for thread in self._threads:
+      thread.join()
+
+  def wait_until_idle(self):
+    """Waits until all submitted chunks are processed."""
+    for q in self._queues:
+      q.join()
+
+  def submit(self, session_resource_id, chunks, timestamp_micros):
+    """Stores chunks and queues them to be processed.
+
+    The chunks are recorded in the log before they are stored, so chunks are
+    never stored without being processed.
+
+    Args:
+      session_resource_id: resource_id.FalkenResourceId of the session.
+      chunks: List of data_store_pb2.EpisodeChunk to store, sorted by chunk ID.
+      timestamp_micros: Time the chunks were stored at in microseconds.
+
+    Raises:
+      ValueError, data_store.InternalError: If the chunks can't be stored.
+        Chunks that were stored before the failure are processed once the log
+        entry is recovered.
+    """
+    log_path = (f'{INGESTION_LOG_DIRECTORY}/'
+                f'{int(time.time() * 1_000_000)}_{uuid.uuid4().hex}/'
+                f'{_ENTRY_FILENAME}')
+    lock = self._fs.lock_file(log_path)
+    try:
+      self._fs.write_file(log_path, json.dumps({
+          'session': str(session_resource_id),
+          'chunks': [str(self._data_store.to_resource_id(chunk))
+                     for chunk in chunks],
+          'timestamp_micros': timestamp_micros,
+      }).encode('utf-8'))
+    except Exception:  # pylint: disable=broad-except
+      self._remove_log_entry(log_path, lock)
+      raise
+    try:
+      self._data_store.write_many(chunks)
+    except Exception:  # pylint: disable=broad-except
+      self._fs.unlock_file(lock)
+      raise
+    self._enqueue(_Task(log_path, lock, session_resource_id, chunks,
+                        timestamp_micros))
+
+  def get_session_info(self, session_resource_id):
+    """Gets the session info of a session.
+
+    Args:
+      session_resource_id: resource_id.FalkenResourceId of the session.
+
+    Returns:
+      session_pb2.SessionInfo as of the last time chunks of the session were
+      processed.
+    """
+    with self._lock:
+      session_info = self._session_infos.get(session_resource_id)
+      if session_info is not None:
+        self._session_infos.move_to_end(session_resource_id)
+        return session_info
+    session_info = self._get_session_info(session_resource_id)
+    self._cache_session_info(session_resource_id, session_info)
+    return session_info
+
+  def _cache_session_info(self, session_resource_id, session_info):
+    """Caches the session info of a session."""
+    with self._lock:
+      self._session_infos[session_resource_id] = session_info
+      self._session_infos.move_to_end(session_resource_id)
+      while len(self._session_infos) > _MAX_CACHED_SESSIONS:
+        self._session_infos.popitem(last=False)
+
+  def _enqueue(self, task):
+    """Queues a task on the thread that processes its session."""
+    self._queues[hash(str(task.session_resource_id)) %
+                 len(self._queues)].put(task)
+
+  def _process_queue(self, task_queue):
+    """Processes tasks from a queue until None is received."""
+    while True:
+      task = task_queue.get()
+      try:
+        if task is None:
+          return
+        self._process(task)
+      finally:
+        task_queue.task_done()
+
+  def _process(self, task):
+    """Processes the chunks of a task and removes its log entry.
+
+    Args:
+      task: _Task to process.
+    """
+    remove_log_entry = True
+    try:
+      self._cache_session_info(
+          task.session_resource_id,
+          self._process_chunks(task.session_resource_id, task.chunks,
+                               task.timestamp_micros))
+    except ValueError as e:
+      # The chunks can't be processed, retrying won't help.
+      logging.error('Failed to process episode chunks of %s: %s',
+                    task.session_resource_id, e)
+    except Exception:  # pylint: disable=broad-except
+      # Keep the log entry so that the chunks are processed again.
+      logging.exception('Failed to process episode chunks of %s.',
+                        task.session_resource_id)
+      remove_log_entry = False
+    if remove_log_entry:
+      self._remove_log_entry(task.log_path, task.lock)
+    else:
+      self._fs.unlock_file(task.lock)
+
+  def _remove_log_entry(self, log_path, lock):
+    """Removes a log entry and releases its lock.
+
+    Args:
+      log_path: Path of the log entry.
+      lock: Lock of the log entry returned by FileSystem.lock_file().
+    """
+    try:
+      self._fs.remove_file(log_path)
+    except FileNotFoundError:
+      pass
+    self._fs.unlock_file(lock)
+    # Another process that claims the directory before it's removed finds no
+    # entry and removes it as well.
+    self._fs.remove_tree(log_path.rpartition('/')[0], ignore_errors=True)
+
+  def _recover_periodically(self):
+    """Recovers log entries until the ingestion is stopped."""
+    while True:
+      try:
+        self.recover()
+      except Exception:  # pylint: disable=broad-except
+        logging.exception('Failed to recover the ingestion log.')
+      if self._stop_event.wait(self._recovery_seconds):
+        return
+
+  def recover(self, min_age_seconds=None):
+    """Queues log entries that were not removed after the recovery delay.
+
+    Entries whose lock is held, e.g. by the process that is processing them,
+    are skipped.
+
+    Args:
+      min_age_seconds: Minimum age of the entries to recover in seconds,
+        defaults to the recovery delay.
+
+    Returns:
+      Number of log entries that were queued.
+    """
+    if min_age_seconds is None:
+      min_age_seconds = self._recovery_seconds
+    max_timestamp_micros = int((time.time() - min_age_seconds) * 1_000_000)
+    recovered = 0
+    for log_path in sorted(self._fs.glob(
+        f'{INGESTION_LOG_DIRECTORY}/*/{_ENTRY_FILENAME}')):
+      timestamp_micros, _, _ = log_path.split('/')[-2].partition('_')
+      if (not timestamp_micros.isdigit() or
+          int(timestamp_micros) > max_timestamp_micros):
+        continue
+      try:
+        lock = self._fs.lock_file(log_path)
+      except file_system.UnableToLockFileError:
+        continue
+      try:
+        task = self._read_log_entry(log_path, lock)
+      except Exception:  # pylint: disable=broad-except
+        self._fs.unlock_file(lock)
+        raise
+      if task:
+        self._enqueue(task)
+        recovered += 1
+    return recovered
+
+  def _read_log_entry(self, log_path, lock):
+    """Reads a claimed log entry and the chunks it lists.
+
+    Args:
+      log_path: Path of the log entry.
+      lock: Lock of the log entry returned by FileSystem.lock_file().
+
+    Returns:
+      _Task to process or None if the entry was removed, in which case the
+      lock is released.
+    """
+    try:
+      entry = json.loads(self._fs.read_file(log_path).decode('utf-8'))
+    except FileNotFoundError:
+      # The entry was processed before it was claimed.
+      self._remove_log_entry(log_path, lock)
+      return None
+    except ValueError as e:
+      logging.error('Removing invalid ingestion log entry %s: %s', log_path, e)
+      self._remove_log_entry(log_path, lock)
+      return None
+    chunks = []
+    for chunk_id in entry['chunks']:
+      try:
+        chunks.append(self._data_store.read(
+            resource_id.FalkenResourceId(chunk_id)))
+      except resource_store.NotFoundError:
+        logging.warning('Chunk %s of ingestion log entry %s not found.',
+                        chunk_id, log_path)
+    if not chunks:
+      # Storing the chunks failed before any of them were written.
+      self._remove_log_entry(log_path, lock)
+      return None
+    return _Task(log_path, lock,
+                 resource_id.FalkenResourceId(entry['session']),
+                 sorted(chunks, key=lambda chunk: chunk.chunk_id),
+                 entry['timestamp_micros'])
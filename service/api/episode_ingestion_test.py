@@ -0,0 +1,227 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Lint as: python3
+"""Tests for episode_ingestion."""
+
+import threading
+from unittest import mock
+
+from absl.testing import absltest
+from api import episode_ingestion
+from data_store import data_store
+from data_store import file_system
+from data_store import resource_id
+
+# pylint: disable=g-bad-import-order
+import common.generate_protos  # pylint: disable=unused-import
+import data_store_pb2
+import session_pb2
+
+
+class EpisodeIngestionTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self._fs = file_system.FileSystem(self.create_tempdir().full_path)
+    self._data_store = data_store.DataStore(self._fs)
+    self._session_resource_id = resource_id.FalkenResourceId(
+        'projects/p0/brains/b0/sessions/s0')
+    # (session_resource_id, chunk IDs, timestamp_micros) of processed chunks.
+    self._processed = []
+    self._process_error = None
+    self._get_session_info = mock.Mock(
+        return_value=session_pb2.SessionInfo(model_id='m0'))
+    self._ingestion = self._create_ingestion()
+
+  def tearDown(self):
+    self._ingestion.stop()
+    super().tearDown()
+
+  def _create_ingestion(self, num_workers=1):
+    """Creates an EpisodeIngestion that records the chunks it processes."""
+    return episode_ingestion.EpisodeIngestion(
+        self._fs, self._data_store, self._process_chunks,
+        self._get_session_info, num_workers=num_workers,
+        recovery_seconds=3600)
+
+  def _process_chunks(self, session_resource_id, chunks, timestamp_micros):
+    """Records processed chunks and returns their session info."""
+    if self._process_error:
+      raise self._process_error
+    self._processed.append((session_resource_id,
+                            [chunk.chunk_id for chunk in chunks],
+                            timestamp_micros))
+    return session_pb2.SessionInfo(model_id=f'm{len(self._processed)}')
+
+  def _chunks(self, chunk_ids, episode_id='e0'):
+    """Returns episode chunks to submit."""
+    return [data_store_pb2.EpisodeChunk(
+        project_id='p0', brain_id='b0', session_id='s0', episode_id=episode_id,
+        chunk_id=chunk_id) for chunk_id in chunk_ids]
+
+  def _log_entries(self):
+    return self._fs.glob(f'{episode_ingestion.INGESTION_LOG_DIRECTORY}/*/entry')
+
+  def test_submit(self):
+    chunks = self._chunks([0, 1])
+    self._ingestion.submit(self._session_resource_id, chunks, 123)
+    self.assertEqual(self._data_store.read(
+        self._data_store.to_resource_id(chunks[1])), chunks[1])
+    self._ingestion.wait_until_idle()
+    self.assertEqual(self._processed,
+                     [(self._session_resource_id, [0, 1], 123)])
+    self.assertEmpty(
+        self._fs.list_files(episode_ingestion.INGESTION_LOG_DIRECTORY))
+    # The session info of the processed chunks is cached.
+    self.assertEqual(
+        self._ingestion.get_session_info(self._session_resource_id),
+        session_pb2.SessionInfo(model_id='m1'))
+    self._get_session_info.assert_not_called()
+
+  def test_get_session_info_not_cached(self):
+    for _ in range(2):
+      self.assertEqual(
+          self._ingestion.get_session_info(self._session_resource_id),
+          session_pb2.SessionInfo(model_id='m0'))
+    self._get_session_info.assert_called_once_with(self._session_resource_id)
+
+  def test_sessions_are_processed_in_order(self):
+    # Block processing until all chunks are submitted.
+    submitted = threading.Event()
+    process_chunks = self._process_chunks
+
+    def wait_and_process_chunks(*args):
+      submitted.wait()
+      return process_chunks(*args)
+
+    self._process_chunks = wait_and_process_chunks
+    self._ingestion.stop()
+    self._ingestion = self._create_ingestion(num_workers=4)
+    for chunk_id in range(20):
+      self._ingestion.submit(self._session_resource_id,
+                             self._chunks([chunk_id]), chunk_id)
+    submitted.set()
+    self._ingestion.wait_until_idle()
+    self.assertEqual([chunk_ids for _, chunk_ids, _ in self._processed],
+                     [[chunk_id] for chunk_id in range(20)])
+
+  def test_invalid_chunks_are_not_retried(self):
+    self._process_error = ValueError('Invalid chunk.')
+    self._ingestion.submit(self._session_resource_id, self._chunks([0]), 123)
+    self._ingestion.wait_until_idle()
+    self.assertEmpty(self._log_entries())
+
+  def test_submit_storing_fails(self):
+    chunks = self._chunks([0, 1])
+    # Only the first chunk is stored.
+    self._data_store.write(chunks[0])
+    with mock.patch.object(self._data_store, 'write_many',
+                           side_effect=ValueError('Disk full.')):
+      with self.assertRaises(ValueError):
+        self._ingestion.submit(self._session_resource_id, chunks, 123)
+    self._ingestion.wait_until_idle()
+    self.assertEmpty(self._processed)
+    # The chunk that was stored is processed when the entry is recovered.
+    self.assertEqual(self._ingestion.recover(min_age_seconds=0), 1)
+    self._ingestion.wait_until_idle()
+    self.assertEqual(self._processed,
+                     [(self._session_resource_id, [0], 123)])
+    self.assertEmpty(self._log_entries())
+
+  def test_submit_storing_fails_without_stored_chunks(self):
+    with mock.patch.object(self._data_store, 'write_many',
+                           side_effect=ValueError('Disk full.')):
+      with self.assertRaises(ValueError):
+        self._ingestion.submit(self._session_resource_id, self._chunks([0]),
+                               123)
+    self.assertLen(self._log_entries(), 1)
+    # Entries without stored chunks are removed without processing them.
+    self.assertEqual(self._ingestion.recover(min_age_seconds=0), 0)
+    self._ingestion.wait_until_idle()
+    self.assertEmpty(self._processed)
+    self.assertEmpty(self._log_entries())
+
+  def test_recover(self):
+    self._process_error = IOError('Disk failure.')
+    self._ingestion.submit(self._session_resource_id, self._chunks([1, 0]),
+                           123)
+    self._ingestion.wait_until_idle()
+    self.assertEmpty(self._processed)
+    self.assertLen(self._log_entries(), 1)
+
+    # Entries are only recovered after the recovery delay.
+    self.assertEqual(self._ingestion.recover(), 0)
+    self._process_error = None
+    self.assertEqual(self._ingestion.recover(min_age_seconds=0), 1)
+    self._ingestion.wait_until_idle()
+    # The chunks are read from the data store.
+    self.assertEqual(self._processed,
+                     [(self._session_resource_id, [0, 1], 123)])
+    self.assertEmpty(self._log_entries())
+
+  def test_recover_skips_claimed_entries(self):
+    # Block processing until the entry is recovered.
+    recovered = threading.Event()
+    process_chunks = self._process_chunks
+
+    def wait_and_process_chunks(*args):
+      recovered.wait()
+      return process_chunks(*args)
+
+    self._process_chunks = wait_and_process_chunks
+    self._ingestion.stop()
+    self._ingestion = self._create_ingestion()
+    self._ingestion.submit(self._session_resource_id, self._chunks([0]), 123)
+    # The entry is being processed.
+    self.assertEqual(self._ingestion.recover(min_age_seconds=0), 0)
+    recovered.set()
+    self._ingestion.wait_until_idle()
+    self.assertLen(self._processed, 1)
+
+  def test_recover_skips_entries_claimed_by_other_processes(self):
+    self._process_error = IOError('Disk failure.')
+    self._ingestion.submit(self._session_resource_id, self._chunks([0]), 123)
+    self._ingestion.wait_until_idle()
+    self._process_error = None
+    (log_path,) = self._log_entries()
+    lock = self._fs.lock_file(log_path)
+    self.assertEqual(self._ingestion.recover(min_age_seconds=0), 0)
+    self._fs.unlock_file(lock)
+    self.assertEqual(self._ingestion.recover(min_age_seconds=0), 1)
+    self._ingestion.wait_until_idle()
+    self.assertEqual(self._processed,
+                     [(self._session_resource_id, [0], 123)])
+
+  def test_recover_after_restart(self):
+    self._ingestion.stop()
+    self._process_error = IOError('Crash.')
+    ingestion = self._create_ingestion()
+    ingestion.submit(self._session_resource_id, self._chunks([0]), 123)
+    ingestion.stop()
+
+    self._process_error = None
+    self._ingestion = self._create_ingestion()
+    self.assertEqual(self._ingestion.recover(min_age_seconds=0), 1)
+    self._ingestion.wait_until_idle()
+    self.assertEqual(self._processed,
+                     [(self._session_resource_id, [0], 123)])
+
+  def test_invalid_num_workers(self):
+    with self.assertRaises(ValueError):
+      self._create_ingestion(num_workers=0)
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -14,7 +14,9 @@
 
 # Lint as: python3
 """The Python implementation of the GRPC falken_service.FalkenService."""
+import asyncio
 from concurrent import futures
+import functools
 import os
 
 from absl import app
@@ -23,6 +25,7 @@ from absl import logging
 from api import api_keys
 from api import create_brain_handler
 from api import create_session_handler
+from api import episode_ingestion
 from api import get_handler
 from api import get_session_count_handler
 from api import list_handler
@@ -32,12 +35,17 @@ from api import submit_episode_chunks_handler
 
 # pylint: disable=g-bad-import-order
 import common.generate_protos  # pylint: disable=unused-import
+import falken_service_pb2
 import falken_service_pb2_grpc
 from google.rpc import code_pb2
 
 from data_store import assignment_monitor
 from data_store import data_store
 from data_store import file_system
+from data_store import manifest_store
+from data_store import resource_store
+from data_store import segment_store
+from data_store import sqlite_file_system
 import grpc
 
 FLAGS = flags.FLAGS
@@ -47,25 +55,146 @@ flags.DEFINE_integer('port', None,
 flags.DEFINE_string('ssl_dir', '', 'Path containing the SSL cert and key.')
 flags.DEFINE_integer(
     'max_workers', 10,
-    'The max number of threads to use in the pool to start the grpc server.')
+    'The max number of threads to use in the pool to start the grpc server. '
+    'With --experimental_aio_server this is the number of threads that '
+    'perform the data store I/O.')
+flags.DEFINE_bool(
+    'experimental_aio_server', False,
+    'Experimental: Serve RPCs with a grpc.aio server. SubmitEpisodeChunks, '
+    'GetModel, GetSession and ListSessions are handled on the event loop and '
+    'only use the pool of --max_workers threads for data store I/O, so more '
+    'of these RPCs are in flight than there are threads. Other methods run '
+    'their handlers on the pool. Supports --rpc_concurrency_limits.')
+flags.DEFINE_integer(
+    'max_concurrent_rpcs', None,
+    'Maximum number of RPCs the server accepts at the same time, further RPCs '
+    'fail with RESOURCE_EXHAUSTED. Unlimited if not set.', lower_bound=1)
+flags.DEFINE_list(
+    'rpc_concurrency_limits', [],
+    'List of "<method>=<limit>" pairs, e.g. "SubmitEpisodeChunks=64,'
+    'GetModel=8", that limit how many RPCs of a method run at the same time. '
+    'RPCs over the limit wait until an RPC of the method finishes. Only used '
+    'with --experimental_aio_server.')
 flags.DEFINE_string('root_dir', '',
                     'Directory where the Falken service will store data.')
 flags.DEFINE_multi_string(
     'project_ids', [],
     'Project IDs to create API keys for and use with Falken.')
+flags.DEFINE_enum(
+    'storage_engine', 'file', sqlite_file_system.STORAGE_ENGINES,
+    'How data is stored in --root_dir: "file" stores each resource in its own '
+    'file, "sqlite" stores all resources in a single SQLite database.')
+flags.DEFINE_enum(
+    'write_durability', file_system.DURABILITY_NONE,
+    file_system.DURABILITY_LEVELS,
+    'How writes to --root_dir are flushed to disk: "none" replaces files '
+    'atomically without flushing them, "file" also flushes each file before it '
+    'is replaced and "directory" also flushes the directory containing each '
+    'file so that new files survive a crash.')
+flags.DEFINE_enum(
+    'lock_backend', file_system.LOCK_BACKEND_FLUFL, file_system.LOCK_BACKENDS,
+    'How the "file" storage engine locks files: "flufl" creates lock files '
+    'that expire unless they are refreshed, "fcntl" uses flock() which is '
+    'cheaper but only works on POSIX systems with a local --root_dir. The API '
+    'and learner services must use the same setting.')
+flags.DEFINE_float(
+    'listing_cache_seconds', 0,
+    'Number of seconds directory listings are reused while the directory is '
+    'not modified, which avoids listing the same directories when searching '
+    'the data store. 0 disables the cache. Only used by the "file" storage '
+    'engine.')
+flags.DEFINE_bool(
+    'episode_chunk_segments', False,
+    'Append episode chunks to per-session segment files rather than storing '
+    'each chunk in its own file. Only supported by the "file" storage engine, '
+    'the API and learner services must use the same setting.')
+flags.DEFINE_bool(
+    'episode_chunk_manifests', False,
+    'List the episode chunks of each session by creation time in a manifest '
+    'file so that new chunks are found without listing all chunks of a '
+    'session. Only supported by the "file" storage engine, the API and '
+    'learner services must use the same setting.')
+flags.DEFINE_enum(
+    'resource_compression', 'zlib', data_store.CODEC_NAMES,
+    'Codec used to compress episode chunks and serialized models. Resources '
+    'compressed with any codec can be read regardless of this setting.')
+flags.DEFINE_bool(
+    'resource_index', True,
+    'Keep an in-memory index of resource timestamps so that reads do not '
+    'need to search the data store directory.')
+flags.DEFINE_integer(
+    'resource_cache_size', 1024,
+    'Maximum number of decoded resources to cache in memory, 0 disables the '
+    'cache.')
+flags.DEFINE_bool(
+    'rebuild_resource_index', False,
+    'Populate the resource index from the data store directory on startup. '
+    'When disabled the index is populated as resources are accessed.')
+flags.DEFINE_bool(
+    'write_behind_ingestion', False,
+    'Reply to SubmitEpisodeChunks once the chunks are stored. The session '
+    'update, online evaluations and assignments derived from the chunks are '
+    'processed in the background and the session info in the reply is the '
+    'one cached when chunks of the session were last processed.')
+flags.DEFINE_integer(
+    'ingestion_workers', 4,
+    'Number of threads that process submitted episode chunks with '
+    '--write_behind_ingestion. Chunks of a session are processed by the same '
+    'thread in the order they were submitted.', lower_bound=1)
 
 # Clients must specify the API key value using this metadata key.
 _API_METADATA_KEY = 'x-goog-api-key'
 
+# Names of the methods of FalkenService.
+_METHOD_NAMES = tuple(
+    m.name for m in
+    falken_service_pb2.DESCRIPTOR.services_by_name['FalkenService'].methods)
+
+# grpc.StatusCode by the google.rpc.Code value passed to context.abort().
+_STATUS_CODES = {code.value[0]: code for code in grpc.StatusCode}
+
 
 class FalkenService(falken_service_pb2_grpc.FalkenService):
   """The Python implementation of the GRPC falken_service.FalkenService."""
 
   def __init__(self):
     """Initializes datastore and sets up API keys."""
-    self._fs = file_system.FileSystem(FLAGS.root_dir)
-    self.data_store = data_store.DataStore(self._fs)
+    self._fs = sqlite_file_system.create_file_system(
+        FLAGS.root_dir, FLAGS.storage_engine, FLAGS.write_durability,
+        FLAGS.listing_cache_seconds, FLAGS.lock_backend)
+    resource_index = (
+        resource_store.ResourceIndex() if FLAGS.resource_index else None)
+    resource_cache = (
+        resource_store.ResourceCache(FLAGS.resource_cache_size)
+        if FLAGS.resource_cache_size > 0 else None)
+    segments = None
+    if FLAGS.episode_chunk_segments:
+      if FLAGS.storage_engine != 'file':
+        raise ValueError(
+            '--episode_chunk_segments requires --storage_engine=file.')
+      segments = segment_store.SegmentStore(self._fs)
+    manifests = None
+    if FLAGS.episode_chunk_manifests:
+      if FLAGS.storage_engine != 'file':
+        raise ValueError(
+            '--episode_chunk_manifests requires --storage_engine=file.')
+      manifests = manifest_store.ManifestStore(self._fs)
+    self.data_store = data_store.DataStore(
+        self._fs, resource_index, resource_cache, segments,
+        data_store.create_codecs(FLAGS.resource_compression), manifests)
+    if resource_index is not None and FLAGS.rebuild_resource_index:
+      self.data_store.rebuild_index('projects')
     self.assignment_notifier = assignment_monitor.AssignmentNotifier(self._fs)
+    self.ingestion = None
+    if FLAGS.write_behind_ingestion:
+      self.ingestion = episode_ingestion.EpisodeIngestion(
+          self._fs, self.data_store,
+          functools.partial(
+              submit_episode_chunks_handler.process_stored_episode_chunks,
+              self.data_store, self.assignment_notifier),
+          functools.partial(submit_episode_chunks_handler.get_session_info,
+                            self.data_store),
+          FLAGS.ingestion_workers)
     self._create_api_keys(FLAGS.project_ids)
 
   def _create_api_keys(self, project_ids):
@@ -88,21 +217,10 @@ class FalkenService(falken_service_pb2_grpc.FalkenService):
       request: RPC request which must contain the project_id field.
       context: RPC context which must contain the api_key in its metadata.
     """
-    if not request.project_id:
-      context.abort(code_pb2.UNAUTHENTICATED,
-                    'No project ID set in the request.')
-    api_key = request_metadata.extract_metadata_value(
-        context, _API_METADATA_KEY)
-    if not api_key:
-      context.abort(code_pb2.UNAUTHENTICATED,
-                    'No API key found in the metadata.')
-    project_id = request.project_id
-    api_key_for_project = self.data_store.read_by_proto_ids(
-        project_id=project_id).api_key
-    if api_key_for_project != api_key:
-      context.abort(
-          code_pb2.UNAUTHENTICATED,
-          f'Project ID {project_id} and API key {api_key} does not match.')
+    api_key = _get_api_key(request, context)
+    _check_api_key(request, context, api_key,
+                   self.data_store.read_by_proto_ids(
+                       project_id=request.project_id))
 
   def CreateBrain(self, request, context):
     """Creates a new brain from a BrainSpec."""
@@ -166,7 +284,8 @@ class FalkenService(falken_service_pb2_grpc.FalkenService):
     """Submits EpisodeChunks."""
     self._validate_project_and_api_key(request, context)
     return submit_episode_chunks_handler.submit_episode_chunks(
-        request, context, self.data_store, self.assignment_notifier)
+        request, context, self.data_store, self.assignment_notifier,
+        self.ingestion)
 
   def GetModel(self, request, context):
     """Returns a serialized model."""
@@ -175,6 +294,275 @@ class FalkenService(falken_service_pb2_grpc.FalkenService):
         request, context, self.data_store).get()
 
 
+def _get_api_key(request, context):
+  """Returns the API key of an RPC.
+
+  Aborts the RPC if the project or the API key are not set.
+
+  Args:
+    request: RPC request which must contain the project_id field.
+    context: RPC context which must contain the api_key in its metadata.
+  """
+  if not request.project_id:
+    context.abort(code_pb2.UNAUTHENTICATED,
+                  'No project ID set in the request.')
+  api_key = request_metadata.extract_metadata_value(
+      context, _API_METADATA_KEY)
+  if not api_key:
+    context.abort(code_pb2.UNAUTHENTICATED,
+                  'No API key found in the metadata.')
+  return api_key
+
+
+def _check_api_key(request, context, api_key, project):
+  """Aborts the RPC if the API key doesn't match the project of the request.
+
+  Args:
+    request: RPC request which must contain the project_id field.
+    context: RPC context.
+    api_key: API key of the RPC.
+    project: data_store_pb2.Project of the request.
+  """
+  if project.api_key != api_key:
+    context.abort(
+        code_pb2.UNAUTHENTICATED,
+        f'Project ID {request.project_id} and API key {api_key} does not '
+        'match.')
+
+
+def parse_rpc_concurrency_limits(limits):
+  """Parses per-method RPC concurrency limits.
+
+  Args:
+    limits: List of "<method>=<limit>" strings.
+
+  Returns:
+    Dictionary of the maximum number of concurrent RPCs by method name.
+
+  Raises:
+    ValueError: If a limit can't be parsed.
+  """
+  limit_by_method = {}
+  for limit in limits:
+    method_name, _, value = limit.partition('=')
+    if method_name not in _METHOD_NAMES:
+      raise ValueError(
+          f'Unknown method "{method_name}" in "{limit}", expected one of '
+          f'{", ".join(_METHOD_NAMES)}.')
+    try:
+      limit_by_method[method_name] = int(value)
+    except ValueError:
+      raise ValueError(f'Invalid concurrency limit "{value}" for {method_name}.')
+    if limit_by_method[method_name] < 1:
+      raise ValueError(
+          f'Concurrency limit for {method_name} must be at least 1.')
+  return limit_by_method
+
+
+class _RpcAborted(Exception):
+  """Raised by _AioContext.abort() to terminate a handler."""
+
+  def __init__(self, code, details):
+    super().__init__(details)
+    self.code = code
+    self.details = details
+
+
+class _AioContext:
+  """Context passed to handlers of AioFalkenService.
+
+  grpc.aio contexts must only be used from the event loop and their abort() is
+  a coroutine, so aborts are raised as _RpcAborted, wherever the handler runs,
+  and applied to the RPC when the handler returns.
+  """
+
+  def __init__(self, context):
+    """Initializes the context.
+
+    Args:
+      context: grpc.aio.ServicerContext of the RPC.
+    """
+    self._context = context
+    self._invocation_metadata = context.invocation_metadata()
+
+  def invocation_metadata(self):
+    """Returns the metadata sent by the client."""
+    return self._invocation_metadata
+
+  def abort(self, code, details):
+    """Terminates the handler, aborting the RPC with the specified status.
+
+    Args:
+      code: google.rpc.Code value or grpc.StatusCode of the status.
+      details: Message of the status.
+
+    Raises:
+      _RpcAborted: Always.
+    """
+    raise _RpcAborted(code, details)
+
+
+class AioFalkenService:
+  """FalkenService for a grpc.aio server.
+
+  Experimental. SubmitEpisodeChunks, GetModel, GetSession and ListSessions are
+  coroutines that run on the event loop and only wait for blocking data store
+  calls on the executor, so the number of these RPCs in flight is not limited
+  by the number of threads. The handlers of other methods run on the executor.
+  """
+
+  def __init__(self, service, executor, concurrency_limits=None):
+    """Initializes the service.
+
+    Args:
+      service: FalkenService instance that handles the RPCs.
+      executor: concurrent.futures.Executor to run blocking calls on.
+      concurrency_limits: Optional dictionary of the maximum number of RPCs
+        of a method that run at the same time by method name.
+    """
+    self._service = service
+    self._executor = executor
+    # Created by _get_semaphore() on the event loop of the server.
+    self._semaphores = {}
+    self._concurrency_limits = concurrency_limits or {}
+
+  def _get_semaphore(self, method_name):
+    """Returns the semaphore that limits RPCs of a method or None."""
+    semaphore = self._semaphores.get(method_name)
+    if not semaphore:
+      limit = self._concurrency_limits.get(method_name)
+      if not limit:
+        return None
+      semaphore = asyncio.Semaphore(limit)
+      self._semaphores[method_name] = semaphore
+    return semaphore
+
+  async def _run(self, function, *args, **kwargs):
+    """Calls a blocking function on the executor.
+
+    Args:
+      function: Function to call.
+      *args: Positional arguments of the function.
+      **kwargs: Keyword arguments of the function.
+
+    Returns:
+      Result of the function.
+    """
+    return await asyncio.get_running_loop().run_in_executor(
+        self._executor, functools.partial(function, *args, **kwargs))
+
+  async def _handle(self, method_name, handler, request, context):
+    """Handles an RPC of a method.
+
+    Args:
+      method_name: Name of the FalkenService method.
+      handler: Coroutine function called with the request and an _AioContext
+        that returns the response.
+      request: Request of the RPC.
+      context: grpc.aio.ServicerContext of the RPC.
+
+    Returns:
+      Response of the RPC.
+    """
+    aio_context = _AioContext(context)
+    semaphore = self._get_semaphore(method_name)
+    try:
+      if semaphore:
+        async with semaphore:
+          return await handler(request, aio_context)
+      return await handler(request, aio_context)
+    except _RpcAborted as e:
+      await context.abort(_STATUS_CODES.get(e.code, e.code), e.details)
+
+  async def _run_handler(self, method_name, request, context):
+    """Runs the FalkenService handler of a method on the executor.
+
+    Args:
+      method_name: Name of the FalkenService method to call.
+      request: Request of the RPC.
+      context: grpc.aio.ServicerContext of the RPC.
+
+    Returns:
+      Response of the RPC.
+    """
+    return await self._handle(
+        method_name,
+        functools.partial(self._run, getattr(self._service, method_name)),
+        request, context)
+
+  async def _validate_project_and_api_key(self, request, context):
+    """Validate the project and API key.
+
+    Aborts the RPC when the validation fails.
+
+    Args:
+      request: RPC request which must contain the project_id field.
+      context: _AioContext which must contain the api_key in its metadata.
+    """
+    api_key = _get_api_key(request, context)
+    project = await self._run(self._service.data_store.read_by_proto_ids,
+                              project_id=request.project_id)
+    _check_api_key(request, context, api_key, project)
+
+  async def _submit_episode_chunks(self, request, context):
+    await self._validate_project_and_api_key(request, context)
+    return await submit_episode_chunks_handler.submit_episode_chunks_async(
+        request, context, self._run, self._service.data_store,
+        self._service.assignment_notifier, self._service.ingestion)
+
+  async def _get_model(self, request, context):
+    await self._validate_project_and_api_key(request, context)
+    return await get_handler.GetModelHandler(
+        request, context, self._service.data_store).get_async(self._run)
+
+  async def _get_session(self, request, context):
+    await self._validate_project_and_api_key(request, context)
+    return await get_handler.GetSessionHandler(
+        request, context, self._service.data_store).get_async(self._run)
+
+  async def _list_sessions(self, request, context):
+    await self._validate_project_and_api_key(request, context)
+    return await list_handler.ListSessionsHandler(
+        request, context, self._service.data_store).list_async(self._run)
+
+  async def SubmitEpisodeChunks(self, request, context):
+    """Submits EpisodeChunks."""
+    return await self._handle('SubmitEpisodeChunks',
+                              self._submit_episode_chunks, request, context)
+
+  async def GetModel(self, request, context):
+    """Returns a serialized model."""
+    return await self._handle('GetModel', self._get_model, request, context)
+
+  async def GetSession(self, request, context):
+    """Retrieves a Session by ID."""
+    return await self._handle('GetSession', self._get_session, request,
+                              context)
+
+  async def ListSessions(self, request, context):
+    """Returns a list of Sessions for a given Brain."""
+    return await self._handle('ListSessions', self._list_sessions, request,
+                              context)
+
+
+def _add_executor_method(method_name):
+  """Adds a coroutine to AioFalkenService that runs a handler on a thread."""
+
+  async def method(self, request, context):
+    # pylint: disable=protected-access
+    return await self._run_handler(method_name, request, context)
+
+  method.__name__ = method_name
+  method.__doc__ = getattr(FalkenService, method_name).__doc__
+  setattr(AioFalkenService, method_name, method)
+
+
+for _method_name in _METHOD_NAMES:
+  # Methods handled by coroutines are defined by the class.
+  if _method_name not in AioFalkenService.__dict__:
+    _add_executor_method(_method_name)
+
+
 def read_server_credentials():
   """Reads server credentials from local directory specified in ssl_dir.
 
@@ -220,7 +608,8 @@ def serve():
     Reference to the server object.
   """
   server = grpc.server(
-      futures.ThreadPoolExecutor(max_workers=FLAGS.max_workers))
+      futures.ThreadPoolExecutor(max_workers=FLAGS.max_workers),
+      maximum_concurrent_rpcs=FLAGS.max_concurrent_rpcs)
   falken_service_pb2_grpc.add_FalkenServiceServicer_to_server(
       FalkenService(), server)
   _configure_server(server, FLAGS.port, read_server_credentials())
@@ -229,11 +618,40 @@ def serve():
   return server
 
 
+async def serve_aio():
+  """Start the experimental grpc.aio API server.
+
+  Must be called from the event loop that runs the server.
+
+  Returns:
+    Reference to the grpc.aio.Server object.
+  """
+  server = grpc.aio.server(maximum_concurrent_rpcs=FLAGS.max_concurrent_rpcs)
+  falken_service_pb2_grpc.add_FalkenServiceServicer_to_server(
+      AioFalkenService(
+          FalkenService(),
+          futures.ThreadPoolExecutor(max_workers=FLAGS.max_workers),
+          parse_rpc_concurrency_limits(FLAGS.rpc_concurrency_limits)),
+      server)
+  _configure_server(server, FLAGS.port, read_server_credentials())
+  await server.start()
+  return server
+
+
+async def _serve_aio_until_termination():
+  """Start the grpc.aio API server and wait until it terminates."""
+  server = await serve_aio()
+  await server.wait_for_termination()
+
+
 def main(argv):
   if len(argv) > 1:
     logging.error('Non-flag parameters are not allowed: %s', argv)
   logging.debug('Starting the API service...')
   logging.get_absl_handler().use_absl_log_file()
+  if FLAGS.experimental_aio_server:
+    asyncio.run(_serve_aio_until_termination())
+    return
   server = serve()
   server.wait_for_termination()
 
@@ -15,14 +15,19 @@
 # Lint as: python3
 """Tests for falken.service.api.falken_service."""
 
+import asyncio
+from concurrent import futures
 import os
 import os.path
 import tempfile
+import time
 from unittest import mock
 
 from absl import flags
 from absl.testing import absltest
+from api import episode_ingestion
 from api import falken_service
+from api import submit_episode_chunks_handler
 from api import test_constants
 
 # pylint: disable=g-bad-import-order
@@ -100,6 +105,158 @@ class FalkenServiceTest(absltest.TestCase):
                           brain_pb2.BrainSpec()))
     server.stop(None)
 
+  @mock.patch.object(falken_service, 'read_server_credentials', autospec=True)
+  @mock.patch.object(falken_service, '_configure_server', autospec=True)
+  @mock.patch.object(falken_service.FalkenService, '_create_api_keys')
+  @mock.patch.object(falken_service.FalkenService,
+                     '_validate_project_and_api_key')
+  def test_serve_aio(self, unused_validate_project_and_api_key,
+                     unused_mock_create_api_keys, mock_configure_server,
+                     unused_mock_read_credentials):
+    """Test that the grpc.aio Falken service can be connected to."""
+    FLAGS.port = 50052
+    mock_configure_server.side_effect = (
+        lambda server, port, _: server.add_insecure_port(f'[::]:{port}'))
+
+    async def get_brain():
+      server = await falken_service.serve_aio()
+      try:
+        async with grpc.aio.insecure_channel('localhost:50052') as channel:
+          stub = falken_service_pb2_grpc.FalkenServiceStub(channel)
+          with self.assertRaises(grpc.aio.AioRpcError) as error:
+            await stub.GetBrain(
+                falken_service_pb2.GetBrainRequest(project_id='test_project'))
+          return error.exception
+      finally:
+        await server.stop(None)
+
+    error = asyncio.run(get_brain())
+    # Aborts of handlers are reported with the status code of the handler.
+    self.assertEqual(error.code(), grpc.StatusCode.INVALID_ARGUMENT)
+    self.assertIn('brain_id', error.details())
+
+  def test_aio_service_concurrency_limits(self):
+    """Test that RPCs of a method wait for its concurrency limit."""
+    running = [0]
+    max_running = [0]
+
+    def handler(request, unused_context):
+      running[0] += 1
+      max_running[0] = max(max_running[0], running[0])
+      time.sleep(0.01)
+      running[0] -= 1
+      return request
+
+    service = mock.Mock()
+    service.CreateSession.side_effect = handler
+    service.GetBrain.side_effect = lambda request, context: context.abort(
+        code_pb2.NOT_FOUND, 'Brain not found.')
+    context = mock.Mock()
+    context.abort = mock.AsyncMock()
+    aio_service = falken_service.AioFalkenService(
+        service, futures.ThreadPoolExecutor(max_workers=4),
+        {'CreateSession': 1})
+
+    async def call_methods():
+      return await asyncio.gather(
+          *[aio_service.CreateSession(i, context) for i in range(4)],
+          aio_service.GetBrain(None, context))
+
+    self.assertEqual(asyncio.run(call_methods()), [0, 1, 2, 3, None])
+    self.assertEqual(max_running[0], 1)
+    context.abort.assert_called_once_with(grpc.StatusCode.NOT_FOUND,
+                                          'Brain not found.')
+
+  @mock.patch.object(submit_episode_chunks_handler,
+                     'submit_episode_chunks_async')
+  def test_aio_service_submit_episode_chunks(self, submit_episode_chunks):
+    """Test that SubmitEpisodeChunks RPCs are not limited by the threads."""
+    running = [0]
+    max_running = [0]
+
+    async def submit(request, unused_context, run, data_store,
+                     unused_assignment_notifier, unused_ingestion):
+      running[0] += 1
+      max_running[0] = max(max_running[0], running[0])
+      await run(data_store.write, request)
+      await asyncio.sleep(0.01)
+      running[0] -= 1
+      return request
+
+    submit_episode_chunks.side_effect = submit
+    service = mock.Mock()
+    service.data_store.read_by_proto_ids.return_value = (
+        data_store_pb2.Project(api_key='key'))
+    context = mock.Mock()
+    context.invocation_metadata.return_value = (('x-goog-api-key', 'key'),)
+    aio_service = falken_service.AioFalkenService(
+        service, futures.ThreadPoolExecutor(max_workers=1))
+    requests = [falken_service_pb2.SubmitEpisodeChunksRequest(
+        project_id='p0', session_id=f's{i}') for i in range(4)]
+
+    async def call_methods():
+      return await asyncio.gather(
+          *[aio_service.SubmitEpisodeChunks(r, context) for r in requests])
+
+    self.assertEqual(asyncio.run(call_methods()), requests)
+    # All RPCs were in flight at the same time with a single thread.
+    self.assertEqual(max_running[0], 4)
+    service.SubmitEpisodeChunks.assert_not_called()
+    service.data_store.write.assert_has_calls(
+        [mock.call(r) for r in requests])
+    service.data_store.read_by_proto_ids.assert_called_with(project_id='p0')
+
+  def test_aio_service_coroutine_aborts(self):
+    """Test that coroutine handlers abort RPCs on the event loop."""
+    service = mock.Mock()
+    service.data_store.read_by_proto_ids.return_value = (
+        data_store_pb2.Project(api_key='key'))
+    context = mock.Mock()
+    context.abort = mock.AsyncMock()
+    context.invocation_metadata.return_value = (('x-goog-api-key', 'other'),)
+    aio_service = falken_service.AioFalkenService(
+        service, futures.ThreadPoolExecutor(max_workers=1))
+
+    self.assertIsNone(asyncio.run(aio_service.GetSession(
+        falken_service_pb2.GetSessionRequest(project_id='p0'), context)))
+    context.abort.assert_called_once_with(
+        grpc.StatusCode.UNAUTHENTICATED,
+        'Project ID p0 and API key other does not match.')
+    service.data_store.read.assert_not_called()
+
+  @mock.patch.object(falken_service.FalkenService, '_create_api_keys')
+  @mock.patch.object(falken_service.FalkenService,
+                     '_validate_project_and_api_key')
+  @mock.patch.object(episode_ingestion, 'EpisodeIngestion')
+  @mock.patch.object(submit_episode_chunks_handler, 'submit_episode_chunks')
+  def test_write_behind_ingestion(self, submit_episode_chunks,
+                                  episode_ingestion_class, unused_validate,
+                                  unused_create_api_keys):
+    """Test that chunks are submitted to the ingestion in write-behind mode."""
+    FLAGS.write_behind_ingestion = True
+    try:
+      service = falken_service.FalkenService()
+    finally:
+      FLAGS.write_behind_ingestion = False
+    request = falken_service_pb2.SubmitEpisodeChunksRequest()
+    context = mock.Mock()
+    self.assertEqual(service.SubmitEpisodeChunks(request, context),
+                     submit_episode_chunks.return_value)
+    submit_episode_chunks.assert_called_once_with(
+        request, context, service.data_store, service.assignment_notifier,
+        episode_ingestion_class.return_value)
+
+  def test_parse_rpc_concurrency_limits(self):
+    """Test parsing per-method concurrency limits."""
+    self.assertEqual(falken_service.parse_rpc_concurrency_limits([]), {})
+    self.assertEqual(
+        falken_service.parse_rpc_concurrency_limits(
+            ['SubmitEpisodeChunks=64', 'GetModel=8']),
+        {'SubmitEpisodeChunks': 64, 'GetModel': 8})
+    for limits in (['Unknown=1'], ['GetModel=many'], ['GetModel=0']):
+      with self.assertRaises(ValueError):
+        falken_service.parse_rpc_concurrency_limits(limits)
+
   def test_read_server_credentials(self):
     """Test read_server_credentials."""
     test_private_key = b'test_private_key'
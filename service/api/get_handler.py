@@ -72,6 +72,22 @@ class GetHandler:
     return self._read_and_convert_proto(
         resource_id.FalkenResourceId(self._instantiate_glob_pattern()))
 
+  async def get_async(self, run):
+    """Retrieves the instance requested without blocking the event loop.
+
+    Args:
+      run: Coroutine function that calls a blocking function with the given
+        arguments, e.g. on an executor, and returns its result.
+
+    Returns:
+      Falken proto that was requested.
+    """
+    logging.debug('Get called with request %s', str(self._request))
+
+    return proto_conversion.ProtoConverter.convert_proto(
+        await run(self._data_store.read, resource_id.FalkenResourceId(
+            self._instantiate_glob_pattern())))
+
   def _read_and_convert_proto(self, res_id):
     return proto_conversion.ProtoConverter.convert_proto(
         self._data_store.read(res_id))
@@ -159,18 +175,17 @@ class GetSessionByIndexHandler(GetHandler):
           'Project ID, brain ID, and session index must be specified in '
           'GetSessionByIndexRequest.')
 
-    session_ids, _ = self._data_store.list(
+    session_id = self._data_store.nth(
         resource_id.FalkenResourceId(
             self._glob_pattern.format(
                 self._request.project_id, self._request.brain_id)),
-        page_size=self._request.session_index + 1)
-    if len(session_ids) < self._request.session_index:
+        self._request.session_index)
+    if not session_id:
       self._abort(
           code_pb2.INVALID_ARGUMENT,
           f'Session at index {self._request.session_index} was not found.')
 
-    return self._read_and_convert_proto(
-        session_ids[self._request.session_index])
+    return self._read_and_convert_proto(session_id)
 
 
 class GetModelHandler(GetHandler):
@@ -194,20 +209,59 @@ class GetModelHandler(GetHandler):
           f'{request.model_id}.')
 
   def get(self):
-    if self._request.model_id:
-      model_glob = self._instantiate_glob_pattern()
-    else:
-      # Read the model glob from the snapshot
+    snapshot = None
+    if not self._request.model_id:
       snapshot = self._data_store.read(
           resource_id.FalkenResourceId(self._instantiate_glob_pattern()))
-      model_glob = resource_id.FalkenResourceId(
-          project=snapshot.project_id,
-          brain=snapshot.brain_id,
-          session='*',
-          model=snapshot.model)
-
+    model_glob = self._get_model_glob(snapshot)
     listed_ids, _ = self._data_store.list(model_glob, page_size=2)
+    model_id = self._get_model_id(model_glob, listed_ids)
+    return _create_model_response(model_id, self._data_store.read(model_id))
+
+  async def get_async(self, run):
+    """Retrieves the model requested without blocking the event loop.
 
+    Args:
+      run: Coroutine function that calls a blocking function with the given
+        arguments, e.g. on an executor, and returns its result.
+
+    Returns:
+      falken_service_pb2.Model that was requested.
+    """
+    snapshot = None
+    if not self._request.model_id:
+      snapshot = await run(
+          self._data_store.read,
+          resource_id.FalkenResourceId(self._instantiate_glob_pattern()))
+    model_glob = self._get_model_glob(snapshot)
+    listed_ids, _ = await run(self._data_store.list, model_glob, page_size=2)
+    model_id = self._get_model_id(model_glob, listed_ids)
+    model = await run(self._data_store.read, model_id)
+    return await run(_create_model_response, model_id, model)
+
+  def _get_model_glob(self, snapshot):
+    """Returns the glob pattern of the requested model.
+
+    Args:
+      snapshot: data_store_pb2.Snapshot requested or None if the model is
+        requested by ID.
+    """
+    if not snapshot:
+      return self._instantiate_glob_pattern()
+    # Read the model glob from the snapshot
+    return resource_id.FalkenResourceId(
+        project=snapshot.project_id,
+        brain=snapshot.brain_id,
+        session='*',
+        model=snapshot.model)
+
+  def _get_model_id(self, model_glob, listed_ids):
+    """Returns the ID of the only model listed for the request.
+
+    Args:
+      model_glob: Glob pattern the models were listed with.
+      listed_ids: List of resource IDs of the listed models.
+    """
     if not listed_ids:
       self._abort(
           code_pb2.INVALID_ARGUMENT, 'No models found for the given request.')
@@ -216,19 +270,28 @@ class GetModelHandler(GetHandler):
       raise RuntimeError(f'{len(listed_ids)} resources found for glob '
                          f'{model_glob}, but only one was expected.')
 
-    model_id = listed_ids[0]
+    return listed_ids[0]
+
 
-    model = self._data_store.read(model_id)
+def _create_model_response(model_id, model):
+  """Creates the response to a GetModel request.
 
-    model_response = falken_service_pb2.Model(model_id=model_id.model)
-    model_files = model_response.serialized_model.packed_files_payload.files
-    with zipfile.ZipFile(model.compressed_model_path) as zipped_file:
-      for name in sorted(zipped_file.namelist()):
-        is_file = os.path.basename(name)
-        is_inside_saved_model = os.path.commonpath(
-            [name, _SAVED_MODEL_PATH]) == _SAVED_MODEL_PATH
-        path = file_system.posix_path(os.path.relpath(name, _SAVED_MODEL_PATH))
-        if is_file and is_inside_saved_model:
-          model_files[path] = zipped_file.read(name)
+  Args:
+    model_id: Resource ID of the model.
+    model: data_store_pb2.Model to read the saved model from.
 
-    return model_response
+  Returns:
+    falken_service_pb2.Model containing the files of the saved model.
+  """
+  model_response = falken_service_pb2.Model(model_id=model_id.model)
+  model_files = model_response.serialized_model.packed_files_payload.files
+  with zipfile.ZipFile(model.compressed_model_path) as zipped_file:
+    for name in sorted(zipped_file.namelist()):
+      is_file = os.path.basename(name)
+      is_inside_saved_model = os.path.commonpath(
+          [name, _SAVED_MODEL_PATH]) == _SAVED_MODEL_PATH
+      path = file_system.posix_path(os.path.relpath(name, _SAVED_MODEL_PATH))
+      if is_file and is_inside_saved_model:
+        model_files[path] = zipped_file.read(name)
+
+  return model_response
@@ -14,6 +14,7 @@
 
 # Lint as: python3
 """Tests for get_handler."""
+import asyncio
 import os.path
 import tempfile
 from unittest import mock
@@ -128,6 +129,37 @@ class GetHandlerTest(absltest.TestCase):
         resource_id.FalkenResourceId(
             'projects/p0/brains/b0/sessions/s0/models/m0'))
 
+  def test_get_handler_get_model_async(self):
+    zip_path = self.setup_compressed_model()
+    request = falken_service_pb2.GetModelRequest(
+        project_id='p0', brain_id='b0', model_id='m0')
+    mock_ds = mock.Mock()
+    mock_ds.list.return_value = ([
+        resource_id.FalkenResourceId(
+            'projects/p0/brains/b0/sessions/s0/models/m0')], None)
+    mock_ds.read.return_value = data_store_pb2.Model(
+        compressed_model_path=zip_path)
+    run_functions = []
+
+    async def run(function, *args, **kwargs):
+      run_functions.append(function)
+      return function(*args, **kwargs)
+
+    self.assertEqual(
+        asyncio.run(get_handler.GetModelHandler(
+            request, mock.Mock(), mock_ds).get_async(run)),
+        falken_service_pb2.Model(
+            model_id='m0',
+            serialized_model=serialized_model_pb2.SerializedModel(
+                packed_files_payload=serialized_model_pb2.PackedFiles(
+                    files={'a.txt': b'file 1 data', 'abc/b.txt': b'file 2 data'}
+                    ))))
+    # All blocking calls are made through run.
+    self.assertEqual(run_functions, [mock_ds.list, mock_ds.read,
+                                     get_handler._create_model_response])
+    mock_ds.list.assert_called_once_with(resource_id.FalkenResourceId(
+        'projects/p0/brains/b0/sessions/*/models/m0'), page_size=2)
+
   def test_get_handler_get_model_snapshot_specified_both(self):
     request = falken_service_pb2.GetModelRequest(
         snapshot_id='s0', model_id='m0')
@@ -206,6 +238,26 @@ class GetHandlerTest(absltest.TestCase):
     read_and_convert_proto.assert_called_once_with(
         resource_id.FalkenResourceId('projects/p0/brains/b0'))
 
+  @mock.patch.object(proto_conversion.ProtoConverter, 'convert_proto')
+  def test_get_async(self, convert_proto):
+    mock_ds = mock.Mock()
+    request = falken_service_pb2.GetSessionRequest(
+        project_id='p0', brain_id='b0', session_id='s0')
+    run_functions = []
+
+    async def run(function, *args, **kwargs):
+      run_functions.append(function)
+      return function(*args, **kwargs)
+
+    self.assertEqual(
+        asyncio.run(get_handler.GetSessionHandler(
+            request, mock.Mock(), mock_ds).get_async(run)),
+        convert_proto.return_value)
+    self.assertEqual(run_functions, [mock_ds.read])
+    mock_ds.read.assert_called_once_with(
+        resource_id.FalkenResourceId('projects/p0/brains/b0/sessions/s0'))
+    convert_proto.assert_called_once_with(mock_ds.read.return_value)
+
   def test_get_session_by_index_bad_request(self):
     mock_context = mock.Mock()
     mock_context.abort.side_effect = Exception()
@@ -222,7 +274,7 @@ class GetHandlerTest(absltest.TestCase):
     mock_context = mock.Mock()
     mock_context.abort.side_effect = Exception()
     mock_ds = mock.Mock()
-    mock_ds.list.return_value = ([], None)
+    mock_ds.nth.return_value = None
 
     with self.assertRaises(Exception):
       get_handler.GetSessionByIndexHandler(
@@ -233,10 +285,9 @@ class GetHandlerTest(absltest.TestCase):
     mock_context.abort.assert_called_once_with(
         code_pb2.INVALID_ARGUMENT,
         'Session at index 20 was not found.')
-    mock_ds.list.assert_called_once_with(
+    mock_ds.nth.assert_called_once_with(
         resource_id.FalkenResourceId(
-            'projects/test_project_id/brains/test_brain_id/sessions/*'),
-        page_size=21)
+            'projects/test_project_id/brains/test_brain_id/sessions/*'), 20)
 
   @mock.patch.object(get_handler.GetHandler, '_read_and_convert_proto')
   def test_get_session_by_index(self, read_and_convert_proto):
@@ -244,13 +295,8 @@ class GetHandlerTest(absltest.TestCase):
     mock_context.abort.side_effect = Exception()
     mock_ds = mock.Mock()
     brain_res_id = 'projects/test_project_id/brains/test_brain_id'
-    mock_ds.list.return_value = ([
-        resource_id.FalkenResourceId(
-            f'{brain_res_id}/sessions/test_session_id_0'),
-        resource_id.FalkenResourceId(
-            f'{brain_res_id}/sessions/test_session_id_1'),
-        resource_id.FalkenResourceId(
-            f'{brain_res_id}/sessions/test_session_id_2')], None)
+    mock_ds.nth.return_value = resource_id.FalkenResourceId(
+        f'{brain_res_id}/sessions/test_session_id_2')
     read_and_convert_proto.return_value = session_pb2.Session()
 
     self.assertEqual(
@@ -263,10 +309,9 @@ class GetHandlerTest(absltest.TestCase):
         read_and_convert_proto.return_value)
 
     mock_context.abort.assert_not_called()
-    mock_ds.list.assert_called_once_with(
+    mock_ds.nth.assert_called_once_with(
         resource_id.FalkenResourceId(
-            'projects/test_project_id/brains/test_brain_id/sessions/*'),
-        page_size=3)
+            'projects/test_project_id/brains/test_brain_id/sessions/*'), 2)
     read_and_convert_proto.assert_called_once_with(
         resource_id.FalkenResourceId(
             'projects/test_project_id/brains/test_brain_id/sessions/'
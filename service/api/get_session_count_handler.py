@@ -49,8 +49,8 @@ def get_session_count(request, context, data_store):
         'Project ID and brain ID must be specified in GetSessionCountRequest.')
     return
 
-  session_ids, _ = data_store.list_by_proto_ids(
+  session_count = data_store.count(data_store.resource_id_from_proto_ids(
       project_id=request.project_id, brain_id=request.brain_id,
-      session_id='*')
+      session_id='*'))
   return falken_service_pb2.GetSessionCountResponse(
-      session_count=len(session_ids))
+      session_count=session_count)
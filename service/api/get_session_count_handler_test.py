@@ -42,11 +42,7 @@ class GetSessionCountHandlerTest(absltest.TestCase):
     mock_context = mock.Mock()
     mock_context.abort.side_effect = Exception()
     mock_ds = mock.Mock()
-    mock_ds.list_by_proto_ids.return_value = (
-        [resource_id.FalkenResourceId('projects/p0/brains/b0/sessions/s0'),
-         resource_id.FalkenResourceId('projects/p0/brains/b0/sessions/s1'),
-         resource_id.FalkenResourceId('projects/p0/brains/b0/sessions/s2')],
-        None)
+    mock_ds.count.return_value = 3
 
     self.assertEqual(
         get_session_count_handler.get_session_count(
@@ -57,8 +53,10 @@ class GetSessionCountHandlerTest(absltest.TestCase):
         falken_service_pb2.GetSessionCountResponse(session_count=3))
 
     mock_context.abort.assert_not_called()
-    mock_ds.list_by_proto_ids.assert_called_once_with(
+    mock_ds.resource_id_from_proto_ids.assert_called_once_with(
         project_id='test_project_id', brain_id='test_brain_id', session_id='*')
+    mock_ds.count.assert_called_once_with(
+        mock_ds.resource_id_from_proto_ids.return_value)
 
 
 if __name__ == '__main__':
@@ -89,27 +89,64 @@ class ListHandler:
     """
     logging.debug('List called with request %s', str(self._request))
 
-    args = []
-    for arg in self._request_args:
-      if not getattr(self._request, arg):
-        self._context.abort(
-            code_pb2.INVALID_ARGUMENT,
-            f'Could not find {arg} in {self._request_type}.')
-      args.append(getattr(self._request, arg))
+    list_resource_ids, next_token = self._data_store.list(
+        self._get_resource_glob(),
+        page_size=self._request.page_size or None,
+        page_token=self._request.page_token or None)
 
     response = self._response_proto_type()
+    response.next_page_token = next_token or ''
 
-    list_resource_ids, next_token = self._data_store.list(
-        resource_id.FalkenResourceId(self._glob_pattern.format(*args)),
+    self._fill_response(response, list_resource_ids)
+
+    return response
+
+  async def list_async(self, run):
+    """Retrieves the requested protos without blocking the event loop.
+
+    Args:
+      run: Coroutine function that calls a blocking function with the given
+        arguments, e.g. on an executor, and returns its result.
+
+    Returns:
+      falken_service_pb2.List*Response proto containing the protos that were
+      requested and the next_page_token.
+
+    Raises:
+      Exception: The gRPC context is aborted when the required fields are not
+        specified in the request, which raises an exception to terminate the RPC
+        with a no-OK status.
+    """
+    logging.debug('List called with request %s', str(self._request))
+
+    list_resource_ids, next_token = await run(
+        self._data_store.list, self._get_resource_glob(),
         page_size=self._request.page_size or None,
         page_token=self._request.page_token or None)
 
+    response = self._response_proto_type()
     response.next_page_token = next_token or ''
 
-    self._fill_response(response, list_resource_ids)
+    await run(self._fill_response, response, list_resource_ids)
 
     return response
 
+  def _get_resource_glob(self):
+    """Returns the resource ID glob of the requested protos.
+
+    Raises:
+      Exception: The gRPC context is aborted when the required fields are not
+        specified in the request.
+    """
+    args = []
+    for arg in self._request_args:
+      if not getattr(self._request, arg):
+        self._context.abort(
+            code_pb2.INVALID_ARGUMENT,
+            f'Could not find {arg} in {self._request_type}.')
+      args.append(getattr(self._request, arg))
+    return resource_id.FalkenResourceId(self._glob_pattern.format(*args))
+
   def _fill_response(self, response, res_ids):
     """Reads proto from datastore from ids and fills up the response.
 
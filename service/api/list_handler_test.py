@@ -14,6 +14,7 @@
 
 # Lint as: python3
 """Tests for list_handler."""
+import asyncio
 from unittest import mock
 
 from absl.testing import absltest
@@ -221,6 +222,30 @@ class ListHandlerTest(absltest.TestCase):
           resource_id.FalkenResourceId('projects/p0/brains/*'),
           page_size=4, page_token='2')
 
+  @mock.patch.object(list_handler.ListHandler, '_fill_response')
+  def test_list_async(self, fill_response):
+    mock_ds = mock.Mock()
+    res_ids = [f'projects/p0/brains/b0/sessions/s{i}' for i in range(4)]
+    mock_ds.list.return_value = (res_ids, '4')
+    request = falken_service_pb2.ListSessionsRequest(
+        project_id='p0', brain_id='b0', page_size=4)
+    handler = list_handler.ListSessionsHandler(request, mock.Mock(), mock_ds)
+    run_functions = []
+
+    async def run(function, *args, **kwargs):
+      run_functions.append(function)
+      return function(*args, **kwargs)
+
+    self.assertEqual(
+        asyncio.run(handler.list_async(run)),
+        falken_service_pb2.ListSessionsResponse(next_page_token='4'))
+    # Listing and reading the sessions are made through run.
+    self.assertEqual(run_functions, [mock_ds.list, fill_response])
+    mock_ds.list.assert_called_once_with(
+        resource_id.FalkenResourceId('projects/p0/brains/b0/sessions/*'),
+        page_size=4, page_token=None)
+    fill_response.assert_called_once_with(mock.ANY, res_ids)
+
   @staticmethod
   def _ds_brain(index):
     return data_store_pb2.Brain(
@@ -18,12 +18,14 @@ import collections
 import copy
 import typing
 
+from api.sampling import online_eval_sampling
+
 
 class EvaluationSummary(typing.NamedTuple):
   """Contains results of evaluations for a model ID."""
   model_id: str
   offline_scores: typing.Dict[int, float]
-  online_scores: typing.List[float]
+  online_record: online_eval_sampling.ModelRecord
 
 
 class AssignmentEvalId(typing.NamedTuple):
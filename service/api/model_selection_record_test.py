@@ -18,6 +18,7 @@
 from absl.testing import absltest
 
 from api import model_selection_record
+from api.sampling import online_eval_sampling
 
 
 class ModelScoresTest(absltest.TestCase):
@@ -146,21 +147,26 @@ class SummaryMapTest(absltest.TestCase):
     summary_map = model_selection_record.SummaryMap()
     summary_map['a0'].append(
         model_selection_record.EvaluationSummary(
-            model_id='m0', offline_scores={1: -6.0}, online_scores=[1.0, -1.0]))
+            model_id='m0', offline_scores={1: -6.0},
+            online_record=online_eval_sampling.ModelRecord(1, 1)))
     summary_map['a0'].append(
         model_selection_record.EvaluationSummary(
-            model_id='m1', offline_scores={1: -22.0}, online_scores=[1.0]))
+            model_id='m1', offline_scores={1: -22.0},
+            online_record=online_eval_sampling.ModelRecord(1, 0)))
     summary_map['a0'].append(
         model_selection_record.EvaluationSummary(
-            model_id='m2', offline_scores={0: -6.0}, online_scores=[-1.0]))
+            model_id='m2', offline_scores={0: -6.0},
+            online_record=online_eval_sampling.ModelRecord(0, 1)))
     summary_map['a1'].append(
         model_selection_record.EvaluationSummary(
-            model_id='m3', offline_scores={0: -6.0}, online_scores=[-1.0]))
+            model_id='m3', offline_scores={0: -6.0},
+            online_record=online_eval_sampling.ModelRecord(0, 1)))
     self.assertEqual(summary_map.models_count, 4)
     self.assertEqual(
         summary_map.eval_summary_for_assignment_and_model('a0', 'm1'),
         model_selection_record.EvaluationSummary(
-            model_id='m1', offline_scores={1: -22.0}, online_scores=[1.0]))
+            model_id='m1', offline_scores={1: -22.0},
+            online_record=online_eval_sampling.ModelRecord(1, 0)))
     self.assertIsNone(summary_map.eval_summary_for_assignment_and_model(
         'a2', 'm1'))
 
@@ -15,7 +15,6 @@
 # Lint as: python3
 """Selects model based on evaluation score."""
 
-import collections
 import copy
 import time
 import typing
@@ -41,6 +40,63 @@ _NUM_ONLINE_EVALS_PER_MODEL = 6
 _NUM_MODELS_TO_ONLINE_EVAL_PER_ASSIGNMENT = 1
 _MAXIMUM_NUMBER_OF_MODELS_TO_ONLINE_EVAL = 8
 
+# Online record of models without online evaluations.
+_NO_ONLINE_EVALUATIONS = online_eval_sampling.ModelRecord(
+    successes=0, failures=0)
+
+
+def add_online_evaluation(summary, model, score, count=1):
+  """Adds the result of an online evaluation to a summary.
+
+  Args:
+    summary: data_store_pb2.OnlineEvaluationSummary to update.
+    model: ID of the evaluated model.
+    score: Score of the evaluation, EPISODE_SCORE_SUCCESS or
+      EPISODE_SCORE_FAILURE.
+    count: Number of evaluations to add, -1 removes an evaluation that was
+      previously added.
+  """
+  if score == EPISODE_SCORE_SUCCESS:
+    field = 'successes'
+  elif score == EPISODE_SCORE_FAILURE:
+    field = 'failures'
+  else:
+    logging.error('Unknown online score %d.', score)
+    return
+  for model_evaluations in summary.models:
+    if model_evaluations.model == model:
+      break
+  else:
+    model_evaluations = summary.models.add(model=model)
+  setattr(model_evaluations, field, getattr(model_evaluations, field) + count)
+
+
+def summarize_online_evaluations(data_store, session_resource_id):
+  """Summarizes the online evaluations stored for a session.
+
+  This reads every online evaluation of the session, it's used for sessions
+  that were evaluated before their online evaluation summary was maintained.
+
+  Args:
+    data_store: data_store.DataStore to read the online evaluations from.
+    session_resource_id: resource_id.FalkenResourceId of the session.
+
+  Returns:
+    data_store_pb2.OnlineEvaluationSummary of the session.
+  """
+  online_eval_resource_ids, _ = data_store.list_by_proto_ids(
+      attribute_type=data_store_pb2.OnlineEvaluation,
+      project_id=session_resource_id.project,
+      brain_id=session_resource_id.brain,
+      session_id=session_resource_id.session, episode_id='*')
+  summary = data_store_pb2.OnlineEvaluationSummary(
+      project_id=session_resource_id.project,
+      brain_id=session_resource_id.brain,
+      session_id=session_resource_id.session)
+  for online_eval in data_store.read_many(online_eval_resource_ids):
+    add_online_evaluation(summary, online_eval.model, online_eval.score)
+  return summary
+
 
 class ModelSelector:
   """Selects model based on evaluation score."""
@@ -373,26 +429,31 @@ class ModelSelector:
     return offline_eval_summary
 
   def _get_online_eval_summary(self) -> (
-      typing.DefaultDict[str, typing.List[float]]):
-    """Gets list of online scores per model.
+      typing.Dict[str, online_eval_sampling.ModelRecord]):
+    """Gets the online evaluation results per model.
 
     Returns:
-      typing.DefaultDict[str, List[float]] mapping model_id to scores.
+      typing.Dict[str, online_eval_sampling.ModelRecord] mapping model_id to
+      the number of successful and failed evaluations.
     """
     # This session is the evaluating session ID, so we look for online evals for
     # self._session_resource_id.
-    online_eval_resource_ids, _ = self._data_store.list_by_proto_ids(
-        attribute_type=data_store_pb2.OnlineEvaluation,
-        project_id=self._session_resource_id.project,
-        brain_id=self._session_resource_id.brain,
-        session_id=self._session_resource_id.session, episode_id='*')
-
-    online_summaries = collections.defaultdict(list)
-    for online_eval_resource_id in online_eval_resource_ids:
-      online_eval = self._data_store.read(online_eval_resource_id)
-      online_summaries[online_eval.model].append(online_eval.score)
-
-    return online_summaries
+    # Sessions evaluated before summaries were recorded have no summary, so
+    # summarize their stored evaluations once and store the result.
+    summary = self._data_store.update(
+        self._data_store.resource_id_from_proto_ids(
+            attribute_type=data_store_pb2.OnlineEvaluationSummary,
+            project_id=self._session_resource_id.project,
+            brain_id=self._session_resource_id.brain,
+            session_id=self._session_resource_id.session),
+        lambda unused_summary: False,
+        create=lambda: summarize_online_evaluations(self._data_store,
+                                                    self._session_resource_id))
+    return {
+        model_evaluations.model: online_eval_sampling.ModelRecord(
+            successes=model_evaluations.successes,
+            failures=model_evaluations.failures)
+        for model_evaluations in summary.models}
 
   def _generate_summary_map(
       self, offline_eval_summary, online_eval_summary
@@ -403,8 +464,8 @@ class ModelSelector:
     Args:
       offline_eval_summary:
         model_selection_record.OfflineEvaluationByAssignmentAndEvalId instance.
-      online_eval_summary: typing.DefaultDict[string, List[float]] mapping
-        model_id to scores.
+      online_eval_summary: typing.Dict[string, ModelRecord] mapping model_id to
+        online evaluation results.
 
     Returns:
       typing.DefaultDict[string, List[EvaluationSummary]] mapping assignment IDs
@@ -427,7 +488,8 @@ class ModelSelector:
               models_limit=_NUM_MODELS_TO_ONLINE_EVAL_PER_ASSIGNMENT))
       for eval_id, model_score in top_model_scores_for_assignment_id:
         self._add_summary(assignment_id, eval_id, model_score,
-                          online_eval_summary.get(model_score.model_id, []),
+                          online_eval_summary.get(model_score.model_id,
+                                                  _NO_ONLINE_EVALUATIONS),
                           summary_map)
         models_by_assignment_map.remove_model(model_score.model_id)
 
@@ -441,12 +503,13 @@ class ModelSelector:
                 assignment_id, models_limit=1))  # Pick off one model at a time.
         for eval_id, model_score in top_scores_for_assignment_id:
           self._add_summary(assignment_id, eval_id, model_score,
-                            online_eval_summary.get(model_score.model_id, []),
+                            online_eval_summary.get(model_score.model_id,
+                                                    _NO_ONLINE_EVALUATIONS),
                             summary_map)
           models_by_assignment_map.remove_model(model_score.model_id)
     return summary_map
 
-  def _add_summary(self, assignment_id, eval_id, model_score, online_scores,
+  def _add_summary(self, assignment_id, eval_id, model_score, online_record,
                    summary_map):
     """Add or update an existing EvaluationSummary in the SummaryMap.
 
@@ -455,7 +518,8 @@ class ModelSelector:
       eval_id: Offline evaluation ID of the score to update the SummaryMap with.
       model_score: ModelScore instance containing information about the score to
         update the SummaryMap with.
-      online_scores: List of online scores to update the SummaryMap with.
+      online_record: online_eval_sampling.ModelRecord with the online
+        evaluation results of the model.
       summary_map: SummaryMap instance to update.
     """
     existing_eval_summary = (
@@ -468,7 +532,7 @@ class ModelSelector:
           model_selection_record.EvaluationSummary(
               model_id=model_score.model_id,
               offline_scores={eval_id: model_score.score},
-              online_scores=online_scores))
+              online_record=online_record))
 
   def _create_model_records(self):
     """Creates ModelRecords for sampling and return number of total eval runs.
@@ -486,19 +550,9 @@ class ModelSelector:
     model_records = []
     for _, eval_summaries in self._get_summary_map().items():
       for eval_summary in eval_summaries:
-        successes = 0
-        failures = 0
         model_ids.append(eval_summary.model_id)
-        for score in eval_summary.online_scores:
-          if score == EPISODE_SCORE_SUCCESS:
-            successes += 1
-          elif score == EPISODE_SCORE_FAILURE:
-            failures += 1
-          else:
-            logging.error('Unknown online score %d.', score)
-        total_runs += successes + failures
-        model_records.append(online_eval_sampling.ModelRecord(
-            successes=successes, failures=failures))
+        total_runs += eval_summary.online_record.total
+        model_records.append(eval_summary.online_record)
     if len(model_records) != len(model_ids):
       raise ValueError(
           'Size of model records don\'t match the size of model IDs.')
@@ -14,7 +14,6 @@
 
 # Lint as: python3
 """Tests for model_selector."""
-import collections
 from unittest import mock
 
 from absl.testing import absltest
@@ -32,6 +31,7 @@ import session_pb2
 import data_store_pb2
 
 from data_store import resource_id
+from data_store import resource_store
 
 
 class ModelSelectorTest(parameterized.TestCase):
@@ -53,25 +53,25 @@ class ModelSelectorTest(parameterized.TestCase):
   offline_summary[model_selection_record.AssignmentEvalId('a1', 0)].add_score(
       'm3', -4.0)
 
-  online_summary = collections.defaultdict(list, {
-      'm1': [-1.0, -1.0],
-      'm2': [1.0],
-      'm3': [-1.0, 1.0]
-  })
+  online_summary = {
+      'm1': online_eval_sampling.ModelRecord(successes=0, failures=2),
+      'm2': online_eval_sampling.ModelRecord(successes=1, failures=0),
+      'm3': online_eval_sampling.ModelRecord(successes=1, failures=1),
+  }
 
   summary_map = model_selection_record.SummaryMap({
       'a2': [
           model_selection_record.EvaluationSummary(
               model_id='m2', offline_scores={1: -0.5},
-              online_scores=online_summary['m2'])
+              online_record=online_summary['m2'])
       ],
       'a1': [
           model_selection_record.EvaluationSummary(
               model_id='m1', offline_scores={3: 0.8},
-              online_scores=online_summary['m1']),
+              online_record=online_summary['m1']),
           model_selection_record.EvaluationSummary(
               model_id='m3', offline_scores={0: -4.0},
-              online_scores=online_summary['m3'])
+              online_record=online_summary['m3'])
       ]
   })
 
@@ -337,22 +337,64 @@ class ModelSelectorTest(parameterized.TestCase):
               f'{starting_snapshot.session}'))
 
   def test_get_online_eval_summary(self):
+    self._ds.update.return_value = (
+        data_store_pb2.OnlineEvaluationSummary(models=[
+            data_store_pb2.ModelOnlineEvaluations(model='m1', failures=2),
+            data_store_pb2.ModelOnlineEvaluations(model='m2', successes=1)]))
+
+    self.assertEqual(self._model_selector._get_online_eval_summary(), {
+        'm1': online_eval_sampling.ModelRecord(successes=0, failures=2),
+        'm2': online_eval_sampling.ModelRecord(successes=1, failures=0)})
+    self._ds.resource_id_from_proto_ids.assert_called_once_with(
+        attribute_type=data_store_pb2.OnlineEvaluationSummary,
+        project_id='p0', brain_id='b0', session_id='s0')
+    self._ds.update.assert_called_once_with(
+        self._ds.resource_id_from_proto_ids.return_value, mock.ANY,
+        create=mock.ANY)
+    # The stored summary isn't modified.
+    update_summary = self._ds.update.call_args[0][1]
+    self.assertFalse(update_summary(self._ds.update.return_value))
+    self._ds.list_by_proto_ids.assert_not_called()
+
+  def test_get_online_eval_summary_without_summary(self):
+    self._ds.update.side_effect = (
+        lambda unused_res_id, update_resource, create: create())
     self._ds.list_by_proto_ids.return_value = (
         ['projects/p0/brains/b0/sessions/s0/episode/e0/online_evaluation',
          'projects/p0/brains/b0/sessions/s0/episode/e1/online_evaluation',
          'projects/p0/brains/b0/sessions/s0/episode/e2/online_evaluation'],
         None)
-    self._ds.read.side_effect = [
+    self._ds.read_many.return_value = [
         data_store_pb2.OnlineEvaluation(model='m1', score=-1.0),
         data_store_pb2.OnlineEvaluation(model='m2', score=1.0),
         data_store_pb2.OnlineEvaluation(model='m1', score=-1.0)
     ]
 
-    self.assertEqual(self._model_selector._get_online_eval_summary(),
-                     {'m1': [-1.0, -1.0], 'm2': [1.0]})
+    self.assertEqual(self._model_selector._get_online_eval_summary(), {
+        'm1': online_eval_sampling.ModelRecord(successes=0, failures=2),
+        'm2': online_eval_sampling.ModelRecord(successes=1, failures=0)})
     self._ds.list_by_proto_ids.assert_called_once_with(
         attribute_type=data_store_pb2.OnlineEvaluation,
         project_id='p0', brain_id='b0', session_id='s0', episode_id='*')
+    self._ds.read_many.assert_called_once_with(
+        self._ds.list_by_proto_ids.return_value[0])
+
+  def test_add_online_evaluation(self):
+    summary = data_store_pb2.OnlineEvaluationSummary()
+    model_selector.add_online_evaluation(
+        summary, 'm0', model_selector.EPISODE_SCORE_SUCCESS)
+    model_selector.add_online_evaluation(
+        summary, 'm1', model_selector.EPISODE_SCORE_FAILURE)
+    model_selector.add_online_evaluation(
+        summary, 'm0', model_selector.EPISODE_SCORE_FAILURE)
+    model_selector.add_online_evaluation(
+        summary, 'm1', model_selector.EPISODE_SCORE_FAILURE, count=-1)
+    # Unknown scores are ignored.
+    model_selector.add_online_evaluation(summary, 'm2', 0)
+    self.assertEqual(summary.models, [
+        data_store_pb2.ModelOnlineEvaluations(
+            model='m0', successes=1, failures=1),
+        data_store_pb2.ModelOnlineEvaluations(model='m1')])
 
   def test_generate_summary_map(self):
     self.assertEqual(
@@ -384,20 +426,24 @@ class ModelSelectorTest(parameterized.TestCase):
 
     # NOTE: online summary population is tested in
     # test_generate_summary_map_plenty_of_models().
-    online_summary = collections.defaultdict(list, {})
+    online_summary = {}
     summary_map = self._model_selector._generate_summary_map(offline_summary,
                                                              online_summary)
 
     expected_summary_map = model_selection_record.SummaryMap({
         'a0': [
             model_selection_record.EvaluationSummary(
-                model_id='m4', offline_scores={1: -2.0}, online_scores=[]),
+                model_id='m4', offline_scores={1: -2.0},
+                online_record=online_eval_sampling.ModelRecord(0, 0)),
             model_selection_record.EvaluationSummary(
-                model_id='m5', offline_scores={1: -0.4}, online_scores=[]),
+                model_id='m5', offline_scores={1: -0.4},
+                online_record=online_eval_sampling.ModelRecord(0, 0)),
             model_selection_record.EvaluationSummary(
-                model_id='m3', offline_scores={1: 0.2}, online_scores=[]),
+                model_id='m3', offline_scores={1: 0.2},
+                online_record=online_eval_sampling.ModelRecord(0, 0)),
             model_selection_record.EvaluationSummary(
-                model_id='m2', offline_scores={0: -5.0}, online_scores=[]),
+                model_id='m2', offline_scores={0: -5.0},
+                online_record=online_eval_sampling.ModelRecord(0, 0)),
         ],
     })
     self.assertEqual(summary_map, expected_summary_map)
@@ -419,27 +465,27 @@ class ModelSelectorTest(parameterized.TestCase):
     offline_summary[model_selection_record.AssignmentEvalId('a2', 0)].add_score(
         'm3', 0.4)
 
-    online_summary = collections.defaultdict(list, {
-        'm1': [-1.0, -1.0],
-        'm2': [1.0],
-        'm3': [-1.0, 1.0]
-    })
+    online_summary = {
+        'm1': online_eval_sampling.ModelRecord(successes=0, failures=2),
+        'm2': online_eval_sampling.ModelRecord(successes=1, failures=0),
+        'm3': online_eval_sampling.ModelRecord(successes=1, failures=1),
+    }
 
     summary_map = model_selection_record.SummaryMap({
         'a0': [
             model_selection_record.EvaluationSummary(
                 model_id='m1', offline_scores={1: -64.0},
-                online_scores=[-1.0, -1.0])
+                online_record=online_eval_sampling.ModelRecord(0, 2))
         ],
         'a2': [
             model_selection_record.EvaluationSummary(
                 model_id='m3', offline_scores={0: 0.4},
-                online_scores=[-1.0, 1.0])
+                online_record=online_eval_sampling.ModelRecord(1, 1))
         ],
         'a1': [
             model_selection_record.EvaluationSummary(
                 model_id='m2', offline_scores={1: -20.0},
-                online_scores=[1.0])
+                online_record=online_eval_sampling.ModelRecord(1, 0))
         ]
     })
     self.assertEqual(
@@ -450,26 +496,28 @@ class ModelSelectorTest(parameterized.TestCase):
     self.assertEqual(
         self._model_selector._generate_summary_map(
             model_selection_record.OfflineEvaluationByAssignmentAndEvalId(),
-            collections.defaultdict(list)), model_selection_record.SummaryMap())
+            {}), model_selection_record.SummaryMap())
 
   def test_add_summary(self):
     summary_map = model_selection_record.SummaryMap()
     self._model_selector._add_summary(
         'a0', 0, model_selection_record.ModelScore(model_id='m0', score=0.8),
-        [1.0, -1.0], summary_map)
+        online_eval_sampling.ModelRecord(1, 1), summary_map)
     self.assertSameElements(summary_map['a0'], [
         model_selection_record.EvaluationSummary(
-            model_id='m0', offline_scores={0: 0.8}, online_scores=[1.0, -1.0])
+            model_id='m0', offline_scores={0: 0.8},
+            online_record=online_eval_sampling.ModelRecord(1, 1))
     ])
 
   def test_add_summary_existing(self):
     summary_map = model_selection_record.SummaryMap()
     existing_summary = model_selection_record.EvaluationSummary(
-        model_id='m0', offline_scores={1: -6.0}, online_scores=[1.0, -1.0])
+        model_id='m0', offline_scores={1: -6.0},
+        online_record=online_eval_sampling.ModelRecord(1, 1))
     summary_map['a0'].append(existing_summary)
     self._model_selector._add_summary(
         'a0', 0, model_selection_record.ModelScore(model_id='m0', score=0.8),
-        [1.0, -1.0], summary_map)
+        online_eval_sampling.ModelRecord(1, 1), summary_map)
     self.assertSameElements(summary_map['a0'], [
         model_selection_record.EvaluationSummary(
             model_id='m0',
@@ -477,7 +525,7 @@ class ModelSelectorTest(parameterized.TestCase):
                 1: -6.0,
                 0: 0.8
             },
-            online_scores=[1.0, -1.0])
+            online_record=online_eval_sampling.ModelRecord(1, 1))
     ])
 
   @mock.patch.object(model_selector.ModelSelector, '_get_summary_map')
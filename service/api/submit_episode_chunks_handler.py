@@ -15,6 +15,7 @@
 # Lint as: python3
 """Submit episode chunks and returns session info containing state and model."""
 
+import collections
 import json
 import time
 
@@ -37,6 +38,10 @@ from learner.brains import specs
 
 FLAGS = flags.FLAGS
 
+# Maximum number of chunks stored ahead of a missing chunk that are tracked in
+# the summary of an episode.
+_MAX_PENDING_CHUNK_IDS = 64
+
 flags.DEFINE_multi_string(
     'hyperparameters',
     r'{"fc_layers":[32], "learning_rate":1e-4, "continuous":false, '
@@ -78,7 +83,8 @@ flags.register_validator(
     message='--hyperparameters must be a valid JSON string.')
 
 
-def submit_episode_chunks(request, context, data_store, assignment_notifier):
+def submit_episode_chunks(request, context, data_store, assignment_notifier,
+                          ingestion=None):
   """Submits episode chunks to be trained on and returns session info.
 
   Args:
@@ -89,6 +95,9 @@ def submit_episode_chunks(request, context, data_store, assignment_notifier):
       retrieve session info from.
     assignment_notifier: Falken data_store.AssignmentNotifier object to notify
       when an assignment needs to be processed.
+    ingestion: Optional episode_ingestion.EpisodeIngestion object. If set, the
+      RPC only stores the chunks and the work derived from them is done in the
+      background.
 
   Returns:
     falken_service_pb2.SubmitEpisodeChunksResponse containing session info for
@@ -116,6 +125,10 @@ def submit_episode_chunks(request, context, data_store, assignment_notifier):
       project_id=request.project_id, brain_id=request.brain_id,
       session_id=request.session_id)
 
+  if ingestion:
+    return _submit_episode_chunks_write_behind(
+        request, context, ingestion, session_resource_id)
+
   try:
     chunks_steps_type = _store_episode_chunks(
         data_store, request.chunks, session_resource_id)
@@ -135,28 +148,212 @@ def submit_episode_chunks(request, context, data_store, assignment_notifier):
         f'Starting assignment failed for {session_resource_id}.'
         f' {e}')
 
+  try:
+    session_info = get_session_info(data_store, session_resource_id)
+  except ValueError as e:
+    context.abort(code_pb2.INVALID_ARGUMENT, str(e))
+
+  return falken_service_pb2.SubmitEpisodeChunksResponse(
+      session_info=session_info)
+
+
+async def submit_episode_chunks_async(request, context, run, data_store,
+                                     assignment_notifier, ingestion=None):
+  """Submits episode chunks without blocking the event loop.
+
+  Coroutine version of submit_episode_chunks() that calls the blocking data
+  store operations through run.
+
+  Args:
+    request: falken_service_pb2.SubmitEpisodeChunksRequest containing info about
+      the chunk and chunks itself that are submitted.
+    context: Context of the RPC whose abort() raises an exception.
+    run: Coroutine function that calls a blocking function with the given
+      arguments, e.g. on an executor, and returns its result.
+    data_store: data_store.DataStore object to write the chunks to and
+      retrieve session info from.
+    assignment_notifier: Falken data_store.AssignmentNotifier object to notify
+      when an assignment needs to be processed.
+    ingestion: Optional episode_ingestion.EpisodeIngestion object. If set, the
+      RPC only stores the chunks and the work derived from them is done in the
+      background.
+
+  Returns:
+    falken_service_pb2.SubmitEpisodeChunksResponse containing session info for
+      the session that episode chunks were submitted for.
+
+  Raises:
+    Exception: The gRPC context is aborted when the required fields are not
+      specified in the request, which raises an exception to terminate the RPC
+      with a no-OK status.
+  """
+  logging.debug(
+      'SubmitEpisodeChunksHandler called for project %s brain %s session %s.',
+      request.project_id, request.brain_id, request.session_id)
+
+  try:
+    await run(_check_episode_data_with_brain_spec, data_store,
+              request.project_id, request.brain_id, request.chunks)
+  except specs.TypingError as e:
+    context.abort(
+        code_pb2.INVALID_ARGUMENT,
+        'Episode data failed did not match the brain spec for the session. '
+        f'{e}')
+
+  session_resource_id = data_store.resource_id_from_proto_ids(
+      project_id=request.project_id, brain_id=request.brain_id,
+      session_id=request.session_id)
+
+  if ingestion:
+    return await run(_submit_episode_chunks_write_behind, request, context,
+                     ingestion, session_resource_id)
+
+  try:
+    chunks_steps_type = await run(_store_episode_chunks, data_store,
+                                  request.chunks, session_resource_id)
+  except (ValueError, resource_store.InternalError) as e:
+    context.abort(
+        code_pb2.INVALID_ARGUMENT,
+        f'Storing episode chunks failed for {session_resource_id}.'
+        f' {e}')
+
+  try:
+    await run(_try_start_assignments, data_store, assignment_notifier,
+              session_resource_id, chunks_steps_type, request.chunks)
+  except (FileNotFoundError, resource_store.InternalError) as e:
+    context.abort(
+        code_pb2.NOT_FOUND,
+        f'Starting assignment failed for {session_resource_id}.'
+        f' {e}')
+
+  try:
+    session_info = await run(get_session_info, data_store, session_resource_id)
+  except ValueError as e:
+    context.abort(code_pb2.INVALID_ARGUMENT, str(e))
+
+  return falken_service_pb2.SubmitEpisodeChunksResponse(
+      session_info=session_info)
+
+
+def _submit_episode_chunks_write_behind(
+    request, context, ingestion, session_resource_id):
+  """Stores episode chunks and leaves the derived work to the ingestion.
+
+  Args:
+    request: falken_service_pb2.SubmitEpisodeChunksRequest containing the
+      chunks to store.
+    context: grpc.ServicerContext containing context about the RPC.
+    ingestion: episode_ingestion.EpisodeIngestion object that stores the
+      chunks, does the work derived from them and caches the session info.
+    session_resource_id: data_store.resource_id.FalkenResourceID instance
+      representing the session associated with the chunks.
+
+  Returns:
+    falken_service_pb2.SubmitEpisodeChunksResponse containing the most recent
+      session info known for the session.
+
+  Raises:
+    Exception: The gRPC context is aborted when the chunks can't be stored.
+  """
+  timestamp_micros = int(time.time() * 1_000_000)
+  try:
+    write_episode_chunks, _, _ = _create_episode_chunks(
+        request.chunks, session_resource_id, timestamp_micros)
+    ingestion.submit(session_resource_id, write_episode_chunks,
+                     timestamp_micros)
+  except (ValueError, resource_store.InternalError) as e:
+    context.abort(
+        code_pb2.INVALID_ARGUMENT,
+        f'Storing episode chunks failed for {session_resource_id}.'
+        f' {e}')
+
+  try:
+    session_info = ingestion.get_session_info(session_resource_id)
+  except ValueError as e:
+    context.abort(code_pb2.INVALID_ARGUMENT, str(e))
+
+  return falken_service_pb2.SubmitEpisodeChunksResponse(
+      session_info=session_info)
+
+
+def get_session_info(data_store, session_resource_id):
+  """Selects the model to use in a session and reports its training state.
+
+  Args:
+    data_store: data_store.DataStore to read the session's models from.
+    session_resource_id: data_store.resource_id.FalkenResourceID instance
+      representing the session.
+
+  Returns:
+    session_pb2.SessionInfo of the session.
+
+  Raises:
+    ValueError: If the training state can't be determined or a model can't be
+      selected.
+  """
   selector = model_selector.ModelSelector(data_store, session_resource_id)
   session_info = session_pb2.SessionInfo()
 
   try:
     session_info.state = selector.get_training_state()
   except (ValueError) as e:
-    context.abort(code_pb2.INVALID_ARGUMENT,
-                  f'Getting training state failed. {e}')
+    raise ValueError(f'Getting training state failed. {e}')
 
   try:
     model_res_id = selector.select_next_model()
     session_info.model_id = model_res_id.model if model_res_id else ''
   except (FileNotFoundError, resource_store.InternalError, ValueError) as e:
-    context.abort(
-        code_pb2.INVALID_ARGUMENT,
+    raise ValueError(
         f'Failed to select model for session {session_resource_id}. '
         f'{e}')
 
   session_info.training_progress = selector.session_progress
+  return session_info
 
-  return falken_service_pb2.SubmitEpisodeChunksResponse(
-      session_info=session_info)
+
+def process_stored_episode_chunks(
+    data_store, assignment_notifier, session_resource_id, write_episode_chunks,
+    timestamp_micros):
+  """Does the work derived from episode chunks that were stored.
+
+  This updates episode summaries and session timestamps, records online
+  evaluations and starts assignments for chunks stored by a write-behind
+  submission. Chunks can be processed in any order and processing chunks
+  again has no further effect.
+
+  Args:
+    data_store: data_store.DataStore instance the chunks were stored in.
+    assignment_notifier: Falken data_store.AssignmentNotifier object to notify
+      if an assignment needs to be processed.
+    session_resource_id: data_store.resource_id.FalkenResourceID instance
+      representing the session associated with the chunks.
+    write_episode_chunks: List of data_store_pb2.EpisodeChunk instances that
+      were stored, sorted by chunk ID.
+    timestamp_micros: Time the chunks were stored at in microseconds.
+
+  Returns:
+    session_pb2.SessionInfo of the session after processing the chunks.
+
+  Raises:
+    ValueError if the episodes have issues such as containing invalid data or
+      the session info can't be determined.
+    FileNotFoundError, data_store.InternalError if reading or writing
+      resources fails.
+  """
+  chunks_steps_type = data_store_pb2.UNKNOWN
+  for chunk in write_episode_chunks:
+    chunks_steps_type = _merge_steps_types(chunks_steps_type, chunk.steps_type)
+  episode_summaries = _update_episode_summaries(
+      data_store, write_episode_chunks, session_resource_id)
+  _record_episode_chunks(
+      data_store, write_episode_chunks, episode_summaries,
+      session_resource_id, timestamp_micros,
+      chunks_steps_type in (data_store_pb2.ONLY_DEMONSTRATIONS,
+                            data_store_pb2.MIXED))
+  _try_start_assignments(
+      data_store, assignment_notifier, session_resource_id, chunks_steps_type,
+      write_episode_chunks)
+  return get_session_info(data_store, session_resource_id)
 
 
 def _check_episode_data_with_brain_spec(
@@ -172,7 +369,8 @@ def _check_episode_data_with_brain_spec(
   Raises:
     specs.TypingError if type checking fails.
   """
-  brain_spec_proto = data_cache.get_brain_spec(data_store, project_id, brain_id)
+  validator = data_cache.get_brain_spec_validator(
+      data_store, project_id, brain_id)
 
   for chunk_nr in range(0, len(chunks)):
     chunk = chunks[chunk_nr]
@@ -188,16 +386,13 @@ def _check_episode_data_with_brain_spec(
         raise specs.TypingError(
             f'Received an empty episode at chunk_index: {chunk_nr}.')
 
-    brain_spec = specs.BrainSpec(brain_spec_proto)
-
     for step_nr in range(0, len(chunk.steps)):
       step = chunk.steps[step_nr]
       try:
         # Check action data against action spec.
-        _ = brain_spec.action_spec.proto_node.data_to_proto_nest(step.action)
+        validator.check_action_data(step.action)
         # Check observation data against observation spec.
-        _ = brain_spec.observation_spec.proto_node.data_to_proto_nest(
-            step.observation)
+        validator.check_observation_data(step.observation)
       except specs.TypingError as e:
         raise specs.TypingError(
             f'Brainspec check failed in chunk {chunk_nr}, step {step_nr}: {e}')
@@ -219,19 +414,45 @@ def _store_episode_chunks(data_store, chunks, session_resource_id):
     ValueError if the episodes received has issues such as containing invalid
       data or incomplete episodes.
   """
-  chunks_steps_type = data_store_pb2.UNKNOWN
-  write_episode_chunk = data_store_pb2.EpisodeChunk(
-      # Set properties common to all chunks.
-      project_id=session_resource_id.project,
-      brain_id=session_resource_id.brain,
-      session_id=session_resource_id.session)
+  timestamp_micros = int(time.time() * 1_000_000)
+  write_episode_chunks, chunks_steps_type, has_demo_data = (
+      _create_episode_chunks(chunks, session_resource_id, timestamp_micros))
+  data_store.write_many(write_episode_chunks)
+  # Summaries are updated after their chunks are written so that they never
+  # count chunks that were not stored.
+  episode_summaries = _update_episode_summaries(
+      data_store, write_episode_chunks, session_resource_id)
+  _record_episode_chunks(
+      data_store, write_episode_chunks, episode_summaries,
+      session_resource_id, timestamp_micros, has_demo_data)
+  return chunks_steps_type
 
+
+def _create_episode_chunks(chunks, session_resource_id, timestamp_micros):
+  """Creates the data store resources of submitted episode chunks.
+
+  Args:
+    chunks: list of episode_pb2.EpisodeChunk instances to store.
+    session_resource_id: data_store.resource_id.FalkenResourceID instance
+      representing the session associated with the chunks.
+    timestamp_micros: Creation time of the chunks in microseconds.
+
+  Returns:
+    (write_episode_chunks, chunks_steps_type, has_demo_data) tuple where
+    write_episode_chunks is a list of data_store_pb2.EpisodeChunk sorted by
+    chunk ID, chunks_steps_type is the merged steps type of the chunks and
+    has_demo_data is whether the chunks contain demonstrations.
+
+  Raises:
+    ValueError if a chunk contains a step with an unsupported step type.
+  """
+  chunks_steps_type = data_store_pb2.UNKNOWN
   has_demo_data = False
-  timestamp_micros = int(time.time() * 1_000_000)
 
   # Sort request chunks by chunk ID. This is to ensure the GetEpisodeSteps has
   # previous chunks accessible before querying later chunks.
   chunks = sorted(chunks, key=lambda chunk: chunk.chunk_id)
+  write_episode_chunks = []
   for chunk in chunks:
     try:
       steps_type = _get_steps_type(chunk)
@@ -242,35 +463,160 @@ def _store_episode_chunks(data_store, chunks, session_resource_id):
     except ValueError as e:
       raise ValueError('Encountered error while getting steps type for episode '
                        f'{chunk.episode_id} chunk {chunk.chunk_id}. {e}')
-    write_episode_chunk.chunk_id = chunk.chunk_id
-    write_episode_chunk.episode_id = chunk.episode_id
-    write_episode_chunk.steps_type = steps_type
-    write_episode_chunk.data.CopyFrom(chunk)
-    write_episode_chunk.created_micros = timestamp_micros
-    data_store.write(write_episode_chunk)
-
-    episode_resource_id = data_store.resource_id_from_proto_ids(
+    write_episode_chunk = data_store_pb2.EpisodeChunk(
         project_id=session_resource_id.project,
         brain_id=session_resource_id.brain,
         session_id=session_resource_id.session,
-        episode_id=chunk.episode_id)
+        chunk_id=chunk.chunk_id,
+        episode_id=chunk.episode_id,
+        steps_type=steps_type,
+        created_micros=timestamp_micros)
+    write_episode_chunk.data.CopyFrom(chunk)
+    write_episode_chunks.append(write_episode_chunk)
+  return write_episode_chunks, chunks_steps_type, has_demo_data
 
-    # Update datastore timestamps.
-    data_store.update_session_data_timestamps(
-        session_resource_id,
-        timestamp_micros,
-        has_demo_data)
 
-    # Record online evaluation results.
-    try:
-      _record_online_evaluation(
-          data_store, write_episode_chunk, episode_resource_id)
-    except ValueError as e:
-      raise ValueError(
-          'Encountered error while recording online evaluation for episode '
-          f'{chunk.episode_id} chunk {chunk.chunk_id}. {e}')
+def _record_episode_chunks(data_store, write_episode_chunks,
+                           episode_summaries, session_resource_id,
+                           timestamp_micros, has_demo_data):
+  """Updates session timestamps and online evaluations for stored chunks.
 
-  return chunks_steps_type
+  Episodes are evaluated once all of their chunks are summarized, so an
+  episode whose final chunk was stored before one of its other chunks is
+  evaluated when the missing chunk is stored. Online evaluations are added to
+  the summary of the session with a single update per request.
+
+  Args:
+    data_store: data_store.DataStore instance to record to.
+    write_episode_chunks: List of data_store_pb2.EpisodeChunk instances that
+      were stored.
+    episode_summaries: List of (episode_summary, modified) tuples returned by
+      _update_episode_summaries().
+    session_resource_id: data_store.resource_id.FalkenResourceID instance
+      representing the session associated with the chunks.
+    timestamp_micros: Creation time of the chunks in microseconds.
+    has_demo_data: Whether the chunks contain demonstrations.
+
+  Raises:
+    ValueError if the online evaluation of a chunk can't be recorded.
+  """
+  # Update datastore timestamps.
+  data_store.update_session_data_timestamps(
+      session_resource_id,
+      timestamp_micros,
+      has_demo_data)
+
+  # Record online evaluation results.
+  chunks_by_id = {(chunk.episode_id, chunk.chunk_id): chunk
+                  for chunk in write_episode_chunks}
+  online_evaluations = []
+  try:
+    for episode_summary, modified in episode_summaries:
+      final_chunk = _get_final_chunk(data_store, chunks_by_id, episode_summary,
+                                     modified)
+      if not final_chunk:
+        continue
+      episode_resource_id = data_store.resource_id_from_proto_ids(
+          project_id=session_resource_id.project,
+          brain_id=session_resource_id.brain,
+          session_id=session_resource_id.session,
+          episode_id=final_chunk.episode_id)
+      try:
+        online_evaluation = _record_online_evaluation(
+            data_store, final_chunk, episode_resource_id, episode_summary)
+      except ValueError as e:
+        raise ValueError(
+            'Encountered error while recording online evaluation for episode '
+            f'{final_chunk.episode_id} chunk {final_chunk.chunk_id}. {e}')
+      if online_evaluation:
+        online_evaluations.append(online_evaluation)
+  finally:
+    # Summarize the evaluations that were recorded even if a later chunk
+    # failed.
+    if online_evaluations:
+      _update_online_evaluation_summary(data_store, session_resource_id,
+                                        online_evaluations)
+
+
+def _get_final_chunk(data_store, chunks_by_id, episode_summary, modified):
+  """Returns the last chunk of an episode if the episode can be evaluated.
+
+  Args:
+    data_store: data_store.DataStore instance to read the chunk from if it
+      was stored by an earlier request.
+    chunks_by_id: Dictionary of the data_store_pb2.EpisodeChunk instances
+      that were stored by (episode_id, chunk_id).
+    episode_summary: data_store_pb2.EpisodeSummary of the episode.
+    modified: Whether the stored chunks were added to the summary.
+
+  Returns:
+    data_store_pb2.EpisodeChunk with the largest chunk ID of the episode or
+    None if the chunk is not stored by this request and the request didn't
+    complete the summary of the episode.
+  """
+  final_chunk = chunks_by_id.get((episode_summary.episode_id,
+                                  episode_summary.last_chunk_id))
+  if final_chunk:
+    return final_chunk
+  if not modified or (episode_summary.chunk_count <=
+                      episode_summary.last_chunk_id):
+    return None
+  # The chunks completed an episode whose last chunk was stored earlier.
+  return data_store.read_by_proto_ids(
+      project_id=episode_summary.project_id,
+      brain_id=episode_summary.brain_id,
+      session_id=episode_summary.session_id,
+      episode_id=episode_summary.episode_id,
+      chunk_id=episode_summary.last_chunk_id)
+
+
+def _update_online_evaluation_summary(data_store, session_resource_id,
+                                      online_evaluations):
+  """Adds recorded online evaluations to the summary of their session.
+
+  Args:
+    data_store: data_store.DataStore instance to update the summary in.
+    session_resource_id: data_store.resource_id.FalkenResourceID instance
+      representing the session associated with the evaluations.
+    online_evaluations: List of (previous_evaluation, evaluation) tuples
+      returned by _record_online_evaluation().
+  """
+
+  # Set when the summary is created by summarizing the stored evaluations.
+  created = []
+
+  def create_summary():
+    created.append(True)
+    return model_selector.summarize_online_evaluations(data_store,
+                                                       session_resource_id)
+
+  def update_summary(summary):
+    if created:
+      # The evaluations were written before the summary, so summarizing the
+      # stored evaluations already includes them.
+      return True
+    updated = False
+    for previous_evaluation, evaluation in online_evaluations:
+      if previous_evaluation:
+        if (previous_evaluation.model == evaluation.model and
+            previous_evaluation.score == evaluation.score):
+          # The episode was already evaluated with the same result.
+          continue
+        model_selector.add_online_evaluation(
+            summary, previous_evaluation.model, previous_evaluation.score,
+            count=-1)
+      model_selector.add_online_evaluation(summary, evaluation.model,
+                                           evaluation.score)
+      updated = True
+    return updated
+
+  data_store.update(
+      data_store.resource_id_from_proto_ids(
+          attribute_type=data_store_pb2.OnlineEvaluationSummary,
+          project_id=session_resource_id.project,
+          brain_id=session_resource_id.brain,
+          session_id=session_resource_id.session),
+      update_summary, create=create_summary)
 
 
 def _get_steps_type(chunk):
@@ -308,7 +654,8 @@ def _get_steps_type(chunk):
   return data_store_pb2.UNKNOWN
 
 
-def _record_online_evaluation(data_store, chunk, episode_resource_id):
+def _record_online_evaluation(data_store, chunk, episode_resource_id,
+                              episode_summary):
   """Calculates episode completion state and score, and stores in data_store.
 
   Args:
@@ -317,6 +664,14 @@ def _record_online_evaluation(data_store, chunk, episode_resource_id):
       and state from.
     episode_resource_id: resource_id.FalkenResourceId instance representing
       the episode.
+    episode_summary: data_store_pb2.EpisodeSummary of the episode up to and
+      including the chunk.
+
+  Returns:
+    (previous_evaluation, evaluation) tuple with the
+    data_store_pb2.OnlineEvaluation that was written and the evaluation it
+    replaced or None if the episode wasn't evaluated before, None if no
+    evaluation was written.
 
   Raises:
     ValueError if the episodes received has issues such as containing invalid
@@ -327,33 +682,32 @@ def _record_online_evaluation(data_store, chunk, episode_resource_id):
   except ValueError as e:
     raise e
   if not complete:
-    return
+    return None
 
   try:
     episode_score = _episode_score(chunk)
   except ValueError as e:
     raise e
 
-  # Fetch previous episode chunk inference info for the same episode.
-  steps_type, model_ids = _get_episode_steps_type(data_store, chunk,
-                                                  episode_resource_id)
-  if not steps_type and not model_ids:
-    # Previous chunks were not found. This should not happen since chunks
-    # should be submitted in sequence. This is under SDK control though,
-    # so we log an error and move on. (The outcome is just a missing eval,
-    # which is not critical. The system should be resilient to missing evals.)
+  if episode_summary.chunk_count <= chunk.chunk_id:
+    # Previous chunks were not found. The episode is evaluated if the missing
+    # chunks are submitted later. This is under SDK control though, so we log
+    # an error and move on. (The outcome is just a missing eval, which is not
+    # critical. The system should be resilient to missing evals.)
     logging.error(
         'Failed to find all previous chunks for episode %s '
         'chunk %d.', chunk.episode_id, chunk.chunk_id)
-    return
+    return None
 
+  steps_type = episode_summary.steps_type
+  model_ids = set(episode_summary.model_ids)
   if steps_type != data_store_pb2.ONLY_INFERENCES or not model_ids:
     # If there were non-inference action sources or multiple models used to
     # perform inference, then we can't score the episode.
     logging.debug(
         'Skipping online eval for complete episode of type %s and %d inference '
         'models.', str(steps_type), len(model_ids))
-    return
+    return None
 
   if len(model_ids) > 1:
     # If there are multiple models, we can't attribute the performance to any
@@ -362,19 +716,26 @@ def _record_online_evaluation(data_store, chunk, episode_resource_id):
         'Skipping online eval for complete episode of type %s '
         'because it contains multiple models (%d).', str(steps_type),
         len(model_ids))
-    return
+    return None
 
   model_id = model_ids.pop()
   logging.debug('Recording score %d for episode %d model %s.', episode_score,
                 episode_resource_id.episode, model_id)
-  data_store.write(
-      data_store_pb2.OnlineEvaluation(
-          project_id=episode_resource_id.project,
-          brain_id=episode_resource_id.brain,
-          session_id=episode_resource_id.session,
-          episode_id=episode_resource_id.episode,
-          model=model_id,
-          score=episode_score))
+  evaluation = data_store_pb2.OnlineEvaluation(
+      project_id=episode_resource_id.project,
+      brain_id=episode_resource_id.brain,
+      session_id=episode_resource_id.session,
+      episode_id=episode_resource_id.episode,
+      model=model_id,
+      score=episode_score)
+  try:
+    # The final chunk of the episode may have been submitted before.
+    previous_evaluation = data_store.read(
+        data_store.to_resource_id(evaluation))
+  except resource_store.NotFoundError:
+    previous_evaluation = None
+  data_store.write(evaluation)
+  return previous_evaluation, evaluation
 
 
 def _episode_complete(chunk):
@@ -422,56 +783,141 @@ def _episode_score(chunk):
                    f'{chunk.chunk_id} can\'t be scored.')
 
 
-def _get_episode_steps_type(data_store, current_chunk, episode_resource_id):
-  """Get the merged StepsType of the episode and model_ids used in inference.
+def _update_episode_summaries(data_store, chunks, session_resource_id):
+  """Adds stored chunks to the summaries of their episodes.
+
+  Each summary is changed with a single update, so chunks of an episode that
+  are stored concurrently are all summarized.
 
   Args:
-    data_store: data_store.DataStore instance to check previous episode chunks.
-    current_chunk: episode_pb2.EpisodeChunk containing the current_step.
-    episode_resource_id: resource_id.EpisodeResourceId instance containing
-      resource IDs for the episode.
+    data_store: data_store.DataStore instance to update episode summaries in.
+    chunks: List of data_store_pb2.EpisodeChunk instances that were stored.
+    session_resource_id: data_store.resource_id.FalkenResourceID instance
+      representing the session associated with the chunks.
 
   Returns:
-    steps_type, model_ids: A tuple of the merged data_store_pb2.StepsType and
-      set of model_id strings.
+    List of (episode_summary, modified) tuples with the updated
+    data_store_pb2.EpisodeSummary of each episode and whether the chunks were
+    added to the summary rather than summarized before.
+  """
+  chunks_by_episode_id = collections.defaultdict(list)
+  for chunk in chunks:
+    chunks_by_episode_id[chunk.episode_id].append(chunk)
+  return [_update_episode_summary(data_store, session_resource_id, episode_id,
+                                  episode_chunks)
+          for episode_id, episode_chunks in chunks_by_episode_id.items()]
 
-  Raises:
-    FileNotFoundError: when the chunk ID does not line up with the number of
-      previous chunks found.
+
+def _update_episode_summary(data_store, session_resource_id, episode_id,
+                            chunks):
+  """Adds stored chunks of an episode to its summary.
+
+  Args:
+    data_store: data_store.DataStore instance to update the summary in.
+    session_resource_id: data_store.resource_id.FalkenResourceID instance
+      representing the session associated with the chunks.
+    episode_id: ID of the episode.
+    chunks: List of data_store_pb2.EpisodeChunk instances of the episode.
+
+  Returns:
+    (episode_summary, modified) tuple with the updated
+    data_store_pb2.EpisodeSummary and whether it was modified.
   """
-  model_ids = set()
+  episode_ids = dict(
+      project_id=session_resource_id.project,
+      brain_id=session_resource_id.brain,
+      session_id=session_resource_id.session,
+      episode_id=episode_id)
+  # Set if any attempt to update the summary modified it, which at worst
+  # reads the last chunk of the episode again.
+  modified = []
+
+  def create_summary():
+    summary = data_store_pb2.EpisodeSummary(**episode_ids)
+    if all(chunk.chunk_id for chunk in chunks):
+      # Summarize episodes that were stored without a summary from their
+      # chunks, which include the chunks being added.
+      _summarize_stored_chunks(data_store, summary)
+      modified.append(True)
+    return summary
+
+  def add_chunks(summary):
+    for chunk in chunks:
+      if _add_chunk_to_episode_summary(summary, chunk):
+        modified.append(True)
+    return bool(modified)
+
+  summary = data_store.update(
+      data_store.resource_id_from_proto_ids(
+          attribute_type=data_store_pb2.EpisodeSummary, **episode_ids),
+      add_chunks, create=create_summary)
+  return summary, bool(modified)
 
-  # Adds model to set if used in inference.
-  if (current_chunk.steps_type != data_store_pb2.ONLY_DEMONSTRATIONS and
-      current_chunk.data.model_id):
-    model_ids.add(current_chunk.data.model_id)
 
-  if current_chunk.chunk_id == 0:  # First chunk, nothing to merge with.
-    return current_chunk.steps_type, model_ids
+def _summarize_stored_chunks(data_store, summary):
+  """Adds all stored chunks of an episode to its summary.
 
-  # Read episode chunks from data_store for the same episode.
+  Args:
+    data_store: data_store.DataStore instance to read the chunks from.
+    summary: data_store_pb2.EpisodeSummary to update.
+  """
   read_chunk_ids, _ = data_store.list_by_proto_ids(
-      project_id=episode_resource_id.project,
-      brain_id=episode_resource_id.brain,
-      session_id=episode_resource_id.session,
-      episode_id=episode_resource_id.episode,
+      project_id=summary.project_id, brain_id=summary.brain_id,
+      session_id=summary.session_id, episode_id=summary.episode_id,
       chunk_id='*')
+  for chunk in sorted(data_store.read_many(read_chunk_ids),
+                      key=lambda c: c.chunk_id):
+    _add_chunk_to_episode_summary(summary, chunk)
+
 
-  count = 0
-  steps_type = data_store_pb2.UNKNOWN
-  for chunk_res_id in read_chunk_ids:
-    chunk = data_store.read(chunk_res_id)
-    steps_type = _merge_steps_types(steps_type, chunk.steps_type)
-    if (chunk.steps_type != data_store_pb2.ONLY_DEMONSTRATIONS and
-        chunk.data.model_id):
-      model_ids.add(chunk.data.model_id)
-    count += 1
+def _add_chunk_to_episode_summary(summary, chunk):
+  """Adds a chunk to the summary of its episode.
+
+  Chunks are tracked by the number of chunks summarized in order and the IDs
+  of the few chunks stored ahead of a missing chunk, so summaries don't grow
+  with the length of the episode.
+
+  Args:
+    summary: data_store_pb2.EpisodeSummary to update.
+    chunk: data_store_pb2.EpisodeChunk to add to the summary.
 
-  if count <= current_chunk.chunk_id:
-    raise FileNotFoundError(
-        'Did not find all previous chunks for chunk id '
-        f'{current_chunk.chunk_id}, only got {count} chunks.')
-  return steps_type, model_ids
+  Returns:
+    True if the chunk was added, False if it was summarized before or too many
+    chunks are pending.
+  """
+  chunk_id = chunk.chunk_id
+  if (chunk_id < summary.next_chunk_id or
+      chunk_id in summary.pending_chunk_ids):
+    # The chunk was already summarized, e.g. when a request is retried.
+    return False
+  if chunk_id == summary.next_chunk_id:
+    summary.next_chunk_id += 1
+    pending_chunk_ids = set(summary.pending_chunk_ids)
+    while summary.next_chunk_id in pending_chunk_ids:
+      summary.next_chunk_id += 1
+    if pending_chunk_ids:
+      remaining_chunk_ids = [i for i in summary.pending_chunk_ids
+                             if i > summary.next_chunk_id]
+      del summary.pending_chunk_ids[:]
+      summary.pending_chunk_ids.extend(remaining_chunk_ids)
+  elif len(summary.pending_chunk_ids) >= _MAX_PENDING_CHUNK_IDS:
+    # The episode isn't evaluated unless the chunk is submitted again after
+    # the missing chunks.
+    logging.warning(
+        'Not summarizing chunk %d of episode %s as %d chunks are stored ahead '
+        'of missing chunk %d.', chunk_id, summary.episode_id,
+        len(summary.pending_chunk_ids), summary.next_chunk_id)
+    return False
+  else:
+    summary.pending_chunk_ids.append(chunk_id)
+  summary.steps_type = _merge_steps_types(summary.steps_type, chunk.steps_type)
+  # Adds model to the summary if used in inference.
+  if (chunk.steps_type != data_store_pb2.ONLY_DEMONSTRATIONS and
+      chunk.data.model_id and chunk.data.model_id not in summary.model_ids):
+    summary.model_ids.append(chunk.data.model_id)
+  summary.chunk_count += 1
+  summary.last_chunk_id = max(summary.last_chunk_id, chunk_id)
+  return True
 
 
 def _merge_steps_types(type_left, type_right):
@@ -514,8 +960,8 @@ def _try_start_assignments(
       representing the session in which assignments should be created.
     chunks_steps_type: Merged steps type of chunks submitted, to determine if
       a new assignment should be started or not.
-    chunks: list of episode_pb2.EpisodeChunk instances for the new chunks that
-      were created.
+    chunks: list of episode_pb2.EpisodeChunk or data_store_pb2.EpisodeChunk
+      instances for the new chunks that were created.
 
   Raises:
     FileNotFoundError, data_store.InternalError if reading assignments or
@@ -542,13 +988,12 @@ def _try_start_assignments(
         session_id=session_resource_id.session,
         assignment_id=assignment_id)
     data_store.write(assignment)
-    for chunk in chunks:
-      assignment_notifier.trigger_assignment_notification(
-          data_store.to_resource_id(assignment),
-          data_store.resource_id_from_proto_ids(
-              project_id=session_resource_id.project,
-              brain_id=session_resource_id.brain,
-              session_id=session_resource_id.session,
-              episode_id=chunk.episode_id,
-              chunk_id=chunk.chunk_id))
+    assignment_notifier.trigger_assignment_notifications(
+        data_store.to_resource_id(assignment),
+        [data_store.resource_id_from_proto_ids(
+            project_id=session_resource_id.project,
+            brain_id=session_resource_id.brain,
+            session_id=session_resource_id.session,
+            episode_id=chunk.episode_id,
+            chunk_id=chunk.chunk_id) for chunk in chunks])
 
@@ -14,6 +14,7 @@
 
 # Lint as: python3
 """Tests for submit_episode_chunks_handler."""
+import asyncio
 import time
 from unittest import mock
 
@@ -26,6 +27,7 @@ from data_store import assignment_monitor
 from data_store import data_store
 from data_store import file_system
 from data_store import resource_id
+from data_store import resource_store
 
 # pylint: disable=g-bad-import-order
 import common.generate_protos  # pylint: disable=unused-import
@@ -75,6 +77,37 @@ class SubmitEpisodeChunksHandlerTest(parameterized.TestCase):
             model_id='m0')
     ]
 
+  def _episode_summary(self, **kwargs):
+    fields = dict(
+        project_id='p0',
+        brain_id='b0',
+        session_id='s0',
+        episode_id='ep0',
+        steps_type=data_store_pb2.ONLY_DEMONSTRATIONS,
+        chunk_ids=[0])
+    fields.update(kwargs)
+    chunk_ids = fields.pop('chunk_ids')
+    next_chunk_id = 0
+    while next_chunk_id in chunk_ids:
+      next_chunk_id += 1
+    return data_store_pb2.EpisodeSummary(
+        chunk_count=len(chunk_ids), last_chunk_id=max(chunk_ids),
+        next_chunk_id=next_chunk_id,
+        pending_chunk_ids=[i for i in chunk_ids if i > next_chunk_id],
+        **fields)
+
+  def _online_evaluation_summary(self):
+    return self._data_store.read_by_proto_ids(
+        attribute_type=data_store_pb2.OnlineEvaluationSummary,
+        project_id='p0', brain_id='b0', session_id='s0')
+
+  @staticmethod
+  def _create_resource(unused_res_id, update_resource, create):
+    """Updates a resource created by a mock data store."""
+    resource = create()
+    update_resource(resource)
+    return resource
+
   def _data_store_chunk(self, created_micros=0):
     return data_store_pb2.EpisodeChunk(
         project_id='p0',
@@ -109,6 +142,37 @@ class SubmitEpisodeChunksHandlerTest(parameterized.TestCase):
                 model_id='m0', state=session_pb2.SessionInfo.TRAINING,
                 training_progress=0.5)))
 
+  @mock.patch.object(submit_episode_chunks_handler,
+                     '_check_episode_data_with_brain_spec')
+  @mock.patch.object(submit_episode_chunks_handler, '_store_episode_chunks')
+  @mock.patch.object(submit_episode_chunks_handler, '_try_start_assignments')
+  @mock.patch.object(submit_episode_chunks_handler, 'get_session_info')
+  def test_submit_episode_chunks_async(self, get_session_info,
+                                       try_start_assignments,
+                                       store_episode_chunks,
+                                       check_episode_data):
+    mock_ds = mock.Mock()
+    mock_ds.resource_id_from_proto_ids.return_value = self._session_resource_id
+    get_session_info.return_value = session_pb2.SessionInfo(model_id='m0')
+    request = falken_service_pb2.SubmitEpisodeChunksRequest(
+        project_id='p0', brain_id='b0', session_id='s0')
+    run_functions = []
+
+    async def run(function, *args, **kwargs):
+      run_functions.append(function)
+      return function(*args, **kwargs)
+
+    self.assertEqual(
+        asyncio.run(submit_episode_chunks_handler.submit_episode_chunks_async(
+            request, mock.Mock(), run, mock_ds, mock.Mock())),
+        falken_service_pb2.SubmitEpisodeChunksResponse(
+            session_info=session_pb2.SessionInfo(model_id='m0')))
+    # All data store operations are made through run.
+    self.assertEqual(run_functions, [check_episode_data, store_episode_chunks,
+                                     try_start_assignments, get_session_info])
+    get_session_info.assert_called_once_with(mock_ds,
+                                             self._session_resource_id)
+
   @mock.patch.object(submit_episode_chunks_handler,
                      '_check_episode_data_with_brain_spec')
   def test_submit_episode_chunks_check_fails(self, check_episode_data):
@@ -233,11 +297,108 @@ class SubmitEpisodeChunksHandlerTest(parameterized.TestCase):
         brain_id=request.brain_id,
         session_id=request.session_id)
 
-  @mock.patch.object(data_cache, 'get_brain_spec')
+  @mock.patch.object(submit_episode_chunks_handler,
+                     '_check_episode_data_with_brain_spec')
+  @mock.patch.object(submit_episode_chunks_handler, '_store_episode_chunks')
+  @mock.patch.object(submit_episode_chunks_handler, '_try_start_assignments')
+  @mock.patch.object(time, 'time')
+  def test_submit_episode_chunks_write_behind(
+      self, mock_time, try_start_assignments, store_episode_chunks,
+      unused_check):
+    mock_ds = mock.Mock()
+    mock_ds.resource_id_from_proto_ids.return_value = self._session_resource_id
+    mock_time.return_value = 1
+    ingestion = mock.Mock()
+    ingestion.get_session_info.return_value = session_pb2.SessionInfo(
+        model_id='m0', state=session_pb2.SessionInfo.TRAINING)
+    request = falken_service_pb2.SubmitEpisodeChunksRequest(
+        project_id='p0', brain_id='b0', session_id='s0',
+        chunks=self._chunks())
+
+    self.assertEqual(
+        submit_episode_chunks_handler.submit_episode_chunks(
+            request, mock.Mock(), mock_ds, mock.Mock(), ingestion),
+        falken_service_pb2.SubmitEpisodeChunksResponse(
+            session_info=ingestion.get_session_info.return_value))
+
+    # Only the chunks are stored, the derived work is left to the ingestion.
+    store_episode_chunks.assert_not_called()
+    try_start_assignments.assert_not_called()
+    mock_ds.write_many.assert_not_called()
+    mock_ds.update_session_data_timestamps.assert_not_called()
+    ingestion.submit.assert_called_once_with(
+        self._session_resource_id, [self._data_store_chunk(1_000_000)],
+        1_000_000)
+    ingestion.get_session_info.assert_called_once_with(
+        self._session_resource_id)
+
+  @mock.patch.object(submit_episode_chunks_handler,
+                     '_check_episode_data_with_brain_spec')
+  def test_submit_episode_chunks_write_behind_storing_fails(
+      self, unused_check):
+    mock_context = mock.Mock()
+    mock_context.abort.side_effect = Exception()
+    mock_ds = mock.Mock()
+    mock_ds.resource_id_from_proto_ids.return_value = self._session_resource_id
+    ingestion = mock.Mock()
+    ingestion.submit.side_effect = resource_store.InternalError('Disk full.')
+
+    with self.assertRaises(Exception):
+      submit_episode_chunks_handler.submit_episode_chunks(
+          falken_service_pb2.SubmitEpisodeChunksRequest(chunks=self._chunks()),
+          mock_context, mock_ds, mock.Mock(), ingestion)
+    mock_context.abort.assert_called_once_with(
+        code_pb2.INVALID_ARGUMENT,
+        'Storing episode chunks failed for projects/p0/brains/b0/sessions/s0. '
+        'Disk full.')
+    ingestion.get_session_info.assert_not_called()
+
+  @mock.patch.object(submit_episode_chunks_handler, 'get_session_info')
+  @mock.patch.object(submit_episode_chunks_handler, '_try_start_assignments')
+  @mock.patch.object(submit_episode_chunks_handler, '_record_online_evaluation')
+  def test_process_stored_episode_chunks(
+      self, record_online_evaluation, try_start_assignments,
+      get_session_info):
+    record_online_evaluation.return_value = None
+    self._data_store.write(data_store_pb2.Session(
+        project_id='p0', brain_id='b0', session_id='s0'))
+    chunks = [self._data_store_chunk(1_000_000)]
+    self._data_store.write_many(chunks)
+    assignment_notifier = mock.Mock()
+
+    self.assertEqual(
+        submit_episode_chunks_handler.process_stored_episode_chunks(
+            self._data_store, assignment_notifier, self._session_resource_id,
+            chunks, 1_000_000),
+        get_session_info.return_value)
+    # Processing the chunks again doesn't count them twice.
+    submit_episode_chunks_handler.process_stored_episode_chunks(
+        self._data_store, assignment_notifier, self._session_resource_id,
+        chunks, 1_000_000)
+
+    summary = self._data_store.read_by_proto_ids(
+        project_id='p0', brain_id='b0', session_id='s0', episode_id='ep0',
+        attribute_type=data_store_pb2.EpisodeSummary)
+    summary.ClearField('created_micros')
+    self.assertEqual(summary, self._episode_summary())
+    session = self._data_store.read(self._session_resource_id)
+    self.assertEqual(session.last_data_received_micros, 1_000_000)
+    self.assertEqual(session.last_demo_data_received_micros, 1_000_000)
+    record_online_evaluation.assert_called_with(
+        self._data_store, chunks[0], self._ep_resource_id, mock.ANY)
+    evaluated_summary = record_online_evaluation.call_args[0][3]
+    evaluated_summary.ClearField('created_micros')
+    self.assertEqual(evaluated_summary, self._episode_summary())
+    try_start_assignments.assert_called_with(
+        self._data_store, assignment_notifier, self._session_resource_id,
+        data_store_pb2.ONLY_DEMONSTRATIONS, chunks)
+    get_session_info.assert_called_with(self._data_store,
+                                        self._session_resource_id)
+
+  @mock.patch.object(data_cache, 'get_brain_spec_validator')
   def test_check_episode_data_with_brain_spec_empty_in_progress(
-      self, get_brain_spec):
+      self, get_brain_spec_validator):
     mock_ds = mock.Mock()
-    get_brain_spec.return_value = mock.Mock()
     chunks = self._chunks(False)
     with self.assertRaisesWithLiteralMatch(
         specs.TypingError,
@@ -245,13 +406,12 @@ class SubmitEpisodeChunksHandlerTest(parameterized.TestCase):
         'chunk_index: 0.'):
       submit_episode_chunks_handler._check_episode_data_with_brain_spec(
           mock_ds, 'p0', 'b0', chunks)
-    get_brain_spec.assert_called_once_with(mock_ds, 'p0', 'b0')
+    get_brain_spec_validator.assert_called_once_with(mock_ds, 'p0', 'b0')
 
-  @mock.patch.object(data_cache, 'get_brain_spec')
+  @mock.patch.object(data_cache, 'get_brain_spec_validator')
   def test_check_episode_data_with_brain_spec_empty_at_id_0(
-      self, get_brain_spec):
+      self, get_brain_spec_validator):
     mock_ds = mock.Mock()
-    get_brain_spec.return_value = mock.Mock()
     chunks = self._chunks(False)
     chunks[0].episode_state = episode_pb2.FAILURE
 
@@ -259,38 +419,32 @@ class SubmitEpisodeChunksHandlerTest(parameterized.TestCase):
         specs.TypingError, 'Received an empty episode at chunk_index: 0.'):
       submit_episode_chunks_handler._check_episode_data_with_brain_spec(
           mock_ds, 'p0', 'b0', chunks)
-    get_brain_spec.assert_called_once_with(mock_ds, 'p0', 'b0')
+    get_brain_spec_validator.assert_called_once_with(mock_ds, 'p0', 'b0')
 
   @parameterized.named_parameters(
-      ('action', 'action_spec'),
-      ('observation', 'observation_spec'))
-  @mock.patch.object(specs, 'BrainSpec')
-  @mock.patch.object(data_cache, 'get_brain_spec')
+      ('action', 'check_action_data'),
+      ('observation', 'check_observation_data'))
+  @mock.patch.object(data_cache, 'get_brain_spec_validator')
   def test_check_episode_data_with_brain_spec_check_fails(
-      self, field, get_brain_spec, brain_spec_proto_node):
+      self, check_method, get_brain_spec_validator):
     mock_ds = mock.Mock()
-    get_brain_spec.return_value = mock.Mock()
     chunks = self._chunks()
-    mock_brain_spec_node = mock.Mock()
-    brain_spec_proto_node.return_value = mock_brain_spec_node
-    getattr(mock_brain_spec_node,
-            field).proto_node.data_to_proto_nest.side_effect = (
-                specs.TypingError('data_to_proto_nest failed.'))
+    validator = get_brain_spec_validator.return_value
+    getattr(validator, check_method).side_effect = (
+        specs.TypingError('check failed.'))
 
     with self.assertRaisesWithLiteralMatch(
         specs.TypingError,
-        'Brainspec check failed in chunk 0, step 0: data_to_proto_nest '
-        'failed.'):
+        'Brainspec check failed in chunk 0, step 0: check failed.'):
       submit_episode_chunks_handler._check_episode_data_with_brain_spec(
           mock_ds, 'p0', 'b0', chunks)
 
-    get_brain_spec.assert_called_once_with(mock_ds, 'p0', 'b0')
-    mock_brain_spec_node.action_spec.proto_node.data_to_proto_nest.assert_called_once_with(
+    get_brain_spec_validator.assert_called_once_with(mock_ds, 'p0', 'b0')
+    validator.check_action_data.assert_called_once_with(
         chunks[0].steps[0].action)
-    if field == 'observation_spec':
-      (mock_brain_spec_node.observation_spec.proto_node.data_to_proto_nest
-       .assert_called_once_with(chunks[0].steps[0].observation))
-    brain_spec_proto_node.assert_called_once_with(get_brain_spec.return_value)
+    if check_method == 'check_observation_data':
+      validator.check_observation_data.assert_called_once_with(
+          chunks[0].steps[0].observation)
 
   @mock.patch.object(submit_episode_chunks_handler, '_record_online_evaluation')
   @mock.patch.object(submit_episode_chunks_handler, '_get_steps_type')
@@ -302,9 +456,11 @@ class SubmitEpisodeChunksHandlerTest(parameterized.TestCase):
       merge_steps_type,
       get_steps_type,
       record_online_evaluation):
+    record_online_evaluation.return_value = None
     mock_ds = mock.Mock()
     mock_ds.resource_id_from_proto_ids.return_value = (
         self._ep_resource_id)
+    mock_ds.update.side_effect = self._create_resource
 
     mock_time.return_value = 1
 
@@ -317,7 +473,7 @@ class SubmitEpisodeChunksHandlerTest(parameterized.TestCase):
             mock_ds, chunks, self._session_resource_id),
         merge_steps_type.return_value)
 
-    mock_ds.write.assert_called_once_with(
+    mock_ds.write_many.assert_called_once_with([
         data_store_pb2.EpisodeChunk(
             project_id='p0',
             brain_id='b0',
@@ -326,7 +482,7 @@ class SubmitEpisodeChunksHandlerTest(parameterized.TestCase):
             chunk_id=0,
             created_micros=1_000_000,
             data=chunks[0],
-            steps_type=get_steps_type.return_value))
+            steps_type=get_steps_type.return_value)])
 
     mock_ds.update_session_data_timestamps.assert_called_once_with(
         self._session_resource_id,
@@ -334,7 +490,8 @@ class SubmitEpisodeChunksHandlerTest(parameterized.TestCase):
         True)
 
     record_online_evaluation.assert_called_once_with(
-        mock_ds, self._data_store_chunk(1_000_000), self._ep_resource_id)
+        mock_ds, self._data_store_chunk(1_000_000), self._ep_resource_id,
+        self._episode_summary())
     get_steps_type.assert_called_once_with(chunks[0])
 
   @mock.patch.object(submit_episode_chunks_handler, '_get_steps_type')
@@ -350,7 +507,7 @@ class SubmitEpisodeChunksHandlerTest(parameterized.TestCase):
       submit_episode_chunks_handler._store_episode_chunks(
           mock_ds, chunks, self._ep_resource_id)
 
-    mock_ds.write.assert_not_called()
+    mock_ds.write_many.assert_not_called()
     get_steps_type.assert_called_once_with(chunks[0])
 
   @mock.patch.object(submit_episode_chunks_handler, '_record_online_evaluation')
@@ -360,6 +517,7 @@ class SubmitEpisodeChunksHandlerTest(parameterized.TestCase):
       self, mock_time, get_steps_type, record_online_evaluation):
     mock_ds = mock.Mock()
     mock_ds.resource_id_from_proto_ids.return_value = self._ep_resource_id
+    mock_ds.update.side_effect = self._create_resource
     chunks = self._chunks()
     get_steps_type.return_value = data_store_pb2.ONLY_DEMONSTRATIONS
     record_online_evaluation.side_effect = ValueError('Episode incomplete.')
@@ -373,7 +531,7 @@ class SubmitEpisodeChunksHandlerTest(parameterized.TestCase):
       submit_episode_chunks_handler._store_episode_chunks(
           mock_ds, chunks, self._session_resource_id)
 
-    mock_ds.write.assert_called_once_with(
+    mock_ds.write_many.assert_called_once_with([
         data_store_pb2.EpisodeChunk(
             project_id='p0',
             brain_id='b0',
@@ -382,7 +540,7 @@ class SubmitEpisodeChunksHandlerTest(parameterized.TestCase):
             chunk_id=0,
             created_micros=1_000_000,
             data=chunks[0],
-            steps_type=get_steps_type.return_value))
+            steps_type=get_steps_type.return_value)])
 
     mock_ds.update_session_data_timestamps.assert_called_once_with(
         self._session_resource_id,
@@ -390,7 +548,8 @@ class SubmitEpisodeChunksHandlerTest(parameterized.TestCase):
         True)
 
     record_online_evaluation.assert_called_once_with(
-        mock_ds, self._data_store_chunk(1_000_000), self._ep_resource_id)
+        mock_ds, self._data_store_chunk(1_000_000), self._ep_resource_id,
+        self._episode_summary())
     get_steps_type.assert_called_once_with(chunks[0])
 
   def test_get_steps_type_mixed(self):
@@ -445,32 +604,31 @@ class SubmitEpisodeChunksHandlerTest(parameterized.TestCase):
                                            'Unsupported step type: 0'):
       submit_episode_chunks_handler._get_steps_type(chunk)
 
-  @mock.patch.object(submit_episode_chunks_handler, '_get_episode_steps_type')
   @mock.patch.object(submit_episode_chunks_handler, '_episode_score')
   @mock.patch.object(submit_episode_chunks_handler, '_episode_complete')
-  def test_record_online_evaluation(self, episode_complete, episode_score,
-                                    get_episode_steps_type):
+  def test_record_online_evaluation(self, episode_complete, episode_score):
     episode_complete.return_value = True
     episode_score.return_value = 1
-    get_episode_steps_type.return_value = (data_store_pb2.ONLY_INFERENCES,
-                                           {'m0'})
 
     mock_ds = mock.Mock()
     chunk = self._chunks()[0]
-    _ = submit_episode_chunks_handler._record_online_evaluation(
-        mock_ds, chunk, self._ep_resource_id)
-    mock_ds.write.assert_called_once_with(
-        data_store_pb2.OnlineEvaluation(
-            project_id=self._ep_resource_id.project,
-            brain_id=self._ep_resource_id.brain,
-            session_id=self._ep_resource_id.session,
-            episode_id=self._ep_resource_id.episode,
-            model='m0',
-            score=1.0))
+    mock_ds.read.side_effect = resource_store.NotFoundError()
+    online_evaluation = data_store_pb2.OnlineEvaluation(
+        project_id=self._ep_resource_id.project,
+        brain_id=self._ep_resource_id.brain,
+        session_id=self._ep_resource_id.session,
+        episode_id=self._ep_resource_id.episode,
+        model='m0',
+        score=1.0)
+    self.assertEqual(
+        submit_episode_chunks_handler._record_online_evaluation(
+            mock_ds, chunk, self._ep_resource_id,
+            self._episode_summary(steps_type=data_store_pb2.ONLY_INFERENCES,
+                                  model_ids=['m0'])),
+        (None, online_evaluation))
+    mock_ds.write.assert_called_once_with(online_evaluation)
     episode_complete.assert_called_once_with(chunk)
     episode_score.assert_called_once_with(chunk)
-    get_episode_steps_type.assert_called_once_with(
-        mock_ds, chunk, self._ep_resource_id)
 
   @mock.patch.object(submit_episode_chunks_handler, '_episode_complete')
   def test_record_online_evaluation_failure_at_episode_complete(
@@ -481,7 +639,7 @@ class SubmitEpisodeChunksHandlerTest(parameterized.TestCase):
     with self.assertRaisesWithLiteralMatch(ValueError,
                                            'Unsupported episode state 0.'):
       submit_episode_chunks_handler._record_online_evaluation(
-          mock.Mock(), chunk, mock.Mock())
+          mock.Mock(), chunk, mock.Mock(), self._episode_summary())
     episode_complete.assert_called_once_with(chunk)
 
   @mock.patch.object(submit_episode_chunks_handler, '_episode_score')
@@ -496,33 +654,35 @@ class SubmitEpisodeChunksHandlerTest(parameterized.TestCase):
     with self.assertRaisesWithLiteralMatch(
         ValueError, 'Incomplete episode can\'t be scored.'):
       submit_episode_chunks_handler._record_online_evaluation(
-          mock.Mock(), chunk, mock.Mock())
+          mock.Mock(), chunk, mock.Mock(), self._episode_summary())
 
     episode_complete.assert_called_once_with(chunk)
     episode_score.assert_called_once_with(chunk)
 
   @parameterized.named_parameters(
-      ('no_steps_type_no_model_ids', (None, [])),
-      ('not_inference', (data_store_pb2.MIXED, ['m0', 'm1'])))
-  @mock.patch.object(submit_episode_chunks_handler, '_get_episode_steps_type')
+      ('missing_previous_chunks', dict(chunk_count=0)),
+      ('not_inference', dict(steps_type=data_store_pb2.MIXED,
+                             model_ids=['m0'])),
+      ('no_model_ids', dict(steps_type=data_store_pb2.ONLY_INFERENCES)),
+      ('multiple_model_ids', dict(steps_type=data_store_pb2.ONLY_INFERENCES,
+                                  model_ids=['m0', 'm1'])))
   @mock.patch.object(submit_episode_chunks_handler, '_episode_score')
   @mock.patch.object(submit_episode_chunks_handler, '_episode_complete')
-  def test_record_online_evaluation_no_write(self,
-                                             get_episode_steps_return_value,
-                                             episode_complete, episode_score,
-                                             get_episode_steps_type):
+  def test_record_online_evaluation_no_write(self, summary_fields,
+                                             episode_complete, episode_score):
     episode_complete.return_value = True
     episode_score.return_value = 1
-    get_episode_steps_type.return_value = get_episode_steps_return_value
+    summary = self._episode_summary(model_ids=summary_fields.get('model_ids'))
+    summary.steps_type = summary_fields.get('steps_type', summary.steps_type)
+    summary.chunk_count = summary_fields.get('chunk_count',
+                                             summary.chunk_count)
 
     mock_ds = mock.Mock()
     chunk = self._chunks()[0]
-    _ = submit_episode_chunks_handler._record_online_evaluation(
-        mock_ds, chunk, self._ep_resource_id)
+    self.assertIsNone(submit_episode_chunks_handler._record_online_evaluation(
+        mock_ds, chunk, self._ep_resource_id, summary))
     episode_complete.assert_called_once_with(chunk)
     episode_score.assert_called_once_with(chunk)
-    get_episode_steps_type.assert_called_once_with(
-        mock_ds, chunk, self._ep_resource_id)
     mock_ds.write.assert_not_called()
 
   @parameterized.named_parameters(('success', episode_pb2.SUCCESS),
@@ -575,90 +735,245 @@ class SubmitEpisodeChunksHandlerTest(parameterized.TestCase):
               episode_id='ep0',
               chunk_id=0))
 
-  @parameterized.named_parameters(
-      ('used_in_inference', data_store_pb2.MIXED, {'m0'}),
-      ('not_used_in_inference', data_store_pb2.ONLY_DEMONSTRATIONS, set()))
-  def test_get_episode_steps_type_chunk_id_0(self, steps_type, expected_models):
-    mock_ds = mock.Mock()
-    chunk = self._data_store_chunk()
-    chunk.steps_type = steps_type
-    self.assertEqual(
-        submit_episode_chunks_handler._get_episode_steps_type(
-            mock_ds, chunk,
-            resource_id.FalkenResourceId(
-                'projects/p0/brains/b0/sessions/s0/episodes/e0')),
-        (steps_type, expected_models))
-
-  @mock.patch.object(submit_episode_chunks_handler, '_merge_steps_types')
-  def test_get_episode_steps_type(self, merge_steps_types):
-    mock_ds = mock.Mock()
-    chunk_res_ids = [
-        resource_id.FalkenResourceId(f'{self._ep_resource_id}/chunks/0'),
-        resource_id.FalkenResourceId(f'{self._ep_resource_id}/chunks/1')]
-    mock_ds.list_by_proto_ids.return_value = (chunk_res_ids, None)
-    mock_ds.read.side_effect = [
-        data_store_pb2.EpisodeChunk(
-            chunk_id=0,
-            data=episode_pb2.EpisodeChunk(model_id='m0', chunk_id=0),
-            steps_type=data_store_pb2.ONLY_INFERENCES),
+  def _write_chunks(self, steps_types_and_model_ids, episode_id='ep0'):
+    """Returns data store chunks with the given steps types and model IDs."""
+    return [
         data_store_pb2.EpisodeChunk(
-            chunk_id=1,
-            data=episode_pb2.EpisodeChunk(model_id='m1', chunk_id=1),
-            steps_type=data_store_pb2.ONLY_INFERENCES)
-    ]
-    merge_steps_types.return_value = data_store_pb2.ONLY_INFERENCES
-    chunk = data_store_pb2.EpisodeChunk(
-        chunk_id=1,  # With chunk ID 1, expect chunk 0 and chunk 1.
-        data=episode_pb2.EpisodeChunk(model_id='m2', chunk_id=2),
-        steps_type=data_store_pb2.ONLY_INFERENCES)
-
+            project_id='p0', brain_id='b0', session_id='s0',
+            episode_id=episode_id, chunk_id=i, steps_type=steps_type,
+            data=episode_pb2.EpisodeChunk(model_id=model_id, chunk_id=i))
+        for i, (steps_type, model_id) in enumerate(steps_types_and_model_ids)]
+
+  def _update_episode_summaries(self, chunks):
+    """Updates summaries and returns them without their timestamps."""
+    summaries = submit_episode_chunks_handler._update_episode_summaries(
+        self._data_store, chunks, self._session_resource_id)
+    for summary, _ in summaries:
+      summary.ClearField('created_micros')
+    return summaries
+
+  def _read_episode_summary(self):
+    summary = self._data_store.read_by_proto_ids(
+        attribute_type=data_store_pb2.EpisodeSummary, project_id='p0',
+        brain_id='b0', session_id='s0', episode_id='ep0')
+    summary.ClearField('created_micros')
+    return summary
+
+  def test_update_episode_summaries(self):
+    chunks = self._write_chunks([
+        (data_store_pb2.ONLY_INFERENCES, 'm0'),
+        (data_store_pb2.ONLY_DEMONSTRATIONS, 'm1'),
+        (data_store_pb2.ONLY_INFERENCES, 'm2')])
+    chunks.extend(self._write_chunks(
+        [(data_store_pb2.ONLY_INFERENCES, 'm0')], episode_id='ep1'))
+    with mock.patch.object(self._data_store, 'list_by_proto_ids') as (
+        list_by_proto_ids):
+      summaries = self._update_episode_summaries(chunks)
+      # New episodes are summarized without listing their chunks.
+      list_by_proto_ids.assert_not_called()
+    self.assertEqual(summaries, [
+        (self._episode_summary(steps_type=data_store_pb2.MIXED,
+                               model_ids=['m0', 'm2'], chunk_ids=[0, 1, 2]),
+         True),
+        (self._episode_summary(episode_id='ep1',
+                               steps_type=data_store_pb2.ONLY_INFERENCES,
+                               model_ids=['m0']),
+         True)])
+    self.assertEqual(self._read_episode_summary(), summaries[0][0])
+
+  def test_update_episode_summaries_reads_previous_summary(self):
+    self._data_store.write(self._episode_summary(
+        steps_type=data_store_pb2.ONLY_INFERENCES, model_ids=['m0']))
+    chunks = self._write_chunks([(data_store_pb2.ONLY_INFERENCES, 'm1')] * 2)
+    with mock.patch.object(self._data_store, 'read_many') as read_many:
+      summaries = self._update_episode_summaries(chunks[1:])
+      read_many.assert_not_called()
+    self.assertEqual(summaries, [(self._episode_summary(
+        steps_type=data_store_pb2.ONLY_INFERENCES, model_ids=['m0', 'm1'],
+        chunk_ids=[0, 1]), True)])
+    self.assertEqual(self._read_episode_summary(), summaries[0][0])
+
+  def test_update_episode_summaries_ignores_resubmitted_chunks(self):
+    self._data_store.write(self._episode_summary(
+        steps_type=data_store_pb2.ONLY_INFERENCES, model_ids=['m0'],
+        chunk_ids=[0, 1]))
+    chunks = self._write_chunks([(data_store_pb2.ONLY_DEMONSTRATIONS, '')] * 3)
+    self.assertEqual(self._update_episode_summaries(chunks[1:]), [(
+        self._episode_summary(
+            steps_type=data_store_pb2.MIXED, model_ids=['m0'],
+            chunk_ids=[0, 1, 2]),
+        True)])
+
+  def test_update_episode_summaries_resubmitted_first_chunk(self):
+    summary = self._episode_summary(
+        steps_type=data_store_pb2.ONLY_INFERENCES, model_ids=['m0'],
+        chunk_ids=[0, 1])
+    self._data_store.write(summary)
+    chunks = self._write_chunks([(data_store_pb2.ONLY_INFERENCES, 'm0')])
+    summary.ClearField('created_micros')
+    # The summary of the episode is kept rather than started again.
+    self.assertEqual(self._update_episode_summaries(chunks),
+                     [(summary, False)])
+    self.assertEqual(self._read_episode_summary(), summary)
+
+  def test_update_episode_summaries_out_of_order(self):
+    self._data_store.write(self._episode_summary(
+        steps_type=data_store_pb2.ONLY_INFERENCES, model_ids=['m0'],
+        chunk_ids=[0, 2]))
+    chunks = self._write_chunks([(data_store_pb2.ONLY_INFERENCES, 'm0'),
+                                 (data_store_pb2.ONLY_DEMONSTRATIONS, 'm1')])
+    self.assertEqual(self._update_episode_summaries(chunks[1:]), [(
+        self._episode_summary(
+            steps_type=data_store_pb2.MIXED, model_ids=['m0'],
+            chunk_ids=[0, 2, 1]),
+        True)])
+
+  def test_update_episode_summaries_without_previous_summary(self):
+    """Episodes stored before summaries were maintained are summarized."""
+    chunks = self._write_chunks([
+        (data_store_pb2.ONLY_INFERENCES, 'm0'),
+        (data_store_pb2.ONLY_INFERENCES, 'm1'),
+        (data_store_pb2.ONLY_INFERENCES, 'm1')])
+    self._data_store.write_many(chunks)
+    self.assertEqual(self._update_episode_summaries(chunks[2:]), [(
+        self._episode_summary(
+            steps_type=data_store_pb2.ONLY_INFERENCES, model_ids=['m0', 'm1'],
+            chunk_ids=[0, 1, 2]),
+        True)])
+
+  def test_update_episode_summaries_tracks_pending_chunks(self):
+    chunks = self._write_chunks([(data_store_pb2.ONLY_INFERENCES, 'm0')] * 4)
+    self._update_episode_summaries([chunks[0], chunks[3], chunks[2]])
+    summary = self._read_episode_summary()
+    self.assertEqual(summary.next_chunk_id, 1)
+    self.assertEqual(summary.pending_chunk_ids, [3, 2])
+    self.assertEqual(summary.chunk_count, 3)
+    self.assertEqual(summary.last_chunk_id, 3)
+
+    # Storing the missing chunk summarizes the pending chunks.
+    self._update_episode_summaries(chunks[1:2])
+    summary = self._read_episode_summary()
+    self.assertEqual(summary.next_chunk_id, 4)
+    self.assertEqual(summary.pending_chunk_ids, [])
+    self.assertEqual(summary.chunk_count, 4)
+
+  @mock.patch.object(submit_episode_chunks_handler, '_MAX_PENDING_CHUNK_IDS',
+                     2)
+  def test_update_episode_summaries_too_many_pending_chunks(self):
+    chunks = self._write_chunks([(data_store_pb2.ONLY_INFERENCES, 'm0')] * 5)
+    self.assertEqual(self._update_episode_summaries(
+        [chunks[0], chunks[2], chunks[3], chunks[4]]), [(
+            self._episode_summary(
+                steps_type=data_store_pb2.ONLY_INFERENCES, model_ids=['m0'],
+                chunk_ids=[0, 2, 3]),
+            True)])
+    # The skipped chunk is summarized when submitted after the missing chunk.
+    self._update_episode_summaries(chunks[1:2])
+    self.assertEqual(self._update_episode_summaries(chunks[4:]), [(
+        self._episode_summary(
+            steps_type=data_store_pb2.ONLY_INFERENCES, model_ids=['m0'],
+            chunk_ids=[0, 1, 2, 3, 4]),
+        True)])
+
+  def test_store_episode_chunks_records_online_evaluation(self):
+    self._data_store.write(data_store_pb2.Session(
+        project_id='p0', brain_id='b0', session_id='s0'))
+    chunks = [
+        episode_pb2.EpisodeChunk(
+            episode_id='ep0', chunk_id=i, model_id='m0',
+            episode_state=state,
+            steps=[episode_pb2.Step(action=action_pb2.ActionData(
+                source=action_pb2.ActionData.BRAIN_ACTION))])
+        for i, state in enumerate((episode_pb2.IN_PROGRESS,
+                                   episode_pb2.SUCCESS))]
+    for chunk in chunks:
+      submit_episode_chunks_handler._store_episode_chunks(
+          self._data_store, [chunk], self._session_resource_id)
     self.assertEqual(
-        submit_episode_chunks_handler._get_episode_steps_type(
-            mock_ds, chunk, self._ep_resource_id),
-        (merge_steps_types.return_value, {'m2', 'm0', 'm1'}))
-
-    mock_ds.list_by_proto_ids.assert_called_once_with(
-        project_id='p0', brain_id='b0', session_id='s0', episode_id='ep0',
-        chunk_id='*')
-    mock_ds.read.assert_has_calls([
-        mock.call(chunk_res_ids[0]),
-        mock.call(chunk_res_ids[1])])
-
-    merge_steps_types.assert_has_calls([
-        mock.call(data_store_pb2.UNKNOWN, data_store_pb2.ONLY_INFERENCES),
-        mock.call(data_store_pb2.ONLY_INFERENCES,
-                  data_store_pb2.ONLY_INFERENCES)
-    ])
-
-  @mock.patch.object(submit_episode_chunks_handler, '_merge_steps_types')
-  def test_get_episode_steps_type_count_mismatch(self, merge_steps_types):
-    mock_ds = mock.Mock()
-    mock_ds.list_by_proto_ids.return_value = (
-        [f'{self._ep_resource_id}/chunks/0'], None)
-    mock_ds.read.side_effect = [
-        data_store_pb2.EpisodeChunk(
-            chunk_id=0,
-            data=episode_pb2.EpisodeChunk(model_id='m0', chunk_id=0),
-            steps_type=data_store_pb2.ONLY_INFERENCES),
-    ]
-    merge_steps_types.return_value = data_store_pb2.ONLY_INFERENCES
-    chunk = data_store_pb2.EpisodeChunk(
-        chunk_id=2,
-        data=episode_pb2.EpisodeChunk(model_id='m2', chunk_id=2),
-        steps_type=data_store_pb2.ONLY_INFERENCES)
-
-    with self.assertRaisesWithLiteralMatch(
-        FileNotFoundError,
-        'Did not find all previous chunks for chunk id 2, only got 1 chunks.'):
-      submit_episode_chunks_handler._get_episode_steps_type(
-          mock_ds, chunk, self._ep_resource_id)
-
-    mock_ds.list_by_proto_ids.assert_called_once_with(
+        self._data_store.read_by_proto_ids(
+            attribute_type=data_store_pb2.EpisodeSummary, project_id='p0',
+            brain_id='b0', session_id='s0', episode_id='ep0').chunk_count, 2)
+    online_evaluation = self._data_store.read_by_proto_ids(
+        attribute_type=data_store_pb2.OnlineEvaluation, project_id='p0',
+        brain_id='b0', session_id='s0', episode_id='ep0')
+    self.assertEqual(online_evaluation.model, 'm0')
+    self.assertEqual(online_evaluation.score,
+                     model_selector.EPISODE_SCORE_SUCCESS)
+    self.assertEqual(self._online_evaluation_summary().models, [
+        data_store_pb2.ModelOnlineEvaluations(model='m0', successes=1)])
+
+    # Resubmitting the final chunk doesn't count the episode twice.
+    submit_episode_chunks_handler._store_episode_chunks(
+        self._data_store, chunks[1:], self._session_resource_id)
+    self.assertEqual(self._online_evaluation_summary().models, [
+        data_store_pb2.ModelOnlineEvaluations(model='m0', successes=1)])
+
+    # Resubmitting the final chunk with a different result replaces the
+    # result of the episode.
+    chunks[1].episode_state = episode_pb2.FAILURE
+    submit_episode_chunks_handler._store_episode_chunks(
+        self._data_store, chunks[1:], self._session_resource_id)
+    self.assertEqual(self._online_evaluation_summary().models, [
+        data_store_pb2.ModelOnlineEvaluations(model='m0', failures=1)])
+
+  def test_store_episode_chunks_records_online_evaluation_out_of_order(self):
+    self._data_store.write(data_store_pb2.Session(
+        project_id='p0', brain_id='b0', session_id='s0'))
+    chunks = [
+        episode_pb2.EpisodeChunk(
+            episode_id='ep0', chunk_id=i, model_id='m0',
+            episode_state=state,
+            steps=[episode_pb2.Step(action=action_pb2.ActionData(
+                source=action_pb2.ActionData.BRAIN_ACTION))])
+        for i, state in enumerate((episode_pb2.IN_PROGRESS,
+                                   episode_pb2.IN_PROGRESS,
+                                   episode_pb2.FAILURE))]
+    # The final chunk is stored before one of the previous chunks.
+    for chunk in (chunks[0], chunks[2]):
+      submit_episode_chunks_handler._store_episode_chunks(
+          self._data_store, [chunk], self._session_resource_id)
+    with self.assertRaises(resource_store.NotFoundError):
+      self._online_evaluation_summary()
+
+    submit_episode_chunks_handler._store_episode_chunks(
+        self._data_store, chunks[1:2], self._session_resource_id)
+    episode_summary = self._read_episode_summary()
+    self.assertEqual(episode_summary.next_chunk_id, 3)
+    self.assertEqual(episode_summary.pending_chunk_ids, [])
+    self.assertEqual(self._online_evaluation_summary().models, [
+        data_store_pb2.ModelOnlineEvaluations(model='m0', failures=1)])
+
+    # Resubmitting the chunk doesn't evaluate the episode again.
+    submit_episode_chunks_handler._store_episode_chunks(
+        self._data_store, chunks[1:2], self._session_resource_id)
+    self.assertEqual(self._online_evaluation_summary().models, [
+        data_store_pb2.ModelOnlineEvaluations(model='m0', failures=1)])
+
+  def test_online_evaluation_summary_of_previously_evaluated_session(self):
+    self._data_store.write(data_store_pb2.OnlineEvaluation(
         project_id='p0', brain_id='b0', session_id='s0', episode_id='ep0',
-        chunk_id='*')
-    mock_ds.read.assert_called_once_with(f'{self._ep_resource_id}/chunks/0')
-    merge_steps_types.assert_called_once_with(data_store_pb2.UNKNOWN,
-                                              data_store_pb2.ONLY_INFERENCES)
+        model='m0', score=model_selector.EPISODE_SCORE_FAILURE))
+    self._data_store.write(data_store_pb2.OnlineEvaluation(
+        project_id='p0', brain_id='b0', session_id='s0', episode_id='ep1',
+        model='m1', score=model_selector.EPISODE_SCORE_SUCCESS))
+    submit_episode_chunks_handler._update_online_evaluation_summary(
+        self._data_store, self._session_resource_id,
+        [(None, data_store_pb2.OnlineEvaluation(
+            model='m1', score=model_selector.EPISODE_SCORE_SUCCESS))])
+    # The summary is created from the stored evaluations.
+    self.assertEqual(self._online_evaluation_summary().models, [
+        data_store_pb2.ModelOnlineEvaluations(model='m0', failures=1),
+        data_store_pb2.ModelOnlineEvaluations(model='m1', successes=1)])
+
+    # Later evaluations update the created summary.
+    submit_episode_chunks_handler._update_online_evaluation_summary(
+        self._data_store, self._session_resource_id,
+        [(None, data_store_pb2.OnlineEvaluation(
+            model='m0', score=model_selector.EPISODE_SCORE_SUCCESS))])
+    self.assertEqual(self._online_evaluation_summary().models, [
+        data_store_pb2.ModelOnlineEvaluations(
+            model='m0', successes=1, failures=1),
+        data_store_pb2.ModelOnlineEvaluations(model='m1', successes=1)])
 
   merge_step_map = {
       data_store_pb2.UNKNOWN: {
@@ -744,17 +1059,15 @@ class SubmitEpisodeChunksHandlerTest(parameterized.TestCase):
           [mock.call(expected_assignments[0]),
            mock.call(expected_assignments[1])])
 
-      expected_notifications = []
-      for assignment in expected_assignments:
-        for _ in self._chunks():
-          expected_notifications.append(mock.call(
-              self._data_store.to_resource_id(assignment),
-              self._data_store.to_resource_id(self._data_store_chunk())))
-      mock_notifier.trigger_assignment_notification.assert_has_calls(
-          expected_notifications)
+      # A single notification lists all chunks of each assignment.
+      mock_notifier.trigger_assignment_notifications.assert_has_calls(
+          [mock.call(self._data_store.to_resource_id(assignment),
+                     [self._data_store.to_resource_id(self._data_store_chunk())
+                      for _ in self._chunks()])
+           for assignment in expected_assignments])
     else:
       mock_data_store_write.assert_not_called()
-      mock_notifier.trigger_assignment_notification.assert_not_called()
+      mock_notifier.trigger_assignment_notifications.assert_not_called()
 
   def test_set_hyperparameters_valid(self):
     submit_episode_chunks_handler.FLAGS.hyperparameters = [
@@ -35,10 +35,10 @@ The assignment monitor allows for two kinds of monitoring:
   exclusive, the process can start training on that data right away knowing
   no other process will do the same.
 
-* Monitoring on all assignments: A process that hasn't acquired an
-  assignment will receive notifications for all assignments with
-  new episode chunks (excluding assignments that are already acquired by other
-  processes).
+* Monitoring on all assignments: A process that has acquired fewer than
+  max_acquired_assignments assignments will receive notifications for all
+  other assignments with new episode chunks (excluding assignments that are
+  already acquired by other processes).
 
   This kind of monitoring is like a broadcasting system for multiple
   listeners. It provides very weak guarantees: A process that
@@ -59,64 +59,216 @@ clean up the notification files and provide stronger guarantees.
 """
 
 import collections
+import functools
+import hashlib
 import os.path
 import queue
 import threading
 import time
 
 from data_store import file_system
+from data_store import file_watcher
 from data_store import resource_id
 
 
 # Seconds before an assignment acquisition expires.
 _ASSIGNMENT_EXPIRATION_SECONDS = 5 * 60  # Five minutes.
 
+# Name of the file locked to acquire an assignment. FileSystem.lock_file()
+# shares a lock between all files of a directory so locking a file inside the
+# assignment directory gives each assignment its own lock, rather than one per
+# session.
+_ASSIGNMENT_LOCK_FILENAME = 'assignment'
+
 # If activity in an assignment notification directory is older than this value,
 # then the directory will be deleted.
 _NOTIFICATION_MAX_STALENESS_SECONDS = 60 * 60  # One hour.
 
+# Seconds without observed changes after which all notifications are scanned.
+# This refreshes the lock of the acquired assignment and picks up changes the
+# file system could not report, e.g. assignments released by a crashed process.
+# Notifications written by other hosts to a network file system are not
+# reported by inotify, so such file systems must be watched by polling.
+_IDLE_SCAN_SECONDS = 60
+
+# Number of path components of an assignment notification directory, i.e.
+# notifications/projects/<p>/brains/<b>/sessions/<s>/assignments/<a>
+_ASSIGNMENT_DIRECTORY_COMPONENTS = 9
+
+# Prefixes of the notification files written to assignment directories.
+# chunk_<episode>_<chunk> files notify a single episode chunk while
+# chunks_<digest> files list several episode chunks, one
+# <episode>_<chunk> per line.
+_CHUNK_FILE_PREFIX = 'chunk_'
+_CHUNK_BATCH_FILE_PREFIX = 'chunks_'
+
+# Name of the file written to session and assignment notification directories
+# to record their last activity, so that their staleness can be checked
+# without walking them. Hidden so that it's not listed as a chunk file.
+_ACTIVITY_FILENAME = '.activity'
+
+# Minimum seconds between writes of the activity file of a directory by a
+# process. Must be much smaller than _NOTIFICATION_MAX_STALENESS_SECONDS.
+_ACTIVITY_WRITE_INTERVAL_SECONDS = 60
+
+# Weight of the latest tick in the moving average of the cost of ticks.
+_TICK_COST_SMOOTHING = 0.1
+
+# Statistics of the polling of an AssignmentMonitor:
+# * frequency: Current maximum frequency of ticks in Hz, lower than the
+#   notification frequency while backing off.
+# * tick_seconds: Moving average of the seconds spent handling a tick.
+PollingStats = collections.namedtuple('PollingStats',
+                                      ['frequency', 'tick_seconds'])
+
 
 class _Metronome:
-  """Yields values with a maximum frequency."""
+  """Yields changes to watched files with a maximum frequency.
+
+  When a minimum frequency is set, the interval between ticks doubles every
+  time a tick reports that it found no changes, up to the interval of the
+  minimum frequency, and returns to the interval of the maximum frequency as
+  soon as changes are found or a full scan is requested. This reduces the cost
+  of polling file systems that can't report changes while nothing changes.
+  """
 
-  def __init__(self, frequency):
+  def __init__(self, frequency, watcher, min_frequency=None):
     """Initializes the metronome.
 
     Args:
       frequency: Maximum frequency for the metronome ticks.
+      watcher: Watcher of the files the ticks report changes to, as returned
+        by FileSystem.watch().
+      min_frequency: Frequency the ticks back off to while no changes are
+        found or None to always tick with the maximum frequency.
     """
     if frequency <= 0:
       raise ValueError(
           f'Metronome frequency must be positive, but is {frequency}.')
+    if min_frequency is not None and not 0 < min_frequency <= frequency:
+      raise ValueError(
+          f'Metronome minimum frequency must be positive and at most '
+          f'{frequency}, but is {min_frequency}.')
     self._sleep_time = 1 / frequency
-    self._stop = False
+    self._max_sleep_time = 1 / (min_frequency or frequency)
+    # Current interval between ticks.
+    self._interval = self._sleep_time
+    self._watcher = watcher
+    self._stop = threading.Event()
+    self._full_scan_requested = threading.Event()
+    # Interrupts backing off.
+    self._wake_up = threading.Event()
+
+  @property
+  def frequency(self):
+    """Current maximum frequency of ticks."""
+    return 1 / self._interval
+
+  def report_tick(self, found_changes):
+    """Reports whether the last tick found changes, to adapt the frequency.
+
+    Args:
+      found_changes: Whether handling the last tick found any changes.
+    """
+    if found_changes:
+      self._interval = self._sleep_time
+    else:
+      self._interval = min(self._interval * 2, self._max_sleep_time)
+
+  def _wait_for_changes(self, deadline):
+    """Waits for watched files to change.
+
+    Args:
+      deadline: time.monotonic() value after which to stop waiting.
+
+    Returns:
+      Set of paths that changed, empty if the metronome was stopped, or None
+      if any file may have changed.
+    """
+    changed_paths = set()
+    while not changed_paths and not self._stop.is_set():
+      if self._full_scan_requested.is_set():
+        self._full_scan_requested.clear()
+        return None
+      timeout = deadline - time.monotonic()
+      if timeout <= 0:
+        return None
+      events = self._watcher.wait_for_events(timeout=timeout)
+      if events is None:
+        return None
+      changed_paths.update(event.path for event in events)
+    return changed_paths
 
   def wait_for_tick(self):
-    """Generator that yields with the maximum requested frequency."""
-    while not self._stop:
-      yield
-      time.sleep(self._sleep_time)
+    """Generator that yields with the maximum requested frequency.
+
+    The first tick and ticks that follow _IDLE_SCAN_SECONDS without changes
+    report that any file may have changed.
+
+    Yields:
+      Set of paths relative to the root of the file system that changed since
+      the previous tick, or None if any file may have changed.
+    """
+    changed_paths = None
+    while not self._stop.is_set():
+      tick_time = time.monotonic()
+      yield changed_paths
+      changed_paths = self._wait_for_changes(tick_time + _IDLE_SCAN_SECONDS)
+      if changed_paths:
+        self._interval = self._sleep_time
+      # Limit the frequency of ticks, accumulating changes in the meantime.
+      if self._stop.wait(tick_time + self._sleep_time - time.monotonic()):
+        return
+      if self._interval > self._sleep_time:
+        # Back off, unless a full scan is requested.
+        if self._wake_up.wait(tick_time + self._interval - time.monotonic()):
+          self._wake_up.clear()
+        if self._stop.is_set():
+          return
+      if changed_paths is not None:
+        events = self._watcher.wait_for_events(timeout=0)
+        if events is None:
+          changed_paths = None
+        else:
+          changed_paths.update(event.path for event in events)
+
+  def request_full_scan(self):
+    """Makes wait_for_tick report that any file may have changed."""
+    self._interval = self._sleep_time
+    self._full_scan_requested.set()
+    self._wake_up.set()
+    self._watcher.interrupt()
 
   def stop(self):
     """Makes wait_for_tick stop yielding ticks."""
-    self._stop = True
+    self._stop.set()
+    self._wake_up.set()
+    self._watcher.interrupt()
 
 
 class _FakeMetronome:
   """Simulates Metronome ticks when it is requested to do so."""
   _STOP_STRING = 'stop'
 
-  def __init__(self, unused_frequency):
+  def __init__(self, frequency, unused_watcher, unused_min_frequency=None):
     """Initializes the fake metronome.
 
     Args:
-      unused_frequency: Used only to be consistent with the _Metronome
+      frequency: Reported as the frequency of the metronome.
+      unused_watcher: Used only to be consistent with the _Metronome
+        constructor.
+      unused_min_frequency: Used only to be consistent with the _Metronome
         constructor.
     """
+    self.frequency = frequency
     self._ticks = queue.Queue()
 
   def wait_for_tick(self):
-    """Generator that yields every time force_tick() is called."""
+    """Generator that yields every time force_tick() is called.
+
+    Yields:
+      None as every tick reports that any file may have changed.
+    """
     while True:
       # Block until force_tick has been called at least once.
       tick = self._ticks.get()
@@ -124,18 +276,34 @@ class _FakeMetronome:
       if tick == self._STOP_STRING:
         return
 
-      yield
+      yield None
 
   def force_tick(self):
     """Make wait_for_tick tick."""
     self._ticks.put('tick!')
 
+  def report_tick(self, unused_found_changes):
+    """Does nothing as ticks are only simulated on request."""
+
+  def request_full_scan(self):
+    """Does nothing as every tick is a full scan."""
+
   def stop(self):
     """Makes wait_for_tick stop yielding ticks."""
     self._ticks.put(self._STOP_STRING)
     self._ticks.join()
 
 
+class _AcquiredAssignment:
+  """State of an assignment acquired by an AssignmentMonitor."""
+
+  def __init__(self, lock_file):
+    # Lock file used to make assignment acquisition exclusive across processes.
+    self.lock_file = lock_file
+    # List of chunk files to remove whenever the assignment is released.
+    self.chunk_files_to_remove = []
+
+
 # A path for a file, with its corresponding timestamp in milliseconds since
 # the epoch.
 TimestampedPath = collections.namedtuple(
@@ -154,11 +322,50 @@ class _AssignmentMonitorBase:
     super().__init__()
     self._fs = fs
     self._notification_dir = 'notifications'
+    # time.monotonic() of the last write of each activity file by this process.
+    self._activity_write_times = {}
+    self._activity_lock = threading.Lock()
 
   def _get_assignment_directory(self, assignment_resource_id):
     """Gives the directory given the resource id of an assignment."""
     return os.path.join(self._notification_dir, str(assignment_resource_id))
 
+  @staticmethod
+  def _get_assignment_lock_path(assignment_dir):
+    """Gives the path to lock to acquire the assignment of a directory."""
+    return os.path.join(assignment_dir, _ASSIGNMENT_LOCK_FILENAME)
+
+  def _record_activity(self, assignment_id):
+    """Records activity in the directories of an assignment and its session.
+
+    Activity files are written at most every _ACTIVITY_WRITE_INTERVAL_SECONDS
+    by each process.
+
+    Args:
+      assignment_id: Resource ID of the assignment.
+    """
+    assignment_dir = self._get_assignment_directory(assignment_id)
+    session_dir = os.path.dirname(os.path.dirname(assignment_dir))
+    now = time.monotonic()
+    paths = []
+    with self._activity_lock:
+      for directory in (assignment_dir, session_dir):
+        path = os.path.join(directory, _ACTIVITY_FILENAME)
+        last_write_time = self._activity_write_times.get(path)
+        if (last_write_time is None or
+            now - last_write_time >= _ACTIVITY_WRITE_INTERVAL_SECONDS):
+          paths.append(path)
+      if not paths:
+        return
+      # Forget directories that weren't active recently.
+      self._activity_write_times = {
+          p: t for p, t in self._activity_write_times.items()
+          if now - t < _ACTIVITY_WRITE_INTERVAL_SECONDS}
+      for path in paths:
+        self._activity_write_times[path] = now
+    for path in paths:
+      self._fs.write_file(path, b'')
+
 
 class AssignmentNotifier(_AssignmentMonitorBase):
   """Sends assignment notifications."""
@@ -181,15 +388,45 @@ class AssignmentNotifier(_AssignmentMonitorBase):
     # There's no need to lock for this.
     path = os.path.join(
         self._get_assignment_directory(assignment_id),
-        f'chunk_{episode_chunk_id.episode}_{episode_chunk_id.chunk}')
+        f'{_CHUNK_FILE_PREFIX}{episode_chunk_id.episode}_'
+        f'{episode_chunk_id.chunk}')
     self._fs.write_file(path, b'')
+    self._record_activity(assignment_id)
+
+  def trigger_assignment_notifications(self, assignment_id, episode_chunk_ids):
+    """Triggers a notification for several chunks of a given assignment.
+
+    Writes a single file that lists all chunks, which is consumed like the
+    files written by trigger_assignment_notification().
+
+    Args:
+      assignment_id: Resource ID of the assignment to trigger notifications for.
+      episode_chunk_ids: Resource IDs of newly created chunks. The episode
+        component of the resource IDs must not contain underscores.
+    """
+    if not episode_chunk_ids:
+      return
+    lines = []
+    for episode_chunk_id in episode_chunk_ids:
+      assert '_' not in episode_chunk_id.episode
+      lines.append(f'{episode_chunk_id.episode}_{episode_chunk_id.chunk}\n')
+    data = ''.join(lines).encode('utf-8')
+    # Name the file after its contents so that notifying the same chunks again
+    # before they're consumed doesn't report them twice.
+    path = os.path.join(
+        self._get_assignment_directory(assignment_id),
+        _CHUNK_BATCH_FILE_PREFIX + hashlib.sha256(data).hexdigest()[:32])
+    self._fs.write_file(path, data)
+    self._record_activity(assignment_id)
 
 
 class AssignmentMonitor(_AssignmentMonitorBase):
   """Monitors creation of assignments."""
 
   def __init__(self, fs, assignment_callback, chunk_callback,
-               notification_frequency=5):
+               notification_frequency=5, max_acquired_assignments=1,
+               min_notification_frequency=None,
+               watcher_kind=file_watcher.AUTO):
     """Initializes an assignment monitor.
 
     Args:
@@ -197,37 +434,58 @@ class AssignmentMonitor(_AssignmentMonitorBase):
       assignment_callback: A callback function with a single argument,
         the resource id for the assignment. This callback function will be
         called to notify every time any assignment has received a new episode
-        chunk (but only when no assignment has been acquired with
-        acquire_assignment).
+        chunk (but only while fewer than max_acquired_assignments assignments
+        have been acquired with acquire_assignment).
       chunk_callback: A callback function with two arguments:
         - assignment_id: Resource id for an assignment that has at least one
           new chunk.
         - chunks: A list of chunk resource ids.
         This callback function will be called to notify every time at least one
-        episode chunk has been added to the acquired assignment. It is
+        episode chunk has been added to an acquired assignment. It is
         responsibility of the client to find which episode chunks were created
         before the first callback call.
-      notification_frequency: Maximum amount of times per second to poll.
+      notification_frequency: Maximum amount of times per second to notify
+        changes. Also the polling frequency if the file system can't report
+        changes.
+      max_acquired_assignments: Maximum number of assignments that can be
+        acquired at the same time.
+      min_notification_frequency: If set, the polling frequency backs off
+        exponentially down to this frequency while no changes are found and
+        returns to notification_frequency as soon as changes are found.
+      watcher_kind: Kind of watcher used to detect notifications, one of
+        file_watcher.WATCHER_KINDS. Use file_watcher.POLLING if notifications
+        are written by other hosts to a shared file system, e.g. over NFS.
     """
     super().__init__(fs)
 
     if not assignment_callback or not chunk_callback:
       raise ValueError('All callbacks must be set.')
-
-    self._metronome = _Metronome(notification_frequency)
-
-    # Information about the currently acquired assignment.
-    self._acquired_assignment_id = None
-    # Lock file used to make assignment acquisition exclusive across processes.
-    self._acquired_assignment_lock_file = None
-    # threading.Lock object to protect access to _acquired_assignment_id and
-    # _acquired_assignment_lock_file variables across threads of the same
-    # process.
+    if max_acquired_assignments < 1:
+      raise ValueError('max_acquired_assignments must be positive, but is '
+                       f'{max_acquired_assignments}.')
+    if (min_notification_frequency is not None and
+        min_notification_frequency < 1 / _IDLE_SCAN_SECONDS):
+      # Locks of acquired assignments are refreshed on every tick.
+      raise ValueError(
+          'min_notification_frequency must be at least '
+          f'{1 / _IDLE_SCAN_SECONDS}, but is {min_notification_frequency}.')
+
+    self._watcher = self._fs.watch(self._notification_dir,
+                                   1 / notification_frequency, watcher_kind)
+    self._metronome = _Metronome(notification_frequency, self._watcher,
+                                 min_notification_frequency)
+    # Moving average of the seconds spent handling a tick, excluding
+    # callbacks.
+    self._tick_seconds = 0.0
+
+    self._max_acquired_assignments = max_acquired_assignments
+    # _AcquiredAssignment objects by resource id of the currently acquired
+    # assignments.
+    self._acquired_assignments = {}
+    # threading.Lock object to protect access to _acquired_assignments across
+    # threads of the same process.
     self._acquired_assignment_in_process_lock = threading.Lock()
 
-    # List of chunk files to remove whenever an assignment is released.
-    self._chunk_files_to_remove = []
-
     # Set callbacks.
     self._assignment_callback = assignment_callback
     self._chunk_callback = chunk_callback
@@ -240,8 +498,11 @@ class AssignmentMonitor(_AssignmentMonitorBase):
     #   previous one.
     self._last_timestamp = {}
 
-    # Clean up old notification directories.
-    self._cleanup()
+    # Clean up old notification directories in the background so that startup
+    # doesn't depend on the number of notification directories.
+    self._stop_cleanup = threading.Event()
+    self._cleanup_thread = threading.Thread(target=self._cleanup, daemon=True)
+    self._cleanup_thread.start()
 
     # Start polling.
     self._thread = threading.Thread(
@@ -250,21 +511,31 @@ class AssignmentMonitor(_AssignmentMonitorBase):
 
   def __del__(self):
     """Ensure that monitor is stopped upon destruction."""
-    if self._metronome:
+    # The metronome isn't set if the constructor raised an exception.
+    if getattr(self, '_metronome', None):
       self.shutdown()
 
   def shutdown(self):
     """Shutdown monitoring assignments."""
     self.release_assignment(raise_if_none_acquired=False)
+    self._stop_cleanup.set()
+    self._cleanup_thread.join()
     self._metronome.stop()
     self._thread.join()
     self._metronome = None
+    self._watcher.close()
+
+  @property
+  def polling_stats(self):
+    """Returns the PollingStats of the monitor."""
+    return PollingStats(frequency=self._metronome.frequency,
+                        tick_seconds=self._tick_seconds)
 
   def acquire_assignment(self, assignment_id):
     """Acquires an assignment.
 
-    A process can only acquired a single assignment at a time. An assignment
-    cannot be acquired by more than one process.
+    A process can acquire up to max_acquired_assignments assignments at a
+    time. An assignment cannot be acquired by more than one process.
 
     Args:
       assignment_id: The resource id for the assignment to acquire.
@@ -272,32 +543,47 @@ class AssignmentMonitor(_AssignmentMonitorBase):
       A boolean telling whether the assignment was correctly acquired or not.
     """
     with self._acquired_assignment_in_process_lock:
-      if self._acquired_assignment_id:
+      if assignment_id in self._acquired_assignments:
+        raise ValueError(f'Assignment {assignment_id} is already acquired.')
+      if len(self._acquired_assignments) >= self._max_acquired_assignments:
+        acquired_ids = ', '.join(str(a) for a in self._acquired_assignments)
         raise ValueError(
             f'Cannot acquire assignment {assignment_id} as assignment '
-            f'{self._acquired_assignment_id} is already acquired.')
+            f'{acquired_ids} is already acquired.')
 
-      lock_path = self._get_assignment_directory(assignment_id)
+      lock_path = self._get_assignment_lock_path(
+          self._get_assignment_directory(assignment_id))
       try:
-        self._acquired_assignment_lock_file = self._fs.lock_file(
-            lock_path, _ASSIGNMENT_EXPIRATION_SECONDS)
+        lock_file = self._fs.lock_file(lock_path,
+                                       _ASSIGNMENT_EXPIRATION_SECONDS)
       except file_system.UnableToLockFileError:
-        self._acquired_assignment_lock_file = None
         return False
 
-      self._acquired_assignment_id = assignment_id
-      self._chunk_files_to_remove = []
+      self._acquired_assignments[assignment_id] = _AcquiredAssignment(
+          lock_file)
+      # Report chunks added before the assignment was acquired.
+      self._metronome.request_full_scan()
       return True
 
-  def release_assignment(self, raise_if_none_acquired=True):
-    """Releases the currently acquired assignment.
+  def release_assignment(self, assignment_id=None,
+                         raise_if_none_acquired=True):
+    """Releases acquired assignments.
 
     Args:
+      assignment_id: The resource id of the assignment to release or None to
+        release all acquired assignments.
       raise_if_none_acquired: If True, raise an exception whenever this
-        method is call but no assignment has been acquired.
+        method is call but the assignment, or any assignment if assignment_id
+        is None, has not been acquired.
     """
     with self._acquired_assignment_in_process_lock:
-      if not self._acquired_assignment_lock_file:
+      if assignment_id is None:
+        assignment_ids = list(self._acquired_assignments)
+      elif assignment_id in self._acquired_assignments:
+        assignment_ids = [assignment_id]
+      else:
+        assignment_ids = []
+      if not assignment_ids:
         if raise_if_none_acquired:
           raise ValueError(
               'Attempted to release an assignment, but none has been acquired '
@@ -305,41 +591,79 @@ class AssignmentMonitor(_AssignmentMonitorBase):
         else:
           return
 
-      # By removing these files, we ensure they won't be sent as notifications
-      # from any process, in the future.
-      for f in self._chunk_files_to_remove:
-        self._fs.remove_file(f)
-      self._chunk_files_to_remove = []
+      for acquired_id in assignment_ids:
+        acquired = self._acquired_assignments.pop(acquired_id)
+        # By removing these files, we ensure they won't be sent as
+        # notifications from any process, in the future.
+        for f in acquired.chunk_files_to_remove:
+          self._fs.remove_file(f)
+        self._fs.unlock_file(acquired.lock_file)
+
+  def _get_changed_assignment_directories(self, changed_paths):
+    """Gives the assignment directories containing changed paths.
 
-      self._fs.unlock_file(self._acquired_assignment_lock_file)
-      self._acquired_assignment_id = None
-      self._acquired_assignment_lock_file = None
+    Args:
+      changed_paths: Iterable of paths relative to the root of the file system
+        or None if any file may have changed.
+    Returns:
+      Set of assignment directory paths or None if any assignment may have
+      changed.
+    """
+    if changed_paths is None:
+      return None
+    assignment_dirs = set()
+    for path in changed_paths:
+      components = file_system.posix_path(path).split('/')
+      if (len(components) >= _ASSIGNMENT_DIRECTORY_COMPONENTS and
+          components[0] == self._notification_dir):
+        assignment_dirs.add(
+            '/'.join(components[:_ASSIGNMENT_DIRECTORY_COMPONENTS]))
+    return assignment_dirs
 
   def _poll_assignments_and_episode_chunks(self):
     """Polls the notification dir using the metronome to dictate frequency."""
     try:
-      for _ in self._metronome.wait_for_tick():
-        callback = None
+      for changed_paths in self._metronome.wait_for_tick():
+        tick_start_time = time.monotonic()
+        callbacks = []
+        broadcast = False
+        changed_dirs = self._get_changed_assignment_directories(changed_paths)
 
         with self._acquired_assignment_in_process_lock:
-          if self._acquired_assignment_id:
-            self._fs.refresh_lock(
-                self._acquired_assignment_lock_file,
-                _ASSIGNMENT_EXPIRATION_SECONDS)
-
-            chunks = self._pop_episode_chunks(self._acquired_assignment_id)
+          acquired_dirs = set()
+          for assignment_id, acquired in self._acquired_assignments.items():
+            self._fs.refresh_lock(acquired.lock_file,
+                                  _ASSIGNMENT_EXPIRATION_SECONDS)
+            self._record_activity(assignment_id)
+
+            assignment_dir = file_system.posix_path(
+                self._get_assignment_directory(assignment_id))
+            acquired_dirs.add(assignment_dir)
+            chunks = None
+            if changed_dirs is None or assignment_dir in changed_dirs:
+              chunks = self._pop_episode_chunks(assignment_id)
 
             if chunks:
-              callback = lambda: self._chunk_callback(  # pylint: disable=g-long-lambda
-                  self._acquired_assignment_id, chunks)  # pylint: disable=cell-var-from-loop
-          else:
-            # TODO(b/185940506): List chunks for all assignments that aren't
-            # acquired by any other processes.
-            callback = lambda: [  # pylint: disable=g-long-lambda
-                self._assignment_callback(a)
-                for a in self._get_assignments_with_changes()]
-
-        if callback:
+              callbacks.append(functools.partial(
+                  self._chunk_callback, assignment_id, chunks))
+
+          if (len(self._acquired_assignments) <
+              self._max_acquired_assignments):
+            if changed_dirs is not None:
+              changed_dirs -= acquired_dirs
+            broadcast = changed_dirs is None or bool(changed_dirs)
+
+        if broadcast:
+          # TODO(b/185940506): List chunks for all assignments that aren't
+          # acquired by any other processes.
+          callbacks.extend(
+              functools.partial(self._assignment_callback, a)
+              for a in self._get_assignments_with_changes(changed_dirs))
+
+        self._metronome.report_tick(bool(callbacks))
+        self._tick_seconds += _TICK_COST_SMOOTHING * (
+            time.monotonic() - tick_start_time - self._tick_seconds)
+        for callback in callbacks:
           callback()
     except KeyboardInterrupt:
       pass
@@ -352,35 +676,44 @@ class AssignmentMonitor(_AssignmentMonitorBase):
     Returns:
       A list of resource ids for each episode chunk found.
     """
-    assert self._acquired_assignment_id == assignment_id
+    acquired = self._acquired_assignments[assignment_id]
 
     chunks = []
     files = self._fs.glob(os.path.join(
-        self._get_assignment_directory(assignment_id), 'chunk_*'))
-    files = sorted(list(set(files) - set(self._chunk_files_to_remove)))
-    self._chunk_files_to_remove.extend(files)
+        self._get_assignment_directory(assignment_id),
+        f'{{{_CHUNK_FILE_PREFIX},{_CHUNK_BATCH_FILE_PREFIX}}}*'))
+    files = sorted(list(set(files) - set(acquired.chunk_files_to_remove)))
+    acquired.chunk_files_to_remove.extend(files)
 
     for f in files:
-      id_parts = os.path.basename(f).split('_')
-      if len(id_parts) != 3 or id_parts[0] != 'chunk':
-        raise ValueError(f'Invalid chunk file {f}.')
-      episode_id, chunk_id = id_parts[1:]
+      filename = os.path.basename(f)
+      if filename.startswith(_CHUNK_BATCH_FILE_PREFIX):
+        names = [_CHUNK_FILE_PREFIX + line
+                 for line in self._fs.read_file(f).decode('utf-8').split()]
+      else:
+        names = [filename]
+      for name in names:
+        id_parts = name.split('_')
+        if len(id_parts) != 3 or id_parts[0] != 'chunk':
+          raise ValueError(f'Invalid chunk file {f}.')
+        episode_id, chunk_id = id_parts[1:]
 
-      try:
-        chunk_id = int(chunk_id)
-      except ValueError:
-        raise ValueError(f'Failed to parse {chunk_id} as an int, for file {f}.')
+        try:
+          chunk_id = int(chunk_id)
+        except ValueError:
+          raise ValueError(
+              f'Failed to parse {chunk_id} as an int, for file {f}.')
 
-      chunks.append(resource_id.FalkenResourceId(
-          project=assignment_id.project,
-          brain=assignment_id.brain,
-          session=assignment_id.session,
-          episode=episode_id,
-          chunk=int(chunk_id)))
+        chunks.append(resource_id.FalkenResourceId(
+            project=assignment_id.project,
+            brain=assignment_id.brain,
+            session=assignment_id.session,
+            episode=episode_id,
+            chunk=int(chunk_id)))
 
     return chunks
 
-  def _get_assignments_with_changes(self):
+  def _get_assignments_with_changes(self, assignment_dirs=None):
     """Gives a list of assignments that had additions to their chunks list.
 
     This allows for monitoring on all assignments; see comment at top of
@@ -393,28 +726,27 @@ class AssignmentMonitor(_AssignmentMonitorBase):
 
     Modifies the self._last_timestamp cache as a side-effect.
 
+    Args:
+      assignment_dirs: Assignment directories to check for changes or None to
+        check all assignments.
+
     Returns:
       List of resource ids for the assignments that have changed.
     """
-    assert self._acquired_assignment_id is None
-
-    assignment_dirs = self._fs.glob(os.path.join(
-        self._notification_dir,
-        str(resource_id.FalkenResourceId(
-            project='*', brain='*', session='*', assignment='*'))) + os.sep)
+    if assignment_dirs is None:
+      assignment_dirs = self._fs.glob(os.path.join(
+          self._notification_dir,
+          str(resource_id.FalkenResourceId(
+              project='*', brain='*', session='*', assignment='*'))) + os.sep)
+    else:
+      assignment_dirs = [d for d in sorted(assignment_dirs)
+                         if self._fs.exists(d)]
 
     assignment_ids_with_changes = []
     for assignment_dir in assignment_dirs:
       # Process only assignment dirs for assignments that haven't been acquired
       # by another process.
-      locked = True
-      try:
-        with self._fs.lock_file_context(assignment_dir):
-          locked = False
-      except file_system.UnableToLockFileError:
-        pass
-
-      if locked:
+      if self._fs.is_locked(self._get_assignment_lock_path(assignment_dir)):
         continue
 
       # Ignore chunk data we've already seen.
@@ -449,8 +781,33 @@ class AssignmentMonitor(_AssignmentMonitorBase):
 
     return assignment_ids_with_changes
 
+  def _get_notification_staleness(self, directory):
+    """Computes the millisecond staleness of a notification directory.
+
+    Args:
+      directory: Session or assignment notification directory.
+
+    Returns:
+      Milliseconds since the last activity recorded in the directory or None
+      if the directory doesn't exist.
+    """
+    try:
+      return self._fs.get_staleness(
+          os.path.join(directory, _ACTIVITY_FILENAME))
+    except FileNotFoundError:
+      pass
+    # Directories without an activity file were created by a notifier that
+    # didn't record activity, so they're walked.
+    try:
+      return self._fs.get_staleness(directory)
+    except FileNotFoundError:
+      return None
+
   def _cleanup(self):
-    """Remove assignment and session dirs that are stale."""
+    """Remove assignment and session dirs that are stale.
+
+    Runs in the background and stops early if the monitor is shut down.
+    """
     assignment_dirs = self._fs.glob(os.path.join(
         self._notification_dir,
         str(resource_id.FalkenResourceId(
@@ -461,7 +818,11 @@ class AssignmentMonitor(_AssignmentMonitorBase):
             project='*', brain='*', session='*'))))
 
     for d in assignment_dirs + session_dirs:
-      if self._fs.get_staleness(d) > 1000 * _NOTIFICATION_MAX_STALENESS_SECONDS:
+      if self._stop_cleanup.is_set():
+        return
+      staleness = self._get_notification_staleness(d)
+      if (staleness is not None and
+          staleness > 1000 * _NOTIFICATION_MAX_STALENESS_SECONDS):
         try:
           self._fs.remove_tree(d, ignore_errors=True)
         except FileNotFoundError:
@@ -17,6 +17,7 @@
 import os.path
 import tempfile
 import threading
+import time
 import types
 from unittest import mock
 
@@ -25,6 +26,7 @@ from absl.testing import parameterized
 
 from data_store import assignment_monitor
 from data_store import file_system
+from data_store import file_watcher
 from data_store import resource_id
 
 
@@ -61,11 +63,15 @@ class AssignmentMonitorTest(parameterized.TestCase):
     """Create a datastore object that uses a temporary directory."""
     super().setUp()
     self._temporary_directory = tempfile.TemporaryDirectory()
-    self._fs = file_system.FileSystem(self._temporary_directory.name)
+    self._fs = self._create_file_system(self._temporary_directory.name)
     self._monitor = assignment_monitor.AssignmentMonitor(
         self._fs, lambda x: None, lambda x, y: None)
     self._notifier = assignment_monitor.AssignmentNotifier(self._fs)
 
+  def _create_file_system(self, root_path):
+    """Creates the file system used by the test."""
+    return file_system.FileSystem(root_path)
+
   def tearDown(self):
     """Clean up the temporary directory and datastore."""
     super().tearDown()
@@ -217,6 +223,49 @@ class AssignmentMonitorTest(parameterized.TestCase):
     self._monitor.release_assignment()
     self.assertFalse(self._fs.exists(chunk_path))
 
+  @mock.patch.object(
+      assignment_monitor, '_Metronome', new=assignment_monitor._FakeMetronome)
+  def test_batched_notifications(self):
+    """Chunks notified together are reported together from a single file."""
+    assignments = []
+    chunks = []
+    callback_called = threading.Event()
+    def assignment_callback(assignment_id):
+      assignments.append(assignment_id)
+      callback_called.set()
+    def chunk_callback(assignment_id, chunk_ids):
+      chunks.append((assignment_id, chunk_ids))
+      callback_called.set()
+
+    self._monitor.shutdown()
+    self._monitor = assignment_monitor.AssignmentMonitor(
+        self._fs, assignment_callback, chunk_callback)
+    metronome = self._monitor._metronome
+    assignment_id = resource_id.FalkenResourceId(
+        project='p0', brain='b0', session='s0', assignment='a0')
+    chunk_ids = [
+        resource_id.FalkenResourceId(
+            project='p0', brain='b0', session='s0', episode=f'e{i % 2}',
+            chunk=i) for i in range(10)]
+    self._notifier.trigger_assignment_notifications(assignment_id, chunk_ids)
+    # Notifying the same chunks again before they're consumed has no effect.
+    self._notifier.trigger_assignment_notifications(assignment_id, chunk_ids)
+    self._notifier.trigger_assignment_notifications(assignment_id, [])
+    assignment_dir = self._monitor._get_assignment_directory(assignment_id)
+    self.assertLen(self._fs.glob(os.path.join(assignment_dir, '*')), 1)
+
+    metronome.force_tick()
+    self.assertTrue(callback_called.wait(3))
+    self.assertEqual(assignments, [assignment_id])
+    callback_called.clear()
+
+    self.assertTrue(self._monitor.acquire_assignment(assignment_id))
+    metronome.force_tick()
+    self.assertTrue(callback_called.wait(3))
+    self.assertEqual(chunks, [(assignment_id, chunk_ids)])
+    self._monitor.release_assignment()
+    self.assertEmpty(self._fs.glob(os.path.join(assignment_dir, '*')))
+
   @mock.patch.object(
       assignment_monitor, '_Metronome', new=assignment_monitor._FakeMetronome)
   def test_lock_refresh(self):
@@ -235,7 +284,7 @@ class AssignmentMonitorTest(parameterized.TestCase):
     assignment_id = resource_id.FalkenResourceId(
         project='p0', brain='b0', session='s0', assignment='a0')
     self.assertTrue(self._monitor.acquire_assignment(assignment_id))
-    lock = self._monitor._acquired_assignment_lock_file
+    lock = self._monitor._acquired_assignments[assignment_id].lock_file
 
     self._fs.refresh_lock.assert_not_called()
     for _ in range(3):
@@ -250,6 +299,166 @@ class AssignmentMonitorTest(parameterized.TestCase):
     self._monitor = None
     self._fs.refresh_lock.assert_not_called()
 
+  def test_acquire_multiple(self):
+    """Tests a monitor can hold up to max_acquired_assignments leases."""
+    self._monitor.shutdown()
+    self._monitor = assignment_monitor.AssignmentMonitor(
+        self._fs, lambda x: None, lambda x, y: None,
+        max_acquired_assignments=2)
+    second_monitor = assignment_monitor.AssignmentMonitor(
+        self._fs, lambda x: None, lambda x, y: None)
+    assignment_ids = [
+        resource_id.FalkenResourceId(
+            project='p0', brain='b0', session='s0', assignment=f'a{i}')
+        for i in range(3)]
+
+    self.assertTrue(self._monitor.acquire_assignment(assignment_ids[0]))
+    with self.assertRaises(ValueError):
+      self._monitor.acquire_assignment(assignment_ids[0])
+    self.assertTrue(self._monitor.acquire_assignment(assignment_ids[1]))
+    with self.assertRaises(ValueError):
+      self._monitor.acquire_assignment(assignment_ids[2])
+    self.assertFalse(second_monitor.acquire_assignment(assignment_ids[1]))
+
+    self._monitor.release_assignment(assignment_ids[1])
+    with self.assertRaises(ValueError):
+      self._monitor.release_assignment(assignment_ids[1])
+    self._monitor.release_assignment(assignment_ids[1],
+                                     raise_if_none_acquired=False)
+    self.assertTrue(second_monitor.acquire_assignment(assignment_ids[1]))
+    self.assertTrue(self._monitor.acquire_assignment(assignment_ids[2]))
+    second_monitor.release_assignment()
+    self.assertFalse(second_monitor.acquire_assignment(assignment_ids[0]))
+
+    # Releasing without an assignment id releases all assignments.
+    self._monitor.release_assignment()
+    self.assertTrue(second_monitor.acquire_assignment(assignment_ids[0]))
+    self.assertTrue(self._monitor.acquire_assignment(assignment_ids[2]))
+    second_monitor.shutdown()
+
+  def test_invalid_max_acquired_assignments(self):
+    with self.assertRaises(ValueError):
+      assignment_monitor.AssignmentMonitor(
+          self._fs, lambda x: None, lambda x, y: None,
+          max_acquired_assignments=0)
+
+  @mock.patch.object(
+      assignment_monitor, '_Metronome', new=assignment_monitor._FakeMetronome)
+  def test_callbacks_multiple_acquired(self):
+    """Chunks are reported per acquired assignment."""
+    assignments = []
+    chunks = []
+    called = threading.Semaphore(0)
+    def assignment_callback(assignment_id):
+      assignments.append(assignment_id)
+      called.release()
+    def chunk_callback(assignment_id, chunk_ids):
+      chunks.append((assignment_id, chunk_ids))
+      called.release()
+
+    self._monitor.shutdown()
+    self._monitor = assignment_monitor.AssignmentMonitor(
+        self._fs, assignment_callback, chunk_callback,
+        max_acquired_assignments=2)
+    metronome = self._monitor._metronome
+    refreshed = threading.Semaphore(0)
+    self._fs.refresh_lock = mock.Mock(
+        side_effect=lambda *unused_args: refreshed.release())
+
+    assignment_ids = [
+        resource_id.FalkenResourceId(
+            project='p0', brain='b0', session=f's{i}', assignment='a0')
+        for i in range(3)]
+    chunk_ids = [
+        resource_id.FalkenResourceId(
+            project='p0', brain='b0', session=f's{i}', episode='e0', chunk=0)
+        for i in range(3)]
+    for assignment_id, chunk_id in zip(assignment_ids, chunk_ids):
+      self._notifier.trigger_assignment_notification(assignment_id, chunk_id)
+
+    # While below capacity, other assignments are still reported.
+    self.assertTrue(self._monitor.acquire_assignment(assignment_ids[0]))
+    metronome.force_tick()
+    for _ in range(3):
+      self.assertTrue(called.acquire(timeout=3))
+    self.assertTrue(refreshed.acquire(timeout=3))
+    self.assertEqual(chunks, [(assignment_ids[0], [chunk_ids[0]])])
+    self.assertCountEqual(assignments, assignment_ids[1:])
+    chunks.clear()
+    assignments.clear()
+
+    # At capacity, only the acquired assignments are reported.
+    self.assertTrue(self._monitor.acquire_assignment(assignment_ids[1]))
+    self._notifier.trigger_assignment_notification(
+        assignment_ids[2], resource_id.FalkenResourceId(
+            project='p0', brain='b0', session='s2', episode='e0', chunk=1))
+    metronome.force_tick()
+    self.assertTrue(called.acquire(timeout=3))
+    # Lock refreshes of the next tick happen after all callbacks of the
+    # previous tick returned.
+    metronome.force_tick()
+    for _ in range(4):
+      self.assertTrue(refreshed.acquire(timeout=3))
+    self.assertEqual(chunks, [(assignment_ids[1], [chunk_ids[1]])])
+    self.assertEmpty(assignments)
+
+    self._monitor.release_assignment()
+
+  @absltest.skipUnless(file_watcher._LIBC, 'inotify is not supported.')
+  @mock.patch.object(assignment_monitor, '_IDLE_SCAN_SECONDS', 600)
+  def test_callbacks_on_change(self):
+    """Tests that changes are reported without polling."""
+    assignments = []
+    chunks = []
+    callback_called = threading.Event()
+    def assignment_callback(assignment_id):
+      assignments.append(assignment_id)
+      callback_called.set()
+    def chunk_callback(assignment_id, chunk_ids):
+      chunks.append((assignment_id, chunk_ids))
+      callback_called.set()
+
+    scanned = threading.Event()
+    get_assignments_with_changes = (
+        assignment_monitor.AssignmentMonitor._get_assignments_with_changes)
+    def scan(monitor, assignment_dirs=None):
+      assignment_ids = get_assignments_with_changes(monitor, assignment_dirs)
+      scanned.set()
+      return assignment_ids
+
+    self._monitor.shutdown()
+    with mock.patch.object(
+        assignment_monitor.AssignmentMonitor, '_get_assignments_with_changes',
+        autospec=True, side_effect=scan) as scan_mock:
+      self._monitor = assignment_monitor.AssignmentMonitor(
+          self._fs, assignment_callback, chunk_callback,
+          notification_frequency=100)
+      # Wait for the initial scan of all assignments.
+      self.assertTrue(scanned.wait(3))
+      scan_mock.assert_called_once_with(self._monitor, None)
+
+      assignment_id = resource_id.FalkenResourceId(
+          project='p0', brain='b0', session='s0', assignment='a0')
+      self._notifier.trigger_assignment_notification(
+          assignment_id, resource_id.FalkenResourceId(
+              project='p0', brain='b0', session='s0', episode='e0', chunk=0))
+      self.assertTrue(callback_called.wait(3))
+      self.assertEqual(assignments, [assignment_id])
+      # Only the assignment that changed was scanned.
+      scan_mock.assert_called_with(
+          self._monitor,
+          {self._monitor._get_assignment_directory(assignment_id)})
+    callback_called.clear()
+
+    self.assertTrue(self._monitor.acquire_assignment(assignment_id))
+    chunk_id = resource_id.FalkenResourceId(
+        project='p0', brain='b0', session='s0', episode='e0', chunk=1)
+    self.assertTrue(callback_called.wait(3))
+    callback_called.clear()
+    self._notifier.trigger_assignment_notification(assignment_id, chunk_id)
+    self.assertTrue(callback_called.wait(3))
+    self.assertEqual(chunks[-1], (assignment_id, [chunk_id]))
+
   def test_cleanup_cleans_stale(self):
     notifier = assignment_monitor.AssignmentNotifier(self._fs)
     notifier.trigger_assignment_notification(
@@ -267,8 +476,15 @@ class AssignmentMonitorTest(parameterized.TestCase):
       # Always return a stale result.
       staleness_mock.return_value = (
           assignment_monitor._NOTIFICATION_MAX_STALENESS_SECONDS * 1000 + 1)
-      assignment_monitor.AssignmentMonitor(
+      monitor = assignment_monitor.AssignmentMonitor(
           self._fs, lambda x: None, lambda x: None)
+      monitor._cleanup_thread.join()
+      monitor.shutdown()
+      # Staleness is read from activity files rather than walking the
+      # notification directories.
+      staleness_mock.assert_any_call(os.path.join(
+          notifier._notification_dir,
+          'projects/p0/brains/b0/sessions/s0/.activity'))
 
     # Check that session was deleted.
     self.assertFalse(self._fs.exists(
@@ -298,10 +514,165 @@ class AssignmentMonitorTest(parameterized.TestCase):
     self._monitor.shutdown()
     self._monitor = assignment_monitor.AssignmentMonitor(
         self._fs, lambda x: None, lambda x: None)
+    self._monitor._cleanup_thread.join()
 
     self.assertTrue(self._fs.exists(
         notifier._get_assignment_directory(assignment_resource_id)))
 
+  def test_cleanup_walks_directories_without_activity(self):
+    """Directories without activity files are cleaned up when stale."""
+    session_dir = os.path.join(self._monitor._notification_dir,
+                               'projects/p0/brains/b0/sessions/s0')
+    self._fs.write_file(os.path.join(session_dir, 'assignments/a0/chunk_e0_0'),
+                        b'')
+    with mock.patch.object(self._fs, 'get_staleness',
+                           wraps=self._fs.get_staleness) as staleness_mock:
+      monitor = assignment_monitor.AssignmentMonitor(
+          self._fs, lambda x: None, lambda x: None)
+      monitor._cleanup_thread.join()
+      monitor.shutdown()
+      staleness_mock.assert_any_call(session_dir)
+    self.assertTrue(self._fs.exists(session_dir))
+
+  @mock.patch.object(assignment_monitor.time, 'monotonic')
+  def test_activity_writes_are_limited(self, monotonic_mock):
+    # The monitor's metronome also reads the mocked clock.
+    self._monitor.shutdown()
+    self._monitor = None
+    monotonic_mock.return_value = 1000
+    notifier = assignment_monitor.AssignmentNotifier(self._fs)
+    assignment_id = resource_id.FalkenResourceId(
+        'projects/p0/brains/b0/sessions/s0/assignments/a0')
+    activity_path = os.path.join(
+        notifier._get_assignment_directory(assignment_id), '.activity')
+    with mock.patch.object(self._fs, 'write_file',
+                           wraps=self._fs.write_file) as write_file:
+      for chunk in range(3):
+        notifier.trigger_assignment_notification(
+            assignment_id, resource_id.FalkenResourceId(
+                project='p0', brain='b0', session='s0', episode='e0',
+                chunk=chunk))
+      self.assertEqual(
+          [c for c in write_file.call_args_list if c[0][0] == activity_path],
+          [mock.call(activity_path, b'')])
+      write_file.reset_mock()
+      monotonic_mock.return_value += (
+          assignment_monitor._ACTIVITY_WRITE_INTERVAL_SECONDS)
+      notifier.trigger_assignment_notification(
+          assignment_id, resource_id.FalkenResourceId(
+              project='p0', brain='b0', session='s0', episode='e0', chunk=3))
+      write_file.assert_any_call(activity_path, b'')
+
+
+  @mock.patch.object(
+      assignment_monitor, '_Metronome', new=assignment_monitor._FakeMetronome)
+  def test_polling_stats(self):
+    self._monitor.shutdown()
+    self._monitor = assignment_monitor.AssignmentMonitor(
+        self._fs, lambda x: None, lambda x, y: None,
+        notification_frequency=10)
+    self.assertEqual(self._monitor.polling_stats,
+                     assignment_monitor.PollingStats(frequency=10,
+                                                     tick_seconds=0.0))
+    self._fs.refresh_lock = mock.Mock()
+    self.assertTrue(self._monitor.acquire_assignment(
+        resource_id.FalkenResourceId(
+            project='p0', brain='b0', session='s0', assignment='a0')))
+    refreshed = threading.Event()
+    self._fs.refresh_lock.side_effect = lambda *unused_args: refreshed.set()
+    self._monitor._metronome.force_tick()
+    self.assertTrue(refreshed.wait(3))
+    self._monitor.shutdown()
+    self._monitor = None
+
+  def test_polling_watcher(self):
+    self._monitor.shutdown()
+    with mock.patch.object(self._fs, 'watch', wraps=self._fs.watch) as watch:
+      self._monitor = assignment_monitor.AssignmentMonitor(
+          self._fs, lambda x: None, lambda x, y: None,
+          notification_frequency=10, watcher_kind=file_watcher.POLLING)
+      watch.assert_called_once_with(mock.ANY, 0.1, file_watcher.POLLING)
+    self.assertIsInstance(self._monitor._watcher,
+                          file_watcher.PollingFileWatcher)
+
+  def test_invalid_min_notification_frequency(self):
+    with self.assertRaises(ValueError):
+      assignment_monitor.AssignmentMonitor(
+          self._fs, lambda x: None, lambda x, y: None,
+          min_notification_frequency=(
+              0.5 / assignment_monitor._IDLE_SCAN_SECONDS))
+
+
+class MetronomeTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self._watcher = file_watcher.PollingFileWatcher(0.01)
+    # Backs off from 100Hz down to 5Hz.
+    self._metronome = assignment_monitor._Metronome(100, self._watcher, 5)
+
+  def tearDown(self):
+    self._metronome.stop()
+    self._watcher.close()
+    super().tearDown()
+
+  def test_invalid_frequencies(self):
+    with self.assertRaises(ValueError):
+      assignment_monitor._Metronome(0, self._watcher)
+    with self.assertRaises(ValueError):
+      assignment_monitor._Metronome(10, self._watcher, 20)
+    with self.assertRaises(ValueError):
+      assignment_monitor._Metronome(10, self._watcher, 0)
+
+  def test_backoff(self):
+    frequencies = []
+    for _ in range(6):
+      self._metronome.report_tick(False)
+      frequencies.append(self._metronome.frequency)
+    self.assertEqual(frequencies, [50, 25, 12.5, 6.25, 5, 5])
+    self._metronome.report_tick(True)
+    self.assertEqual(self._metronome.frequency, 100)
+    self._metronome.report_tick(False)
+    self._metronome.request_full_scan()
+    self.assertEqual(self._metronome.frequency, 100)
+
+  def test_no_backoff_without_min_frequency(self):
+    metronome = assignment_monitor._Metronome(100, self._watcher)
+    metronome.report_tick(False)
+    self.assertEqual(metronome.frequency, 100)
+
+  def test_ticks_back_off(self):
+    ticks = self._metronome.wait_for_tick()
+    next(ticks)
+    for _ in range(5):
+      self._metronome.report_tick(False)
+    start_time = time.monotonic()
+    next(ticks)
+    self.assertGreaterEqual(time.monotonic() - start_time, 0.19)
+
+  def test_full_scan_interrupts_backoff(self):
+    metronome = assignment_monitor._Metronome(100, self._watcher, 0.1)
+    ticks = metronome.wait_for_tick()
+    next(ticks)
+    for _ in range(10):
+      metronome.report_tick(False)
+    start_time = time.monotonic()
+    timer = threading.Timer(0.05, metronome.request_full_scan)
+    timer.start()
+    self.assertIsNone(next(ticks))
+    self.assertLess(time.monotonic() - start_time, 5)
+    timer.join()
+    metronome.stop()
+
+
+class FcntlLockAssignmentMonitorTest(AssignmentMonitorTest):
+  """Test AssignmentMonitor with the fcntl lock backend."""
+
+  def _create_file_system(self, root_path):
+    """Creates a file system that locks files with flock()."""
+    return file_system.FileSystem(
+        root_path, lock_backend=file_system.LOCK_BACKEND_FCNTL)
+
 
 if __name__ == '__main__':
   absltest.main()
@@ -0,0 +1,408 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Lint as: python3
+"""Benchmarks the data store with synthetic workloads.
+
+Usage:
+  python -m data_store.benchmark --scales 1000 --scales 100000 \
+      --output results.jsonl
+
+For each scale a data store is populated with a project, a brain and enough
+sessions, episodes and chunks to reach the requested number of resources.
+Then the latency of writes, reads, paginated listings, globs,
+get_most_recent() and assignment notifications is measured. Each
+measurement is written as a line of JSON so results of different storage
+engines and revisions can be compared.
+"""
+
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from absl import app
+from absl import flags
+from data_store import assignment_monitor
+from data_store import data_store as data_store_module
+from data_store import file_system
+from data_store import resource_id
+from data_store import resource_store
+from data_store import segment_store
+from data_store import sqlite_file_system
+
+# pylint: disable=g-bad-import-order
+import common.generate_protos  # pylint: disable=unused-import
+import data_store_pb2
+import episode_pb2
+import observation_pb2
+import primitives_pb2
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_multi_integer(
+    'scales', [1000, 10000],
+    'Number of resources to populate the data store with for each run.')
+flags.DEFINE_string(
+    'root_dir', None,
+    'Directory to create the data stores in. Defaults to a temporary '
+    'directory that is removed after the benchmark.')
+flags.DEFINE_enum(
+    'storage_engine', 'file', sqlite_file_system.STORAGE_ENGINES,
+    'Storage engine to benchmark.')
+flags.DEFINE_float('listing_cache_seconds', 0,
+                   'Seconds the "file" storage engine reuses directory '
+                   'listings.')
+flags.DEFINE_enum('lock_backend', file_system.LOCK_BACKEND_FLUFL,
+                  file_system.LOCK_BACKENDS,
+                  'How the "file" storage engine locks files.')
+flags.DEFINE_bool('resource_index', True,
+                  'Whether the data store uses a resource index.')
+flags.DEFINE_bool('episode_chunk_segments', False,
+                  'Whether episode chunks are appended to segments.')
+flags.DEFINE_enum('resource_compression', 'zlib',
+                  data_store_module.CODEC_NAMES,
+                  'Codec used to compress episode chunks.')
+flags.DEFINE_integer('chunks_per_session', 100,
+                     'Number of episode chunks written to each session.')
+flags.DEFINE_integer('chunks_per_episode', 10,
+                     'Number of chunks in each episode.')
+flags.DEFINE_integer('steps_per_chunk', 10,
+                     'Number of steps in each episode chunk.')
+flags.DEFINE_integer('write_batch_size', 100,
+                     'Number of chunks written by each write_many() call.')
+flags.DEFINE_integer('samples', 200,
+                     'Number of reads, listings and get_most_recent() calls '
+                     'to measure.')
+flags.DEFINE_integer('page_size', 100, 'Page size of paginated listings.')
+flags.DEFINE_integer('notifications', 20,
+                     'Number of assignment notifications to measure.')
+flags.DEFINE_string(
+    'output', None,
+    'File to write JSON results to, one measurement per line. Defaults to '
+    'stdout.')
+
+_PROJECT_ID = 'benchmark_project'
+_BRAIN_ID = 'benchmark_brain'
+
+# Seconds to wait for an assignment notification before giving up.
+_NOTIFICATION_TIMEOUT_SECONDS = 30
+
+
+def _percentile(sorted_values, fraction):
+  """Returns a percentile of a sorted list of values."""
+  return sorted_values[min(len(sorted_values) - 1,
+                           int(fraction * len(sorted_values)))]
+
+
+def summarize(benchmark, scale, latencies, operations_per_sample=1):
+  """Summarizes latency measurements.
+
+  Args:
+    benchmark: Name of the benchmark.
+    scale: Number of resources in the data store.
+    latencies: List of seconds taken by each sample.
+    operations_per_sample: Number of operations performed by each sample,
+      e.g. the number of resources written by a batch.
+
+  Returns:
+    Dictionary of results that can be serialized as JSON.
+  """
+  latencies = sorted(latencies)
+  total_seconds = sum(latencies)
+  operations = len(latencies) * operations_per_sample
+  result = {
+      'benchmark': benchmark,
+      'scale': scale,
+      'samples': len(latencies),
+      'operations': operations,
+      'total_seconds': total_seconds,
+      'operations_per_second': (
+          operations / total_seconds if total_seconds else None),
+  }
+  for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99),
+                         ('max', 1.0)):
+    result[f'{name}_ms'] = (
+        1000 * _percentile(latencies, fraction) if latencies else None)
+  return result
+
+
+def _create_chunk(session_id, episode_id, chunk_id, steps):
+  """Creates a synthetic episode chunk.
+
+  Args:
+    session_id: ID of the session of the chunk.
+    episode_id: ID of the episode of the chunk.
+    chunk_id: Index of the chunk in the episode.
+    steps: Number of steps in the chunk.
+
+  Returns:
+    A data_store_pb2.EpisodeChunk.
+  """
+  return data_store_pb2.EpisodeChunk(
+      project_id=_PROJECT_ID, brain_id=_BRAIN_ID, session_id=session_id,
+      episode_id=episode_id, chunk_id=chunk_id,
+      data=episode_pb2.EpisodeChunk(
+          episode_id=episode_id, chunk_id=chunk_id,
+          steps=[episode_pb2.Step(
+              timestamp_millis=i,
+              observation=observation_pb2.ObservationData(
+                  player=observation_pb2.Entity(
+                      position=primitives_pb2.Position(
+                          x=random.random(), y=random.random(),
+                          z=random.random()))),
+              reward=episode_pb2.Reward(reward_value=random.random()))
+                 for i in range(steps)]))
+
+
+class Benchmark:
+  """Populates a data store and measures operations on it."""
+
+  def __init__(self, root_dir, scale, storage_engine='file',
+               resource_index=True, episode_chunk_segments=False,
+               resource_compression='zlib', chunks_per_session=100,
+               chunks_per_episode=10, steps_per_chunk=10,
+               write_batch_size=100, samples=200, page_size=100,
+               notifications=20, listing_cache_seconds=0,
+               lock_backend=file_system.LOCK_BACKEND_FLUFL):
+    """Initializes the benchmark.
+
+    Args:
+      root_dir: Empty directory to create the data store in.
+      scale: Number of resources to populate the data store with.
+      storage_engine: One of sqlite_file_system.STORAGE_ENGINES.
+      resource_index: Whether the data store uses a resource index.
+      episode_chunk_segments: Whether episode chunks are appended to segments.
+      resource_compression: One of data_store.CODEC_NAMES.
+      chunks_per_session: Number of episode chunks written to each session.
+      chunks_per_episode: Number of chunks in each episode.
+      steps_per_chunk: Number of steps in each episode chunk.
+      write_batch_size: Number of chunks written by each write_many() call.
+      samples: Number of reads, listings and get_most_recent() calls to
+        measure.
+      page_size: Page size of paginated listings.
+      notifications: Number of assignment notifications to measure.
+      listing_cache_seconds: Seconds the "file" storage engine reuses
+        directory listings.
+      lock_backend: One of file_system.LOCK_BACKENDS.
+    """
+    self._scale = scale
+    self._chunks_per_session = chunks_per_session
+    self._chunks_per_episode = chunks_per_episode
+    self._steps_per_chunk = steps_per_chunk
+    self._write_batch_size = write_batch_size
+    self._samples = samples
+    self._page_size = page_size
+    self._notifications = notifications
+    self._fs = sqlite_file_system.create_file_system(
+        root_dir, storage_engine, listing_cache_seconds=listing_cache_seconds,
+        lock_backend=lock_backend)
+    segments = None
+    if episode_chunk_segments:
+      segments = segment_store.SegmentStore(self._fs)
+    self._data_store = data_store_module.DataStore(
+        self._fs,
+        resource_index=(
+            resource_store.ResourceIndex() if resource_index else None),
+        segments=segments,
+        codecs=data_store_module.create_codecs(resource_compression))
+    self._session_ids = []
+    self._chunk_ids = []
+
+  def _time(self, function, *args, **kwargs):
+    """Returns the seconds taken to call a function."""
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+  def populate(self):
+    """Writes sessions and episode chunks to the data store.
+
+    Returns:
+      Results of the session and chunk writes.
+    """
+    self._data_store.write(data_store_pb2.Project(project_id=_PROJECT_ID))
+    self._data_store.write(data_store_pb2.Brain(project_id=_PROJECT_ID,
+                                                brain_id=_BRAIN_ID))
+    session_count = max(1, self._scale // (self._chunks_per_session + 1))
+    chunk_count = max(0, self._scale - session_count - 2)
+    session_latencies = []
+    for i in range(session_count):
+      session_id = f'session{i:08d}'
+      self._session_ids.append(session_id)
+      session_latencies.append(self._time(
+          self._data_store.write, data_store_pb2.Session(
+              project_id=_PROJECT_ID, brain_id=_BRAIN_ID,
+              session_id=session_id)))
+
+    chunks = []
+    for i in range(chunk_count):
+      session_id = self._session_ids[
+          i // self._chunks_per_session % session_count]
+      index_in_session = i % self._chunks_per_session
+      chunks.append(_create_chunk(
+          session_id, f'episode{index_in_session // self._chunks_per_episode}',
+          index_in_session % self._chunks_per_episode,
+          self._steps_per_chunk))
+    chunk_latencies = []
+    for start in range(0, len(chunks), self._write_batch_size):
+      batch = chunks[start:start + self._write_batch_size]
+      begin = time.perf_counter()
+      self._chunk_ids.extend(self._data_store.write_many(batch))
+      # Record the average latency of each chunk in the batch.
+      chunk_latencies.extend(
+          [(time.perf_counter() - begin) / len(batch)] * len(batch))
+    return [summarize('write_session', self._scale, session_latencies),
+            summarize('write_chunk', self._scale, chunk_latencies)]
+
+  def read(self):
+    """Measures reads of random episode chunks."""
+    latencies = [self._time(self._data_store.read, chunk_id)
+                 for chunk_id in random.choices(self._chunk_ids,
+                                                k=self._samples)]
+    return summarize('read_chunk', self._scale, latencies)
+
+  def read_session_chunks(self):
+    """Measures listing and reading all chunks of a session."""
+    latencies = []
+    for session_id in random.choices(self._session_ids, k=self._samples):
+      start = time.perf_counter()
+      chunk_ids, _ = self._data_store.list_by_proto_ids(
+          project_id=_PROJECT_ID, brain_id=_BRAIN_ID, session_id=session_id,
+          episode_id='*', chunk_id='*')
+      self._data_store.read_many(chunk_ids)
+      latencies.append(time.perf_counter() - start)
+    return summarize('read_session_chunks', self._scale, latencies)
+
+  def list_pages(self):
+    """Measures paginated listing of all chunks of the brain."""
+    latencies = []
+    # Listing past the last page returns an empty token, so listing restarts
+    # from the first page until enough samples are collected.
+    token = None
+    while len(latencies) < self._samples:
+      start = time.perf_counter()
+      _, token = self._data_store.list_by_proto_ids(
+          project_id=_PROJECT_ID, brain_id=_BRAIN_ID, session_id='*',
+          episode_id='*', chunk_id='*', page_size=self._page_size,
+          page_token=token)
+      latencies.append(time.perf_counter() - start)
+    return summarize('list_chunk_page', self._scale, latencies)
+
+  def glob(self):
+    """Measures globs of the sessions of the brain."""
+    pattern = str(self._data_store.resource_id_from_proto_ids(
+        project_id=_PROJECT_ID, brain_id=_BRAIN_ID, session_id='*')) + '/*'
+    latencies = [self._time(self._fs.glob, pattern)
+                 for _ in range(self._samples)]
+    return summarize('glob_sessions', self._scale, latencies)
+
+  def get_most_recent(self):
+    """Measures get_most_recent() of the sessions of the brain."""
+    res_id_glob = self._data_store.resource_id_from_proto_ids(
+        project_id=_PROJECT_ID, brain_id=_BRAIN_ID, session_id='*')
+    latencies = [self._time(self._data_store.get_most_recent, res_id_glob)
+                 for _ in range(self._samples)]
+    return summarize('get_most_recent_session', self._scale, latencies)
+
+  def notify(self):
+    """Measures latency from triggering to receiving assignment notifications.
+
+    Returns:
+      Results of the notifications or None if a notification was not received.
+    """
+    notified = threading.Event()
+    monitor = assignment_monitor.AssignmentMonitor(
+        self._fs, lambda unused_assignment_id: notified.set(),
+        lambda unused_assignment_id, unused_chunks: None,
+        notification_frequency=100)
+    notifier = assignment_monitor.AssignmentNotifier(self._fs)
+    latencies = []
+    try:
+      for i in range(self._notifications):
+        session_id = self._session_ids[i % len(self._session_ids)]
+        assignment_id = resource_id.FalkenResourceId(
+            project=_PROJECT_ID, brain=_BRAIN_ID, session=session_id,
+            assignment=f'assignment{i}')
+        chunk_id = resource_id.FalkenResourceId(
+            project=_PROJECT_ID, brain=_BRAIN_ID, session=session_id,
+            episode=f'notification{i}', chunk=0)
+        notified.clear()
+        start = time.perf_counter()
+        notifier.trigger_assignment_notification(assignment_id, chunk_id)
+        if not notified.wait(_NOTIFICATION_TIMEOUT_SECONDS):
+          return None
+        latencies.append(time.perf_counter() - start)
+    finally:
+      monitor.shutdown()
+    return summarize('assignment_notification', self._scale, latencies)
+
+  def run(self):
+    """Populates the data store and runs all benchmarks.
+
+    Returns:
+      List of results.
+    """
+    results = self.populate()
+    results.extend([self.read(), self.read_session_chunks(),
+                    self.list_pages(), self.glob(), self.get_most_recent()])
+    notification_results = self.notify()
+    if notification_results:
+      results.append(notification_results)
+    return results
+
+
+def main(argv):
+  if len(argv) > 1:
+    raise app.UsageError('Too many command-line arguments.')
+  temporary_directory = None
+  root_dir = FLAGS.root_dir
+  if not root_dir:
+    temporary_directory = tempfile.TemporaryDirectory()
+    root_dir = temporary_directory.name
+  configuration = {
+      'storage_engine': FLAGS.storage_engine,
+      'resource_index': FLAGS.resource_index,
+      'episode_chunk_segments': FLAGS.episode_chunk_segments,
+      'resource_compression': FLAGS.resource_compression,
+      'listing_cache_seconds': FLAGS.listing_cache_seconds,
+      'lock_backend': FLAGS.lock_backend,
+  }
+  output = open(FLAGS.output, 'w') if FLAGS.output else sys.stdout
+  try:
+    for scale in FLAGS.scales:
+      benchmark = Benchmark(
+          os.path.join(root_dir, f'scale_{scale}'), scale,
+          chunks_per_session=FLAGS.chunks_per_session,
+          chunks_per_episode=FLAGS.chunks_per_episode,
+          steps_per_chunk=FLAGS.steps_per_chunk,
+          write_batch_size=FLAGS.write_batch_size, samples=FLAGS.samples,
+          page_size=FLAGS.page_size, notifications=FLAGS.notifications,
+          **configuration)
+      for result in benchmark.run():
+        result.update(configuration)
+        output.write(json.dumps(result) + '\n')
+        output.flush()
+  finally:
+    if output is not sys.stdout:
+      output.close()
+    if temporary_directory:
+      temporary_directory.cleanup()
+
+
+if __name__ == '__main__':
+  app.run(main)
@@ -0,0 +1,72 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the data store benchmark."""
+
+import tempfile
+
+from absl.testing import absltest
+from absl.testing import parameterized
+from data_store import benchmark
+
+
+class BenchmarkTest(parameterized.TestCase):
+
+  def setUp(self):
+    """Create a temporary directory for the data store."""
+    super().setUp()
+    self._temporary_directory = tempfile.TemporaryDirectory()
+
+  def tearDown(self):
+    """Clean up the temporary directory."""
+    super().tearDown()
+    self._temporary_directory.cleanup()
+
+  def test_summarize(self):
+    result = benchmark.summarize('write', 10, [0.004, 0.001, 0.002, 0.003],
+                                 operations_per_sample=2)
+    self.assertEqual(result['benchmark'], 'write')
+    self.assertEqual(result['scale'], 10)
+    self.assertEqual(result['samples'], 4)
+    self.assertEqual(result['operations'], 8)
+    self.assertAlmostEqual(result['total_seconds'], 0.01)
+    self.assertAlmostEqual(result['operations_per_second'], 800)
+    self.assertAlmostEqual(result['p50_ms'], 3)
+    self.assertAlmostEqual(result['max_ms'], 4)
+
+  @parameterized.parameters(
+      {'storage_engine': 'file'},
+      {'storage_engine': 'sqlite'},
+      {'storage_engine': 'file', 'episode_chunk_segments': True,
+       'resource_compression': 'none'})
+  def test_run(self, **kwargs):
+    results = benchmark.Benchmark(
+        self._temporary_directory.name, 50, chunks_per_session=10,
+        chunks_per_episode=5, steps_per_chunk=2, write_batch_size=7,
+        samples=3, page_size=4, notifications=2, **kwargs).run()
+    results_by_name = {r['benchmark']: r for r in results}
+    self.assertCountEqual(
+        results_by_name,
+        ['write_session', 'write_chunk', 'read_chunk', 'read_session_chunks',
+         'list_chunk_page', 'glob_sessions', 'get_most_recent_session',
+         'assignment_notification'])
+    # 2 resources are the project and brain.
+    self.assertEqual(results_by_name['write_session']['operations'] +
+                     results_by_name['write_chunk']['operations'], 48)
+    self.assertEqual(results_by_name['read_chunk']['samples'], 3)
+    self.assertEqual(results_by_name['assignment_notification']['samples'], 2)
+
+
+if __name__ == '__main__':
+  absltest.main()
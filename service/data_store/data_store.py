@@ -15,18 +15,27 @@
 # Lint as: python3
 """Business logic to access Falken objects in the data store."""
 
+import abc
 import hashlib
 from typing import Dict, Optional, Union, Tuple, Type
+import zlib
 
 from data_store import file_system
+from data_store import manifest_store
 from data_store import resource_id
 from data_store import resource_store
+from data_store import segment_store
 from log import falken_logging
 
 # pylint: disable=g-bad-import-order
 import common.generate_protos  # pylint: disable=unused-import
 import data_store_pb2
 
+try:
+  import zstandard  # pylint: disable=g-import-not-at-top
+except ImportError:
+  zstandard = None
+
 
 NotFoundError = resource_store.NotFoundError
 
@@ -35,9 +44,11 @@ DatastoreProto = Union[
     data_store_pb2.Assignment,
     data_store_pb2.Brain,
     data_store_pb2.EpisodeChunk,
+    data_store_pb2.EpisodeSummary,
     data_store_pb2.Model,
     data_store_pb2.OfflineEvaluation,
     data_store_pb2.OnlineEvaluation,
+    data_store_pb2.OnlineEvaluationSummary,
     data_store_pb2.Project,
     data_store_pb2.Session,
     data_store_pb2.SerializedModel,
@@ -60,12 +71,151 @@ _PROTO_BY_COLLECTION_ID = {
 _PROTO_BY_ATTRIBUTE_ID = {
     'serialized_model': data_store_pb2.SerializedModel,
     'online_evaluation': data_store_pb2.OnlineEvaluation,
+    'episode_summary': data_store_pb2.EpisodeSummary,
+    'online_evaluation_summary': data_store_pb2.OnlineEvaluationSummary,
+}
+
+# Prefix of compressed resources, followed by the ID of the codec. Serialized
+# protos never start with 0xff as the first byte would encode the invalid wire
+# type 7, so compressed and uncompressed resources can coexist.
+_CODEC_MAGIC = b'\xffFC'
+
+
+class Codec(abc.ABC):
+  """Compresses and decompresses encoded resources."""
+
+  # Single byte that identifies the codec in the header of compressed
+  # resources.
+  codec_id = None
+
+  @abc.abstractmethod
+  def compress(self, data: bytes) -> bytes:
+    """Compresses data."""
+    raise NotImplementedError()
+
+  @abc.abstractmethod
+  def decompress(self, data: bytes) -> bytes:
+    """Decompresses data returned by compress()."""
+    raise NotImplementedError()
+
+
+class ZlibCodec(Codec):
+  """Compresses resources using zlib."""
+
+  codec_id = b'z'
+
+  def __init__(self, level: int = 6):
+    """Initializes the codec.
+
+    Args:
+      level: zlib compression level from 1 (fastest) to 9 (smallest).
+    """
+    self._level = level
+
+  def compress(self, data: bytes) -> bytes:
+    return zlib.compress(data, self._level)
+
+  def decompress(self, data: bytes) -> bytes:
+    return zlib.decompress(data)
+
+
+class ZstdCodec(Codec):
+  """Compresses resources using Zstandard, requires the zstandard module."""
+
+  codec_id = b's'
+
+  def __init__(self, level: int = 3):
+    """Initializes the codec.
+
+    Args:
+      level: Zstandard compression level from 1 (fastest) to 22 (smallest).
+
+    Raises:
+      ImportError: If the zstandard module is not installed.
+    """
+    if not zstandard:
+      raise ImportError('Zstandard compression requires the zstandard module.')
+    self._level = level
+
+  def compress(self, data: bytes) -> bytes:
+    # Compressors are not thread safe so create one per call.
+    return zstandard.ZstdCompressor(level=self._level).compress(data)
+
+  def decompress(self, data: bytes) -> bytes:
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+# Codecs that can decode resources by codec ID.
+_CODEC_TYPES_BY_ID = {
+    ZlibCodec.codec_id: ZlibCodec,
+    ZstdCodec.codec_id: ZstdCodec,
 }
 
+# Names of the codecs that can be selected with create_codecs().
+CODEC_NAMES = ('none', 'zlib', 'zstd')
+
+# Collection and attribute IDs of the resources that are compressed. Episode
+# chunks are mostly repeated observations and serialized models are mostly
+# checkpoint data, both of which compress well, the remaining resources are
+# too small to benefit.
+COMPRESSED_COLLECTIONS = ('chunks', 'serialized_model')
+
+
+def create_codecs(codec_name: str = 'zlib') -> Dict[str, Optional[Codec]]:
+  """Creates the codecs used to store each kind of resource.
+
+  Args:
+    codec_name: One of CODEC_NAMES used for COMPRESSED_COLLECTIONS.
+
+  Returns:
+    Dictionary of codecs by collection or attribute ID.
+
+  Raises:
+    ValueError: If the codec is not supported.
+    ImportError: If the module that implements the codec is not installed.
+  """
+  if codec_name not in CODEC_NAMES:
+    raise ValueError(f'Unsupported codec {codec_name}.')
+  if codec_name == 'none':
+    return {}
+  codec = ZstdCodec() if codec_name == 'zstd' else ZlibCodec()
+  return {collection_id: codec for collection_id in COMPRESSED_COLLECTIONS}
+
 
 class _ResourceEncoder(resource_store.ResourceEncoder):
   """Encodes/decodes protos to/from bytes based on resource id."""
 
+  def __init__(self, codecs: Optional[Dict[str, Codec]] = None):
+    """Initializes the encoder.
+
+    Args:
+      codecs: Dictionary of codecs used to compress resources by collection or
+        attribute ID, resources without a codec are not compressed. Defaults
+        to create_codecs().
+    """
+    self._codecs = create_codecs() if codecs is None else codecs
+    # Codecs used to decompress resources by codec ID, created on demand so
+    # that optional modules are only required to read resources that use them.
+    self._codecs_by_id = {c.codec_id: c for c in self._codecs.values() if c}
+
+  def _get_codec(self, res_id: resource_id.FalkenResourceId) -> (
+      Optional[Codec]):
+    """Returns the codec used to compress a resource or None."""
+    if res_id.attribute:
+      return self._codecs.get(res_id.attribute)
+    return self._codecs.get(res_id.parts[-2])
+
+  def _get_codec_by_id(self, codec_id: bytes) -> Codec:
+    """Returns the codec used to decompress resources with a codec ID."""
+    codec = self._codecs_by_id.get(codec_id)
+    if not codec:
+      try:
+        codec = _CODEC_TYPES_BY_ID[codec_id]()
+      except KeyError:
+        raise ValueError(f'Unsupported codec ID {codec_id}.')
+      self._codecs_by_id[codec_id] = codec
+    return codec
+
   def _get_proto_type(self, res_id: resource_id.FalkenResourceId) -> (
       Type[DatastoreProto]):
     """Determines the protobuf type from a resource id."""
@@ -105,7 +255,14 @@ class _ResourceEncoder(resource_store.ResourceEncoder):
           f'Resource has type {type(resource)}, but it should have type '
           f'{expected_type}.')
 
-    return resource.SerializeToString()
+    data = resource.SerializeToString()
+    codec = self._get_codec(res_id)
+    if codec:
+      compressed = _CODEC_MAGIC + codec.codec_id + codec.compress(data)
+      # Only store compressed data if it's smaller.
+      if len(compressed) < len(data):
+        return compressed
+    return data
 
   def decode_resource(self,
                       res_id: resource_id.ResourceId,
@@ -119,9 +276,29 @@ class _ResourceEncoder(resource_store.ResourceEncoder):
       A proto representation of the resource.
     """
     proto_type = self._get_proto_type(res_id)
+    if data[:len(_CODEC_MAGIC)] == _CODEC_MAGIC:
+      header_size = len(_CODEC_MAGIC) + 1
+      codec = self._get_codec_by_id(bytes(data[len(_CODEC_MAGIC):header_size]))
+      data = codec.decompress(data[header_size:])
     return proto_type.FromString(data)
 
 
+def _get_episode_chunk_session(res_id: str) -> Optional[str]:
+  """Returns the session of an episode chunk resource id or glob.
+
+  Args:
+    res_id: Resource id string, which may be a glob.
+  Returns:
+    Resource id string of the session or None if res_id is not an episode
+    chunk.
+  """
+  parts = res_id.split('/')
+  if (len(parts) == 10 and parts[6] == 'episodes' and
+      parts[8] == 'chunks'):
+    return '/'.join(parts[:6])
+  return None
+
+
 class _ResourceResolver(resource_store.ResourceResolver):
   """Handles and parses the underlying resource type for ResourceID usage."""
 
@@ -141,6 +318,8 @@ class _ResourceResolver(resource_store.ResourceResolver):
   # Maps proto types to their attributes.
   _ATTRIBUTE_MAP = {
       data_store_pb2.OnlineEvaluation: 'online_evaluation',
+      data_store_pb2.EpisodeSummary: 'episode_summary',
+      data_store_pb2.OnlineEvaluationSummary: 'online_evaluation_summary',
       data_store_pb2.SerializedModel: 'serialized_model',
   }
 
@@ -167,6 +346,14 @@ class _ResourceResolver(resource_store.ResourceResolver):
       raise ValueError(f'Unsupported proto field: {field_name}')
     return field_name[:-len('_id')], value
 
+  def get_segment_key(self, res_id: str) -> Optional[str]:
+    """Episode chunks are appended to the segments of their session."""
+    return _get_episode_chunk_session(res_id)
+
+  def get_manifest_key(self, res_id: str) -> Optional[str]:
+    """Episode chunks are listed in the manifest of their session."""
+    return _get_episode_chunk_session(res_id)
+
   def get_timestamp_micros(self, resource: DatastoreProto) -> int:
     """Determine timestamp in microseconds from resource object."""
     return resource.created_micros or None  # return 0s as Nones
@@ -232,14 +419,27 @@ class SessionDataStoreMixin:
       resource_id.ResourceId):
     """Write the specified session to the data store marking it as stopped.
 
+    The stored session is stopped with update() so that concurrent updates of
+    the session, e.g. of its data timestamps, are not overwritten. Only the
+    end time and the snapshot of the provided session are written.
+
     Args:
-      session: Session to stop.
+      session: Session to stop, its ended_micros field is set to the time the
+        session was stopped.
 
     Returns:
       ResourceId of the session.
     """
     session.ended_micros = self.get_timestamp_in_microseconds()
-    resource = self.write(session)
+
+    def stop_session(stored_session):
+      stored_session.ended_micros = session.ended_micros
+      stored_session.snapshot = session.snapshot
+      return True
+
+    resource = self.to_resource_id(session)
+    self.update(resource, stop_session)
+    self.seal_segments(resource)
     falken_logging.info(f'Stopped session {resource}.')
     return resource
 
@@ -255,21 +455,29 @@ class SessionDataStoreMixin:
     that contained demo data. This function updates one or both of those fields
     to the indicated value.
 
+    The session is updated with update() so that concurrent submissions to a
+    session don't overwrite each other's timestamps, a session whose
+    timestamps are already more recent is not written.
+
     Args:
       session_resource_id: Resource ID of the session to update.
       timestamp_micros: A microsecond timestamp.
       has_demo_data: Whether the last_demo_data_received_micros timestamp should
           be updated.
     """
-    session = self.read(session_resource_id)
-    session.last_data_received_micros = (
-        max(timestamp_micros, session.last_data_received_micros))
 
-    if has_demo_data:
-      session.last_demo_data_received_micros = (
-          max(timestamp_micros, session.last_demo_data_received_micros))
-    write_resource_id = self.write(session)
-    assert session_resource_id == write_resource_id
+    def update_timestamps(session):
+      updated = False
+      if timestamp_micros > session.last_data_received_micros:
+        session.last_data_received_micros = timestamp_micros
+        updated = True
+      if (has_demo_data and
+          timestamp_micros > session.last_demo_data_received_micros):
+        session.last_demo_data_received_micros = timestamp_micros
+        updated = True
+      return updated
+
+    self.update(session_resource_id, update_timestamps)
 
   def get_assignment_progress(
       self,
@@ -309,11 +517,33 @@ class DataStore(resource_store.ResourceStore,
                 SessionDataStoreMixin):
   """Reads and writes data from storage."""
 
-  def __init__(self, fs: file_system.FileSystem):
+  def __init__(self, fs: file_system.FileSystem,
+               resource_index: Optional[resource_store.ResourceIndex] = None,
+               resource_cache: Optional[resource_store.ResourceCache] = None,
+               segments: Optional[segment_store.SegmentStore] = None,
+               codecs: Optional[Dict[str, Codec]] = None,
+               manifests: Optional[manifest_store.ManifestStore] = None):
     """Initializes the data store with a given root path.
 
     Args:
       fs: A FileSystem or MockFileSystem object.
+      resource_index: Optional ResourceIndex used to look up resource
+        timestamps without querying the file system.
+      resource_cache: Optional ResourceCache used to avoid reading and
+        decoding resources that have not changed.
+      segments: Optional SegmentStore that episode chunks are appended to,
+        when not set each chunk is stored in its own file.
+      codecs: Dictionary of codecs used to compress resources by collection or
+        attribute ID. Defaults to create_codecs(), which compresses episode
+        chunks and serialized models with zlib. Resources are read regardless
+        of how they were compressed.
+      manifests: Optional ManifestStore that lists the episode chunks of each
+        session by timestamp, so that chunks created after a timestamp are
+        listed without listing all chunks of a session.
     """
-    super().__init__(fs, _ResourceEncoder(), _ResourceResolver(),
-                     resource_id.FalkenResourceId)
+    super().__init__(fs, _ResourceEncoder(codecs), _ResourceResolver(),
+                     resource_id.FalkenResourceId,
+                     resource_index=resource_index,
+                     resource_cache=resource_cache,
+                     segments=segments,
+                     manifests=manifests)
@@ -15,6 +15,7 @@
 # Lint as: python3
 """Tests for data store mix-ins."""
 
+import tempfile
 import time
 from unittest import mock
 
@@ -22,12 +23,15 @@ from absl.testing import absltest
 from absl.testing import parameterized
 from data_store import data_store
 from data_store import file_system
+from data_store import manifest_store
 from data_store import resource_id
 from data_store import resource_store
+from data_store import segment_store
 
 # pylint: disable=g-bad-import-order
 import common.generate_protos  # pylint: disable=unused-import
 import data_store_pb2
+import episode_pb2
 
 
 def create_data_store_mixin(mixin_class):
@@ -76,18 +80,25 @@ class SessionDataStoreMixinTest(absltest.TestCase):
   @mock.patch.object(time, 'time')
   def test_write_stopped_session(self, mock_time):
     data_store_mixin = create_data_store_mixin(data_store.SessionDataStoreMixin)
-    with mock.patch.object(data_store_mixin, 'write') as mock_write:
+    with mock.patch.object(data_store_mixin, 'update') as mock_update:
       session_resource_id = resource_id.FalkenResourceId(
           project='p0', brain='b0', session='s0')
       session_proto = data_store_pb2.Session(project_id='p0', brain_id='b0',
-                                             session_id='s0')
+                                             session_id='s0', snapshot='sn0')
       mock_time.return_value = 123
-      mock_write.return_value = session_resource_id
       self.assertEqual(data_store_mixin.write_stopped_session(session_proto),
                        session_resource_id)
-      mock_write.assert_called_once_with(
+      mock_update.assert_called_once_with(session_resource_id, mock.ANY)
+      # Only the end time and the snapshot are applied to the stored session.
+      stored_session = data_store_pb2.Session(
+          project_id='p0', brain_id='b0', session_id='s0',
+          last_data_received_micros=5)
+      self.assertTrue(mock_update.call_args[0][1](stored_session))
+      self.assertEqual(
+          stored_session,
           data_store_pb2.Session(project_id='p0', brain_id='b0',
-                                 session_id='s0', ended_micros=123000000))
+                                 session_id='s0', ended_micros=123000000,
+                                 snapshot='sn0', last_data_received_micros=5))
 
 
 class DataStoreTest(parameterized.TestCase):
@@ -151,6 +162,35 @@ class DataStoreTest(parameterized.TestCase):
             data_store_pb2.OnlineEvaluation, project_id='p1', brain_id='b1',
             session_id='s1', episode_id='e1')).episode_id, 'e1')
 
+  def test_read_write_episode_summary(self):
+    self._data_store.write(
+        data_store_pb2.EpisodeSummary(
+            project_id='p1', brain_id='b1', session_id='s1', episode_id='e1',
+            model_ids=['m0'], chunk_count=2, last_chunk_id=1))
+    res_id = self._data_store.resource_id_from_proto_ids(
+        data_store_pb2.EpisodeSummary, project_id='p1', brain_id='b1',
+        session_id='s1', episode_id='e1')
+    self.assertEqual(
+        res_id, 'projects/p1/brains/b1/sessions/s1/episodes/e1/episode_summary')
+    summary = self._data_store.read(res_id)
+    self.assertEqual(summary.model_ids, ['m0'])
+    self.assertEqual(summary.chunk_count, 2)
+
+  def test_read_write_online_evaluation_summary(self):
+    self._data_store.write(
+        data_store_pb2.OnlineEvaluationSummary(
+            project_id='p1', brain_id='b1', session_id='s1',
+            models=[data_store_pb2.ModelOnlineEvaluations(
+                model='m0', successes=2, failures=1)]))
+    res_id = self._data_store.resource_id_from_proto_ids(
+        data_store_pb2.OnlineEvaluationSummary, project_id='p1',
+        brain_id='b1', session_id='s1')
+    self.assertEqual(
+        res_id, 'projects/p1/brains/b1/sessions/s1/online_evaluation_summary')
+    summary = self._data_store.read(res_id)
+    self.assertEqual(summary.models[0].successes, 2)
+    self.assertEqual(summary.models[0].failures, 1)
+
   def test_list_online_evaluation_by_resource_id(self):
     """List a resource with an attribute from the data store."""
     id_dict = dict(project_id='p1', brain_id='b1',
@@ -164,6 +204,30 @@ class DataStoreTest(parameterized.TestCase):
         ['projects/p1/brains/b1/sessions/s1/episodes/e1/online_evaluation'],
         list_eval)
 
+  @mock.patch.object(time, 'time', autospec=True)
+  def test_write_many_read_many(self, mock_time):
+    mock_time.return_value = 1
+    chunks = [data_store_pb2.EpisodeChunk(
+        project_id='p0', brain_id='b0', session_id='s0',
+        episode_id=f'e{i % 2}', chunk_id=i) for i in range(10)]
+    res_ids = self._data_store.write_many(chunks)
+    self.assertEqual(
+        [str(r) for r in res_ids],
+        [f'projects/p0/brains/b0/sessions/s0/episodes/e{i % 2}/chunks/{i}'
+         for i in range(10)])
+    for chunk in chunks:
+      self.assertEqual(chunk.created_micros, 1_000_000)
+    self.assertEqual(self._data_store.read_many(res_ids), chunks)
+    self.assertEqual(self._data_store.read_many(list(reversed(res_ids))),
+                     list(reversed(chunks)))
+
+  def test_read_many_not_found(self):
+    self._data_store.write(data_store_pb2.Project(project_id='p0'))
+    with self.assertRaises(resource_store.NotFoundError):
+      self._data_store.read_many(
+          [resource_id.FalkenResourceId('projects/p0'),
+           resource_id.FalkenResourceId('projects/p1')])
+
   def test_read_write_assignment(self):
     rid = self._data_store.write(
         data_store_pb2.Assignment(
@@ -233,6 +297,119 @@ class DataStoreTest(parameterized.TestCase):
         self._data_store.read(res_id).last_demo_data_received_micros,
         3_000_000)
 
+  def test_update_session_data_timestamps_keeps_concurrent_updates(self):
+    res_id = self._data_store.write(data_store_pb2.Session(
+        project_id='p1', brain_id='b1', session_id='s1'))
+    update = self._data_store.update
+
+    def update_after_concurrent_write(update_res_id, update_resource):
+      def write_and_update(session):
+        if not session.ended_micros:
+          # Stop the session after it was read.
+          stopped = data_store_pb2.Session()
+          stopped.CopyFrom(session)
+          stopped.ended_micros = 5
+          self._data_store.write(stopped)
+        return update_resource(session)
+      return update(update_res_id, write_and_update)
+
+    with mock.patch.object(self._data_store, 'update',
+                           side_effect=update_after_concurrent_write):
+      self._data_store.update_session_data_timestamps(res_id, 10, True)
+    session = self._data_store.read(res_id)
+    self.assertEqual(session.ended_micros, 5)
+    self.assertEqual(session.last_data_received_micros, 10)
+    self.assertEqual(session.last_demo_data_received_micros, 10)
+
+  def test_write_stopped_session_keeps_concurrent_updates(self):
+    res_id = self._data_store.write(data_store_pb2.Session(
+        project_id='p1', brain_id='b1', session_id='s1'))
+    # The session is read before its data timestamps are updated.
+    session = self._data_store.read(res_id)
+    self._data_store.update_session_data_timestamps(res_id, 10, True)
+    session.snapshot = 'sn0'
+    self._data_store.write_stopped_session(session)
+    stopped_session = self._data_store.read(res_id)
+    self.assertEqual(stopped_session.ended_micros, session.ended_micros)
+    self.assertEqual(stopped_session.snapshot, 'sn0')
+    self.assertEqual(stopped_session.last_data_received_micros, 10)
+    self.assertEqual(stopped_session.last_demo_data_received_micros, 10)
+
+  def test_update_unmodified_resource_is_not_written(self):
+    res_id = self._data_store.write(data_store_pb2.Session(
+        project_id='p1', brain_id='b1', session_id='s1',
+        last_data_received_micros=10))
+    with mock.patch.object(self._fs, 'write_file') as mock_write_file:
+      self._data_store.update_session_data_timestamps(res_id, 5, False)
+      mock_write_file.assert_not_called()
+
+  def test_update_conflict(self):
+    res_id = self._data_store.write(data_store_pb2.Session(
+        project_id='p1', brain_id='b1', session_id='s1'))
+    attempts = []
+
+    def write_concurrently(session):
+      attempts.append(session.ended_micros)
+      session.ended_micros += 1
+      self._data_store.write(session)
+      return True
+
+    with self.assertRaises(resource_store.ConflictError):
+      self._data_store.update(res_id, write_concurrently, max_attempts=3)
+    self.assertEqual(attempts, [0, 1, 2])
+
+  def test_update_not_found(self):
+    with self.assertRaises(resource_store.NotFoundError):
+      self._data_store.update(
+          resource_id.FalkenResourceId('projects/p1/brains/b1/sessions/s1'),
+          lambda session: True)
+
+  def test_update_create(self):
+    res_id = resource_id.FalkenResourceId('projects/p1/brains/b1/sessions/s1')
+
+    def update(session):
+      session.last_data_received_micros += 1
+      return True
+
+    def create():
+      return data_store_pb2.Session(project_id='p1', brain_id='b1',
+                                    session_id='s1')
+
+    self._data_store.update(res_id, update, create=create)
+    self.assertEqual(self._data_store.read(res_id).last_data_received_micros,
+                     1)
+    # Existing resources are updated rather than created.
+    self._data_store.update(res_id, update, create=create)
+    self.assertEqual(self._data_store.read(res_id).last_data_received_micros,
+                     2)
+
+  def test_update_create_concurrently_created(self):
+    res_id = resource_id.FalkenResourceId('projects/p1/brains/b1/sessions/s1')
+    read_timestamp_micros = self._data_store.read_timestamp_micros
+    reads = []
+
+    def read_created_concurrently(read_res_id):
+      if not reads:
+        reads.append(read_res_id)
+        # Another caller creates the resource after it was found missing.
+        self._data_store.write(data_store_pb2.Session(
+            project_id='p1', brain_id='b1', session_id='s1',
+            last_data_received_micros=10))
+        raise resource_store.NotFoundError('Not found.')
+      return read_timestamp_micros(read_res_id)
+
+    def update(session):
+      session.last_data_received_micros += 1
+      return True
+
+    create = mock.Mock()
+    with mock.patch.object(self._data_store, 'read_timestamp_micros',
+                           side_effect=read_created_concurrently):
+      self._data_store.update(res_id, update, create=create)
+    create.assert_not_called()
+    self.assertEqual(self._data_store.read(res_id).last_data_received_micros,
+                     11)
+
   def test_get_assignment_progress(self):
     session = data_store_pb2.Session(
         project_id='p0',
@@ -391,6 +568,34 @@ class DataStoreTest(parameterized.TestCase):
     else:
       self.assertCountEqual(result, rids)
 
+  @mock.patch.object(time, 'time', autospec=True)
+  def test_count_exists_nth(self, mock_time):
+    rids = []
+    for i in range(10):
+      mock_time.return_value = i / 1e6
+      rids.append(self._data_store.write(
+          data_store_pb2.Session(project_id='p0', brain_id='b0',
+                                 session_id=f's{i}')))
+    rid_glob = self._data_store.resource_id_from_proto_ids(
+        project_id='p0', brain_id='b0', session_id='*')
+    self.assertEqual(self._data_store.count(rid_glob), 10)
+    self.assertEqual(
+        self._data_store.count(rid_glob, min_timestamp_micros=7), 3)
+    self.assertEqual(self._data_store.count(
+        self._data_store.resource_id_from_proto_ids(
+            project_id='p1', brain_id='b0', session_id='*')), 0)
+    self.assertTrue(self._data_store.exists(rids[3]))
+    self.assertFalse(self._data_store.exists(
+        self._data_store.resource_id_from_proto_ids(
+            project_id='p0', brain_id='b0', session_id='s10')))
+    self.assertEqual(self._data_store.nth(rid_glob, 2), rids[2])
+    self.assertEqual(
+        self._data_store.nth(rid_glob, 2, time_descending=True), rids[7])
+    self.assertIsNone(self._data_store.nth(rid_glob, 10))
+    self.assertEqual(self._data_store.get_most_recent(rid_glob), rids[9])
+    with self.assertRaises(ValueError):
+      self._data_store.nth(rid_glob, -1)
+
   @parameterized.parameters(range(1, 10))
   @mock.patch.object(time, 'time', autospec=True)
   def test_pagination_overlapping_timestamps(
@@ -434,5 +639,327 @@ class DataStoreTest(parameterized.TestCase):
     self.assertEqual(len(set(result)), len(result))
     self.assertLen(result, expected_results)
 
+
+class CachedDataStoreTest(DataStoreTest):
+  """Test DataStore with a resource cache."""
+
+  def setUp(self):
+    """Create a datastore object that uses a resource cache."""
+    super().setUp()
+    self._cache = resource_store.ResourceCache()
+    self._data_store = data_store.DataStore(self._fs,
+                                            resource_cache=self._cache)
+
+  def test_update_session_reads_cached_session(self):
+    self._data_store.write(data_store_pb2.Session(
+        project_id='p0', brain_id='b0', session_id='s0'))
+    session_id = resource_id.FalkenResourceId(
+        'projects/p0/brains/b0/sessions/s0')
+    self._data_store.read(session_id)
+    with mock.patch.object(self._fs, 'read_file') as mock_read_file:
+      self._data_store.read(session_id)
+      mock_read_file.assert_not_called()
+    self._data_store.update_session_data_timestamps(session_id, 10, True)
+    session = self._data_store.read(session_id)
+    self.assertEqual(session.last_data_received_micros, 10)
+    self.assertEqual(session.last_demo_data_received_micros, 10)
+
+
+class IndexedDataStoreTest(DataStoreTest):
+  """Test DataStore with a resource index."""
+
+  def setUp(self):
+    """Create a datastore object that uses a resource index."""
+    super().setUp()
+    self._data_store = data_store.DataStore(self._fs,
+                                            resource_store.ResourceIndex())
+
+  @mock.patch.object(time, 'time', autospec=True)
+  def test_list_reuses_listing(self, mock_time):
+    for i in range(20):
+      mock_time.return_value = i / 1e6
+      self._data_store.write(data_store_pb2.Session(
+          project_id='p0', brain_id='b0', session_id=f's{i}'))
+    page, token = self._data_store.list_by_proto_ids(
+        project_id='p0', brain_id='b0', session_id='*', page_size=5)
+    self.assertEqual(page, [f'projects/p0/brains/b0/sessions/s{i}'
+                            for i in range(5)])
+
+    # Following pages are read from the cached listing.
+    with mock.patch.object(self._fs, 'list_directory') as mock_list_directory:
+      page, token = self._data_store.list_by_proto_ids(
+          project_id='p0', brain_id='b0', session_id='*', page_size=5,
+          page_token=token)
+      mock_list_directory.assert_not_called()
+    self.assertEqual(page, [f'projects/p0/brains/b0/sessions/s{i}'
+                            for i in range(5, 10)])
+
+    # New resources invalidate the listing.
+    mock_time.return_value = 100 / 1e6
+    self._data_store.write(data_store_pb2.Session(
+        project_id='p0', brain_id='b0', session_id='new'))
+    page, _ = self._data_store.list_by_proto_ids(
+        project_id='p0', brain_id='b0', session_id='*', page_size=5,
+        time_descending=True)
+    self.assertEqual(page[0], 'projects/p0/brains/b0/sessions/new')
+
+  @mock.patch.object(time, 'time', autospec=True)
+  def test_list_chunks_across_episodes(self, mock_time):
+    chunk_ids = []
+    for i in range(12):
+      mock_time.return_value = i / 1e6
+      chunk_ids.append(str(self._data_store.write(data_store_pb2.EpisodeChunk(
+          project_id='p0', brain_id='b0', session_id='s0',
+          episode_id=f'e{i % 3}', chunk_id=i // 3))))
+    result = []
+    token = None
+    while True:
+      page, next_token = self._data_store.list_by_proto_ids(
+          project_id='p0', brain_id='b0', session_id='s0', episode_id='*',
+          chunk_id='*', page_size=5, page_token=token)
+      if not page:
+        break
+      result.extend(str(p) for p in page)
+      token = next_token
+    self.assertEqual(result, chunk_ids)
+
+    # Chunks added to an existing episode are listed.
+    mock_time.return_value = 20 / 1e6
+    self._data_store.write(data_store_pb2.EpisodeChunk(
+        project_id='p0', brain_id='b0', session_id='s0', episode_id='e1',
+        chunk_id=10))
+    page, _ = self._data_store.list_by_proto_ids(
+        project_id='p0', brain_id='b0', session_id='s0', episode_id='*',
+        chunk_id='*', page_token=token)
+    self.assertEqual(
+        page, ['projects/p0/brains/b0/sessions/s0/episodes/e1/chunks/10'])
+
+
+class SegmentedDataStoreTest(DataStoreTest):
+  """Test DataStore that appends episode chunks to segments."""
+
+  def setUp(self):
+    """Create a datastore object that uses segments in a temporary directory."""
+    super().setUp()
+    self._temporary_directory = tempfile.TemporaryDirectory()
+    self._fs = file_system.FileSystem(self._temporary_directory.name)
+    self._data_store = data_store.DataStore(
+        self._fs, resource_store.ResourceIndex(),
+        segments=segment_store.SegmentStore(self._fs))
+
+  def tearDown(self):
+    """Clean up the temporary directory."""
+    super().tearDown()
+    self._temporary_directory.cleanup()
+
+  def _write_chunks(self, session_id, count):
+    """Writes episode chunks to a session.
+
+    Args:
+      session_id: Session to write the chunks to.
+      count: Number of chunks to write.
+    Returns:
+      List of the resource ids of the chunks.
+    """
+    return self._data_store.write_many([
+        data_store_pb2.EpisodeChunk(
+            project_id='p0', brain_id='b0', session_id=session_id,
+            episode_id=f'e{i % 3}', chunk_id=i // 3, created_micros=i + 1)
+        for i in range(count)])
+
+  def test_chunks_are_appended_to_segments(self):
+    chunk_ids = self._write_chunks('s0', 6)
+    self.assertFalse(self._fs.exists('projects/p0/brains/b0/sessions/s0/'
+                                     'episodes'))
+    self.assertLen(self._fs.glob('projects/p0/brains/b0/sessions/s0/segments/'
+                                 'segment.*'), 1)
+    with mock.patch.object(self._fs, 'read_file_range',
+                           wraps=self._fs.read_file_range) as read_range:
+      chunks = self._data_store.read_many(chunk_ids)
+      read_range.assert_called_once()
+    self.assertEqual([c.created_micros for c in chunks], list(range(1, 7)))
+    self.assertEqual(self._data_store.read(chunk_ids[4]).episode_id, 'e1')
+
+  def test_list_segmented_chunks(self):
+    chunk_ids = self._write_chunks('s0', 12) + self._write_chunks('s1', 3)
+    result = []
+    token = None
+    while True:
+      page, next_token = self._data_store.list_by_proto_ids(
+          project_id='p0', brain_id='b0', session_id='{s0,s1}',
+          episode_id='*', chunk_id='*', page_size=5, page_token=token)
+      if not page:
+        break
+      result.extend(page)
+      token = next_token
+    self.assertCountEqual(result, chunk_ids)
+    page, _ = self._data_store.list_by_proto_ids(
+        project_id='p0', brain_id='b0', session_id='s0', episode_id='e1',
+        chunk_id='*')
+    self.assertEqual(page, [chunk_ids[1], chunk_ids[4], chunk_ids[7],
+                            chunk_ids[10]])
+
+  def test_write_stopped_session_seals_segments(self):
+    self._data_store.write(data_store_pb2.Session(
+        project_id='p0', brain_id='b0', session_id='s0'))
+    self._write_chunks('s0', 3)
+    self._data_store.write_stopped_session(data_store_pb2.Session(
+        project_id='p0', brain_id='b0', session_id='s0'))
+    self.assertTrue(self._fs.exists('projects/p0/brains/b0/sessions/s0/'
+                                    'segments/segment.00000000.index'))
+    _, token = self._data_store.list_by_proto_ids(
+        project_id='p0', brain_id='b0', session_id='s0', episode_id='*',
+        chunk_id='*')
+    self._data_store.write(data_store_pb2.EpisodeChunk(
+        project_id='p0', brain_id='b0', session_id='s0', episode_id='e9',
+        chunk_id=0))
+    page, _ = self._data_store.list_by_proto_ids(
+        project_id='p0', brain_id='b0', session_id='s0', episode_id='*',
+        chunk_id='*', page_token=token)
+    self.assertEqual(
+        page, ['projects/p0/brains/b0/sessions/s0/episodes/e9/chunks/0'])
+
+  def test_update_segmented_chunk(self):
+    (chunk_id,) = self._write_chunks('s0', 1)
+    with self.assertRaises(ValueError):
+      self._data_store.update(chunk_id, lambda chunk: True)
+
+  def test_read_chunks_stored_in_files(self):
+    """Chunks written before segments were enabled can still be read."""
+    chunk_id = data_store.DataStore(self._fs).write(
+        data_store_pb2.EpisodeChunk(project_id='p0', brain_id='b0',
+                                    session_id='s0', episode_id='e0',
+                                    chunk_id=0))
+    self._data_store.write(data_store_pb2.EpisodeChunk(
+        project_id='p0', brain_id='b0', session_id='s0', episode_id='e1',
+        chunk_id=0))
+    self.assertEqual(self._data_store.read(chunk_id).episode_id, 'e0')
+    page, _ = self._data_store.list_by_proto_ids(
+        project_id='p0', brain_id='b0', session_id='s0', episode_id='*',
+        chunk_id='*')
+    self.assertLen(page, 2)
+
+
+class ManifestDataStoreTest(DataStoreTest):
+  """Test DataStore that lists episode chunks in manifests."""
+
+  def setUp(self):
+    """Create a datastore object that uses manifests."""
+    super().setUp()
+    self._temporary_directory = tempfile.TemporaryDirectory()
+    self._fs = file_system.FileSystem(self._temporary_directory.name)
+    self._data_store = data_store.DataStore(
+        self._fs, resource_store.ResourceIndex(),
+        manifests=manifest_store.ManifestStore(self._fs))
+
+  def tearDown(self):
+    """Clean up the temporary directory."""
+    super().tearDown()
+    self._temporary_directory.cleanup()
+
+  def _write_chunk(self, store, session_id, chunk_id, created_micros):
+    """Writes an episode chunk to a session."""
+    return store.write(data_store_pb2.EpisodeChunk(
+        project_id='p0', brain_id='b0', session_id=session_id,
+        episode_id=f'e{chunk_id % 2}', chunk_id=chunk_id,
+        created_micros=created_micros))
+
+  def _list_chunks(self, store, session_ids, min_timestamp_micros):
+    """Lists the chunks of sessions created after a timestamp."""
+    chunk_ids, _ = store.list_by_proto_ids(
+        project_id='p0', brain_id='b0',
+        session_id='{' + ','.join(session_ids) + '}', episode_id='*',
+        chunk_id='*', min_timestamp_micros=min_timestamp_micros)
+    return chunk_ids
+
+  def test_list_new_chunks_from_manifests(self):
+    writer = data_store.DataStore(
+        self._fs, manifests=manifest_store.ManifestStore(self._fs))
+    chunk_ids = [self._write_chunk(writer, f's{i % 2}', i, i + 1)
+                 for i in range(6)]
+    self.assertEqual(self._list_chunks(self._data_store, ['s0', 's1'], 3),
+                     chunk_ids[2:])
+    chunk_ids.append(self._write_chunk(writer, 's1', 6, 7))
+    with mock.patch.object(self._fs, 'glob') as mock_glob, mock.patch.object(
+        self._fs, 'list_directory') as mock_list_directory:
+      self.assertEqual(self._list_chunks(self._data_store, ['s0', 's1'], 6),
+                       chunk_ids[5:])
+      mock_glob.assert_not_called()
+      mock_list_directory.assert_not_called()
+
+  def test_manifest_lists_chunks_written_without_manifest(self):
+    """Chunks written before manifests were enabled are listed."""
+    chunk_id = self._write_chunk(data_store.DataStore(self._fs), 's0', 0, 1)
+    self.assertEqual(self._list_chunks(self._data_store, ['s0', 's1'], 0),
+                     [chunk_id])
+    chunk_ids = [chunk_id, self._write_chunk(self._data_store, 's0', 1, 2)]
+    self.assertTrue(self._fs.exists(
+        manifest_store.ManifestStore.get_path(
+            'projects/p0/brains/b0/sessions/s0')))
+    self.assertEqual(self._list_chunks(
+        data_store.DataStore(
+            self._fs, manifests=manifest_store.ManifestStore(self._fs)),
+        ['s0', 's1'], 0), chunk_ids)
+
+
+class CompressionTest(parameterized.TestCase):
+  """Test compression of resources."""
+
+  def setUp(self):
+    """Create a datastore object that uses a fake file system."""
+    super().setUp()
+    self._fs = file_system.FakeFileSystem()
+    self._data_store = data_store.DataStore(self._fs)
+    self._chunk = data_store_pb2.EpisodeChunk(
+        project_id='p0', brain_id='b0', session_id='s0', episode_id='e0',
+        chunk_id=0, created_micros=1, data=episode_pb2.EpisodeChunk(
+            steps=[episode_pb2.Step(timestamp_millis=i) for i in range(100)]))
+
+  def _read_chunk_file(self):
+    """Returns the contents of the file written for the test chunk."""
+    (path,) = self._fs.glob(
+        'projects/p0/brains/b0/sessions/s0/episodes/e0/chunks/0/resource.*')
+    return self._fs.read_file(path)
+
+  def test_chunks_are_compressed(self):
+    chunk_id = self._data_store.write(self._chunk)
+    data = self._read_chunk_file()
+    self.assertTrue(data.startswith(data_store._CODEC_MAGIC + b'z'))
+    self.assertLess(len(data), len(self._chunk.SerializeToString()))
+    self.assertEqual(self._data_store.read(chunk_id), self._chunk)
+
+  def test_small_resources_are_not_compressed(self):
+    chunk = data_store_pb2.EpisodeChunk(
+        project_id='p0', brain_id='b0', session_id='s0', episode_id='e0',
+        chunk_id=0, created_micros=1)
+    chunk_id = self._data_store.write(chunk)
+    self.assertEqual(self._read_chunk_file(), chunk.SerializeToString())
+    self.assertEqual(self._data_store.read(chunk_id), chunk)
+
+  def test_read_uncompressed(self):
+    """Resources written without compression can be read."""
+    chunk_id = data_store.DataStore(self._fs, codecs={}).write(self._chunk)
+    self.assertEqual(self._read_chunk_file(), self._chunk.SerializeToString())
+    self.assertEqual(self._data_store.read(chunk_id), self._chunk)
+
+  @absltest.skipUnless(data_store.zstandard, 'zstandard is not installed.')
+  def test_zstd(self):
+    chunk_id = data_store.DataStore(
+        self._fs, codecs=data_store.create_codecs('zstd')).write(self._chunk)
+    self.assertTrue(self._read_chunk_file().startswith(
+        data_store._CODEC_MAGIC + b's'))
+    self.assertEqual(self._data_store.read(chunk_id), self._chunk)
+
+  def test_unsupported_codec(self):
+    with self.assertRaises(ValueError):
+      data_store.create_codecs('lzma')
+    chunk_id = self._data_store.write(self._chunk)
+    (path,) = self._fs.glob(
+        'projects/p0/brains/b0/sessions/s0/episodes/e0/chunks/0/resource.*')
+    self._fs.write_file(path, data_store._CODEC_MAGIC + b'?')
+    with self.assertRaisesRegex(ValueError, 'Unsupported codec ID'):
+      self._data_store.read(chunk_id)
+
+
 if __name__ == '__main__':
   absltest.main()
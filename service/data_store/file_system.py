@@ -15,25 +15,75 @@
 # Lint as: python3
 """Reads and writes data from storage."""
 
+import collections
 import contextlib
 import datetime
+import fnmatch
 import glob
 import os
 import os.path
 import re
 import shutil
 import tempfile
+import threading
 import time
 
 import braceexpand
+from data_store import file_watcher
 import flufl.lock
 
+try:
+  import fcntl  # pylint: disable=g-import-not-at-top
+except ImportError:
+  fcntl = None
+
+
+# Durability levels of FileSystem writes.
+# Files are replaced atomically but not flushed to disk.
+DURABILITY_NONE = 'none'
+# Files are flushed to disk before they replace the previous version.
+DURABILITY_FILE = 'file'
+# Files and their directories are flushed to disk so that new files also
+# survive a crash.
+DURABILITY_DIRECTORY = 'directory'
+DURABILITY_LEVELS = (DURABILITY_NONE, DURABILITY_FILE, DURABILITY_DIRECTORY)
+
+# Lock backends of FileSystem.lock_file().
+# Locks are held by creating claim files with flufl.lock, locks expire unless
+# they're refreshed.
+LOCK_BACKEND_FLUFL = 'flufl'
+# Locks are held with flock() on the lock file and released when the process
+# holding them exits. Only supported on POSIX systems and local file systems.
+LOCK_BACKEND_FCNTL = 'fcntl'
+LOCK_BACKENDS = (LOCK_BACKEND_FLUFL, LOCK_BACKEND_FCNTL)
+
+# Seconds between attempts to acquire a lock held by someone else.
+_LOCK_RETRY_SECONDS = 0.1
+
+# Prefix of temporary files written next to their destination. Globs do not
+# match hidden files so partially written files are never listed.
+_TEMPORARY_FILE_PREFIX = '.tmp.'
+
+# Maximum number of directory listings cached by a FileSystem.
+_MAX_CACHED_LISTINGS = 4096
+
+# Directories modified within this many nanoseconds of being listed may change
+# again without changing their modification time, so their listings are not
+# cached.
+_RACY_MODIFICATION_NANOS = 1_000_000_000
+
 
 class UnableToLockFileError(RuntimeError):
   """Signals that we were unable to lock a file."""
   pass
 
 
+# Identifies a version of a file or directory. Writing a file or adding
+# entries to a directory changes its generation.
+FileGeneration = collections.namedtuple(
+    'FileGeneration', ['mtime_ns', 'inode', 'size'])
+
+
 def posix_path(path):
   """Replace system with POSIX directory separators.
 
@@ -46,16 +96,79 @@ def posix_path(path):
   return path.replace(os.path.sep, '/')
 
 
+def _fsync_directory(path):
+  """Flushes a directory's entries to disk.
+
+  Args:
+    path: Absolute path of the directory.
+  """
+  if os.name == 'nt':
+    # Directories can't be opened on Windows, NTFS journals renames.
+    return
+  fd = os.open(path, os.O_RDONLY)
+  try:
+    os.fsync(fd)
+  finally:
+    os.close(fd)
+
+
+class _FcntlLock:
+  """A lock acquired with FileSystem.lock_file using flock()."""
+
+  def __init__(self, path, fd):
+    self.path = path
+    self.fd = fd
+    self.is_locked = True
+
+
+def _scan_directory(path):
+  """Lists a directory.
+
+  Args:
+    path: Absolute path of the directory.
+  Returns:
+    Dictionary that maps the names of the entries in the directory to whether
+    they are directories. Empty if the path is not a directory.
+  """
+  try:
+    with os.scandir(path) as entries:
+      return {entry.name: entry.is_dir() for entry in entries}
+  except OSError:
+    return {}
+
+
 class FileSystem(object):
   """Encapsulates file system operations so they can be faked in tests."""
 
-  def __init__(self, root_path):
+  def __init__(self, root_path, durability=DURABILITY_NONE,
+               listing_cache_seconds=0, lock_backend=LOCK_BACKEND_FLUFL):
     """Initializes the file system object with a given root path.
 
     Args:
       root_path: Path where all Falken files will be stored.
+      durability: One of DURABILITY_LEVELS, selects how writes are flushed
+        to disk.
+      listing_cache_seconds: Number of seconds glob() reuses the listing of a
+        directory that was not modified since it was listed. 0 disables the
+        cache so that each glob() call lists directories again.
+      lock_backend: One of LOCK_BACKENDS, selects how lock_file() locks
+        files. All processes that share root_path must use the same backend.
     """
+    if durability not in DURABILITY_LEVELS:
+      raise ValueError(f'Unsupported durability level {durability}.')
+    if lock_backend not in LOCK_BACKENDS:
+      raise ValueError(f'Unsupported lock backend {lock_backend}.')
+    if lock_backend == LOCK_BACKEND_FCNTL and not fcntl:
+      raise ValueError(f'Lock backend {lock_backend} is not supported on '
+                       'this platform.')
     self._root_path = os.path.realpath(root_path)
+    self._durability = durability
+    self._lock_backend = lock_backend
+    self._listing_cache_nanos = int(listing_cache_seconds * 1_000_000_000)
+    # (mtime_ns, listed_nanos, entries) tuples by directory path in least
+    # recently used order, see _list_glob_directory().
+    self._listings = collections.OrderedDict()
+    self._listings_lock = threading.Lock()
 
   def _resolve(self, path):
     absolute_path = os.path.abspath(os.path.join(
@@ -75,6 +188,20 @@ class FileSystem(object):
     with open(self._resolve(path), 'rb') as f:
       return f.read()
 
+  def read_file_range(self, path, offset, length):
+    """Reads part of a file.
+
+    Args:
+      path: The path of the file to read.
+      offset: Offset of the first byte to read.
+      length: Maximum number of bytes to read.
+    Returns:
+      A bytes-like object containing at most length bytes.
+    """
+    with open(self._resolve(path), 'rb') as f:
+      f.seek(offset)
+      return f.read(length)
+
   def write_file(self, path, data):
     """Writes into a file.
 
@@ -82,13 +209,85 @@ class FileSystem(object):
       path: The path of the file to write the data to.
       data: A bytes-like object containing the data to write.
     """
-    temp_filename = tempfile.NamedTemporaryFile(delete=False).name
+    destination_path = self._resolve(path)
+    directory = os.path.dirname(destination_path)
+    os.makedirs(directory, exist_ok=True)
+    self._write_resolved_file(destination_path, data)
+    if self._durability == DURABILITY_DIRECTORY:
+      _fsync_directory(directory)
+
+  def write_files(self, paths_and_data, executor=None):
+    """Writes several files.
+
+    Each destination directory is created, and flushed if required, once
+    rather than once per file.
+
+    Args:
+      paths_and_data: Iterable of (path, data) pairs.
+      executor: Optional concurrent.futures.Executor used to write the files
+        in parallel.
+    """
+    resolved = [(self._resolve(path), data) for path, data in paths_and_data]
+    directories = {os.path.dirname(path) for path, _ in resolved}
+    for directory in directories:
+      os.makedirs(directory, exist_ok=True)
+    if executor:
+      # Consume the results to propagate exceptions.
+      list(executor.map(lambda item: self._write_resolved_file(*item),
+                        resolved))
+    else:
+      for destination_path, data in resolved:
+        self._write_resolved_file(destination_path, data)
+    if self._durability == DURABILITY_DIRECTORY:
+      for directory in directories:
+        _fsync_directory(directory)
+
+  def append_file(self, path, data):
+    """Appends to a file, creating it if it doesn't exist.
+
+    Callers must serialize appends to the same file, e.g. using lock_file().
+
+    Args:
+      path: The path of the file to append the data to.
+      data: A bytes-like object containing the data to append.
+    Returns:
+      Offset of the appended data in the file.
+    """
+    destination_path = self._resolve(path)
+    directory = os.path.dirname(destination_path)
+    os.makedirs(directory, exist_ok=True)
+    created = not os.path.exists(destination_path)
+    with open(destination_path, 'ab') as f:
+      offset = f.tell()
+      f.write(data)
+      if self._durability != DURABILITY_NONE:
+        f.flush()
+        os.fsync(f.fileno())
+    if created and self._durability == DURABILITY_DIRECTORY:
+      _fsync_directory(directory)
+    return offset
+
+  def _write_resolved_file(self, destination_path, data):
+    """Atomically writes into a file in an existing directory.
+
+    The data is written to a temporary file in the destination directory
+    which then replaces the destination, this is a rename rather than a copy
+    as both files are on the same file system.
+
+    Args:
+      destination_path: Absolute path of the file to write the data to.
+      data: A bytes-like object containing the data to write.
+    """
+    directory, filename = os.path.split(destination_path)
+    fd, temp_filename = tempfile.mkstemp(
+        prefix=f'{_TEMPORARY_FILE_PREFIX}{filename}.', dir=directory)
     try:
-      with open(temp_filename, 'wb') as f:
+      with os.fdopen(fd, 'wb') as f:
         f.write(data)
-      destination_path = self._resolve(path)
-      os.makedirs(os.path.dirname(destination_path), exist_ok=True)
-      shutil.move(temp_filename, destination_path)
+        if self._durability != DURABILITY_NONE:
+          f.flush()
+          os.fsync(f.fileno())
+      os.replace(temp_filename, destination_path)
     except Exception as e:
       if os.path.exists(temp_filename):
         os.remove(temp_filename)
@@ -116,8 +315,39 @@ class FileSystem(object):
     """
     return int(1000 * os.path.getmtime(self._resolve(path)))
 
+  def get_generation(self, path):
+    """Gives the generation of a file or directory.
+
+    Args:
+      path: The path of the file or directory.
+    Returns:
+      A FileGeneration.
+    Raises:
+      FileNotFoundError: If the path does not exist.
+    """
+    stat = os.stat(self._resolve(path))
+    return FileGeneration(stat.st_mtime_ns, stat.st_ino, stat.st_size)
+
+  def list_directory(self, path):
+    """Lists the names of the entries in a directory.
+
+    Args:
+      path: The path of the directory.
+    Returns:
+      List of file and directory names.
+    Raises:
+      FileNotFoundError: If the directory does not exist.
+      NotADirectoryError: If the path is not a directory.
+    """
+    return os.listdir(self._resolve(path))
+
   def glob(self, pattern):
-    """Encapsulates glob.glob.
+    """Finds the files and directories that match a pattern.
+
+    Matches the same paths as glob.glob. Patterns are matched one directory
+    level at a time and patterns that share a prefix, e.g. the alternatives of
+    a brace expression, are matched together so each directory is listed at
+    most once per call.
 
     Args:
       pattern: Pattern to search for. May contains brace-style options,
@@ -126,13 +356,104 @@ class FileSystem(object):
     Returns:
       List of path strings found. All paths use POSIX directory separators.
     """
-    result = []
+    # Tree of pattern components, None marks the end of a pattern.
+    tree = {}
     for p in braceexpand.braceexpand(posix_path(pattern)):
-      for f in glob.glob(self._resolve(p)):
-        if os.access(f, os.R_OK):
-          result.append(posix_path(os.path.relpath(f, self._root_path)))
+      relative_path = os.path.relpath(self._resolve(p), self._root_path)
+      node = tree
+      if relative_path != os.curdir:
+        for part in relative_path.split(os.sep):
+          node = node.setdefault(part, {})
+      node[None] = {}
+    result = []
+    if None in tree:
+      result.append(os.curdir)
+    self._glob_tree(self._root_path, '', tree, {}, result)
     return result
 
+  def _glob_tree(self, path, relative_path, tree, listings, result):
+    """Finds the entries of a directory that match a tree of patterns.
+
+    Args:
+      path: Absolute path of the directory.
+      relative_path: POSIX path of the directory relative to the root
+        directory.
+      tree: Dictionary that maps the pattern components to match in the
+        directory to the trees to match in the matching subdirectories.
+      listings: Dictionary of directory listings read by this glob() call.
+      result: List the matching paths are appended to.
+    """
+    parts = [part for part in tree if part is not None]
+    entries = None
+    if len(parts) > 1 or any(glob.has_magic(part) for part in parts):
+      entries = self._list_glob_directory(path, listings)
+    for part in parts:
+      if glob.has_magic(part):
+        names = fnmatch.filter(entries, part)
+        # Wildcards don't match hidden files, as with glob.glob.
+        if not part.startswith('.'):
+          names = [name for name in names if not name.startswith('.')]
+      elif entries is None or part in entries:
+        names = [part]
+      else:
+        continue
+      subtree = tree[part]
+      for name in names:
+        child_path = os.path.join(path, name)
+        child_relative_path = (f'{relative_path}/{name}' if relative_path
+                               else name)
+        if None in subtree and (entries is not None or
+                                os.path.lexists(child_path)):
+          result.append(child_relative_path)
+        if len(subtree) > (None in subtree) and (entries is None or
+                                                 entries[name]):
+          self._glob_tree(child_path, child_relative_path, subtree, listings,
+                          result)
+
+  def _list_glob_directory(self, path, listings):
+    """Lists a directory for glob().
+
+    Args:
+      path: Absolute path of the directory.
+      listings: Dictionary of directory listings read by this glob() call.
+    Returns:
+      Dictionary that maps the names of the entries in the directory to
+      whether they are directories. Empty if the path is not a directory.
+    """
+    entries = listings.get(path)
+    if entries is not None:
+      return entries
+    if not self._listing_cache_nanos:
+      entries = _scan_directory(path)
+      listings[path] = entries
+      return entries
+
+    # Read the modification time before listing the directory so that changes
+    # made while listing result in a stale modification time rather than a
+    # stale listing.
+    now_nanos = time.time_ns()
+    try:
+      mtime_ns = os.stat(path).st_mtime_ns
+    except OSError:
+      mtime_ns = None
+    with self._listings_lock:
+      cached = self._listings.get(path)
+      if (cached and cached[0] == mtime_ns and
+          now_nanos - cached[1] < self._listing_cache_nanos):
+        self._listings.move_to_end(path)
+        listings[path] = cached[2]
+        return cached[2]
+    entries = _scan_directory(path) if mtime_ns is not None else {}
+    listings[path] = entries
+    if (mtime_ns is not None and
+        mtime_ns <= now_nanos - _RACY_MODIFICATION_NANOS):
+      with self._listings_lock:
+        self._listings[path] = (mtime_ns, now_nanos, entries)
+        self._listings.move_to_end(path)
+        while len(self._listings) > _MAX_CACHED_LISTINGS:
+          self._listings.popitem(last=False)
+    return entries
+
   def exists(self, path):
     """Encapsulates os.path.exists.
 
@@ -143,6 +464,22 @@ class FileSystem(object):
     """
     return os.path.exists(self._resolve(path))
 
+  def list_files(self, path=''):
+    """Recursively lists all files contained in a directory.
+
+    Args:
+      path: Path of the directory to list. Defaults to the root directory.
+    Returns:
+      List of path strings relative to the root directory. All paths use POSIX
+      directory separators.
+    """
+    result = []
+    for dirpath, _, filenames in os.walk(self._resolve(path)):
+      for filename in filenames:
+        result.append(posix_path(os.path.relpath(
+            os.path.join(dirpath, filename), self._root_path)))
+    return result
+
   def lock_file(self, path, expire_after=60*60, timeout=0):
     """Locks a file.
 
@@ -152,15 +489,20 @@ class FileSystem(object):
     Args:
       path: Path of file or directory to lock.
       expire_after: How many seconds to wait for the lock to expire.
-        Default is one hour.
+        Default is one hour. Locks acquired with the fcntl backend don't
+        expire, they're released when the process holding them exits.
       timeout: Seconds to wait to acquire the file.
     Returns:
-      A flufl.Lock object that can be unlocked with unlock_file.
+      A lock object that can be unlocked with unlock_file.
+    Raises:
+      UnableToLockFileError: If the lock is held by someone else.
     """
     lock_failure_text = f'Could not lock file {path}.'
     path = self._resolve(self._get_lock_path(path))
 
     os.makedirs(os.path.dirname(path), exist_ok=True)
+    if self._lock_backend == LOCK_BACKEND_FCNTL:
+      return self._lock_fcntl(path, timeout, lock_failure_text)
 
     lock = flufl.lock.Lock(
         path, lifetime=datetime.timedelta(seconds=expire_after))
@@ -174,6 +516,31 @@ class FileSystem(object):
 
     return lock
 
+  def _lock_fcntl(self, path, timeout, lock_failure_text):
+    """Locks a lock file with flock().
+
+    Args:
+      path: Absolute path of the lock file.
+      timeout: Seconds to wait to acquire the lock.
+      lock_failure_text: Message of the error raised if the lock is held by
+        someone else.
+    Returns:
+      A _FcntlLock object.
+    """
+    # The lock file is never removed so that processes waiting for the lock
+    # don't lock a file that was replaced.
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    deadline = time.time() + timeout
+    while True:
+      try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return _FcntlLock(path, fd)
+      except BlockingIOError:
+        if time.time() >= deadline:
+          os.close(fd)
+          raise UnableToLockFileError(lock_failure_text)
+        time.sleep(_LOCK_RETRY_SECONDS)
+
   def refresh_lock(self, lock, expire_after=60*60):
     """Refreshes a file lock.
 
@@ -182,7 +549,12 @@ class FileSystem(object):
       expire_after: How many seconds to wait for the lock to expire again.
         Default is one hour.
     """
-    lock.refresh(expire_after)
+    if isinstance(lock, _FcntlLock):
+      # flock() locks don't expire, touch the lock file so that the directory
+      # containing it isn't considered stale.
+      os.utime(lock.path)
+    else:
+      lock.refresh(expire_after)
 
   def unlock_file(self, lock):
     """Unlocks a file.
@@ -190,9 +562,48 @@ class FileSystem(object):
     Args:
       lock: A lock object returned by lock_file.
     """
-    if lock.is_locked:
+    if not lock.is_locked:
+      return
+    if isinstance(lock, _FcntlLock):
+      fcntl.flock(lock.fd, fcntl.LOCK_UN)
+      os.close(lock.fd)
+      lock.is_locked = False
+    else:
       lock.unlock()
 
+  def is_locked(self, path):
+    """Checks whether a file is locked.
+
+    The check doesn't create any files nor take the lock, so it doesn't
+    interfere with other attempts to lock the file.
+
+    Args:
+      path: Path of file or directory to check.
+    Returns:
+      True if the lock shared by the files in the directory of path is held,
+      including by this process.
+    """
+    lock_path = self._resolve(self._get_lock_path(path))
+    if self._lock_backend == LOCK_BACKEND_FLUFL:
+      # flufl.lock sets the modification time of the lock file to the time the
+      # lock expires.
+      try:
+        return os.stat(lock_path).st_mtime > time.time()
+      except FileNotFoundError:
+        return False
+    try:
+      fd = os.open(lock_path, os.O_RDONLY)
+    except FileNotFoundError:
+      return False
+    try:
+      fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+      return True
+    finally:
+      # Closing the file releases the lock if it was acquired.
+      os.close(fd)
+    return False
+
   @contextlib.contextmanager
   def lock_file_context(self, path, expire_after=60*60, timeout=0):
     """Gives a context manager that locks the given file.
@@ -243,16 +654,69 @@ class FileSystem(object):
     """
     resolved_path = self._resolve(path)
 
-    max_mtime = 0
+    max_mtime = os.path.getmtime(resolved_path)
     if os.path.isdir(resolved_path):
       for dirpath, dirnames, filenames in os.walk(resolved_path):
         for p in dirnames + filenames:
           p_mtime = os.path.getmtime(os.path.join(dirpath, p))
           max_mtime = max(max_mtime, p_mtime)
-    else:
-      max_mtime = os.path.getmtime(resolved_path)
     return int((time.time() - max_mtime) * 1000)
 
+  def watch(self, path, poll_interval, kind=file_watcher.AUTO):
+    """Watches a directory tree for changes.
+
+    Args:
+      path: Directory to watch, which is created if it doesn't exist.
+      poll_interval: Seconds between reports of unknown changes if changes
+        can't be watched on this platform.
+      kind: Kind of watcher, one of file_watcher.WATCHER_KINDS.
+
+    Returns:
+      A watcher object whose wait_for_events() method returns a list of
+      file_watcher.FileEvent with paths relative to the root of this file
+      system, or None if any file below the path may have changed.
+    """
+    resolved_path = self._resolve(path)
+    os.makedirs(resolved_path, exist_ok=True)
+    return file_watcher.create_file_watcher(
+        self._root_path, resolved_path, poll_interval, kind)
+
+  def list_resources(self, res_id_glob, min_timestamp_micros=0,
+                     start_after=None, limit=None, time_descending=False):
+    """Lists resources in timestamp order using an index of the file system.
+
+    Files are not indexed, so resources are found by listing files instead.
+
+    Args:
+      res_id_glob: Resource id glob.
+      min_timestamp_micros: Only return resources at least as recent as this
+        timestamp.
+      start_after: Optional (timestamp_micros, resource_id) pair to list
+        resources after.
+      limit: Maximum number of resources to return or None for all.
+      time_descending: If True, list resources in descending timestamp order.
+    Returns:
+      None as resources are not indexed.
+    """
+    del res_id_glob, min_timestamp_micros, start_after, limit  # Unused.
+    del time_descending  # Unused.
+    return None
+
+  def count_resources(self, res_id_glob, min_timestamp_micros=0):
+    """Counts resources using an index of the file system.
+
+    Files are not indexed, so resources are counted by listing files instead.
+
+    Args:
+      res_id_glob: Resource id glob.
+      min_timestamp_micros: Only count resources at least as recent as this
+        timestamp.
+    Returns:
+      None as resources are not indexed.
+    """
+    del res_id_glob, min_timestamp_micros  # Unused.
+    return None
+
 
 class FakeFileSystem(object):
   """In-memory implementation of the FileSystem class."""
@@ -260,6 +724,13 @@ class FakeFileSystem(object):
   def __init__(self):
     # Stores the proto contained in each path.
     self._path_to_proto = {}
+    # Generation counter of each file and directory, incremented whenever a
+    # file is written to or below the path.
+    self._generations = {}
+    self._generation = 0
+    # Locks of directories held by lock_file_context().
+    self._locks = collections.defaultdict(threading.Lock)
+    self._locks_lock = threading.Lock()
 
   def read_file(self, path):
     """Reads a file.
@@ -278,7 +749,86 @@ class FakeFileSystem(object):
       path: The path of the file to write the data to.
       data: A string containing the data to write.
     """
-    self._path_to_proto[posix_path(path)] = data
+    path = posix_path(path)
+    self._path_to_proto[path] = data
+    self._generation += 1
+    while path:
+      self._generations[path] = self._generation
+      path = posix_path(os.path.dirname(path))
+
+  def read_file_range(self, path, offset, length):
+    """Reads part of a file.
+
+    Args:
+      path: The path of the file to read.
+      offset: Offset of the first byte to read.
+      length: Maximum number of bytes to read.
+    Returns:
+      A bytes-like object containing at most length bytes.
+    """
+    return self._path_to_proto[posix_path(path)][offset:offset + length]
+
+  def append_file(self, path, data):
+    """Appends to a file, creating it if it doesn't exist.
+
+    Args:
+      path: The path of the file to append the data to.
+      data: A bytes-like object containing the data to append.
+    Returns:
+      Offset of the appended data in the file.
+    """
+    existing = self._path_to_proto.get(posix_path(path), b'')
+    self.write_file(path, existing + data)
+    return len(existing)
+
+  def write_files(self, paths_and_data, executor=None):
+    """Writes several files.
+
+    Args:
+      paths_and_data: Iterable of (path, data) pairs.
+      executor: Ignored, files are written sequentially.
+    """
+    del executor  # Unused.
+    for path, data in paths_and_data:
+      self.write_file(path, data)
+
+  def get_generation(self, path):
+    """Gives the generation of a file or directory.
+
+    Args:
+      path: The path of the file or directory.
+    Returns:
+      A FileGeneration.
+    Raises:
+      FileNotFoundError: If the path does not exist.
+    """
+    path = posix_path(path)
+    try:
+      return FileGeneration(self._generations[path], 0,
+                            len(self._path_to_proto.get(path, b'')))
+    except KeyError:
+      raise FileNotFoundError(f'{path} not found.')
+
+  def list_directory(self, path):
+    """Lists the names of the entries in a directory.
+
+    Args:
+      path: The path of the directory.
+    Returns:
+      List of file and directory names.
+    Raises:
+      FileNotFoundError: If the directory does not exist.
+      NotADirectoryError: If the path is a file.
+    """
+    path = posix_path(path).rstrip('/')
+    if path in self._path_to_proto:
+      raise NotADirectoryError(f'{path} is a file.')
+    prefix = path + '/' if path else ''
+    names = {p[len(prefix):].split('/')[0] for p in self._path_to_proto
+             if p.startswith(prefix)}
+    if not names:
+      raise FileNotFoundError(f'{path} not found.')
+    return sorted(names)
 
   def glob(self, pattern):
     """Encapsulates glob.glob.
@@ -304,3 +854,95 @@ class FakeFileSystem(object):
       A boolean for whether the file or directory exists.
     """
     return posix_path(path) in self._path_to_proto
+
+  def list_files(self, path=''):
+    """Recursively lists all files contained in a directory.
+
+    Args:
+      path: Path of the directory to list. Defaults to the root directory.
+    Returns:
+      List of path strings.
+    """
+    prefix = posix_path(path).rstrip('/')
+    if not prefix:
+      return sorted(self._path_to_proto)
+    return [p for p in sorted(self._path_to_proto)
+            if p.startswith(prefix + '/')]
+
+  @contextlib.contextmanager
+  def lock_file_context(self, path, expire_after=60*60, timeout=0):
+    """Gives a context manager that locks the given file.
+
+    Lock is shared with other files in the same directory and only excludes
+    other threads that use this object.
+
+    Args:
+      path: Path of file or directory to lock.
+      expire_after: Ignored, locks don't expire.
+      timeout: Seconds to wait to acquire the file.
+    Yields:
+      Uses an empty yield only for the purposes of implementing the context
+      manager.
+    Raises:
+      UnableToLockFileError: If the lock wasn't acquired within the timeout.
+    """
+    del expire_after  # Unused.
+    with self._locks_lock:
+      lock = self._locks[posix_path(os.path.dirname(path))]
+    if not (lock.acquire(timeout=timeout) if timeout else
+            lock.acquire(blocking=False)):
+      raise UnableToLockFileError(f'Could not lock file {path}.')
+    try:
+      yield
+    finally:
+      lock.release()
+
+  def watch(self, unused_path, poll_interval,
+            unused_kind=file_watcher.AUTO):
+    """Watches a directory tree for changes.
+
+    Args:
+      unused_path: Directory to watch.
+      poll_interval: Seconds between reports of unknown changes.
+      unused_kind: Kind of watcher, always polling.
+
+    Returns:
+      A file_watcher.PollingFileWatcher as in-memory changes are not tracked.
+    """
+    return file_watcher.PollingFileWatcher(poll_interval)
+
+  def list_resources(self, res_id_glob, min_timestamp_micros=0,
+                     start_after=None, limit=None, time_descending=False):
+    """Lists resources in timestamp order using an index of the file system.
+
+    Files are not indexed, so resources are found by listing files instead.
+
+    Args:
+      res_id_glob: Resource id glob.
+      min_timestamp_micros: Only return resources at least as recent as this
+        timestamp.
+      start_after: Optional (timestamp_micros, resource_id) pair to list
+        resources after.
+      limit: Maximum number of resources to return or None for all.
+      time_descending: If True, list resources in descending timestamp order.
+    Returns:
+      None as resources are not indexed.
+    """
+    del res_id_glob, min_timestamp_micros, start_after, limit  # Unused.
+    del time_descending  # Unused.
+    return None
+
+  def count_resources(self, res_id_glob, min_timestamp_micros=0):
+    """Counts resources using an index of the file system.
+
+    Files are not indexed, so resources are counted by listing files instead.
+
+    Args:
+      res_id_glob: Resource id glob.
+      min_timestamp_micros: Only count resources at least as recent as this
+        timestamp.
+    Returns:
+      None as resources are not indexed.
+    """
+    del res_id_glob, min_timestamp_micros  # Unused.
+    return None
@@ -14,8 +14,11 @@
 
 """Tests for FileSystem."""
 
+from concurrent import futures
 import glob
 import os.path
+import subprocess
+import sys
 import tempfile
 import time
 from unittest import mock
@@ -51,6 +54,41 @@ class FileSystemTest(parameterized.TestCase):
 
     self.assertEqual(self._text, self._fs.read_file(path))
 
+  def test_write_file_replaces_file_in_same_directory(self):
+    path = os.path.join('dirA', 'file.pb')
+    self._fs.write_file(path, b'old')
+    with mock.patch.object(os, 'replace', wraps=os.replace) as mock_replace:
+      self._fs.write_file(path, self._text)
+      (temp_path, destination_path), _ = mock_replace.call_args
+    self.assertEqual(os.path.dirname(temp_path),
+                     os.path.dirname(destination_path))
+    self.assertEqual(self._text, self._fs.read_file(path))
+    # Temporary files are removed by the rename.
+    self.assertEqual(os.listdir(os.path.dirname(destination_path)),
+                     ['file.pb'])
+
+  @parameterized.named_parameters(
+      ('None', file_system.DURABILITY_NONE, 0, 0),
+      ('File', file_system.DURABILITY_FILE, 2, 0),
+      ('Directory', file_system.DURABILITY_DIRECTORY, 2, 1))
+  def test_write_durability(self, durability, expected_file_syncs,
+                            expected_directory_syncs):
+    fs = file_system.FileSystem(self._temporary_directory.name,
+                                durability=durability)
+    with mock.patch.object(os, 'fsync') as mock_fsync:
+      with mock.patch.object(file_system, '_fsync_directory') as (
+          mock_fsync_directory):
+        fs.write_files([(os.path.join('dirA', 'file1.pb'), self._text),
+                        (os.path.join('dirA', 'file2.pb'), self._text)])
+        self.assertEqual(mock_fsync.call_count, expected_file_syncs)
+        self.assertEqual(mock_fsync_directory.call_count,
+                         expected_directory_syncs)
+
+  def test_invalid_durability(self):
+    with self.assertRaises(ValueError):
+      file_system.FileSystem(self._temporary_directory.name,
+                             durability='paranoid')
+
   def test_glob(self):
     """Tests FileSystem.glob."""
     # Glob should return POSIX paths.
@@ -63,6 +101,53 @@ class FileSystemTest(parameterized.TestCase):
     found_files = self._fs.glob(os.path.join('dir*', 'dir*', 'p1.pb'))
     self.assertEqual(set(files), set(found_files))
 
+  def test_glob_matches_glob_glob(self):
+    """FileSystem.glob finds the same paths as glob.glob."""
+    for f in ['a/b1/c.pb', 'a/b2/c.pb', 'a/b2/d.pb', 'a/.hidden/c.pb',
+              'a/.c.pb', 'e.pb']:
+      self._fs.write_file(f, self._text)
+    root = self._temporary_directory.name
+    for pattern in ['a/*/c.pb', 'a/b*', 'a/*', 'a/.*', 'a/b2/*', 'a/[b]1/*',
+                    'a/.hidden/c.pb', 'a/b3/*', 'e.pb/*', '*', 'a/*/*/*']:
+      expected = [os.path.relpath(f, root).replace(os.path.sep, '/')
+                  for f in glob.glob(os.path.join(root, pattern))]
+      self.assertCountEqual(self._fs.glob(pattern), expected, msg=pattern)
+
+  def test_glob_lists_directories_once(self):
+    """Brace alternatives that share directories list them once."""
+    for i in range(5):
+      self._fs.write_file(f'sessions/s{i}/chunks/c0', self._text)
+      self._fs.write_file(f'sessions/s{i}/chunks/c1', self._text)
+    with mock.patch.object(file_system.os, 'scandir',
+                           wraps=os.scandir) as scandir:
+      self.assertCountEqual(
+          self._fs.glob('sessions/{s0,s1,s2,s9}/{chunks,other}/*'),
+          [f'sessions/s{i}/chunks/c{j}' for i in range(3) for j in range(2)])
+      # The sessions directory and the session directories are listed once,
+      # the missing session and directories are skipped.
+      self.assertEqual(scandir.call_count, 7)
+
+  @mock.patch.object(time, 'time_ns')
+  def test_glob_listing_cache(self, time_mock):
+    fs = file_system.FileSystem(self._temporary_directory.name,
+                                listing_cache_seconds=10)
+    fs.write_file('a/b.pb', self._text)
+    mtime_ns = fs.get_generation('a').mtime_ns
+    time_mock.return_value = mtime_ns + 5_000_000_000
+    self.assertEqual(fs.glob('a/*'), ['a/b.pb'])
+    with mock.patch.object(file_system.os, 'scandir',
+                           wraps=os.scandir) as scandir:
+      self.assertEqual(fs.glob('a/*'), ['a/b.pb'])
+      scandir.assert_not_called()
+      # Cached listings expire.
+      time_mock.return_value = mtime_ns + 20_000_000_000
+      self.assertEqual(fs.glob('a/*'), ['a/b.pb'])
+      scandir.assert_called_once()
+    # Modified directories are listed again.
+    time.sleep(0.01)
+    fs.write_file('a/c.pb', self._text)
+    self.assertCountEqual(fs.glob('a/*'), ['a/b.pb', 'a/c.pb'])
+
   def test_exists(self):
     """Tests FileSystem.exists."""
     path = os.path.join('dirA', 'dirB', 'file.pb')
@@ -110,6 +195,77 @@ class FileSystemTest(parameterized.TestCase):
       elapsed_time = time.time() - current_time
       self.assertGreater(elapsed_time, 0.5)
 
+  def test_is_locked(self):
+    path = os.path.join('dir1', 'to_lock.txt')
+    self.assertFalse(self._fs.is_locked(path))
+    with self._fs.lock_file_context(path):
+      self.assertTrue(self._fs.is_locked(path))
+    self.assertFalse(self._fs.is_locked(path))
+
+  def test_is_locked_doesnt_lock(self):
+    """Checking a lock doesn't prevent others from taking it."""
+    path = os.path.join('dir1', 'to_lock.txt')
+    with mock.patch.object(self._fs, 'lock_file') as lock_file:
+      self.assertFalse(self._fs.is_locked(path))
+      lock_file.assert_not_called()
+
+  @mock.patch.object(time, 'time')
+  def test_is_locked_expired(self, time_mock):
+    path = os.path.join('dir1', 'to_lock.txt')
+    time_mock.return_value = 1000
+    lock = self._fs.lock_file(path, expire_after=10)
+    # Locks expire after expire_after seconds.
+    lock_path = os.path.join(self._temporary_directory.name, 'dir1', '.lock')
+    time_mock.return_value = os.stat(lock_path).st_mtime - 1
+    self.assertTrue(self._fs.is_locked(path))
+    time_mock.return_value += 2
+    self.assertFalse(self._fs.is_locked(path))
+    self._fs.unlock_file(lock)
+
+  def test_fcntl_lock(self):
+    fs = file_system.FileSystem(self._temporary_directory.name,
+                                lock_backend=file_system.LOCK_BACKEND_FCNTL)
+    path = os.path.join('dir1', 'to_lock.txt')
+    self.assertFalse(fs.is_locked(path))
+    # Checking the lock doesn't create files.
+    self.assertFalse(fs.exists('dir1'))
+    lock = fs.lock_file(path)
+    self.assertTrue(fs.is_locked(path))
+    with self.assertRaises(file_system.UnableToLockFileError):
+      fs.lock_file(path, timeout=0.2)
+    fs.refresh_lock(lock)
+    fs.unlock_file(lock)
+    fs.unlock_file(lock)
+    self.assertFalse(fs.is_locked(path))
+    with fs.lock_file_context(path):
+      self.assertTrue(fs.is_locked(path))
+
+  def test_fcntl_lock_is_released_on_exit(self):
+    """Locks held by a process are released when it exits."""
+    fs = file_system.FileSystem(self._temporary_directory.name,
+                                lock_backend=file_system.LOCK_BACKEND_FCNTL)
+    path = os.path.join('dir1', 'to_lock.txt')
+    lock_path = os.path.join(self._temporary_directory.name, 'dir1', '.lock')
+    fs.unlock_file(fs.lock_file(path))
+    with subprocess.Popen(
+        [sys.executable, '-c',
+         'import fcntl, sys, time\n'
+         f'f = open({lock_path!r})\n'
+         'fcntl.flock(f, fcntl.LOCK_EX)\n'
+         'print(flush=True)\n'
+         'sys.stdin.read()\n'],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE) as process:
+      process.stdout.readline()
+      self.assertTrue(fs.is_locked(path))
+      process.stdin.close()
+      process.wait()
+    self.assertFalse(fs.is_locked(path))
+
+  def test_invalid_lock_backend(self):
+    with self.assertRaises(ValueError):
+      file_system.FileSystem(self._temporary_directory.name,
+                             lock_backend='carrier_pigeon')
+
   @mock.patch.object(time, 'time')
   def test_get_staleness(self, time_mock):
     path = os.path.join('dirA', 'dirB', 'file.pb')
@@ -128,6 +284,69 @@ class FileSystemTest(parameterized.TestCase):
           self._fs.get_staleness('dirA'),
           1000)
 
+  @mock.patch.object(time, 'time')
+  def test_get_staleness_empty_directory(self, time_mock):
+    """The staleness of an empty directory is given by its own mtime."""
+    path = os.path.join(self._temporary_directory.name, 'dirA')
+    os.makedirs(path)
+    time_mock.return_value = os.path.getmtime(path) + 1
+    self.assertEqual(self._fs.get_staleness('dirA'), 1000)
+
+  def test_list_files(self):
+    paths = [os.path.join('dirA', 'file.pb'),
+             os.path.join('dirA', 'dirB', 'file.pb'),
+             os.path.join('dirC', 'file.pb')]
+    for path in paths:
+      self._fs.write_file(path, self._text)
+    self.assertCountEqual(
+        self._fs.list_files('dirA'), ['dirA/file.pb', 'dirA/dirB/file.pb'])
+    self.assertCountEqual(
+        self._fs.list_files(),
+        [file_system.posix_path(path) for path in paths])
+    self.assertEqual(self._fs.list_files('dirD'), [])
+
+  @parameterized.named_parameters(
+      ('Sequential', False),
+      ('Parallel', True))
+  def test_write_files(self, parallel):
+    paths = [os.path.join('dirA', f'file{i}.pb') for i in range(10)] + [
+        os.path.join('dirB', 'dirC', 'file.pb')]
+    with futures.ThreadPoolExecutor(max_workers=4) as executor:
+      self._fs.write_files(
+          [(path, path.encode('utf-8')) for path in paths],
+          executor=executor if parallel else None)
+    for path in paths:
+      self.assertEqual(self._fs.read_file(path), path.encode('utf-8'))
+
+  def test_append_file(self):
+    path = os.path.join('dirA', 'file.pb')
+    self.assertEqual(self._fs.append_file(path, self._text), 0)
+    self.assertEqual(self._fs.append_file(path, self._text), len(self._text))
+    self.assertEqual(self._fs.read_file(path), self._text + self._text)
+    self.assertEqual(self._fs.read_file_range(path, len(self._text) + 6, 100),
+                     self._text[6:])
+
+  def test_get_generation(self):
+    path = os.path.join('dirA', 'file.pb')
+    self._fs.write_file(path, self._text)
+    file_generation = self._fs.get_generation(path)
+    directory_generation = self._fs.get_generation('dirA')
+    self._fs.write_file(path, self._text + self._text)
+    self.assertNotEqual(self._fs.get_generation(path), file_generation)
+    # Ensure the directory is modified in a different clock tick.
+    time.sleep(0.1)
+    self._fs.write_file(os.path.join('dirA', 'other.pb'), self._text)
+    self.assertNotEqual(self._fs.get_generation('dirA'), directory_generation)
+    with self.assertRaises(FileNotFoundError):
+      self._fs.get_generation('dirB')
+
+  def test_list_directory(self):
+    self._fs.write_file(os.path.join('dirA', 'file.pb'), self._text)
+    self._fs.write_file(os.path.join('dirA', 'dirB', 'file.pb'), self._text)
+    self.assertCountEqual(self._fs.list_directory('dirA'), ['file.pb', 'dirB'])
+    with self.assertRaises(FileNotFoundError):
+      self._fs.list_directory('dirC')
+
   def test_remove_tree(self):
     path = os.path.join('dirA', 'dirB', 'file.pb')
     self._fs.write_file(path, self._text)
@@ -136,5 +355,13 @@ class FileSystemTest(parameterized.TestCase):
     self.assertFalse(self._fs.exists(path))
 
 
+  def test_resources_are_not_indexed(self):
+    self._fs.write_file(os.path.join('dirA', 'file.pb'), self._text)
+    self.assertIsNone(self._fs.list_resources('dirA/*'))
+    self.assertIsNone(self._fs.count_resources('dirA/*'))
+    fake_fs = file_system.FakeFileSystem()
+    self.assertIsNone(fake_fs.list_resources('dirA/*'))
+    self.assertIsNone(fake_fs.count_resources('dirA/*'))
+
 if __name__ == '__main__':
   absltest.main()
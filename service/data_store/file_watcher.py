@@ -0,0 +1,322 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Lint as: python3
+"""Watches directory trees for changes.
+
+On Linux changes are delivered by inotify, on other platforms or when inotify
+is not available changes are detected by polling, in which case the watcher
+only reports that the tree may have changed. inotify only reports changes made
+through the local kernel, so trees on network file systems that are changed
+by other hosts, e.g. over NFS, must be watched by polling.
+"""
+
+import collections
+import ctypes
+import ctypes.util
+import errno
+import os
+import os.path
+import select
+import struct
+import sys
+import threading
+
+from absl import logging
+
+# Kinds of watcher created by create_file_watcher():
+# * AUTO: inotify if it's supported, polling otherwise.
+# * INOTIFY: inotify, fails if it's not supported.
+# * POLLING: polling.
+AUTO = 'auto'
+INOTIFY = 'inotify'
+POLLING = 'polling'
+WATCHER_KINDS = (AUTO, INOTIFY, POLLING)
+
+# Kinds of FileEvent.
+CREATED = 'created'
+MODIFIED = 'modified'
+DELETED = 'deleted'
+
+# A change to a file or directory.
+# kind: One of CREATED, MODIFIED or DELETED.
+# path: Path of the file or directory relative to the root of the file system
+#   that is being watched, using POSIX directory separators.
+FileEvent = collections.namedtuple('FileEvent', ['kind', 'path'])
+
+# Constants from <sys/inotify.h>.
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = (_IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE |
+               _IN_DELETE | _IN_ONLYDIR)
+
+# struct inotify_event {int wd; uint32_t mask, cookie, len; char name[];}
+_EVENT_HEADER = struct.Struct('iIII')
+_READ_SIZE = 64 * 1024
+
+
+def _load_inotify():
+  """Returns the C library if it supports inotify, None otherwise."""
+  if not sys.platform.startswith('linux'):
+    return None
+  try:
+    libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                       use_errno=True)
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                       ctypes.c_uint32]
+    return libc
+  except (OSError, AttributeError):
+    return None
+
+
+_LIBC = _load_inotify()
+
+
+class PollingFileWatcher:
+  """Watcher that can't detect changes, so it reports them periodically."""
+
+  def __init__(self, poll_interval):
+    """Initializes the watcher.
+
+    Args:
+      poll_interval: Seconds between reports of unknown changes.
+    """
+    self._poll_interval = poll_interval
+    self._interrupted = threading.Event()
+
+  def wait_for_events(self, timeout=None):
+    """Waits for the poll interval to elapse.
+
+    Args:
+      timeout: Maximum number of seconds to wait, None waits for the poll
+        interval.
+
+    Returns:
+      None, as the files that changed are unknown.
+    """
+    if timeout is None or timeout > self._poll_interval:
+      timeout = self._poll_interval
+    if self._interrupted.wait(timeout):
+      self._interrupted.clear()
+    return None
+
+  def interrupt(self):
+    """Makes a blocked wait_for_events() call return."""
+    self._interrupted.set()
+
+  def close(self):
+    """Releases resources used by the watcher."""
+    self.interrupt()
+
+
+class InotifyFileWatcher:
+  """Watches a directory tree using inotify."""
+
+  def __init__(self, root_path, path, poll_interval):
+    """Initializes the watcher.
+
+    Args:
+      root_path: Absolute path events are reported relative to.
+      path: Absolute path of the directory tree to watch, which must exist.
+      poll_interval: Seconds between reports of unknown changes if the
+        watcher runs out of inotify watches.
+
+    Raises:
+      OSError: If inotify is not available.
+    """
+    if not _LIBC:
+      raise OSError(errno.ENOSYS, 'inotify is not supported.')
+    self._root_path = root_path
+    self._poll_interval = poll_interval
+    self._fd = _LIBC.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+    if self._fd < 0:
+      raise OSError(ctypes.get_errno(), 'inotify_init1 failed.')
+    # Pipe used to interrupt blocking waits.
+    self._interrupt_read, self._interrupt_write = os.pipe()
+    os.set_blocking(self._interrupt_read, False)
+    # Maps watch descriptors to absolute directory paths.
+    self._directories = {}
+    # Set when events were lost because the kernel's queue overflowed.
+    self._overflowed = False
+    # Set when a directory could not be watched, in which case the watcher
+    # behaves like a PollingFileWatcher.
+    self._degraded = False
+    self._pending = []
+    self._watch_tree(path, report=False)
+
+  def _relative_path(self, path):
+    """Returns a path relative to the root using POSIX separators."""
+    return os.path.relpath(path, self._root_path).replace(os.path.sep, '/')
+
+  def _watch_tree(self, path, report):
+    """Watches a directory and its subdirectories.
+
+    Args:
+      path: Absolute path of the directory.
+      report: Whether to report files found in the tree as created. Files
+        added to a new directory before it's watched would be missed
+        otherwise.
+    """
+    for directory, subdirectories, filenames in os.walk(path):
+      wd = _LIBC.inotify_add_watch(self._fd, os.fsencode(directory),
+                                   _WATCH_MASK)
+      if wd < 0:
+        error = ctypes.get_errno()
+        if error in (errno.ENOENT, errno.ENOTDIR):
+          # Removed while walking the tree.
+          subdirectories[:] = []
+          continue
+        logging.warning('Unable to watch %s (%s), falling back to polling.',
+                        directory, os.strerror(error))
+        self._degraded = True
+        return
+      self._directories[wd] = directory
+      subdirectories[:] = [d for d in subdirectories if not d.startswith('.')]
+      if report:
+        self._pending.append(
+            FileEvent(CREATED, self._relative_path(directory)))
+        self._pending.extend(
+            FileEvent(CREATED, self._relative_path(os.path.join(directory, f)))
+            for f in filenames if not f.startswith('.'))
+
+  def _read_events(self):
+    """Reads and parses all queued inotify events."""
+    while True:
+      try:
+        data = os.read(self._fd, _READ_SIZE)
+      except BlockingIOError:
+        return
+      offset = 0
+      while offset < len(data):
+        wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+        offset += _EVENT_HEADER.size
+        name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+        offset += length
+        self._handle_event(wd, mask, name)
+
+  def _handle_event(self, wd, mask, name):
+    """Converts an inotify event into FileEvents.
+
+    Args:
+      wd: Watch descriptor of the directory that changed.
+      mask: Mask of the event.
+      name: Name of the changed entry in the directory.
+    """
+    if mask & _IN_Q_OVERFLOW:
+      self._overflowed = True
+      return
+    if mask & _IN_IGNORED:
+      self._directories.pop(wd, None)
+      return
+    directory = self._directories.get(wd)
+    if directory is None or not name or name.startswith('.'):
+      # Hidden files are temporary files and locks.
+      return
+    path = os.path.join(directory, name)
+    if mask & (_IN_DELETE | _IN_MOVED_FROM):
+      self._pending.append(FileEvent(DELETED, self._relative_path(path)))
+    elif mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO):
+      self._watch_tree(path, report=True)
+    elif mask & (_IN_CREATE | _IN_MOVED_TO):
+      self._pending.append(FileEvent(CREATED, self._relative_path(path)))
+    elif mask & (_IN_CLOSE_WRITE | _IN_MODIFY):
+      self._pending.append(FileEvent(MODIFIED, self._relative_path(path)))
+
+  def wait_for_events(self, timeout=None):
+    """Waits for changes to the watched tree.
+
+    Args:
+      timeout: Maximum number of seconds to wait or None to wait until a
+        change occurs or the watcher is interrupted.
+
+    Returns:
+      A list of FileEvent which is empty if the wait timed out or was
+      interrupted, or None if events were lost and any file may have
+      changed.
+    """
+    self._read_events()
+    if not self._pending and not self._overflowed:
+      if self._degraded:
+        timeout = (self._poll_interval if timeout is None
+                   else min(timeout, self._poll_interval))
+      readable, _, _ = select.select(
+          [self._fd, self._interrupt_read], [], [], timeout)
+      if self._interrupt_read in readable:
+        try:
+          os.read(self._interrupt_read, _READ_SIZE)
+        except BlockingIOError:
+          pass
+      self._read_events()
+    if self._overflowed or self._degraded:
+      self._overflowed = False
+      self._pending = []
+      return None
+    events, self._pending = self._pending, []
+    return events
+
+  def interrupt(self):
+    """Makes a blocked wait_for_events() call return."""
+    os.write(self._interrupt_write, b'\0')
+
+  def close(self):
+    """Releases resources used by the watcher."""
+    for fd in (self._fd, self._interrupt_read, self._interrupt_write):
+      try:
+        os.close(fd)
+      except OSError:
+        pass
+    self._directories = {}
+
+
+def create_file_watcher(root_path, path, poll_interval, kind=AUTO):
+  """Creates a watcher, by default the most efficient one of the platform.
+
+  Args:
+    root_path: Absolute path events are reported relative to.
+    path: Absolute path of the directory tree to watch, which must exist.
+    poll_interval: Seconds between reports of unknown changes when changes
+      can't be watched.
+    kind: One of WATCHER_KINDS.
+
+  Returns:
+    An InotifyFileWatcher or a PollingFileWatcher.
+
+  Raises:
+    OSError: If kind is INOTIFY and inotify is not available.
+    ValueError: If kind is unknown.
+  """
+  if kind not in WATCHER_KINDS:
+    raise ValueError(f'Unknown file watcher {kind}, expected one of '
+                     f'{", ".join(WATCHER_KINDS)}.')
+  if kind == INOTIFY:
+    return InotifyFileWatcher(root_path, path, poll_interval)
+  if kind == AUTO and _LIBC:
+    try:
+      return InotifyFileWatcher(root_path, path, poll_interval)
+    except OSError as e:
+      logging.warning('Unable to use inotify (%s), falling back to polling.',
+                      e)
+  return PollingFileWatcher(poll_interval)
@@ -0,0 +1,150 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for file_watcher."""
+
+import os.path
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from absl.testing import absltest
+from data_store import file_system
+from data_store import file_watcher
+
+
+class PollingFileWatcherTest(absltest.TestCase):
+
+  def test_wait_for_events(self):
+    """Polling watchers report unknown changes after the poll interval."""
+    watcher = file_watcher.PollingFileWatcher(0.01)
+    self.assertIsNone(watcher.wait_for_events())
+    self.assertIsNone(watcher.wait_for_events(timeout=10))
+
+  def test_interrupt(self):
+    """Interrupting a watcher makes the wait return."""
+    watcher = file_watcher.PollingFileWatcher(60)
+    threading.Timer(0.05, watcher.interrupt).start()
+    start = time.monotonic()
+    watcher.wait_for_events()
+    self.assertLess(time.monotonic() - start, 30)
+    watcher.close()
+
+
+@absltest.skipUnless(file_watcher._LIBC, 'inotify is not supported.')
+class InotifyFileWatcherTest(absltest.TestCase):
+
+  def setUp(self):
+    """Watch a directory in a file system that uses a temporary directory."""
+    super().setUp()
+    self._temporary_directory = tempfile.TemporaryDirectory()
+    self._fs = file_system.FileSystem(self._temporary_directory.name)
+    self._watcher = self._fs.watch('watched', 60)
+
+  def tearDown(self):
+    """Clean up the watcher and temporary directory."""
+    super().tearDown()
+    self._watcher.close()
+    self._temporary_directory.cleanup()
+
+  def _wait_for_paths(self, expected_paths):
+    """Waits for events until all expected paths are reported.
+
+    Args:
+      expected_paths: Set of paths that must be reported.
+    Returns:
+      List of FileEvent received.
+    """
+    received = []
+    deadline = time.monotonic() + 5
+    while not expected_paths <= {e.path for e in received}:
+      timeout = deadline - time.monotonic()
+      self.assertGreater(timeout, 0, msg=f'Received only {received}')
+      events = self._watcher.wait_for_events(timeout=timeout)
+      self.assertIsNotNone(events)
+      received.extend(events)
+    return received
+
+  def test_watch_creates_directory(self):
+    self.assertIsInstance(self._watcher, file_watcher.InotifyFileWatcher)
+    self.assertTrue(self._fs.exists('watched'))
+
+  def test_timeout(self):
+    self.assertEqual(self._watcher.wait_for_events(timeout=0.01), [])
+
+  def test_created_files(self):
+    """Files written in new subdirectories are reported as created."""
+    self._fs.write_file('watched/a/b/c', b'data')
+    self._fs.write_file('unwatched/d', b'data')
+    events = self._wait_for_paths({'watched/a/b/c'})
+    self.assertIn(file_watcher.FileEvent(file_watcher.CREATED,
+                                         'watched/a/b/c'), events)
+    self.assertFalse(any(e.path.startswith('unwatched') for e in events))
+    # Temporary files and locks are hidden, so they're not reported.
+    self.assertFalse(any(os.path.basename(e.path).startswith('.')
+                         for e in events))
+
+  def test_deleted_files(self):
+    self._fs.write_file('watched/a', b'data')
+    self._wait_for_paths({'watched/a'})
+    self._fs.remove_file('watched/a')
+    self.assertIn(
+        file_watcher.FileEvent(file_watcher.DELETED, 'watched/a'),
+        self._wait_for_paths({'watched/a'}))
+
+  def test_interrupt(self):
+    """Interrupting a watcher makes the wait return without events."""
+    threading.Timer(0.05, self._watcher.interrupt).start()
+    self.assertEqual(self._watcher.wait_for_events(), [])
+
+  def test_overflow(self):
+    """Events lost by the kernel are reported as unknown changes."""
+    self._fs.write_file('watched/a', b'data')
+    with mock.patch.object(self._watcher, '_handle_event') as handle_event:
+      def overflow(*unused_args):
+        self._watcher._overflowed = True
+      handle_event.side_effect = overflow
+      self.assertIsNone(self._watcher.wait_for_events(timeout=5))
+    self.assertEqual(self._watcher.wait_for_events(timeout=0), [])
+
+  def test_create_file_watcher_falls_back_to_polling(self):
+    with mock.patch.object(file_watcher, '_LIBC', None):
+      self.assertIsInstance(
+          file_watcher.create_file_watcher(
+              self._temporary_directory.name, self._temporary_directory.name,
+              60),
+          file_watcher.PollingFileWatcher)
+
+  def test_create_polling_file_watcher(self):
+    watcher = self._fs.watch('watched', 60, file_watcher.POLLING)
+    self.assertIsInstance(watcher, file_watcher.PollingFileWatcher)
+    watcher.close()
+
+  def test_create_inotify_file_watcher_unsupported(self):
+    with mock.patch.object(file_watcher, '_LIBC', None):
+      with self.assertRaises(OSError):
+        file_watcher.create_file_watcher(
+            self._temporary_directory.name, self._temporary_directory.name,
+            60, file_watcher.INOTIFY)
+
+  def test_create_file_watcher_unknown_kind(self):
+    with self.assertRaises(ValueError):
+      file_watcher.create_file_watcher(
+          self._temporary_directory.name, self._temporary_directory.name, 60,
+          'fanotify')
+
+
+if __name__ == '__main__':
+  absltest.main()
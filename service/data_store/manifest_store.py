@@ -0,0 +1,176 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Lint as: python3
+"""Indexes resources by timestamp in append-only manifest files.
+
+Resources that share a key, e.g. the episode chunks of a session, are listed
+in the manifest of the key:
+
+  <key>/manifest/entries
+
+Each line of a manifest is "<timestamp_micros> <resource id>" where the
+resource id is relative to the key. Lines are appended after the resources
+they list are written so readers only find resources that can be read.
+Readers cache the manifests they read in timestamp order and only parse the
+lines that were appended since they last read a manifest, so finding the
+resources created after a timestamp costs a stat of the manifest plus work
+proportional to the number of new resources.
+
+Appends are serialized by a lock file in the manifest directory. When the
+first resource of a key is appended, the manifest is created with the
+resources of the key that were stored before the manifest existed.
+"""
+
+import bisect
+import threading
+
+# Name of the directory below a key that contains its manifest.
+MANIFEST_DIRECTORY = 'manifest'
+
+_MANIFEST_FILENAME = 'entries'
+
+# Seconds to wait for another process to finish appending to a manifest.
+_LOCK_TIMEOUT_SECONDS = 30
+
+
+class _Manifest:
+  """State of a manifest file known to a ManifestStore."""
+
+  def __init__(self, inode):
+    self.inode = inode
+    # Offset after the last complete line read from the manifest.
+    self.end = 0
+    # Size of the manifest when it was last read.
+    self.size = 0
+    # (timestamp_micros, res_id) pairs sorted in ascending order.
+    self.entries = []
+    self.entry_set = set()
+
+  def add(self, entry):
+    """Adds a (timestamp_micros, res_id) pair unless it was already read."""
+    if entry not in self.entry_set:
+      self.entry_set.add(entry)
+      bisect.insort(self.entries, entry)
+
+
+def _encode_entries(key, entries):
+  """Encodes (timestamp_micros, res_id) pairs as manifest lines."""
+  prefix_length = len(key) + 1
+  return ''.join(f'{timestamp_micros} {res_id[prefix_length:]}\n'
+                 for timestamp_micros, res_id in entries).encode('utf-8')
+
+
+class ManifestStore:
+  """Appends resources to and lists resources from manifest files."""
+
+  def __init__(self, fs):
+    """Initializes the manifest store.
+
+    Args:
+      fs: A FileSystem object.
+    """
+    self._fs = fs
+    # _Manifest objects by key.
+    self._manifests = {}
+    self._lock = threading.RLock()
+
+  @staticmethod
+  def get_path(key):
+    """Returns the path of the manifest of a key."""
+    return f'{key}/{MANIFEST_DIRECTORY}/{_MANIFEST_FILENAME}'
+
+  def _refresh(self, key):
+    """Reads lines appended to the manifest of a key.
+
+    Args:
+      key: Key of the manifest.
+    Returns:
+      The _Manifest of the key or None if the key has no manifest.
+    """
+    path = self.get_path(key)
+    try:
+      generation = self._fs.get_generation(path)
+    except (FileNotFoundError, NotADirectoryError):
+      self._manifests.pop(key, None)
+      return None
+    manifest = self._manifests.get(key)
+    if (not manifest or manifest.inode != generation.inode or
+        generation.size < manifest.size):
+      # The manifest was replaced.
+      manifest = _Manifest(generation.inode)
+      self._manifests[key] = manifest
+    if generation.size > manifest.end:
+      data = self._fs.read_file_range(path, manifest.end,
+                                      generation.size - manifest.end)
+      # Lines are only read once they are complete.
+      length = data.rfind(b'\n') + 1
+      for line in data[:length].decode('utf-8').splitlines():
+        timestamp_micros, _, res_id = line.partition(' ')
+        # Ignore lines partially written by a process that crashed.
+        if res_id and timestamp_micros.isdigit():
+          manifest.add((int(timestamp_micros), f'{key}/{res_id}'))
+      manifest.end += length
+    manifest.size = generation.size
+    return manifest
+
+  def list(self, key, min_timestamp_micros=0):
+    """Lists the resources in the manifest of a key.
+
+    Args:
+      key: Key of the manifest.
+      min_timestamp_micros: Only return resources at least as recent as this
+        timestamp.
+    Returns:
+      List of (timestamp_micros, res_id) pairs sorted in ascending order or
+      None if the key has no manifest.
+    """
+    with self._lock:
+      manifest = self._refresh(key)
+      if manifest is None:
+        return None
+      return manifest.entries[
+          bisect.bisect_left(manifest.entries, (min_timestamp_micros,)):]
+
+  def append(self, key, entries, list_resources):
+    """Appends resources to the manifest of a key.
+
+    Args:
+      key: Key of the manifest.
+      entries: Sequence of (timestamp_micros, res_id) pairs of resources that
+        were written.
+      list_resources: Callable that returns the (timestamp_micros, res_id)
+        pairs of all resources of the key, used to create the manifest of a
+        key that does not have one.
+    Raises:
+      UnableToLockFileError: If the manifest is locked by another process for
+        longer than _LOCK_TIMEOUT_SECONDS.
+    """
+    path = self.get_path(key)
+    with self._lock, self._fs.lock_file_context(
+        path, timeout=_LOCK_TIMEOUT_SECONDS):
+      manifest = self._refresh(key)
+      if manifest is None:
+        self._fs.write_file(path, _encode_entries(
+            key, sorted(set(list_resources()).union(entries))))
+        self._refresh(key)
+        return
+      data = _encode_entries(key, entries)
+      if manifest.end < manifest.size:
+        # Terminate a line partially written by a process that crashed.
+        data = b'\n' + data
+      self._fs.append_file(path, data)
+      for entry in entries:
+        manifest.add(entry)
+      manifest.end = manifest.size = manifest.size + len(data)
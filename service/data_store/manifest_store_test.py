@@ -0,0 +1,82 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for ManifestStore."""
+
+import tempfile
+from unittest import mock
+
+from absl.testing import absltest
+from data_store import file_system
+from data_store import manifest_store
+
+
+class ManifestStoreTest(absltest.TestCase):
+
+  def setUp(self):
+    """Create a manifest store that uses a temporary directory."""
+    super().setUp()
+    self._temporary_directory = tempfile.TemporaryDirectory()
+    self._fs = file_system.FileSystem(self._temporary_directory.name)
+    self._store = manifest_store.ManifestStore(self._fs)
+    self._list_resources = mock.Mock(return_value=[])
+
+  def tearDown(self):
+    """Clean up the temporary directory."""
+    super().tearDown()
+    self._temporary_directory.cleanup()
+
+  def test_append_list(self):
+    self.assertIsNone(self._store.list('k'))
+    self._list_resources.return_value = [(2, 'k/a/0'), (1, 'k/a/1')]
+    self._store.append('k', [(1, 'k/a/1')], self._list_resources)
+    self._list_resources.assert_called_once()
+    self._store.append('k', [(3, 'k/b/0'), (0, 'k/b/1')], self._list_resources)
+    self._list_resources.assert_called_once()
+    self.assertEqual(self._store.list('k'),
+                     [(0, 'k/b/1'), (1, 'k/a/1'), (2, 'k/a/0'), (3, 'k/b/0')])
+    self.assertEqual(self._store.list('k', min_timestamp_micros=2),
+                     [(2, 'k/a/0'), (3, 'k/b/0')])
+
+  def test_reads_appends_from_other_stores(self):
+    """Manifests appended to by other processes are read incrementally."""
+    other_store = manifest_store.ManifestStore(self._fs)
+    self._store.append('k', [(1, 'k/a')], self._list_resources)
+    self.assertEqual(other_store.list('k'), [(1, 'k/a')])
+    self._store.append('k', [(2, 'k/b'), (1, 'k/a')], self._list_resources)
+    with mock.patch.object(self._fs, 'read_file_range',
+                           wraps=self._fs.read_file_range) as read_range:
+      self.assertEqual(other_store.list('k'), [(1, 'k/a'), (2, 'k/b')])
+      read_range.assert_called_once()
+      self.assertGreater(read_range.call_args[0][1], 0)
+      read_range.reset_mock()
+      self.assertEqual(other_store.list('k', min_timestamp_micros=2),
+                       [(2, 'k/b')])
+      read_range.assert_not_called()
+
+  def test_partial_lines_are_ignored(self):
+    """Lines partially written by a crashed process are skipped."""
+    self._store.append('k', [(1, 'k/a')], self._list_resources)
+    path = manifest_store.ManifestStore.get_path('k')
+    self._fs.append_file(path, b'12')
+    other_store = manifest_store.ManifestStore(self._fs)
+    self.assertEqual(other_store.list('k'), [(1, 'k/a')])
+    other_store.append('k', [(2, 'k/b')], self._list_resources)
+    self.assertEqual(manifest_store.ManifestStore(self._fs).list('k'),
+                     [(1, 'k/a'), (2, 'k/b')])
+    self.assertEqual(self._store.list('k'), [(1, 'k/a'), (2, 'k/b')])
+
+
+if __name__ == '__main__':
+  absltest.main()
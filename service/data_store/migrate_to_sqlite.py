@@ -0,0 +1,86 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Lint as: python3
+"""Converts a file-per-resource data store into a SQLite data store.
+
+Usage:
+  python -m data_store.migrate_to_sqlite --root_dir /path/to/root_dir
+
+The resources stored under --root_dir are copied into the database used by
+sqlite_file_system.SQLiteFileSystem, which is created in --root_dir unless
+--destination_dir is set. The source files are left untouched. Assignment
+notifications are not migrated since they are transient.
+"""
+
+from absl import app
+from absl import flags
+from absl import logging
+from data_store import file_system
+from data_store import sqlite_file_system
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_string('root_dir', None,
+                    'Directory of the file-per-resource data store to migrate.')
+flags.DEFINE_string(
+    'destination_dir', None,
+    'Directory where the SQLite database is created. Defaults to --root_dir.')
+flags.DEFINE_integer('batch_size', 1000,
+                     'Number of files to write per database transaction.')
+
+# Directory that contains all Falken resources.
+_RESOURCES_DIR = 'projects'
+
+
+def migrate(source_fs, destination_fs, path=_RESOURCES_DIR, batch_size=1000):
+  """Copies all files under a directory from one file system to another.
+
+  Args:
+    source_fs: FileSystem to read files from.
+    destination_fs: SQLiteFileSystem to write files to.
+    path: Directory to copy.
+    batch_size: Number of files to write per database transaction.
+  Returns:
+    Number of files copied.
+  """
+  count = 0
+  batch = []
+  for f in source_fs.list_files(path):
+    batch.append((f, source_fs.read_file(f)))
+    if len(batch) >= batch_size:
+      destination_fs.write_files(batch)
+      count += len(batch)
+      batch = []
+      logging.info('Migrated %d files.', count)
+  if batch:
+    destination_fs.write_files(batch)
+    count += len(batch)
+  return count
+
+
+def main(argv):
+  if len(argv) > 1:
+    raise app.UsageError('Too many command-line arguments.')
+  source_fs = file_system.FileSystem(FLAGS.root_dir)
+  destination_fs = sqlite_file_system.SQLiteFileSystem(
+      FLAGS.destination_dir or FLAGS.root_dir)
+  count = migrate(source_fs, destination_fs, batch_size=FLAGS.batch_size)
+  logging.info('Migrated %d files from %s to %s.', count, FLAGS.root_dir,
+               destination_fs.database_path)
+
+
+if __name__ == '__main__':
+  flags.mark_flag_as_required('root_dir')
+  app.run(main)
@@ -412,8 +412,12 @@ class FalkenResourceId(ResourceId):
           }
       },
       attribute_map={
+          'sessions': [
+              'online_evaluation_summary',
+          ],
           'episodes': [
               'online_evaluation',
+              'episode_summary',
           ],
           'models': [
               'serialized_model',
@@ -16,15 +16,55 @@
 """Reads resources from and writes resources to storage."""
 
 import abc
+import bisect
+import collections
+from concurrent import futures
+import fnmatch
 import os
 import os.path
+import threading
 import time
-from typing import List, Optional, Union, Tuple, Type
+from typing import Callable, List, Optional, Sequence, Union, Tuple, Type
 
+import braceexpand
 from data_store import file_system
+from data_store import manifest_store
 from data_store import resource_id
+from data_store import segment_store
 from google.protobuf import message
 
+# Maximum number of threads used to read and write files by
+# ResourceStore.read_many() and ResourceStore.write_many().
+_MAX_IO_WORKERS = 16
+
+# Directories modified within this many nanoseconds of being listed may change
+# again without changing their modification time, so their listings are not
+# reused.
+_RACY_MODIFICATION_NANOS = 1_000_000_000
+
+# Maximum number of directory listings and resource listings cached by a
+# ResourceIndex.
+_MAX_CACHED_DIRECTORIES = 4096
+_MAX_CACHED_LISTINGS = 256
+
+# Maximum number of times ResourceStore.update() reads a resource again after
+# it was replaced by another writer.
+_MAX_UPDATE_ATTEMPTS = 10
+
+# Seconds to wait for another writer to finish updating a resource.
+_LOCK_TIMEOUT_SECONDS = 30
+
+# Generation recorded for directories whose listings should not be reused.
+_UNTRUSTED_GENERATION = object()
+
+# Timestamp ordered resources that match a resource id glob.
+# entries: Sorted list of (timestamp_micros, res_id_string) pairs.
+# directories: (path, generation) pairs for the directories that were listed
+#   to find the entries, the generation is None for missing directories.
+# pending: Paths that matched the glob but did not contain a resource file.
+_ResourceListing = collections.namedtuple(
+    '_ResourceListing', ['entries', 'directories', 'pending'])
+
 
 class NotFoundError(Exception):
   """Raised when datastore cannot find a requested object."""
@@ -36,6 +76,16 @@ class InternalError(Exception):
   pass
 
 
+class ConflictError(Exception):
+  """Raised when a resource keeps being replaced while it's updated."""
+  pass
+
+
+def _glob_has_magic(pattern: str) -> bool:
+  """Returns True if the pattern contains glob wildcards."""
+  return any(c in pattern for c in '*?[')
+
+
 class ResourceEncoder(abc.ABC):
   """Base class for resource encoders."""
 
@@ -106,6 +156,202 @@ class ResourceResolver(abc.ABC):
     """Determine resource id from the resource data object."""
     raise NotImplementedError()
 
+  def get_segment_key(self, res_id: str) -> Optional[str]:
+    """Determine the key of the segments a resource is appended to.
+
+    Args:
+      res_id: Resource id string, which may be a glob.
+    Returns:
+      The key, a glob if res_id is a glob, or None if the resource is stored
+      in its own file.
+    """
+    del res_id  # Unused.
+    return None
+
+  def get_manifest_key(self, res_id: str) -> Optional[str]:
+    """Determine the key of the manifest that lists a resource by timestamp.
+
+    Args:
+      res_id: Resource id string, which may be a glob.
+    Returns:
+      The key, a glob if res_id is a glob, or None if the resource is not
+      listed in a manifest.
+    """
+    del res_id  # Unused.
+    return None
+
+
+class ResourceIndex:
+  """In-memory index that maps resource ids to their timestamps.
+
+  The timestamp of a resource never changes once the resource is created, so
+  entries stay valid even when other processes write to the same store. Only
+  positive lookups are answered from the index; resources that are missing
+  from it are looked up in the file system and added on success.
+
+  The index also caches directory listings and timestamp ordered resource
+  listings used to paginate ResourceStore.list(). These are tagged with the
+  generation of the directories they were read from so that they can be
+  revalidated with a stat rather than a directory scan.
+  """
+
+  def __init__(self):
+    # Maps resource id strings to microsecond timestamps.
+    self._timestamps = {}
+    # Maps directory paths to (generation, names) pairs.
+    self._directories = collections.OrderedDict()
+    # Maps resource id glob strings to _ResourceListing instances.
+    self._listings = collections.OrderedDict()
+    self._lock = threading.Lock()
+
+  def __len__(self) -> int:
+    return len(self._timestamps)
+
+  def get_timestamp_micros(
+      self, res_id: Union[str, resource_id.ResourceId]) -> Optional[int]:
+    """Returns the timestamp of a resource or None if it is not indexed."""
+    return self._timestamps.get(str(res_id))
+
+  def set_timestamp_micros(self, res_id: Union[str, resource_id.ResourceId],
+                           timestamp_micros: int):
+    """Records the timestamp of a resource."""
+    with self._lock:
+      self._timestamps[str(res_id)] = timestamp_micros
+
+  def reset(self, timestamps_by_id):
+    """Replaces the contents of the index.
+
+    Args:
+      timestamps_by_id: Dictionary that maps resource id strings to
+        microsecond timestamps.
+    """
+    with self._lock:
+      self._timestamps = dict(timestamps_by_id)
+
+  @staticmethod
+  def _get_cached(cache, key):
+    """Returns a value from an LRU cache or None if it's not present."""
+    value = cache.get(key)
+    if value is not None:
+      try:
+        cache.move_to_end(key)
+      except KeyError:
+        pass  # Evicted by another thread.
+    return value
+
+  @staticmethod
+  def _set_cached(cache, key, value, max_size):
+    """Adds a value to an LRU cache evicting the oldest values if required."""
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > max_size:
+      cache.popitem(last=False)
+
+  def get_directory(self, path: str):
+    """Returns a cached (generation, names) directory listing or None."""
+    with self._lock:
+      return self._get_cached(self._directories, path)
+
+  def set_directory(self, path: str, generation: file_system.FileGeneration,
+                    names: List[str]):
+    """Caches the names of the entries in a directory."""
+    with self._lock:
+      self._set_cached(self._directories, path, (generation, names),
+                       _MAX_CACHED_DIRECTORIES)
+
+  def get_listing(self, res_id_glob: str):
+    """Returns a cached resource listing for a glob or None."""
+    with self._lock:
+      return self._get_cached(self._listings, res_id_glob)
+
+  def set_listing(self, res_id_glob: str, listing):
+    """Caches a resource listing for a glob."""
+    with self._lock:
+      self._set_cached(self._listings, res_id_glob, listing,
+                       _MAX_CACHED_LISTINGS)
+
+
+class ResourceCache:
+  """Size bounded LRU cache of decoded resources.
+
+  Resources are keyed by the path of their file, which encodes the resource id
+  and timestamp, and tagged with the generation of the file they were decoded
+  from. Files are replaced rather than modified in place, so a matching
+  generation means the cached resource is current even when other processes
+  write to the same store. Copies of resources are stored and returned so
+  callers can modify them freely.
+  """
+
+  def __init__(self, max_size: int = 1024):
+    """Initializes the cache.
+
+    Args:
+      max_size: Maximum number of resources to cache.
+    """
+    self._max_size = max_size
+    # Maps file paths to (generation, resource) pairs.
+    self._resources = collections.OrderedDict()
+    self._lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+
+  def __len__(self) -> int:
+    return len(self._resources)
+
+  @staticmethod
+  def _copy(resource: message.Message) -> message.Message:
+    """Returns a copy of a resource."""
+    resource_copy = type(resource)()
+    resource_copy.CopyFrom(resource)
+    return resource_copy
+
+  def get(self, path: str, generation: file_system.FileGeneration) -> (
+      Optional[message.Message]):
+    """Returns a copy of a cached resource.
+
+    Args:
+      path: Path of the resource file.
+      generation: Current generation of the resource file.
+
+    Returns:
+      The resource or None if it's not cached or the cached resource was
+      decoded from a different generation of the file.
+    """
+    with self._lock:
+      cached = self._resources.get(path)
+      if cached is None or cached[0] != generation:
+        self.misses += 1
+        return None
+      self._resources.move_to_end(path)
+      self.hits += 1
+      resource = cached[1]
+    return self._copy(resource)
+
+  def set(self, path: str, generation: file_system.FileGeneration,
+          resource: message.Message):
+    """Caches a copy of a resource.
+
+    Args:
+      path: Path of the resource file.
+      generation: Generation of the file the resource was decoded from.
+      resource: Resource to cache.
+    """
+    resource = self._copy(resource)
+    with self._lock:
+      self._resources[path] = (generation, resource)
+      self._resources.move_to_end(path)
+      while len(self._resources) > self._max_size:
+        self._resources.popitem(last=False)
+
+  def invalidate(self, path: str):
+    """Removes a resource from the cache.
+
+    Args:
+      path: Path of the resource file.
+    """
+    with self._lock:
+      self._resources.pop(path, None)
+
 
 class ResourceStore:
   """Stores resources with ResourceIDs in a filesystem."""
@@ -115,11 +361,39 @@ class ResourceStore:
   def __init__(self, fs: file_system.FileSystem,
                resource_encoder: ResourceEncoder,
                resource_resolver: ResourceResolver,
-               resource_id_type: Type[resource_id.ResourceId]):
+               resource_id_type: Type[resource_id.ResourceId],
+               resource_index: Optional[ResourceIndex] = None,
+               resource_cache: Optional[ResourceCache] = None,
+               segments: Optional[segment_store.SegmentStore] = None,
+               manifests: Optional[manifest_store.ManifestStore] = None):
+    """Initializes the resource store.
+
+    Args:
+      fs: A FileSystem or FakeFileSystem object.
+      resource_encoder: Encodes and decodes resources.
+      resource_resolver: Maps resources to resource ids and timestamps.
+      resource_id_type: Type used to construct resource ids.
+      resource_index: Optional ResourceIndex used to look up resource
+        timestamps without querying the file system.
+      resource_cache: Optional ResourceCache used to avoid reading and
+        decoding resources that have not changed.
+      segments: Optional SegmentStore that resources with a segment key are
+        appended to rather than being written to their own files.
+      manifests: Optional ManifestStore that resources with a manifest key are
+        listed in, so that the resources of a key created after a timestamp
+        are listed without listing all resources of the key.
+    """
     self._fs = fs
     self._encoder = resource_encoder
     self._resolver = resource_resolver
     self._resource_id_type = resource_id_type
+    self._index = resource_index
+    self._cache = resource_cache
+    self._segments = segments
+    self._manifests = manifests
+    # Thread pool used by write_many() and read_many(), created on first use.
+    self._executor = None
+    self._executor_lock = threading.Lock()
 
   def _get_filename(self, timestamp_micros: int) -> str:
     """Returns file name from microsecond timestamp."""
@@ -136,8 +410,30 @@ class ResourceStore:
     """Get the number of microseconds since the epoch."""
     return int(time.time() * 1_000_000)
 
-  def write(self, resource: message.Message) -> resource_id.ResourceId:
-    """Writes the resource to an appropriately chosen path."""
+  def _get_executor(self) -> futures.Executor:
+    """Returns the thread pool used to perform file I/O in parallel."""
+    with self._executor_lock:
+      if not self._executor:
+        self._executor = futures.ThreadPoolExecutor(
+            max_workers=_MAX_IO_WORKERS,
+            thread_name_prefix='resource_store_io')
+      return self._executor
+
+  def _prepare_write(self, resource: message.Message) -> (
+      Tuple[resource_id.ResourceId, int, str]):
+    """Determines where to write a resource and encodes it.
+
+    Args:
+      resource: Resource to write. If the resource does not have a timestamp
+        it's set to the timestamp of the existing resource or the current
+        time.
+
+    Returns:
+      (res_id, timestamp_micros, data) tuple.
+
+    Raises:
+      ValueError: If the resource exists with a different timestamp.
+    """
     res_id = self._resolver.to_resource_id(resource)
     timestamp_micros = self._resolver.get_timestamp_micros(resource)
     read_timestamp = None
@@ -165,12 +461,278 @@ class ResourceStore:
             'Resource already exists with a different timestamp: \n'
             f'resource: {resource}\nexisting timestamp: {read_timestamp}')
 
-    data = self._encoder.encode_resource(res_id, resource)
-    self._fs.write_file(self._get_path(res_id, timestamp_micros), data)
+    return res_id, timestamp_micros, self._encoder.encode_resource(
+        res_id, resource)
+
+  def _get_segment_key(self, res_id: Union[str, resource_id.ResourceId]) -> (
+      Optional[str]):
+    """Returns the segment key of a resource or None if it has its own file."""
+    if self._segments is None:
+      return None
+    return self._resolver.get_segment_key(str(res_id))
+
+  def _lookup_segment_entries(self, res_ids: Sequence[resource_id.ResourceId]):
+    """Finds the resources that are stored in segments.
+
+    Args:
+      res_ids: Ids of the resources to look up.
+    Returns:
+      List with a SegmentEntry or None for each resource id.
+    """
+    entries = [None] * len(res_ids)
+    if self._segments is None:
+      return entries
+    indices_by_key = collections.defaultdict(list)
+    for i, res_id in enumerate(res_ids):
+      key = self._get_segment_key(res_id)
+      if key is not None:
+        indices_by_key[key].append(i)
+    for key, indices in indices_by_key.items():
+      for i, entry in zip(indices, self._segments.lookup_many(
+          key, [str(res_ids[i]) for i in indices])):
+        entries[i] = entry
+    return entries
+
+  def seal_segments(self, res_id: resource_id.ResourceId):
+    """Stops appending to the segments of a key.
+
+    Resources added to the key later are appended to a new segment.
+
+    Args:
+      res_id: Segment key, e.g. the resource id of a session for the segments
+        that store its episode chunks.
+    """
+    if self._segments is not None:
+      self._segments.seal(str(res_id))
+
+  def _get_manifest_key(self, res_id: Union[str, resource_id.ResourceId]) -> (
+      Optional[str]):
+    """Returns the manifest key of a resource or None if it has none."""
+    if self._manifests is None:
+      return None
+    return self._resolver.get_manifest_key(str(res_id))
+
+  def _append_to_manifests(self, entries: Sequence[Tuple[int, str]]):
+    """Appends written resources to the manifests of their keys.
+
+    Args:
+      entries: List of (timestamp_micros, res_id_string) pairs of the
+        resources that were written.
+    """
+    entries_by_key = collections.defaultdict(list)
+    for entry in entries:
+      key = self._get_manifest_key(entry[1])
+      if key is not None:
+        entries_by_key[key].append(entry)
+    for key, key_entries in entries_by_key.items():
+      # Glob of the resources of the key that have the same type as the
+      # written resources, e.g. key/episodes/*/chunks/*.
+      parts = key_entries[0][1][len(key) + 1:].split('/')
+      res_id_glob = '/'.join(
+          [key] + [p if i % 2 == 0 else '*' for i, p in enumerate(parts)])
+      self._manifests.append(
+          key, key_entries,
+          lambda res_id_glob=res_id_glob: self._get_sorted_resources(
+              res_id_glob))
+
+  def write(self, resource: message.Message) -> resource_id.ResourceId:
+    """Writes the resource to an appropriately chosen path."""
+    res_id, timestamp_micros, data = self._prepare_write(resource)
+    key = self._get_segment_key(res_id)
+    if key is not None:
+      self._segments.append(key, [(str(res_id), timestamp_micros, data)])
+    else:
+      path = self._get_path(res_id, timestamp_micros)
+      self._fs.write_file(path, data)
+      if self._cache is not None:
+        self._cache.invalidate(path)
+    if self._index is not None:
+      self._index.set_timestamp_micros(res_id, timestamp_micros)
+    self._append_to_manifests([(timestamp_micros, str(res_id))])
     return res_id
 
+  def _read_with_generation(self, res_id: resource_id.ResourceId,
+                            path: str) -> (
+                                Tuple[message.Message,
+                                      file_system.FileGeneration]):
+    """Reads a resource stored in its own file and the file's generation.
+
+    Args:
+      res_id: The id of the resource to read.
+      path: Path of the resource file.
+    Returns:
+      (resource, generation) tuple.
+    Raises:
+      NotFoundError: If the resource does not exist.
+    """
+    try:
+      # Read the generation before the file so that a concurrent write
+      # results in a stale generation rather than a stale resource.
+      generation = self._fs.get_generation(path)
+      if self._cache is not None:
+        resource = self._cache.get(path, generation)
+        if resource is not None:
+          return resource, generation
+      data = self._fs.read_file(path)
+    except FileNotFoundError:
+      raise NotFoundError(f'Could not find resource "{res_id}"')
+    resource = self._encoder.decode_resource(res_id, data)
+    if self._cache is not None:
+      self._cache.set(path, generation, resource)
+    return resource, generation
+
+  def update(self, res_id: resource_id.ResourceId,
+             update_resource: Callable[[message.Message], bool],
+             max_attempts: int = _MAX_UPDATE_ATTEMPTS,
+             create: Optional[Callable[[], message.Message]] = None) -> (
+                 message.Message):
+    """Updates a resource without overwriting concurrent updates.
+
+    The resource is read, modified by update_resource and written back only
+    if its file was not replaced since it was read. Otherwise the update is
+    applied again to the new version of the resource, so concurrent updates
+    of the same resource, e.g. from several API processes, are all kept.
+
+    Args:
+      res_id: The id of the resource to update, it must be stored in its own
+        file.
+      update_resource: Callable that takes the resource, modifies it in place
+        and returns whether it was modified. It's called again whenever the
+        resource was replaced, resources that are not modified are not
+        written.
+      max_attempts: Maximum number of times the resource is read.
+      create: Optional callable that returns a new resource if the resource
+        does not exist. The new resource is modified by update_resource and
+        written unless another caller created the resource first, in which
+        case the created resource is updated instead.
+    Returns:
+      The updated resource.
+    Raises:
+      NotFoundError: If the resource does not exist and create is not set.
+      ConflictError: If the resource was replaced on each attempt.
+      ValueError: If the resource is stored in a segment.
+    """
+    if self._get_segment_key(res_id) is not None:
+      raise ValueError(f'Resource "{res_id}" is stored in a segment and '
+                       'can\'t be updated.')
+    for _ in range(max_attempts):
+      try:
+        path = self._get_path(res_id, self.read_timestamp_micros(res_id))
+        resource, generation = self._read_with_generation(res_id, path)
+      except NotFoundError:
+        if create is None:
+          raise
+        resource = self._create(res_id, update_resource, create)
+        if resource is None:
+          continue
+        return resource
+      if not update_resource(resource):
+        return resource
+      data = self._encoder.encode_resource(res_id, resource)
+      with self._fs.lock_file_context(path, timeout=_LOCK_TIMEOUT_SECONDS):
+        if self._fs.get_generation(path) != generation:
+          continue
+        self._fs.write_file(path, data)
+      if self._cache is not None:
+        self._cache.invalidate(path)
+      return resource
+    raise ConflictError(f'Resource "{res_id}" was replaced on each of '
+                        f'{max_attempts} attempts to update it.')
+
+  def _create(self, res_id: resource_id.ResourceId,
+              update_resource: Callable[[message.Message], bool],
+              create: Callable[[], message.Message]) -> (
+                  Optional[message.Message]):
+    """Creates a resource for update() unless it was created concurrently.
+
+    Args:
+      res_id: The id of the resource to create.
+      update_resource: Callable that modifies the created resource.
+      create: Callable that returns the resource to create.
+    Returns:
+      The created resource or None if the resource exists.
+    """
+    # The lock is shared with updates of the resource since it's stored in
+    # the same directory.
+    with self._fs.lock_file_context(
+        os.path.join(str(res_id), self._RESOURCE_PREFIX),
+        timeout=_LOCK_TIMEOUT_SECONDS):
+      try:
+        self.read_timestamp_micros(res_id)
+        return None
+      except NotFoundError:
+        pass
+      resource = create()
+      update_resource(resource)
+      self.write(resource)
+    return resource
+
+  def write_many(self, resources: Sequence[message.Message]) -> (
+      List[resource_id.ResourceId]):
+    """Writes several resources.
+
+    Timestamps are resolved and files are written in parallel, each
+    directory is only created once. Resources stored in segments are appended
+    with a single write per segment.
+
+    Args:
+      resources: Resources to write.
+
+    Returns:
+      List of the resource ids of the written resources in the same order as
+      the resources argument.
+
+    Raises:
+      ValueError: If a resource exists with a different timestamp, no
+        resources are written in this case.
+    """
+    if len(resources) <= 1:
+      return [self.write(resource) for resource in resources]
+    executor = self._get_executor()
+    prepared = list(executor.map(self._prepare_write, resources))
+    files = []
+    records_by_key = collections.defaultdict(list)
+    for res_id, timestamp_micros, data in prepared:
+      key = self._get_segment_key(res_id)
+      if key is None:
+        files.append((self._get_path(res_id, timestamp_micros), data))
+      else:
+        records_by_key[key].append((str(res_id), timestamp_micros, data))
+    for key, records in records_by_key.items():
+      self._segments.append(key, records)
+    if files:
+      self._fs.write_files(files, executor=executor)
+    for path, _ in files:
+      if self._cache is not None:
+        self._cache.invalidate(path)
+    for res_id, timestamp_micros, _ in prepared:
+      if self._index is not None:
+        self._index.set_timestamp_micros(res_id, timestamp_micros)
+    self._append_to_manifests([(timestamp_micros, str(res_id))
+                               for res_id, timestamp_micros, _ in prepared])
+    return [res_id for res_id, _, _ in prepared]
+
+  def _parse_timestamp_micros(self, path: str) -> Optional[int]:
+    """Returns the timestamp encoded in a resource path or None."""
+    filename = os.path.basename(path)
+    if not filename.startswith(self._RESOURCE_PREFIX):
+      return None
+    try:
+      return int(filename[len(self._RESOURCE_PREFIX):])
+    except ValueError:
+      return None
+
   def read_timestamp_micros(self, res_id: resource_id.ResourceId) -> int:
-    """Read the timestamp of a resource from the filesystem."""
+    """Read the timestamp of a resource from the index or the filesystem."""
+    if self._index is not None:
+      timestamp_micros = self._index.get_timestamp_micros(res_id)
+      if timestamp_micros is not None:
+        return timestamp_micros
+
+    (entry,) = self._lookup_segment_entries([res_id])
+    if entry:
+      return entry.timestamp_micros
+
     files = self._fs.glob(os.path.join(str(res_id),
                                        f'{self._RESOURCE_PREFIX}*'))
     if not files:
@@ -179,11 +741,40 @@ class ResourceStore:
       raise InternalError(
           f'Found more than one file for resource id "{res_id}"')
     (file,) = files
-    try:
-      return int(os.path.basename(file)[len(self._RESOURCE_PREFIX):])
-    except ValueError:
+    timestamp_micros = self._parse_timestamp_micros(file)
+    if timestamp_micros is None:
       raise InternalError(
           f'Could not translate filename to microsecond timestamp: "{file}"')
+    if self._index is not None:
+      self._index.set_timestamp_micros(res_id, timestamp_micros)
+    return timestamp_micros
+
+  def rebuild_index(self, path: str = ''):
+    """Rebuilds the resource index from the files stored under a path.
+
+    Resource ids with more than one resource file are left out of the index,
+    so that reading them reports an InternalError as usual.
+
+    Args:
+      path: Directory to scan for resources, relative to the file system root.
+    Raises:
+      ValueError: If the store was created without a resource index.
+    """
+    if self._index is None:
+      raise ValueError('Resource store does not have a resource index.')
+    timestamps_by_id = {}
+    duplicate_ids = set()
+    for f in self._fs.list_files(path):
+      timestamp_micros = self._parse_timestamp_micros(f)
+      if timestamp_micros is None:
+        continue
+      res_id_string = file_system.posix_path(os.path.dirname(f))
+      if res_id_string in timestamps_by_id:
+        duplicate_ids.add(res_id_string)
+      timestamps_by_id[res_id_string] = timestamp_micros
+    for res_id_string in duplicate_ids:
+      del timestamps_by_id[res_id_string]
+    self._index.reset(timestamps_by_id)
 
   def read(self, res_id: resource_id.ResourceId) -> message.Message:
     """Reads a resource by resource id and returns it.
@@ -195,12 +786,57 @@ class ResourceStore:
     Raises:
       NotFoundError: If the resource does not exist.
     """
+    (entry,) = self._lookup_segment_entries([res_id])
+    if entry:
+      (data,) = self._segments.read([entry])
+      return self._encoder.decode_resource(res_id, data)
     timestamp_micros = self.read_timestamp_micros(res_id)
+    path = self._get_path(res_id, timestamp_micros)
+    generation = None
     try:
-      data = self._fs.read_file(self._get_path(res_id, timestamp_micros))
+      if self._cache is not None:
+        # Read the generation before the file so that a concurrent write
+        # results in a stale generation rather than a stale resource.
+        generation = self._fs.get_generation(path)
+        resource = self._cache.get(path, generation)
+        if resource is not None:
+          return resource
+      data = self._fs.read_file(path)
     except FileNotFoundError:
       raise NotFoundError(f'Could not find resource "{res_id}"')
-    return self._encoder.decode_resource(res_id, data)
+    resource = self._encoder.decode_resource(res_id, data)
+    if generation is not None:
+      self._cache.set(path, generation, resource)
+    return resource
+
+  def read_many(self, res_ids: Sequence[resource_id.ResourceId]) -> (
+      List[message.Message]):
+    """Reads several resources in parallel.
+
+    Resources stored in segments are read with as few reads as possible.
+
+    Args:
+      res_ids: The ids of the resources to read.
+    Returns:
+      List of datastore protos in the same order as res_ids.
+    Raises:
+      NotFoundError: If any of the resources does not exist.
+    """
+    if len(res_ids) <= 1:
+      return [self.read(res_id) for res_id in res_ids]
+    entries = self._lookup_segment_entries(res_ids)
+    if not any(entries):
+      return list(self._get_executor().map(self.read, res_ids))
+    resources = [None] * len(res_ids)
+    segment_indices = [i for i, entry in enumerate(entries) if entry]
+    for i, data in zip(segment_indices, self._segments.read(
+        [entries[i] for i in segment_indices])):
+      resources[i] = self._encoder.decode_resource(res_ids[i], data)
+    file_indices = [i for i, entry in enumerate(entries) if not entry]
+    for i, resource in zip(file_indices, self._get_executor().map(
+        self.read, [res_ids[i] for i in file_indices])):
+      resources[i] = resource
+    return resources
 
   def _decode_token(self, token):
     """Decodes a pagination token.
@@ -243,6 +879,11 @@ class ResourceStore:
                Tuple[List[resource_id.ResourceId], str]):
     """Lists all resource_ids that match the provided pattern.
 
+    When the store has a ResourceIndex, the timestamp ordered listing of each
+    glob is cached and pages are found by seeking to the page token, so
+    listing a page of a collection that has not changed only requires a stat
+    of each globbed directory.
+
     Args:
       res_id_glob: A resource ID glob, containing '*' and brace components of
         the form '{a,b,c}' that are resolved in a shell-style fashion.
@@ -255,49 +896,344 @@ class ResourceStore:
     Returns:
       A tuple of a list of resource IDs and pagination token.
     """
-    glob_path = os.path.join(str(res_id_glob), f'{self._RESOURCE_PREFIX}*')
-    files = self._fs.glob(glob_path)
-    paths = [os.path.dirname(f) for f in files]
-    timestamps = [
-        int(os.path.basename(f)[len(self._RESOURCE_PREFIX):]) for f in files]
-    by_timestamp = sorted(zip(timestamps, paths), reverse=time_descending)
-
-    page_token_res_id = None
-    page_token_timestamp = None
-    if page_token:
-      page_token_timestamp, page_token_res_id = self._decode_token(page_token)
-    # Return True if the first item goes before the second item in a list in
-    # ascending or descending order.
-    check_is_before = (
-        lambda x, y: x > y) if time_descending else (lambda x, y: x < y)
-
-    page = []
-    last_timestamp_micros = 0
-    for (timestamp_micros, res_id_string) in by_timestamp:
-      if timestamp_micros < min_timestamp_micros:
-        # Skip if created before provided min timestamp.
-        continue
-      if page_token and check_is_before(
-          timestamp_micros, page_token_timestamp):
-        # Skip if created before the token based on time_descending.
-        continue
-      if page_token and timestamp_micros == page_token_timestamp and (
-          # Skip if item is the token.
-          res_id_string == page_token_res_id or
-          # Skip if item is before the token based on time_descending.
-          check_is_before(res_id_string, page_token_res_id)):
+    by_timestamp = self._fs.list_resources(
+        res_id_glob,
+        min_timestamp_micros=min_timestamp_micros,
+        start_after=self._decode_token(page_token) if page_token else None,
+        limit=page_size,
+        time_descending=time_descending)
+    if by_timestamp is not None:
+      # The storage engine supports indexed listing of resources.
+      page = [self._resource_id_type(r) for _, r in by_timestamp]
+      token = ''
+      if page:
+        token = self._encode_token(by_timestamp[-1][0], page[-1])
+      return page, token
+
+    by_timestamp = self._list_manifest_resources(str(res_id_glob),
+                                                 min_timestamp_micros)
+    if by_timestamp is None:
+      by_timestamp = self._get_sorted_resources(res_id_glob)
+    return self._get_page(by_timestamp, min_timestamp_micros, page_token,
+                          page_size, time_descending)
+
+  def _list_manifest_resources(self, glob_string: str,
+                               min_timestamp_micros: int) -> (
+                                   Optional[List[Tuple[int, str]]]):
+    """Finds the resources that match a glob using manifests.
+
+    Args:
+      glob_string: A resource ID glob.
+      min_timestamp_micros: Only return resources at least as recent as this
+        timestamp.
+
+    Returns:
+      List of (timestamp_micros, res_id_string) pairs sorted in ascending
+      order or None if the glob does not match the resources of a list of
+      manifest keys.
+    """
+    if self._manifests is None:
+      return None
+    patterns = list(braceexpand.braceexpand(
+        file_system.posix_path(glob_string)))
+    keys = [self._get_manifest_key(p) for p in patterns]
+    if any(key is None or _glob_has_magic(key) for key in keys):
+      return None
+    entries = set()
+    for pattern, key in zip(patterns, keys):
+      key_entries = self._manifests.list(key, min_timestamp_micros)
+      if key_entries is None:
+        # No resources of the key were written with a manifest.
+        by_timestamp = self._get_sorted_resources(pattern)
+        entries.update(by_timestamp[bisect.bisect_left(
+            by_timestamp, (min_timestamp_micros,)):])
         continue
+      pattern_parts = pattern.split('/')
+      for timestamp_micros, res_id in key_entries:
+        parts = res_id.split('/')
+        if len(parts) == len(pattern_parts) and all(
+            fnmatch.fnmatchcase(a, b) for a, b in zip(parts, pattern_parts)):
+          entries.add((timestamp_micros, res_id))
+    return sorted(entries)
 
-      page.append(self._resource_id_type(res_id_string))
-      last_timestamp_micros = timestamp_micros
-      if page_size and len(page) == page_size:
-        break
+  def _get_page(self, by_timestamp: List[Tuple[int, str]],
+                min_timestamp_micros: int, page_token: Optional[str],
+                page_size: Optional[int], time_descending: bool) -> (
+                    Tuple[List[resource_id.ResourceId], str]):
+    """Selects a page of resource ids from a sorted list.
+
+    Args:
+      by_timestamp: List of (timestamp_micros, res_id_string) pairs sorted in
+        ascending order.
+      min_timestamp_micros: Only return res_ids at least as recent as this
+        timestamp.
+      page_token: The token for the previous page if any.
+      page_size: The size of the page or None to return all IDs.
+      time_descending: If True, list items in descending create time.
+
+    Returns:
+      A tuple of a list of resource IDs and pagination token.
+    """
+    start = bisect.bisect_left(by_timestamp, (min_timestamp_micros,))
+    end = len(by_timestamp)
+    if time_descending:
+      if page_token:
+        end = bisect.bisect_left(by_timestamp, self._decode_token(page_token))
+      if page_size:
+        start = max(start, end - page_size)
+      selected = by_timestamp[start:end][::-1]
+    else:
+      if page_token:
+        start = max(start, bisect.bisect_right(by_timestamp,
+                                               self._decode_token(page_token)))
+      if page_size:
+        end = min(end, start + page_size)
+      selected = by_timestamp[start:end]
 
+    page = [self._resource_id_type(r) for _, r in selected]
     token = ''
     if page:
-      token = self._encode_token(last_timestamp_micros, page[-1])
+      token = self._encode_token(selected[-1][0], page[-1])
     return page, token
 
+  def _get_sorted_resources(self, res_id_glob: resource_id.ResourceId) -> (
+      List[Tuple[int, str]]):
+    """Finds the resources that match a glob.
+
+    Args:
+      res_id_glob: A resource ID glob.
+
+    Returns:
+      List of (timestamp_micros, res_id_string) pairs sorted in ascending
+      order.
+    """
+    if self._index is None:
+      glob_path = os.path.join(str(res_id_glob), f'{self._RESOURCE_PREFIX}*')
+      files = self._fs.glob(glob_path)
+      paths = [file_system.posix_path(os.path.dirname(f)) for f in files]
+      timestamps = [self._parse_timestamp_micros(f) for f in files]
+      entries = set(zip(timestamps, paths))
+      entries.update(self._list_segment_resources(str(res_id_glob)))
+      return sorted(entries)
+
+    glob_string = str(res_id_glob)
+    listing = self._index.get_listing(glob_string)
+    if listing and self._is_listing_current(listing):
+      return listing.entries
+
+    entries = set()
+    directories = []
+    pending = []
+    for pattern in braceexpand.braceexpand(
+        file_system.posix_path(glob_string)):
+      self._scan_resources(pattern.strip('/').split('/'), '', entries,
+                           directories, pending)
+    entries.update(self._list_segment_resources(glob_string, directories))
+    listing = _ResourceListing(sorted(entries), directories, pending)
+    self._index.set_listing(glob_string, listing)
+    return listing.entries
+
+  def _get_generation(self, path: str) -> Optional[file_system.FileGeneration]:
+    """Returns the generation of a path or None if it doesn't exist."""
+    try:
+      return self._fs.get_generation(path)
+    except (FileNotFoundError, NotADirectoryError):
+      return None
+
+  def _list_directory(self, path: str):
+    """Lists a directory using the index's cache if it's up to date.
+
+    Args:
+      path: Directory to list.
+
+    Returns:
+      (generation, names) tuple where generation is the generation of the
+      directory the names were read from, None if the directory does not
+      exist or _UNTRUSTED_GENERATION if the directory was modified too recently
+      for the listing to be reused.
+    """
+    # Read the generation before listing the directory so that changes made
+    # while listing result in a stale generation rather than a stale listing.
+    now_nanos = time.time_ns()
+    generation = self._get_generation(path)
+    if generation is None:
+      return None, []
+    cached = self._index.get_directory(path)
+    if cached and cached[0] == generation:
+      return cached
+    try:
+      names = self._fs.list_directory(path)
+    except (FileNotFoundError, NotADirectoryError):
+      return None, []
+    if generation.mtime_ns > now_nanos - _RACY_MODIFICATION_NANOS:
+      return _UNTRUSTED_GENERATION, names
+    self._index.set_directory(path, generation, names)
+    return generation, names
+
+  def _read_resource_timestamps(self, path: str) -> List[int]:
+    """Reads the timestamps of the resource files in a directory."""
+    timestamp_micros = self._index.get_timestamp_micros(path)
+    if timestamp_micros is not None:
+      return [timestamp_micros]
+    try:
+      names = self._fs.list_directory(path)
+    except (FileNotFoundError, NotADirectoryError):
+      return []
+    timestamps = [t for t in (self._parse_timestamp_micros(n) for n in names)
+                  if t is not None]
+    if len(timestamps) == 1:
+      self._index.set_timestamp_micros(path, timestamps[0])
+    return timestamps
+
+  def _scan_resources(self, segments: List[str], base: str, entries, directories,
+                      pending):
+    """Finds resources matching a glob by listing each globbed directory.
+
+    Args:
+      segments: Path segments of the glob relative to base.
+      base: Directory the glob segments are relative to.
+      entries: Set of (timestamp_micros, res_id_string) pairs which is
+        populated with the resources found.
+      directories: List of (path, generation) pairs which is populated with
+        the directories listed.
+      pending: List of paths that match the glob without containing a
+        resource file.
+    """
+    for i, segment in enumerate(segments):
+      if _glob_has_magic(segment):
+        break
+    else:
+      path = '/'.join([base] + segments) if base else '/'.join(segments)
+      timestamps = self._read_resource_timestamps(path)
+      if not timestamps:
+        pending.append(path)
+      for timestamp_micros in timestamps:
+        entries.add((timestamp_micros, path))
+      return
+
+    parent = '/'.join([base] + segments[:i]) if base else '/'.join(
+        segments[:i])
+    generation, names = self._list_directory(parent)
+    directories.append((parent, generation))
+    segment = segments[i]
+    for name in names:
+      if name.startswith('.') and not segment.startswith('.'):
+        continue
+      if fnmatch.fnmatchcase(name, segment):
+        self._scan_resources(segments[i + 1:],
+                             f'{parent}/{name}' if parent else name,
+                             entries, directories, pending)
+
+  def _get_listing_generation(self, path: str):
+    """Returns the generation of a path to validate a cached listing with.
+
+    Args:
+      path: Path of a file or directory.
+    Returns:
+      The generation of the path, None if it does not exist or
+      _UNTRUSTED_GENERATION if it was modified too recently.
+    """
+    now_nanos = time.time_ns()
+    generation = self._get_generation(path)
+    if (generation is not None and
+        generation.mtime_ns > now_nanos - _RACY_MODIFICATION_NANOS):
+      return _UNTRUSTED_GENERATION
+    return generation
+
+  def _scan_directories(self, segments: List[str], base: str, found,
+                        directories):
+    """Finds directories matching a glob by listing each globbed directory.
+
+    Args:
+      segments: Path segments of the glob relative to base.
+      base: Directory the glob segments are relative to.
+      found: List of paths which is populated with the directories found.
+      directories: List of (path, generation) pairs which is populated with
+        the directories listed and found.
+    """
+    for i, segment in enumerate(segments):
+      if _glob_has_magic(segment):
+        break
+    else:
+      path = '/'.join([base] + segments) if base else '/'.join(segments)
+      generation = self._get_listing_generation(path)
+      directories.append((path, generation))
+      if generation is not None:
+        found.append(path)
+      return
+
+    parent = '/'.join([base] + segments[:i]) if base else '/'.join(
+        segments[:i])
+    generation, names = self._list_directory(parent)
+    directories.append((parent, generation))
+    for name in names:
+      if not name.startswith('.') and fnmatch.fnmatchcase(name, segments[i]):
+        self._scan_directories(segments[i + 1:],
+                               f'{parent}/{name}' if parent else name,
+                               found, directories)
+
+  def _list_segment_resources(self, glob_string: str, directories=None):
+    """Finds the resources stored in segments that match a glob.
+
+    Args:
+      glob_string: A resource ID glob.
+      directories: List of (path, generation) pairs which is populated with
+        the directories and segments read when the store has a ResourceIndex,
+        None otherwise.
+    Returns:
+      Set of (timestamp_micros, res_id_string) pairs.
+    """
+    key_glob = self._get_segment_key(glob_string)
+    if key_glob is None:
+      return set()
+    segment_directories = []
+    if directories is None:
+      segment_directories = self._fs.glob(
+          segment_store.SegmentStore.get_directory(key_glob))
+    else:
+      for pattern in braceexpand.braceexpand(file_system.posix_path(
+          segment_store.SegmentStore.get_directory(key_glob))):
+        self._scan_directories(pattern.strip('/').split('/'), '',
+                               segment_directories, directories)
+    patterns = [p.strip('/').split('/') for p in braceexpand.braceexpand(
+        file_system.posix_path(glob_string))]
+    entries = set()
+    for directory in segment_directories:
+      key = file_system.posix_path(os.path.dirname(directory))
+      key_entries, generations = self._segments.list(key)
+      for timestamp_micros, res_id in key_entries:
+        parts = res_id.split('/')
+        if any(len(parts) == len(p) and
+               all(fnmatch.fnmatchcase(a, b) for a, b in zip(parts, p))
+               for p in patterns):
+          entries.add((timestamp_micros, res_id))
+      if directories is not None:
+        now_nanos = time.time_ns()
+        for path, generation in generations:
+          if generation.mtime_ns > now_nanos - _RACY_MODIFICATION_NANOS:
+            generation = _UNTRUSTED_GENERATION
+          directories.append((path, generation))
+    return entries
+
+  def _is_listing_current(self, listing) -> bool:
+    """Determines whether a cached resource listing is up to date.
+
+    Args:
+      listing: _ResourceListing to check.
+
+    Returns:
+      True if none of the directories the listing was built from changed and
+      no resource files were added to the pending paths.
+    """
+    for path, generation in listing.directories:
+      if (generation is _UNTRUSTED_GENERATION or
+          self._get_generation(path) != generation):
+        return False
+    for path in listing.pending:
+      if self._read_resource_timestamps(path):
+        return False
+    return True
+
   def read_by_proto_ids(
       self,
       attribute_type: Optional[Type[message.Message]] = None,
@@ -394,5 +1330,66 @@ class ResourceStore:
 
   def get_most_recent(self, res_id_glob: Union[str, resource_id.ResourceId]):
     """Returns the most recent ID matching the glob or None if not found."""
-    resource_ids, _ = self.list(res_id_glob, page_size=None)
-    return resource_ids[-1] if resource_ids else None
+    return self.nth(res_id_glob, 0, time_descending=True)
+
+  def count(self, res_id_glob: Union[str, resource_id.ResourceId],
+            min_timestamp_micros: int = 0) -> int:
+    """Counts the resources that match a glob without listing their IDs.
+
+    When the store has a ResourceIndex the count is found with a binary search
+    of the cached listing of the glob.
+
+    Args:
+      res_id_glob: A resource ID glob.
+      min_timestamp_micros: Only count resources at least as recent as this
+        timestamp.
+
+    Returns:
+      Number of resources that match the glob.
+    """
+    count = self._fs.count_resources(
+        res_id_glob, min_timestamp_micros=min_timestamp_micros)
+    if count is not None:
+      return count
+    by_timestamp = self._get_sorted_resources(res_id_glob)
+    return len(by_timestamp) - bisect.bisect_left(by_timestamp,
+                                                  (min_timestamp_micros,))
+
+  def exists(self, res_id: Union[str, resource_id.ResourceId]) -> bool:
+    """Returns whether a resource exists without reading it."""
+    try:
+      self.read_timestamp_micros(res_id)
+      return True
+    except NotFoundError:
+      return False
+
+  def nth(self, res_id_glob: Union[str, resource_id.ResourceId], index: int,
+          time_descending: Optional[bool] = False) -> (
+              Optional[resource_id.ResourceId]):
+    """Returns the ID of the resource at a position in a listing of a glob.
+
+    Args:
+      res_id_glob: A resource ID glob.
+      index: Position of the resource in the timestamp ordered listing of the
+        glob.
+      time_descending: If True, index the listing in descending create time.
+
+    Returns:
+      ID of the resource or None if fewer than index + 1 resources match the
+      glob.
+
+    Raises:
+      ValueError: If the index is negative.
+    """
+    if index < 0:
+      raise ValueError(f'Invalid resource index {index}.')
+    by_timestamp = self._fs.list_resources(res_id_glob, limit=index + 1,
+                                           time_descending=time_descending)
+    if by_timestamp is None:
+      by_timestamp = self._get_sorted_resources(res_id_glob)
+      if time_descending:
+        index = len(by_timestamp) - 1 - index
+    if not 0 <= index < len(by_timestamp):
+      return None
+    _, res_id = by_timestamp[index]
+    return self._resource_id_type(res_id)
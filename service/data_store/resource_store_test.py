@@ -22,6 +22,7 @@ from absl.testing import parameterized
 from data_store import file_system
 from data_store import resource_id
 from data_store import resource_store
+from google.protobuf import timestamp_pb2
 
 
 class ResourceStoreTest(parameterized.TestCase):
@@ -114,6 +115,104 @@ class ResourceStoreTest(parameterized.TestCase):
         mock_read_file.assert_called_once_with(
             self._resource_store._get_path(mock_resource_id, timestamp))
 
+  def test_index_is_updated_on_write(self):
+    index = resource_store.ResourceIndex()
+    store = resource_store.ResourceStore(
+        self._fs, self._mock_resource_encoder, self._mock_resource_resolver,
+        dict, resource_index=index)
+    self._mock_resource_resolver.to_resource_id.return_value = 'a/resource'
+    self._mock_resource_resolver.get_timestamp_micros.return_value = 42
+    self._mock_resource_encoder.encode_resource.return_value = b'data'
+    store.write(mock.Mock())
+    self.assertEqual(index.get_timestamp_micros('a/resource'), 42)
+
+    with mock.patch.object(self._fs, 'glob') as mock_glob:
+      self.assertEqual(store.read_timestamp_micros('a/resource'), 42)
+      mock_glob.assert_not_called()
+
+  def test_index_is_populated_on_read(self):
+    index = resource_store.ResourceIndex()
+    store = resource_store.ResourceStore(
+        self._fs, self._mock_resource_encoder, self._mock_resource_resolver,
+        dict, resource_index=index)
+    self._fs.write_file(store._get_path('a/resource', 7), b'data')
+    self.assertIsNone(index.get_timestamp_micros('a/resource'))
+    self.assertEqual(store.read_timestamp_micros('a/resource'), 7)
+    self.assertEqual(index.get_timestamp_micros('a/resource'), 7)
+    with self.assertRaises(resource_store.NotFoundError):
+      store.read_timestamp_micros('another/resource')
+
+  def test_rebuild_index(self):
+    index = resource_store.ResourceIndex()
+    store = resource_store.ResourceStore(
+        self._fs, self._mock_resource_encoder, self._mock_resource_resolver,
+        dict, resource_index=index)
+    self._fs.write_file(store._get_path('a/resource', 1), b'data')
+    self._fs.write_file(store._get_path('a/resource/b/child', 2), b'data')
+    self._fs.write_file(store._get_path('a/duplicate', 3), b'data')
+    self._fs.write_file(store._get_path('a/duplicate', 4), b'data')
+    self._fs.write_file('a/resource/.lock', b'')
+    store.rebuild_index('a')
+    self.assertLen(index, 2)
+    self.assertEqual(index.get_timestamp_micros('a/resource'), 1)
+    self.assertEqual(index.get_timestamp_micros('a/resource/b/child'), 2)
+    with self.assertRaises(resource_store.InternalError):
+      store.read_timestamp_micros('a/duplicate')
+
+  def test_rebuild_index_without_index(self):
+    with self.assertRaises(ValueError):
+      self._resource_store.rebuild_index()
+
+  def test_cache_is_used_on_read(self):
+    cache = resource_store.ResourceCache()
+    store = resource_store.ResourceStore(
+        self._fs, self._mock_resource_encoder, self._mock_resource_resolver,
+        dict, resource_cache=cache)
+    self._fs.write_file(store._get_path('a/resource', 7), b'data')
+    self._mock_resource_encoder.decode_resource.side_effect = (
+        lambda unused_res_id, data: timestamp_pb2.Timestamp(seconds=len(data)))
+
+    first = store.read('a/resource')
+    self.assertEqual(first.seconds, 4)
+    # Returned resources are copies of the cached resource.
+    first.seconds = 42
+    self.assertEqual(store.read('a/resource').seconds, 4)
+    self.assertEqual((cache.hits, cache.misses), (1, 1))
+    self._mock_resource_encoder.decode_resource.assert_called_once()
+
+    # Writes by other processes are detected by the generation check.
+    self._fs.write_file(store._get_path('a/resource', 7), b'new data')
+    self.assertEqual(store.read('a/resource').seconds, 8)
+    self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+  def test_cache_is_invalidated_on_write(self):
+    cache = resource_store.ResourceCache()
+    store = resource_store.ResourceStore(
+        self._fs, self._mock_resource_encoder, self._mock_resource_resolver,
+        dict, resource_cache=cache)
+    path = store._get_path('a/resource', 42)
+    cache.set(path, file_system.FileGeneration(1, 2, 3),
+              timestamp_pb2.Timestamp())
+    self.assertLen(cache, 1)
+    self._mock_resource_resolver.to_resource_id.return_value = 'a/resource'
+    self._mock_resource_resolver.get_timestamp_micros.return_value = 42
+    self._mock_resource_encoder.encode_resource.return_value = b'data'
+    store.write(mock.Mock())
+    self.assertEmpty(cache)
+
+  def test_cache_evicts_least_recently_used(self):
+    cache = resource_store.ResourceCache(max_size=2)
+    generation = file_system.FileGeneration(1, 2, 3)
+    for i in range(3):
+      cache.set(f'r{i}', generation, timestamp_pb2.Timestamp(seconds=i))
+      # Keep r0 alive.
+      self.assertIsNotNone(cache.get('r0', generation))
+    self.assertLen(cache, 2)
+    self.assertIsNone(cache.get('r1', generation))
+    self.assertEqual(cache.get('r2', generation).seconds, 2)
+    self.assertIsNone(
+        cache.get('r2', file_system.FileGeneration(1, 2, 4)))
+
   def test_read_by_proto_ids(self):
     with mock.patch.object(self._resource_store, 'read') as mock_read:
       with mock.patch.object(self._resource_store,
@@ -158,19 +257,14 @@ class ResourceStoreTest(parameterized.TestCase):
     self.assertEqual(
         resource_store.ResourceStore.get_timestamp_in_microseconds(), 123000)
 
-  @parameterized.named_parameters(
-      ('No items', None, None, None),
-      ('Has items', [5, 4, 3], 'page_token', 3))
-  def test_get_most_recent(self, listed_resource_ids, page_token,
-                           expected_resource_id):
-    with mock.patch.object(self._resource_store, 'list') as mock_list:
+  def test_get_most_recent(self):
+    with mock.patch.object(self._resource_store, 'nth') as mock_nth:
       mock_resource_id_glob = mock.Mock()
-      mock_list.return_value = (listed_resource_ids, page_token)
       self.assertEqual(
           self._resource_store.get_most_recent(mock_resource_id_glob),
-          expected_resource_id)
-      mock_list.assert_called_once_with(mock_resource_id_glob,
-                                        page_size=mock.ANY)
+          mock_nth.return_value)
+      mock_nth.assert_called_once_with(mock_resource_id_glob, 0,
+                                       time_descending=True)
 
   def test_decode_token(self):
     self.assertEqual((12, 'ab'), self._resource_store._decode_token('12:ab'))
@@ -0,0 +1,428 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Lint as: python3
+"""Stores groups of small resources in append-only segment files.
+
+Resources that share a key, e.g. the episode chunks of a session, are
+appended to the segment files in the "segments" directory below the key:
+
+  <key>/segments/segment.<sequence number>
+  <key>/segments/segment.<sequence number>.index
+
+Each segment is a sequence of records:
+
+  <record header><resource id><data>
+
+The header contains a CRC32 of the rest of the record so that partially
+written records are ignored by readers. Appends are serialized by a lock file
+in the segments directory. A segment is sealed by writing its index, a list of
+the offsets of the records it contains, after which nothing is appended to it.
+Readers load the index of sealed segments and scan the records of the segment
+that is being appended to.
+"""
+
+import collections
+import os.path
+import struct
+import threading
+import zlib
+
+# Name of the directory below a key that contains its segments.
+SEGMENTS_DIRECTORY = 'segments'
+
+_SEGMENT_PREFIX = 'segment.'
+_INDEX_SUFFIX = '.index'
+
+# Segments that reach this size are sealed and a new segment is started.
+_MAX_SEGMENT_BYTES = 64 * 1024 * 1024
+
+# Seconds to wait for another process to finish appending to a segment.
+_LOCK_TIMEOUT_SECONDS = 30
+
+# Records read by read() that are at most this many bytes apart are read with
+# a single read of at most _MAX_READ_BYTES.
+_MAX_READ_GAP_BYTES = 64 * 1024
+_MAX_READ_BYTES = 16 * 1024 * 1024
+
+# crc32, resource id length, data length, timestamp_micros.
+_RECORD_HEADER = struct.Struct('<IHIQ')
+# Offset of the CRC32 protected part of the record header.
+_RECORD_CRC_OFFSET = 4
+# Data offset, data length, timestamp_micros and resource id length.
+_INDEX_ENTRY = struct.Struct('<QIQH')
+
+# Location of a resource in a segment.
+# path: Path of the segment file.
+# offset: Offset of the resource data in the segment.
+# length: Length of the resource data.
+# timestamp_micros: Timestamp of the resource.
+SegmentEntry = collections.namedtuple(
+    'SegmentEntry', ['path', 'offset', 'length', 'timestamp_micros'])
+
+
+class _Segment:
+  """State of a segment file known to a SegmentStore."""
+
+  def __init__(self, path):
+    self.path = path
+    # Offset after the last valid record read from the segment.
+    self.end = 0
+    # Size of the segment the last time it was read.
+    self.size = 0
+    # Generation of the segment before it was last read.
+    self.generation = None
+    self.sealed = False
+
+
+class _SegmentGroup:
+  """Segments that store the resources of a key."""
+
+  def __init__(self):
+    # Generation of the segments directory when it was last listed.
+    self.generation = None
+    # Segment objects by path, in sequence order.
+    self.segments = collections.OrderedDict()
+    # Maps resource ids to the SegmentEntry of their most recent record.
+    self.entries = {}
+
+  @property
+  def active_segment(self):
+    """Returns the most recent segment if it can be appended to."""
+    if self.segments:
+      segment = next(reversed(self.segments.values()))
+      if not segment.sealed:
+        return segment
+    return None
+
+
+def _parse_sequence_number(name):
+  """Returns the sequence number of a segment file name or None."""
+  if not name.startswith(_SEGMENT_PREFIX) or name.endswith(_INDEX_SUFFIX):
+    return None
+  try:
+    return int(name[len(_SEGMENT_PREFIX):])
+  except ValueError:
+    return None
+
+
+def _encode_record(res_id, timestamp_micros, data):
+  """Encodes a resource as a segment record.
+
+  Args:
+    res_id: Resource id string.
+    timestamp_micros: Timestamp of the resource.
+    data: Encoded resource.
+  Returns:
+    (record, data_offset) tuple where data_offset is the offset of the data
+    in the record.
+  """
+  encoded_id = res_id.encode('utf-8')
+  header = _RECORD_HEADER.pack(0, len(encoded_id), len(data), timestamp_micros)
+  crc = zlib.crc32(header[_RECORD_CRC_OFFSET:])
+  crc = zlib.crc32(encoded_id, crc)
+  crc = zlib.crc32(data, crc)
+  record = b''.join([struct.pack('<I', crc), header[_RECORD_CRC_OFFSET:],
+                     encoded_id, data])
+  return record, _RECORD_HEADER.size + len(encoded_id)
+
+
+def _decode_records(data, offset):
+  """Decodes the valid records at the start of a buffer.
+
+  Args:
+    data: Bytes read from a segment.
+    offset: Offset of data in the segment.
+  Yields:
+    (res_id, data_offset, data_length, timestamp_micros, end) tuples where
+    end is the offset after the record, with offsets relative to the start
+    of the segment. Stops at the first incomplete or corrupt record.
+  """
+  position = 0
+  view = memoryview(data)
+  while position + _RECORD_HEADER.size <= len(data):
+    crc, id_length, data_length, timestamp_micros = (
+        _RECORD_HEADER.unpack_from(data, position))
+    end = position + _RECORD_HEADER.size + id_length + data_length
+    if end > len(data):
+      return
+    if zlib.crc32(view[position + _RECORD_CRC_OFFSET:end]) != crc:
+      return
+    id_start = position + _RECORD_HEADER.size
+    res_id = bytes(view[id_start:id_start + id_length]).decode('utf-8')
+    yield (res_id, offset + id_start + id_length, data_length,
+           timestamp_micros, offset + end)
+    position = end
+
+
+class SegmentStore:
+  """Appends resources to and reads resources from segment files."""
+
+  def __init__(self, fs, max_segment_bytes=_MAX_SEGMENT_BYTES):
+    """Initializes the segment store.
+
+    Args:
+      fs: A FileSystem object.
+      max_segment_bytes: Size after which segments are sealed.
+    """
+    self._fs = fs
+    self._max_segment_bytes = max_segment_bytes
+    # _SegmentGroup objects by key.
+    self._groups = {}
+    self._lock = threading.RLock()
+
+  @staticmethod
+  def get_directory(key):
+    """Returns the directory that contains the segments of a key."""
+    return f'{key}/{SEGMENTS_DIRECTORY}'
+
+  def _get_segment_path(self, key, sequence_number):
+    """Returns the path of a segment."""
+    return (f'{self.get_directory(key)}/'
+            f'{_SEGMENT_PREFIX}{sequence_number:08d}')
+
+  def _read_index(self, group, segment):
+    """Reads the index of a sealed segment into a group.
+
+    Args:
+      group: _SegmentGroup to add the entries to.
+      segment: Sealed _Segment to read the index of.
+    """
+    data = self._fs.read_file(segment.path + _INDEX_SUFFIX)
+    position = 0
+    while position < len(data):
+      offset, length, timestamp_micros, id_length = (
+          _INDEX_ENTRY.unpack_from(data, position))
+      position += _INDEX_ENTRY.size
+      res_id = data[position:position + id_length].decode('utf-8')
+      position += id_length
+      group.entries[res_id] = SegmentEntry(segment.path, offset, length,
+                                           timestamp_micros)
+      segment.end = max(segment.end, offset + length)
+    segment.size = segment.end
+
+  def _scan_segment(self, group, segment, size):
+    """Reads records appended to a segment since it was last scanned.
+
+    Args:
+      group: _SegmentGroup to add the entries to.
+      segment: _Segment to scan.
+      size: Current size of the segment.
+    """
+    if size <= segment.end:
+      segment.size = size
+      return
+    data = self._fs.read_file_range(segment.path, segment.end,
+                                    size - segment.end)
+    for res_id, offset, length, timestamp_micros, end in _decode_records(
+        data, segment.end):
+      group.entries[res_id] = SegmentEntry(segment.path, offset, length,
+                                           timestamp_micros)
+      segment.end = end
+    segment.size = size
+
+  def _refresh(self, key):
+    """Reads changes made to the segments of a key.
+
+    Args:
+      key: Key of the segments.
+    Returns:
+      The _SegmentGroup of the key.
+    """
+    group = self._groups.setdefault(key, _SegmentGroup())
+    directory = self.get_directory(key)
+    try:
+      generation = self._fs.get_generation(directory)
+    except (FileNotFoundError, NotADirectoryError):
+      return group
+    if generation != group.generation:
+      names = set(self._fs.list_directory(directory))
+      sequence_numbers = sorted(
+          n for n in (_parse_sequence_number(name) for name in names)
+          if n is not None)
+      for sequence_number in sequence_numbers:
+        path = self._get_segment_path(key, sequence_number)
+        segment = group.segments.get(path)
+        if not segment:
+          segment = _Segment(path)
+          group.segments[path] = segment
+        if (not segment.sealed and
+            os.path.basename(path) + _INDEX_SUFFIX in names):
+          # The index only lists valid records, so it replaces any records
+          # read so far.
+          segment.sealed = True
+          segment.end = 0
+          self._read_index(group, segment)
+      # Changes made while listing the directory result in a stale generation
+      # that is listed again on the next refresh.
+      group.generation = generation
+    for segment in group.segments.values():
+      if not segment.sealed:
+        try:
+          segment.generation = self._fs.get_generation(segment.path)
+        except FileNotFoundError:
+          continue
+        self._scan_segment(group, segment, segment.generation.size)
+    return group
+
+  def lookup_many(self, key, res_ids):
+    """Finds the most recent records of resources.
+
+    Args:
+      key: Key of the segments.
+      res_ids: Sequence of resource id strings.
+    Returns:
+      List with a SegmentEntry, or None if the resource is not stored in the
+      segments, for each resource id.
+    """
+    with self._lock:
+      entries = self._refresh(key).entries
+      return [entries.get(res_id) for res_id in res_ids]
+
+  def list(self, key):
+    """Lists the resources stored in the segments of a key.
+
+    Args:
+      key: Key of the segments.
+    Returns:
+      (entries, generations) tuple where entries is a list of
+      (timestamp_micros, res_id) pairs and generations is a list of
+      (path, generation) pairs of the segments that can still change, read
+      before the segments were read.
+    """
+    with self._lock:
+      group = self._refresh(key)
+      entries = [(e.timestamp_micros, res_id)
+                 for res_id, e in group.entries.items()]
+      generations = [(s.path, s.generation) for s in group.segments.values()
+                     if not s.sealed and s.generation]
+      return entries, generations
+
+  def read(self, entries):
+    """Reads resource data from segments.
+
+    Records that are close to each other in the same segment are read with a
+    single read, so reading the resources in the order they were appended
+    results in large sequential reads.
+
+    Args:
+      entries: Sequence of SegmentEntry to read.
+    Returns:
+      List of bytes in the same order as entries.
+    """
+    results = [None] * len(entries)
+    order = sorted(range(len(entries)),
+                   key=lambda i: (entries[i].path, entries[i].offset))
+    run = []
+
+    def read_run():
+      start = entries[run[0]].offset
+      end = max(entries[i].offset + entries[i].length for i in run)
+      data = self._fs.read_file_range(entries[run[0]].path, start, end - start)
+      for i in run:
+        offset = entries[i].offset - start
+        results[i] = data[offset:offset + entries[i].length]
+
+    for i in order:
+      entry = entries[i]
+      if run:
+        first = entries[run[0]]
+        previous_end = max(entries[j].offset + entries[j].length for j in run)
+        if (entry.path != first.path or
+            entry.offset - previous_end > _MAX_READ_GAP_BYTES or
+            entry.offset + entry.length - first.offset > _MAX_READ_BYTES):
+          read_run()
+          run = []
+      run.append(i)
+    if run:
+      read_run()
+    return results
+
+  def _seal(self, group, segment):
+    """Writes the index of a segment so that it's no longer appended to.
+
+    Must be called with the segment lock file held.
+
+    Args:
+      group: _SegmentGroup that contains the segment.
+      segment: _Segment to seal.
+    """
+    index = []
+    for res_id, entry in group.entries.items():
+      if entry.path == segment.path:
+        encoded_id = res_id.encode('utf-8')
+        index.append(_INDEX_ENTRY.pack(entry.offset, entry.length,
+                                       entry.timestamp_micros,
+                                       len(encoded_id)))
+        index.append(encoded_id)
+    self._fs.write_file(segment.path + _INDEX_SUFFIX, b''.join(index))
+    segment.sealed = True
+
+  def append(self, key, records):
+    """Appends resources to the active segment of a key.
+
+    Args:
+      key: Key of the segments.
+      records: Sequence of (res_id, timestamp_micros, data) tuples.
+    Returns:
+      List of SegmentEntry for the appended resources.
+    Raises:
+      UnableToLockFileError: If the segments are locked by another
+        process for longer than _LOCK_TIMEOUT_SECONDS.
+    """
+    encoded = [_encode_record(res_id, timestamp_micros, data)
+               for res_id, timestamp_micros, data in records]
+    payload = b''.join(record for record, _ in encoded)
+    with self._lock, self._fs.lock_file_context(
+        self._get_segment_path(key, 0), timeout=_LOCK_TIMEOUT_SECONDS):
+      group = self._refresh(key)
+      segment = group.active_segment
+      if segment and (segment.end < segment.size or
+                      segment.end >= self._max_segment_bytes):
+        # Seal full segments and segments that end with a partially written
+        # record, e.g. when a process crashed while appending to it.
+        self._seal(group, segment)
+        segment = None
+      if not segment:
+        sequence_number = 0
+        if group.segments:
+          sequence_number = _parse_sequence_number(os.path.basename(
+              next(reversed(group.segments)))) + 1
+        segment = _Segment(self._get_segment_path(key, sequence_number))
+        group.segments[segment.path] = segment
+      offset = self._fs.append_file(segment.path, payload)
+      appended = []
+      for (res_id, timestamp_micros, data), (record, data_offset) in zip(
+          records, encoded):
+        entry = SegmentEntry(segment.path, offset + data_offset, len(data),
+                             timestamp_micros)
+        group.entries[res_id] = entry
+        appended.append(entry)
+        offset += len(record)
+      segment.end = segment.size = offset
+      return appended
+
+  def seal(self, key):
+    """Seals the active segment of a key.
+
+    Args:
+      key: Key of the segments.
+    """
+    with self._lock, self._fs.lock_file_context(
+        self._get_segment_path(key, 0), timeout=_LOCK_TIMEOUT_SECONDS):
+      group = self._refresh(key)
+      segment = group.active_segment
+      if segment:
+        self._seal(group, segment)
+
@@ -0,0 +1,126 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for SegmentStore."""
+
+import tempfile
+from unittest import mock
+
+from absl.testing import absltest
+from data_store import file_system
+from data_store import segment_store
+
+
+class SegmentStoreTest(absltest.TestCase):
+
+  def setUp(self):
+    """Create a segment store that uses a temporary directory."""
+    super().setUp()
+    self._temporary_directory = tempfile.TemporaryDirectory()
+    self._fs = file_system.FileSystem(self._temporary_directory.name)
+    self._store = segment_store.SegmentStore(self._fs)
+
+  def tearDown(self):
+    """Clean up the temporary directory."""
+    super().tearDown()
+    self._temporary_directory.cleanup()
+
+  def _read(self, store, key, res_ids):
+    """Reads resources from a segment store."""
+    return store.read(store.lookup_many(key, res_ids))
+
+  def test_append_read(self):
+    entries = self._store.append('k', [('a', 1, b'hello'), ('b', 2, b'')])
+    self.assertEqual([e.timestamp_micros for e in entries], [1, 2])
+    self.assertEqual(self._read(self._store, 'k', ['b', 'a']),
+                     [b'', b'hello'])
+    self.assertEqual(self._store.lookup_many('k', ['c']), [None])
+    self.assertEqual(self._store.lookup_many('missing', ['a']), [None])
+    entries, _ = self._store.list('k')
+    self.assertCountEqual(entries, [(1, 'a'), (2, 'b')])
+
+  def test_rewrite(self):
+    self._store.append('k', [('a', 1, b'first')])
+    self._store.append('k', [('a', 1, b'second')])
+    self.assertEqual(self._read(self._store, 'k', ['a']), [b'second'])
+
+  def test_read_is_sequential(self):
+    """Resources appended together are read with a single read."""
+    records = [(f'r{i}', i, bytes([i]) * 100) for i in range(10)]
+    self._store.append('k', records)
+    res_ids = [r for r, _, _ in records]
+    with mock.patch.object(self._fs, 'read_file_range',
+                           wraps=self._fs.read_file_range) as read_range:
+      self.assertEqual(self._read(self._store, 'k', res_ids[::-1]),
+                       [data for _, _, data in records[::-1]])
+      read_range.assert_called_once()
+
+  def test_reads_appends_from_other_stores(self):
+    """Appends made by other processes are read incrementally."""
+    other_store = segment_store.SegmentStore(self._fs)
+    self._store.append('k', [('a', 1, b'a')])
+    self.assertEqual(self._read(other_store, 'k', ['a']), [b'a'])
+    self._store.append('k', [('b', 2, b'b')])
+    with mock.patch.object(self._fs, 'read_file_range',
+                           wraps=self._fs.read_file_range) as read_range:
+      self.assertEqual(self._read(other_store, 'k', ['b']), [b'b'])
+      # Only the new record is scanned before it's read.
+      self.assertEqual(read_range.call_count, 2)
+      scan_call = read_range.call_args_list[0]
+      self.assertGreater(scan_call[0][1], 0)
+
+  def test_seal(self):
+    self._store.append('k', [('a', 1, b'a')])
+    self._store.seal('k')
+    self._store.append('k', [('b', 2, b'b')])
+    segments_dir = segment_store.SegmentStore.get_directory('k')
+    self.assertCountEqual(
+        [n for n in self._fs.list_directory(segments_dir)
+         if not n.startswith('.')],
+        ['segment.00000000', 'segment.00000000.index', 'segment.00000001'])
+    # Sealed segments are read from their index.
+    other_store = segment_store.SegmentStore(self._fs)
+    with mock.patch.object(self._fs, 'read_file',
+                           wraps=self._fs.read_file) as read_file:
+      self.assertEqual(self._read(other_store, 'k', ['a', 'b']), [b'a', b'b'])
+      read_file.assert_called_once_with(
+          f'{segments_dir}/segment.00000000.index')
+
+  def test_full_segments_are_sealed(self):
+    store = segment_store.SegmentStore(self._fs, max_segment_bytes=100)
+    for i in range(5):
+      store.append('k', [(f'r{i}', i, b'x' * 100)])
+    names = self._fs.list_directory(segment_store.SegmentStore.get_directory(
+        'k'))
+    self.assertLen([n for n in names if n.endswith('.index')], 4)
+    other_store = segment_store.SegmentStore(self._fs)
+    self.assertEqual(self._read(other_store, 'k', [f'r{i}' for i in range(5)]),
+                     [b'x' * 100] * 5)
+
+  def test_partial_records_are_ignored(self):
+    """Records partially written by a crashed process are skipped."""
+    self._store.append('k', [('a', 1, b'a')])
+    path = segment_store.SegmentStore.get_directory('k') + '/segment.00000000'
+    self._fs.append_file(path, b'\x01\x02\x03partial record')
+    other_store = segment_store.SegmentStore(self._fs)
+    entries, _ = other_store.list('k')
+    self.assertEqual(entries, [(1, 'a')])
+    # The next append starts a new segment.
+    other_store.append('k', [('b', 2, b'b')])
+    entries, _ = segment_store.SegmentStore(self._fs).list('k')
+    self.assertCountEqual(entries, [(1, 'a'), (2, 'b')])
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -0,0 +1,729 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Lint as: python3
+"""Storage engine that keeps all data store files in a SQLite database.
+
+SQLiteFileSystem implements the same interface as file_system.FileSystem, so
+it can be used by ResourceStore and AssignmentMonitor as a drop-in
+replacement. Instead of one file per resource, every file is a row in a single
+database, which makes large data stores much cheaper to list, back up or copy.
+
+Resource files (named "resource.<timestamp>") are additionally indexed by
+their collection path and timestamp, which allows ResourceStore.list to
+paginate using indexed range queries (see list_resources).
+"""
+
+import contextlib
+import os
+import os.path
+import re
+import sqlite3
+import threading
+import time
+import uuid
+
+import braceexpand
+from data_store import file_system
+from data_store import file_watcher
+
+# Name of the database file created in the root directory.
+DATABASE_FILENAME = 'falken.sqlite3'
+
+# Available storage engines.
+STORAGE_ENGINES = ('file', 'sqlite')
+
+# Prefix of the file name of resource files, see ResourceStore.
+_RESOURCE_PREFIX = 'resource.'
+
+# Seconds to wait for a database lock held by another connection.
+_BUSY_TIMEOUT_SECONDS = 30
+
+# Seconds to sleep between attempts to acquire a file lock.
+_LOCK_RETRY_SECONDS = 0.05
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+  path TEXT PRIMARY KEY,
+  parent TEXT NOT NULL,
+  depth INTEGER NOT NULL,
+  collection TEXT,
+  timestamp_micros INTEGER,
+  mtime_micros INTEGER NOT NULL,
+  data BLOB NOT NULL);
+CREATE INDEX IF NOT EXISTS files_by_parent ON files (parent);
+CREATE INDEX IF NOT EXISTS files_by_collection_timestamp
+  ON files (collection, timestamp_micros, parent);
+CREATE INDEX IF NOT EXISTS files_by_depth_timestamp
+  ON files (depth, timestamp_micros, parent);
+CREATE TABLE IF NOT EXISTS directories (
+  path TEXT PRIMARY KEY,
+  mtime_micros INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS locks (
+  path TEXT PRIMARY KEY,
+  owner TEXT NOT NULL,
+  expires_micros INTEGER NOT NULL);
+"""
+
+
+# SQLite synchronous setting for each file_system durability level. In WAL
+# mode NORMAL only syncs at checkpoints, FULL also syncs each commit.
+_SYNCHRONOUS_BY_DURABILITY = {
+    file_system.DURABILITY_NONE: 'NORMAL',
+    file_system.DURABILITY_FILE: 'FULL',
+    file_system.DURABILITY_DIRECTORY: 'FULL',
+}
+
+
+def create_file_system(root_path, storage_engine='file',
+                       durability=file_system.DURABILITY_NONE,
+                       listing_cache_seconds=0,
+                       lock_backend=file_system.LOCK_BACKEND_FLUFL):
+  """Creates the file system object for a storage engine.
+
+  Args:
+    root_path: Path where all Falken files will be stored.
+    storage_engine: One of STORAGE_ENGINES.
+    durability: One of file_system.DURABILITY_LEVELS.
+    listing_cache_seconds: Number of seconds the "file" storage engine reuses
+      unmodified directory listings, see file_system.FileSystem.
+    lock_backend: One of file_system.LOCK_BACKENDS used by the "file" storage
+      engine. The "sqlite" storage engine stores locks in the database.
+  Returns:
+    A FileSystem or SQLiteFileSystem object.
+  """
+  if storage_engine == 'file':
+    return file_system.FileSystem(
+        root_path, durability=durability,
+        listing_cache_seconds=listing_cache_seconds,
+        lock_backend=lock_backend)
+  elif storage_engine == 'sqlite':
+    return SQLiteFileSystem(root_path, durability=durability)
+  raise ValueError(f'Unsupported storage engine {storage_engine}.')
+
+
+def _now_micros():
+  """Returns the current time in microseconds since the epoch."""
+  return int(time.time() * 1_000_000)
+
+
+def _has_wildcards(segment):
+  """Returns whether a path segment contains glob wildcards."""
+  return any(c in segment for c in '*?[')
+
+
+def _segment_to_regex(segment):
+  """Translates a glob path segment into a regular expression.
+
+  Like glob.glob, wildcards never match a leading '.' of a file name.
+
+  Args:
+    segment: Glob pattern for a single path component.
+  Returns:
+    A regular expression string.
+  """
+  result = []
+  if segment and segment[0] in '*?[':
+    result.append(r'(?!\.)')
+  i = 0
+  while i < len(segment):
+    c = segment[i]
+    if c == '*':
+      result.append('[^/]*')
+    elif c == '?':
+      result.append('[^/]')
+    elif c == '[':
+      end = segment.find(']', i + 2)
+      if end < 0:
+        result.append(re.escape(c))
+      else:
+        body = segment[i + 1:end]
+        if body.startswith('!'):
+          body = '^' + body[1:]
+        result.append(f'[{body}]')
+        i = end
+    else:
+      result.append(re.escape(c))
+    i += 1
+  return ''.join(result)
+
+
+class _GlobPattern:
+  """A brace-free glob pattern that can be matched against stored paths."""
+
+  def __init__(self, pattern):
+    """Parses the pattern.
+
+    Args:
+      pattern: Glob pattern using POSIX directory separators.
+    """
+    self.directories_only = pattern.endswith('/')
+    segments = [s for s in pattern.strip('/').split('/') if s not in ('', '.')]
+    self.depth = len(segments)
+    self.pattern = '/'.join(segments)
+    self.regex = re.compile(
+        '/'.join(_segment_to_regex(s) for s in segments) + r'\Z')
+    literal_segments = []
+    for s in segments:
+      if _has_wildcards(s):
+        break
+      literal_segments.append(s)
+    self.literal_prefix = '/'.join(literal_segments)
+    self.is_literal = len(literal_segments) == len(segments)
+
+  def prefix_range(self):
+    """Returns (low, high) bounds for paths that can match the pattern."""
+    if not self.literal_prefix:
+      return '', None
+    low = self.literal_prefix + '/'
+    return low, self.literal_prefix + '0'  # '0' sorts right after '/'.
+
+
+class _SQLiteLock:
+  """A lock acquired with SQLiteFileSystem.lock_file."""
+
+  def __init__(self, path, owner):
+    self.path = path
+    self.owner = owner
+    self.is_locked = True
+
+
+class SQLiteFileSystem:
+  """Stores data store files in a single SQLite database (WAL mode)."""
+
+  def __init__(self, root_path, database_filename=DATABASE_FILENAME,
+               durability=file_system.DURABILITY_NONE):
+    """Initializes the file system object with a given root path.
+
+    Args:
+      root_path: Directory that contains the database file.
+      database_filename: Name of the database file inside root_path.
+      durability: One of file_system.DURABILITY_LEVELS. Without durability
+        the database is never corrupted by a crash but the most recent
+        transactions may be lost, otherwise each transaction is flushed to
+        disk when it's committed.
+    """
+    self._synchronous = _SYNCHRONOUS_BY_DURABILITY[durability]
+    self._root_path = os.path.realpath(root_path)
+    os.makedirs(self._root_path, exist_ok=True)
+    self._database_path = os.path.join(self._root_path, database_filename)
+    # SQLite connections can't be shared across threads.
+    self._thread_state = threading.local()
+    connection = self._connection()
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.executescript(_SCHEMA)
+
+  @property
+  def database_path(self):
+    """Path of the database file."""
+    return self._database_path
+
+  def _connection(self):
+    """Returns the database connection of the current thread."""
+    connection = getattr(self._thread_state, 'connection', None)
+    if connection is None:
+      connection = sqlite3.connect(
+          self._database_path, timeout=_BUSY_TIMEOUT_SECONDS,
+          isolation_level=None)
+      connection.execute(f'PRAGMA synchronous={self._synchronous}')
+      self._thread_state.connection = connection
+    return connection
+
+  @contextlib.contextmanager
+  def _transaction(self):
+    """Runs the statements in the context in a single write transaction."""
+    connection = self._connection()
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+      yield connection
+    except:  # pylint: disable=bare-except
+      connection.execute('ROLLBACK')
+      raise
+    connection.execute('COMMIT')
+
+  @staticmethod
+  def _normalize(path):
+    """Normalizes a path relative to the root directory.
+
+    Args:
+      path: Path to normalize.
+    Returns:
+      Path using POSIX separators without leading or trailing separators.
+    Raises:
+      ValueError: If the path is outside the root directory.
+    """
+    normalized = file_system.posix_path(os.path.normpath(path))
+    if normalized == '.':
+      return ''
+    if normalized.startswith('/') or normalized.split('/')[0] == '..':
+      raise ValueError(f'{path} is outside of the root directory.')
+    return normalized
+
+  @staticmethod
+  def _split_resource_path(path):
+    """Returns (resource_id, collection, timestamp) for a resource file.
+
+    Args:
+      path: Normalized file path.
+    Returns:
+      A tuple (parent, collection, timestamp_micros) where collection and
+      timestamp_micros are None if the path is not a resource file.
+    """
+    parent, filename = os.path.split(path)
+    parent = file_system.posix_path(parent)
+    if not filename.startswith(_RESOURCE_PREFIX):
+      return parent, None, None
+    try:
+      timestamp_micros = int(filename[len(_RESOURCE_PREFIX):])
+    except ValueError:
+      return parent, None, None
+    collection = file_system.posix_path(os.path.dirname(parent))
+    return parent, collection, timestamp_micros
+
+  def _write_rows(self, connection, paths_and_data):
+    """Inserts or replaces files and their parent directories."""
+    mtime_micros = _now_micros()
+    directories = set()
+    rows = []
+    for path, data in paths_and_data:
+      path = self._normalize(path)
+      parent, collection, timestamp_micros = self._split_resource_path(path)
+      rows.append((path, parent, path.count('/') + 1, collection,
+                   timestamp_micros, mtime_micros, bytes(data)))
+      while parent and parent not in directories:
+        directories.add(parent)
+        parent = file_system.posix_path(os.path.dirname(parent))
+    connection.executemany(
+        'INSERT OR REPLACE INTO files (path, parent, depth, collection, '
+        'timestamp_micros, mtime_micros, data) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        rows)
+    connection.executemany(
+        'INSERT OR IGNORE INTO directories (path, mtime_micros) VALUES (?, ?)',
+        [(d, mtime_micros) for d in directories])
+    connection.executemany(
+        'UPDATE directories SET mtime_micros = ? WHERE path = ?',
+        [(mtime_micros, parent) for parent in {r[1] for r in rows}])
+
+  def read_file(self, path):
+    """Reads a file.
+
+    Args:
+      path: The path of the file to read.
+    Returns:
+      A bytes-like object containing the contents of the file.
+    Raises:
+      FileNotFoundError: If the file does not exist.
+    """
+    row = self._connection().execute(
+        'SELECT data FROM files WHERE path = ?',
+        (self._normalize(path),)).fetchone()
+    if row is None:
+      raise FileNotFoundError(f'File {path} not found.')
+    return row[0]
+
+  def write_file(self, path, data):
+    """Writes into a file.
+
+    Args:
+      path: The path of the file to write the data to.
+      data: A bytes-like object containing the data to write.
+    """
+    with self._transaction() as connection:
+      self._write_rows(connection, [(path, data)])
+
+  def write_files(self, paths_and_data, executor=None):
+    """Writes several files in a single transaction.
+
+    Args:
+      paths_and_data: Iterable of (path, data) pairs.
+      executor: Ignored, all files are written by a single transaction.
+    """
+    del executor  # Unused.
+    with self._transaction() as connection:
+      self._write_rows(connection, paths_and_data)
+
+  def remove_file(self, path):
+    """Removes a file.
+
+    Args:
+      path: The path of the file to remove.
+    Raises:
+      FileNotFoundError: If the file does not exist.
+    """
+    with self._transaction() as connection:
+      cursor = connection.execute(
+          'DELETE FROM files WHERE path = ?', (self._normalize(path),))
+    if not cursor.rowcount:
+      raise FileNotFoundError(f'File {path} not found.')
+
+  def remove_tree(self, path, ignore_errors=False):
+    """Removes a directory tree."""
+    path = self._normalize(path)
+    low, high = path + '/', path + '0'
+    with self._transaction() as connection:
+      removed = connection.execute(
+          'DELETE FROM files WHERE path >= ? AND path < ?',
+          (low, high)).rowcount
+      removed += connection.execute(
+          'DELETE FROM directories WHERE path = ? OR '
+          '(path >= ? AND path < ?)', (path, low, high)).rowcount
+    if not removed and not ignore_errors:
+      raise FileNotFoundError(f'Directory {path} not found.')
+
+  def _get_mtime_micros(self, path):
+    """Returns the modification time of a file or directory in micros."""
+    connection = self._connection()
+    row = connection.execute(
+        'SELECT mtime_micros FROM files WHERE path = ?', (path,)).fetchone()
+    if row is None:
+      row = connection.execute(
+          'SELECT mtime_micros FROM directories WHERE path = ?',
+          (path,)).fetchone()
+    if row is None:
+      raise FileNotFoundError(f'{path} not found.')
+    return row[0]
+
+  def get_modification_time(self, path):
+    """Gives the modification time of a file.
+
+    Args:
+      path: The path of the file.
+    Returns:
+      An int with the number of milliseconds since epoch.
+    """
+    return self._get_mtime_micros(self._normalize(path)) // 1000
+
+  def get_generation(self, path):
+    """Gives the generation of a file or directory.
+
+    Replacing a file allocates a new row so the row id identifies each
+    version of a file.
+
+    Args:
+      path: The path of the file or directory.
+    Returns:
+      A file_system.FileGeneration.
+    Raises:
+      FileNotFoundError: If the path does not exist.
+    """
+    path = self._normalize(path)
+    connection = self._connection()
+    row = connection.execute(
+        'SELECT mtime_micros, rowid, length(data) FROM files WHERE path = ?',
+        (path,)).fetchone()
+    if row is None:
+      row = connection.execute(
+          'SELECT mtime_micros, 0, 0 FROM directories WHERE path = ?',
+          (path,)).fetchone()
+    if row is None:
+      raise FileNotFoundError(f'{path} not found.')
+    mtime_micros, row_id, size = row
+    return file_system.FileGeneration(mtime_micros * 1000, row_id, size)
+
+  def glob(self, pattern):
+    """Finds files and directories matching a glob pattern.
+
+    Args:
+      pattern: Pattern to search for. May contains brace-style options,
+        e.g., "a/{b,c}/*". Patterns that end with a separator only match
+        directories.
+
+    Returns:
+      List of path strings found. All paths use POSIX directory separators.
+    """
+    connection = self._connection()
+    result = []
+    for p in braceexpand.braceexpand(file_system.posix_path(pattern)):
+      glob_pattern = _GlobPattern(p)
+      if not glob_pattern.depth:
+        continue
+      low, high = glob_pattern.prefix_range()
+      tables = ['directories']
+      if not glob_pattern.directories_only:
+        tables.insert(0, 'files')
+      for table in tables:
+        if glob_pattern.is_literal:
+          rows = connection.execute(
+              f'SELECT path FROM {table} WHERE path = ?',
+              (glob_pattern.pattern,))
+        elif high is None:
+          rows = connection.execute(
+              f'SELECT path FROM {table} WHERE path GLOB ?',
+              (glob_pattern.pattern,))
+        else:
+          rows = connection.execute(
+              f'SELECT path FROM {table} WHERE path >= ? AND path < ? AND '
+              'path GLOB ?', (low, high, glob_pattern.pattern))
+        result.extend(path for (path,) in rows
+                      if glob_pattern.regex.match(path))
+    return result
+
+  def _query_resources(self, res_id_glob, min_timestamp_micros=0,
+                       start_after=None, limit=None, time_descending=None):
+    """Queries resources using the collection index.
+
+    Args:
+      res_id_glob: Resource id glob, containing '*' and brace components of
+        the form '{a,b,c}'.
+      min_timestamp_micros: Only return resources at least as recent as this
+        timestamp.
+      start_after: Optional (timestamp_micros, resource_id) pair. Only
+        resources that are strictly after this pair in the listing order are
+        returned.
+      limit: Maximum number of resources to return or None for all.
+      time_descending: If True, list resources in descending timestamp order,
+        if False in ascending order and if None in no particular order.
+    Returns:
+      Iterator of (timestamp_micros, resource_id) pairs.
+    """
+    patterns = [_GlobPattern(p) for p in braceexpand.braceexpand(
+        file_system.posix_path(str(res_id_glob)))]
+    conditions = []
+    parameters = []
+    for glob_pattern in patterns:
+      collection = glob_pattern.pattern.rpartition('/')[0]
+      if not _has_wildcards(collection):
+        # Resources of a single collection, served by the collection index.
+        conditions.append('(collection = ? AND parent GLOB ?)')
+        parameters.extend([collection, glob_pattern.pattern])
+      else:
+        # The number of path components makes sure that wildcards don't match
+        # directory separators.
+        conditions.append('(depth = ? AND parent GLOB ?)')
+        parameters.extend([glob_pattern.depth + 1, glob_pattern.pattern])
+    query = [
+        'SELECT timestamp_micros, parent FROM files WHERE',
+        'timestamp_micros IS NOT NULL AND timestamp_micros >= ? AND',
+        '(' + ' OR '.join(conditions) + ')']
+    parameters = [min_timestamp_micros] + parameters
+    if start_after:
+      timestamp_micros, res_id_string = start_after
+      comparison = '<' if time_descending else '>'
+      query.append(f'AND (timestamp_micros {comparison} ? OR '
+                   f'(timestamp_micros = ? AND parent {comparison} ?))')
+      parameters.extend([timestamp_micros, timestamp_micros, res_id_string])
+    if time_descending is not None:
+      order = 'DESC' if time_descending else 'ASC'
+      query.append(f'ORDER BY timestamp_micros {order}, parent {order}')
+    if limit:
+      query.append('LIMIT ?')
+      parameters.append(limit)
+    rows = self._connection().execute(' '.join(query), parameters)
+    return ((timestamp_micros, parent) for timestamp_micros, parent in rows
+            if any(p.regex.match(parent) for p in patterns))
+
+  def list_resources(self, res_id_glob, min_timestamp_micros=0,
+                     start_after=None, limit=None, time_descending=False):
+    """Lists resources in timestamp order using the collection index.
+
+    Args:
+      res_id_glob: Resource id glob, containing '*' and brace components of
+        the form '{a,b,c}'.
+      min_timestamp_micros: Only return resources at least as recent as this
+        timestamp.
+      start_after: Optional (timestamp_micros, resource_id) pair. Only
+        resources that are strictly after this pair in the listing order are
+        returned.
+      limit: Maximum number of resources to return or None for all.
+      time_descending: If True, list resources in descending timestamp order.
+    Returns:
+      List of (timestamp_micros, resource_id) pairs sorted by timestamp and
+      resource id.
+    """
+    return list(self._query_resources(
+        res_id_glob, min_timestamp_micros=min_timestamp_micros,
+        start_after=start_after, limit=limit,
+        time_descending=bool(time_descending)))
+
+  def count_resources(self, res_id_glob, min_timestamp_micros=0):
+    """Counts resources using the collection index.
+
+    Args:
+      res_id_glob: Resource id glob, containing '*' and brace components of
+        the form '{a,b,c}'.
+      min_timestamp_micros: Only count resources at least as recent as this
+        timestamp.
+    Returns:
+      Number of resources that match the glob.
+    """
+    return sum(1 for _ in self._query_resources(
+        res_id_glob, min_timestamp_micros=min_timestamp_micros))
+
+  def exists(self, path):
+    """Checks whether a file or directory exists.
+
+    Args:
+      path: Path of file or directory to verify the existence of.
+    Returns:
+      A boolean for whether the file or directory exists.
+    """
+    try:
+      self._get_mtime_micros(self._normalize(path))
+    except FileNotFoundError:
+      return False
+    return True
+
+  def list_files(self, path=''):
+    """Recursively lists all files contained in a directory.
+
+    Args:
+      path: Path of the directory to list. Defaults to the root directory.
+    Returns:
+      List of path strings relative to the root directory.
+    """
+    path = self._normalize(path)
+    if not path:
+      rows = self._connection().execute('SELECT path FROM files')
+    else:
+      rows = self._connection().execute(
+          'SELECT path FROM files WHERE path >= ? AND path < ?',
+          (path + '/', path + '0'))
+    return [p for (p,) in rows]
+
+  def lock_file(self, path, expire_after=60*60, timeout=0):
+    """Locks a file.
+
+     Lock is shared with other files in the same directory (excluding
+     files contained in subdirectories).
+
+    Args:
+      path: Path of file or directory to lock.
+      expire_after: How many seconds to wait for the lock to expire.
+        Default is one hour.
+      timeout: Seconds to wait to acquire the file.
+    Returns:
+      A lock object that can be unlocked with unlock_file.
+    Raises:
+      UnableToLockFileError: If the lock is held by someone else.
+    """
+    lock_path = self._normalize(self._get_lock_path(path))
+    owner = uuid.uuid4().hex
+    deadline = time.time() + timeout
+    while True:
+      now_micros = _now_micros()
+      with self._transaction() as connection:
+        connection.execute(
+            'DELETE FROM locks WHERE path = ? AND expires_micros <= ?',
+            (lock_path, now_micros))
+        acquired = connection.execute(
+            'INSERT OR IGNORE INTO locks (path, owner, expires_micros) '
+            'VALUES (?, ?, ?)',
+            (lock_path, owner,
+             now_micros + int(expire_after * 1_000_000))).rowcount
+      if acquired:
+        return _SQLiteLock(lock_path, owner)
+      if time.time() >= deadline:
+        raise file_system.UnableToLockFileError(f'Could not lock file {path}.')
+      time.sleep(_LOCK_RETRY_SECONDS)
+
+  def refresh_lock(self, lock, expire_after=60*60):
+    """Refreshes a file lock.
+
+    Args:
+      lock: A lock object returned by lock_file.
+      expire_after: How many seconds to wait for the lock to expire again.
+        Default is one hour.
+    """
+    with self._transaction() as connection:
+      connection.execute(
+          'UPDATE locks SET expires_micros = ? WHERE path = ? AND owner = ?',
+          (_now_micros() + int(expire_after * 1_000_000), lock.path,
+           lock.owner))
+
+  def unlock_file(self, lock):
+    """Unlocks a file.
+
+    Args:
+      lock: A lock object returned by lock_file.
+    """
+    if lock.is_locked:
+      with self._transaction() as connection:
+        connection.execute(
+            'DELETE FROM locks WHERE path = ? AND owner = ?',
+            (lock.path, lock.owner))
+      lock.is_locked = False
+
+  def is_locked(self, path):
+    """Checks whether a file is locked without acquiring its lock.
+
+    Args:
+      path: Path of file or directory to check.
+    Returns:
+      True if the lock shared by the files in the directory of path is held,
+      including by this process.
+    """
+    (count,), = self._connection().execute(
+        'SELECT COUNT(*) FROM locks WHERE path = ? AND expires_micros > ?',
+        (self._normalize(self._get_lock_path(path)), _now_micros()))
+    return count > 0
+
+  @contextlib.contextmanager
+  def lock_file_context(self, path, expire_after=60*60, timeout=0):
+    """Gives a context manager that locks the given file.
+
+    Args:
+      path: Path of file or directory to lock.
+      expire_after: How many seconds to wait for the lock to expire.
+        Default is one hour.
+      timeout: Seconds to wait to acquire the file.
+    Yields:
+      Uses an empty yield only for the purposes of implementing the context
+      manager.
+    """
+    lock = None
+    try:
+      lock = self.lock_file(path, expire_after=expire_after, timeout=timeout)
+      yield
+    finally:
+      if lock:
+        self.unlock_file(lock)
+
+  def _get_lock_path(self, path):
+    """Gives the path of the lock corresponding to path."""
+    return file_system.posix_path(os.path.join(os.path.dirname(path), '.lock'))
+
+  def get_staleness(self, path):
+    """Computes millisecond staleness of file or directory.
+
+    Args:
+      path: The directory or file to check for staleness.
+
+    Returns:
+      The milliseconds since last modification of the tree at path as an int.
+    """
+    path = self._normalize(path)
+    max_mtime_micros = self._get_mtime_micros(path)
+    connection = self._connection()
+    for table in ('files', 'directories'):
+      (mtime_micros,) = connection.execute(
+          f'SELECT MAX(mtime_micros) FROM {table} '
+          'WHERE path >= ? AND path < ?', (path + '/', path + '0')).fetchone()
+      if mtime_micros:
+        max_mtime_micros = max(max_mtime_micros, mtime_micros)
+    return (_now_micros() - max_mtime_micros) // 1000
+
+  def watch(self, unused_path, poll_interval,
+            unused_kind=file_watcher.AUTO):
+    """Watches a directory tree for changes.
+
+    Args:
+      unused_path: Directory to watch.
+      poll_interval: Seconds between reports of unknown changes.
+      unused_kind: Kind of watcher, always polling.
+
+    Returns:
+      A file_watcher.PollingFileWatcher as changes made by other processes to
+      the database can't be observed without polling.
+    """
+    return file_watcher.PollingFileWatcher(poll_interval)
@@ -0,0 +1,228 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for SQLiteFileSystem."""
+
+import os.path
+import tempfile
+import time
+from unittest import mock
+
+from absl.testing import absltest
+from absl.testing import parameterized
+from data_store import data_store
+from data_store import file_system
+from data_store import migrate_to_sqlite
+from data_store import sqlite_file_system
+
+# pylint: disable=g-bad-import-order
+import common.generate_protos  # pylint: disable=unused-import
+import data_store_pb2
+
+
+class SQLiteFileSystemTest(parameterized.TestCase):
+
+  def setUp(self):
+    """Create a file system object that uses a temporary directory."""
+    super().setUp()
+    self._temporary_directory = tempfile.TemporaryDirectory()
+    self._fs = sqlite_file_system.SQLiteFileSystem(
+        self._temporary_directory.name)
+    self._text = 'Hello Falken'.encode('utf-8')
+
+  def tearDown(self):
+    """Clean up the temporary directory and file system."""
+    super().tearDown()
+    self._fs = None
+    self._temporary_directory.cleanup()
+
+  def test_read_write_file(self):
+    path = os.path.join('dirA', 'file.pb')
+    self._fs.write_file(path, self._text)
+    self.assertEqual(self._fs.read_file(path), self._text)
+    self.assertTrue(os.path.exists(self._fs.database_path))
+    self._fs.write_file(path, b'new data')
+    self.assertEqual(self._fs.read_file(path), b'new data')
+
+  def test_read_missing_file(self):
+    with self.assertRaises(FileNotFoundError):
+      self._fs.read_file('missing')
+
+  def test_path_outside_root(self):
+    with self.assertRaises(ValueError):
+      self._fs.write_file('../file.pb', self._text)
+
+  def test_exists_and_remove(self):
+    path = os.path.join('dirA', 'dirB', 'file.pb')
+    self._fs.write_file(path, self._text)
+    self.assertTrue(self._fs.exists(path))
+    self.assertTrue(self._fs.exists('dirA/dirB'))
+    self.assertTrue(self._fs.exists('dirA/'))
+    self.assertFalse(self._fs.exists('dirC'))
+    self._fs.remove_file(path)
+    self.assertFalse(self._fs.exists(path))
+    with self.assertRaises(FileNotFoundError):
+      self._fs.remove_file(path)
+
+  def test_remove_tree(self):
+    self._fs.write_file('dirA/dirB/file.pb', self._text)
+    self._fs.write_file('dirAB/file.pb', self._text)
+    self._fs.remove_tree('dirA')
+    self.assertFalse(self._fs.exists('dirA/dirB/file.pb'))
+    self.assertFalse(self._fs.exists('dirA'))
+    self.assertTrue(self._fs.exists('dirAB/file.pb'))
+    with self.assertRaises(FileNotFoundError):
+      self._fs.remove_tree('dirA')
+    self._fs.remove_tree('dirA', ignore_errors=True)
+
+  def test_glob(self):
+    paths = ['a/b/c/file.pb', 'a/b/d/file.pb', 'a/e/c/file.pb',
+             'a/b/c/.hidden', 'a/b/c/d/file.pb']
+    for path in paths:
+      self._fs.write_file(path, self._text)
+    self.assertCountEqual(self._fs.glob('a/b/*/file.pb'),
+                          ['a/b/c/file.pb', 'a/b/d/file.pb'])
+    self.assertCountEqual(self._fs.glob('a/{b,e}/c/*'),
+                          ['a/b/c/file.pb', 'a/e/c/file.pb', 'a/b/c/d'])
+    self.assertCountEqual(self._fs.glob('a/b/c/*/'), ['a/b/c/d'])
+    self.assertCountEqual(self._fs.glob('*/b'), ['a/b'])
+    self.assertEqual(self._fs.glob('a/b/c/file.pb'), ['a/b/c/file.pb'])
+    self.assertEqual(self._fs.glob('a/b/x*'), [])
+
+  def test_list_files(self):
+    for path in ['dirA/file.pb', 'dirA/dirB/file.pb', 'dirAB/file.pb']:
+      self._fs.write_file(path, self._text)
+    self.assertCountEqual(self._fs.list_files('dirA'),
+                          ['dirA/file.pb', 'dirA/dirB/file.pb'])
+    self.assertLen(self._fs.list_files(), 3)
+
+  @mock.patch.object(time, 'time')
+  def test_get_staleness(self, mock_time):
+    mock_time.return_value = 100
+    self._fs.write_file('dirA/dirB/file.pb', self._text)
+    mock_time.return_value = 102
+    self._fs.write_file('dirA/file.pb', self._text)
+    mock_time.return_value = 103
+    self.assertEqual(self._fs.get_staleness('dirA'), 1000)
+    self.assertEqual(self._fs.get_staleness('dirA/dirB'), 3000)
+    self.assertEqual(self._fs.get_modification_time('dirA/file.pb'), 102_000)
+
+  def test_lock(self):
+    path = os.path.join('dir1', 'to_lock.txt')
+    with self._fs.lock_file_context(path):
+      with self.assertRaises(file_system.UnableToLockFileError):
+        with self._fs.lock_file_context(path):
+          pass
+    with self._fs.lock_file_context(path):
+      pass
+
+  def test_lock_expires(self):
+    path = os.path.join('dir1', 'to_lock.txt')
+    lock = self._fs.lock_file(path, expire_after=0)
+    second_lock = self._fs.lock_file(path)
+    self._fs.unlock_file(lock)
+    with self.assertRaises(file_system.UnableToLockFileError):
+      self._fs.lock_file(path)
+    self._fs.refresh_lock(second_lock, expire_after=0)
+    self._fs.unlock_file(self._fs.lock_file(path))
+
+  def test_is_locked(self):
+    path = os.path.join('dir1', 'to_lock.txt')
+    self.assertFalse(self._fs.is_locked(path))
+    lock = self._fs.lock_file(path, expire_after=60)
+    self.assertTrue(self._fs.is_locked(path))
+    self._fs.refresh_lock(lock, expire_after=0)
+    self.assertFalse(self._fs.is_locked(path))
+
+  @parameterized.named_parameters(('ascending', False), ('descending', True))
+  @mock.patch.object(time, 'time', autospec=True)
+  def test_data_store_list(self, time_descending, mock_time):
+    """Checks that indexed listing matches listing a FileSystem."""
+    file_system_directory = tempfile.TemporaryDirectory()
+    self.addCleanup(file_system_directory.cleanup)
+    stores = [data_store.DataStore(self._fs),
+              data_store.DataStore(
+                  file_system.FileSystem(file_system_directory.name))]
+    for i in range(30):
+      # Create several chunks with the same timestamp.
+      mock_time.return_value = (i // 3) / 1e6
+      for store in stores:
+        store.write(data_store_pb2.EpisodeChunk(
+            project_id='p0', brain_id='b0', session_id=f's{i % 2}',
+            episode_id=f'e{i % 4}', chunk_id=i))
+        store.write(data_store_pb2.Session(
+            project_id='p0', brain_id='b0', session_id=f's{i}'))
+
+    for glob_kwargs in [
+        dict(session_id='*'),
+        dict(session_id='{s0,s1}', episode_id='*', chunk_id='*'),
+        dict(session_id='s1', episode_id='e1', chunk_id='*')]:
+      pages = []
+      for store in stores:
+        res_id_glob = store.resource_id_from_proto_ids(
+            project_id='p0', brain_id='b0', **glob_kwargs)
+        all_ids, _ = store.list(res_id_glob, time_descending=time_descending)
+        page_token = None
+        paged_ids = []
+        while True:
+          page, page_token = store.list(
+              res_id_glob, min_timestamp_micros=2, page_token=page_token,
+              page_size=4, time_descending=time_descending)
+          if not page:
+            break
+          paged_ids.extend(page)
+        pages.append(([str(r) for r in all_ids], [str(r) for r in paged_ids]))
+      self.assertEqual(pages[0], pages[1])
+      self.assertNotEmpty(pages[0][1])
+
+  @mock.patch.object(time, 'time', autospec=True)
+  def test_data_store_count_nth(self, mock_time):
+    store = data_store.DataStore(self._fs)
+    rids = []
+    for i in range(10):
+      mock_time.return_value = i / 1e6
+      rids.append(store.write(data_store_pb2.Session(
+          project_id='p0', brain_id='b0', session_id=f's{i}')))
+      store.write(data_store_pb2.EpisodeChunk(
+          project_id='p0', brain_id='b0', session_id=f's{i}',
+          episode_id='e0', chunk_id=0))
+    res_id_glob = store.resource_id_from_proto_ids(
+        project_id='p0', brain_id='b0', session_id='*')
+    self.assertEqual(store.count(res_id_glob), 10)
+    self.assertEqual(store.count(res_id_glob, min_timestamp_micros=8), 2)
+    self.assertEqual(store.count(store.resource_id_from_proto_ids(
+        project_id='p0', brain_id='b0', session_id='{s1,s2}', episode_id='*',
+        chunk_id='*')), 2)
+    self.assertEqual(store.nth(res_id_glob, 1), rids[1])
+    self.assertEqual(store.nth(res_id_glob, 1, time_descending=True), rids[8])
+    self.assertIsNone(store.nth(res_id_glob, 10))
+
+  def test_migrate(self):
+    source_directory = tempfile.TemporaryDirectory()
+    self.addCleanup(source_directory.cleanup)
+    source_fs = file_system.FileSystem(source_directory.name)
+    source_fs.write_file('projects/p0/resource.1', b'p0')
+    source_fs.write_file('projects/p0/brains/b0/resource.2', b'b0')
+    source_fs.write_file('notifications/projects/p0/chunk_e_0', b'')
+
+    self.assertEqual(
+        migrate_to_sqlite.migrate(source_fs, self._fs, batch_size=1), 2)
+    self.assertEqual(self._fs.read_file('projects/p0/resource.1'), b'p0')
+    self.assertEqual(
+        self._fs.read_file('projects/p0/brains/b0/resource.2'), b'b0')
+    self.assertFalse(self._fs.exists('notifications'))
+
+
+if __name__ == '__main__':
+  absltest.main()
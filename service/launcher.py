@@ -32,6 +32,8 @@ from absl import logging
 from api import api_keys
 from data_store import data_store
 from data_store import file_system
+from data_store import file_watcher
+from data_store import sqlite_file_system
 
 
 FLAGS = flags.FLAGS
@@ -43,6 +45,56 @@ flags.DEFINE_string('ssl_dir',
                     'Path containing the SSL cert and key.')
 flags.DEFINE_string('root_dir', os.getcwd(),
                     'Directory where the Falken service will store data.')
+flags.DEFINE_enum(
+    'storage_engine', 'file', sqlite_file_system.STORAGE_ENGINES,
+    'How data is stored in --root_dir: "file" stores each resource in its own '
+    'file, "sqlite" stores all resources in a single SQLite database.')
+flags.DEFINE_enum(
+    'write_durability', file_system.DURABILITY_NONE,
+    file_system.DURABILITY_LEVELS,
+    'How writes to --root_dir are flushed to disk: "none" replaces files '
+    'atomically without flushing them, "file" also flushes each file before it '
+    'is replaced and "directory" also flushes the directory containing each '
+    'file so that new files survive a crash.')
+flags.DEFINE_enum(
+    'lock_backend', file_system.LOCK_BACKEND_FLUFL, file_system.LOCK_BACKENDS,
+    'How the "file" storage engine locks files: "flufl" creates lock files '
+    'that expire unless they are refreshed, "fcntl" uses flock() which is '
+    'cheaper but only works on POSIX systems with a local --root_dir. The API '
+    'and learner services must use the same setting.')
+flags.DEFINE_float(
+    'listing_cache_seconds', 0,
+    'Number of seconds directory listings are reused while the directory is '
+    'not modified, which avoids listing the same directories when searching '
+    'the data store. 0 disables the cache. Only used by the "file" storage '
+    'engine.')
+flags.DEFINE_bool(
+    'episode_chunk_segments', False,
+    'Append episode chunks to per-session segment files rather than storing '
+    'each chunk in its own file. Only supported by the "file" storage engine.')
+flags.DEFINE_bool(
+    'episode_chunk_manifests', False,
+    'List the episode chunks of each session by creation time in a manifest '
+    'file so that new chunks are found without listing all chunks of a '
+    'session. Only supported by the "file" storage engine.')
+flags.DEFINE_bool(
+    'experimental_aio_server', False,
+    'Experimental: Serve API RPCs with a grpc.aio server. SubmitEpisodeChunks, '
+    'GetModel, GetSession and ListSessions only use a thread while they wait '
+    'for the data store, other RPCs run on a thread pool.')
+flags.DEFINE_bool(
+    'write_behind_ingestion', False,
+    'Reply to SubmitEpisodeChunks once the chunks are stored and process the '
+    'work derived from them in the background of the API service.')
+flags.DEFINE_integer(
+    'max_concurrent_assignments', 1,
+    'Number of assignments the learner processes at the same time.',
+    lower_bound=1)
+flags.DEFINE_enum(
+    'file_watcher', file_watcher.AUTO, file_watcher.WATCHER_KINDS,
+    'How the learner detects new assignments: "auto" uses inotify where '
+    'it\'s supported, "polling" is required if the API service writes to '
+    '--root_dir from another host, e.g. over NFS.')
 flags.DEFINE_bool('clean_up_protos', False,
                   'Clean up generated protos at stop.')
 flags.DEFINE_multi_string(
@@ -101,7 +153,16 @@ def run_api(current_path: str):
   """
   args = [
       sys.executable, '-m', 'api.falken_service', '--root_dir', FLAGS.root_dir,
-      '--port', str(FLAGS.port), '--ssl_dir', FLAGS.ssl_dir,
+      '--storage_engine', FLAGS.storage_engine,
+      '--write_durability', FLAGS.write_durability,
+      '--listing_cache_seconds', str(FLAGS.listing_cache_seconds),
+      '--lock_backend', FLAGS.lock_backend,
+      f'--episode_chunk_segments={FLAGS.episode_chunk_segments}',
+      f'--episode_chunk_manifests={FLAGS.episode_chunk_manifests}',
+      f'--experimental_aio_server={FLAGS.experimental_aio_server}',
+      f'--write_behind_ingestion={FLAGS.write_behind_ingestion}',
+      '--port', str(FLAGS.port),
+      '--ssl_dir', FLAGS.ssl_dir,
       '--verbosity', str(FLAGS.verbosity), '--alsologtostderr',
       '--log_dir', FLAGS.log_dir,
   ]
@@ -125,7 +186,15 @@ def run_learner(current_path: str):
   """
   return subprocess.Popen(
       [sys.executable, '-m', 'learner.learner_service',
-       '--root_dir', FLAGS.root_dir, '--verbosity', str(FLAGS.verbosity),
+       '--root_dir', FLAGS.root_dir, '--storage_engine', FLAGS.storage_engine,
+       '--write_durability', FLAGS.write_durability,
+       '--listing_cache_seconds', str(FLAGS.listing_cache_seconds),
+       '--lock_backend', FLAGS.lock_backend,
+       f'--episode_chunk_segments={FLAGS.episode_chunk_segments}',
+       f'--episode_chunk_manifests={FLAGS.episode_chunk_manifests}',
+       '--max_concurrent_assignments', str(FLAGS.max_concurrent_assignments),
+       '--file_watcher', FLAGS.file_watcher,
+       '--verbosity', str(FLAGS.verbosity),
        '--alsologtostderr', '--log_dir', FLAGS.log_dir],
       env=os.environ, cwd=current_path)
 
@@ -155,7 +224,8 @@ def main(argv):
                        'one project ID is specified via --project_ids')
     (project_id,) = FLAGS.project_ids
     api_key = api_keys.get_or_create_api_key(
-        data_store.DataStore(file_system.FileSystem(FLAGS.root_dir)),
+        data_store.DataStore(sqlite_file_system.create_file_system(
+            FLAGS.root_dir, FLAGS.storage_engine, FLAGS.write_durability)),
         project_id)
     run_generate_sdk_configuration(file_dir, project_id, api_key)
 
@@ -54,7 +54,14 @@ class LauncherTest(absltest.TestCase):
     launcher.run_api('mock_path')
     popen.assert_called_once_with(
         [sys.executable, '-m', 'api.falken_service',
-         '--root_dir', launcher.FLAGS.root_dir, '--port', '50051',
+         '--root_dir', launcher.FLAGS.root_dir, '--storage_engine', 'file',
+         '--write_durability', 'none', '--listing_cache_seconds', '0.0',
+         '--lock_backend', 'flufl',
+         '--episode_chunk_segments=False',
+         '--episode_chunk_manifests=False',
+         '--experimental_aio_server=False',
+         '--write_behind_ingestion=False',
+         '--port', '50051',
          '--ssl_dir', launcher.FLAGS.ssl_dir,
          '--verbosity', '0', '--alsologtostderr',
          '--log_dir', self.temp_dir,
@@ -83,7 +90,14 @@ class LauncherTest(absltest.TestCase):
     launcher.run_learner('mock_path')
     popen.assert_called_once_with(
         [sys.executable, '-m', 'learner.learner_service',
-         '--root_dir', launcher.FLAGS.root_dir, '--verbosity', '0',
+         '--root_dir', launcher.FLAGS.root_dir, '--storage_engine', 'file',
+         '--write_durability', 'none', '--listing_cache_seconds', '0.0',
+         '--lock_backend', 'flufl',
+         '--episode_chunk_segments=False',
+         '--episode_chunk_manifests=False',
+         '--max_concurrent_assignments', '1',
+         '--file_watcher', 'auto',
+         '--verbosity', '0',
          '--alsologtostderr', '--log_dir', self.temp_dir],
         env=os.environ, cwd='mock_path')
 
@@ -0,0 +1,204 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Lint as: python3
+"""Orders the assignments pending to be processed by a learner.
+
+Pending assignments are ranked by a priority computed from signals of the
+assignment and its session, e.g. whether the session received demonstrations
+that haven't been trained on yet. Projects are served in round-robin order, so
+a project with many pending assignments can't starve the others, and the
+highest priority assignment of a project is served first.
+
+The priority of an assignment grows with the time it has been pending so
+low priority assignments are eventually served.
+"""
+
+import collections
+import heapq
+import itertools
+import queue
+import threading
+import time
+
+# Signals of a pending assignment used to compute its priority:
+# * interactive: 1 if the session is an interactive training session,
+#   0 otherwise.
+# * new_demonstrations: 1 if the session received demonstrations that haven't
+#   been trained on by the assignment, 0 otherwise.
+# * untrained: 1 - training progress of the assignment.
+# * idle: Fraction of the time after which the session is considered stale
+#   that elapsed since the session last received data, between 0 and 1.
+PrioritySignals = collections.namedtuple(
+    'PrioritySignals', ['interactive', 'new_demonstrations', 'untrained',
+                        'idle'])
+
+
+class PriorityWeights(collections.namedtuple('PriorityWeights',
+                                             PrioritySignals._fields)):
+  """Weights of each of the PrioritySignals in the priority of assignments."""
+
+  def priority(self, signals):
+    """Computes the priority of an assignment.
+
+    Args:
+      signals: PrioritySignals of the assignment.
+    Returns:
+      The priority of the assignment as a float, higher priorities are served
+      first.
+    """
+    return sum(weight * signal for weight, signal in zip(self, signals))
+
+
+# Favors interactive sessions waiting for a model trained on their latest
+# demonstrations and deprioritizes sessions that are about to go stale.
+DEFAULT_PRIORITY_WEIGHTS = PriorityWeights(
+    interactive=1.0, new_demonstrations=2.0, untrained=1.0, idle=-1.0)
+
+# Priority gained by an assignment for each second it's pending.
+_DEFAULT_AGING_PER_SECOND = 1.0 / 60
+
+
+def parse_priority_weights(weights):
+  """Parses priority weights.
+
+  Args:
+    weights: List of "<signal>=<weight>" strings. Signals that aren't listed
+      use their weight in DEFAULT_PRIORITY_WEIGHTS.
+  Returns:
+    A PriorityWeights object.
+  Raises:
+    ValueError: If a weight can't be parsed.
+  """
+  values = {}
+  for weight in weights:
+    name, _, value = weight.partition('=')
+    if name not in PriorityWeights._fields:
+      raise ValueError(
+          f'Unknown priority signal "{name}" in "{weight}", expected one of '
+          f'{", ".join(PriorityWeights._fields)}.')
+    try:
+      values[name] = float(value)
+    except ValueError:
+      raise ValueError(f'Invalid weight "{value}" for priority signal {name}.')
+  return DEFAULT_PRIORITY_WEIGHTS._replace(**values)
+
+
+class AssignmentScheduler:
+  """Queue of pending assignment resource ids served by priority.
+
+  The queue follows the interface of queue.Queue used by learner.Storage.
+  """
+
+  def __init__(self, get_priority, aging_per_second=_DEFAULT_AGING_PER_SECOND):
+    """Initializes the scheduler.
+
+    Args:
+      get_priority: Callable that takes the resource id of an assignment and
+        returns its priority as a float.
+      aging_per_second: Priority gained by an assignment for each second it's
+        pending.
+    """
+    self._get_priority = get_priority
+    self._aging_per_second = aging_per_second
+    # Heaps of [sort key, sequence number, resource id, enqueue time] entries
+    # by project id in the order projects are served. Entries that are
+    # replaced are invalidated by setting their resource id to None.
+    self._projects = collections.OrderedDict()
+    # Valid entries by resource id.
+    self._entries = {}
+    self._sequence = itertools.count()
+    self._condition = threading.Condition()
+
+  def __len__(self):
+    """Returns the number of pending assignments."""
+    with self._condition:
+      return len(self._entries)
+
+  def put(self, assignment_id):
+    """Adds an assignment or updates the priority of a pending assignment.
+
+    Args:
+      assignment_id: Resource id of the assignment.
+    """
+    self._push(assignment_id, True)
+
+  def update(self, assignment_id):
+    """Updates the priority of an assignment if it's pending.
+
+    Args:
+      assignment_id: Resource id of the assignment.
+    """
+    self._push(assignment_id, False)
+
+  def _push(self, assignment_id, add):
+    """Computes the priority of an assignment and pushes it to its project.
+
+    Args:
+      assignment_id: Resource id of the assignment.
+      add: Whether to add the assignment if it isn't pending.
+    """
+    if not add and assignment_id not in self._entries:
+      return
+    priority = self._get_priority(assignment_id)
+    with self._condition:
+      previous_entry = self._entries.get(assignment_id)
+      if not add and not previous_entry:
+        # The assignment was served while its priority was computed.
+        return
+      if previous_entry:
+        # Keep the time the assignment started pending.
+        enqueue_time = previous_entry[3]
+        previous_entry[2] = None
+      else:
+        enqueue_time = time.monotonic()
+      # Aging increases the priority of all pending assignments at the same
+      # rate, so they're ordered by their priority at the time they were
+      # enqueued.
+      entry = [self._aging_per_second * enqueue_time - priority,
+               next(self._sequence), assignment_id, enqueue_time]
+      self._entries[assignment_id] = entry
+      heapq.heappush(self._projects.setdefault(assignment_id.project, []),
+                     entry)
+      self._condition.notify()
+
+  def get(self, timeout=None):
+    """Removes and returns the next assignment to serve.
+
+    Args:
+      timeout: Maximum number of seconds to wait for an assignment or None to
+        wait indefinitely.
+    Returns:
+      The resource id of an assignment.
+    Raises:
+      queue.Empty: If no assignment is pending after the timeout.
+    """
+    with self._condition:
+      if not self._condition.wait_for(lambda: self._entries, timeout):
+        raise queue.Empty()
+      for project_id, heap in self._projects.items():
+        while heap and heap[0][2] is None:
+          heapq.heappop(heap)
+        if heap:
+          break
+      assignment_id = heapq.heappop(heap)[2]
+      del self._entries[assignment_id]
+      # Serve other projects before this one again.
+      while heap and heap[0][2] is None:
+        heapq.heappop(heap)
+      if heap:
+        self._projects.move_to_end(project_id)
+      else:
+        del self._projects[project_id]
+      return assignment_id
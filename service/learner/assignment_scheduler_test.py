@@ -0,0 +1,135 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Lint as: python3
+"""Tests for AssignmentScheduler."""
+
+import queue
+import threading
+from unittest import mock
+
+from absl.testing import absltest
+from data_store import resource_id
+from learner import assignment_scheduler
+
+
+def _assignment_id(project, assignment):
+  """Creates the resource id of an assignment."""
+  return resource_id.FalkenResourceId(
+      project=project, brain='b0', session='s0', assignment=assignment)
+
+
+class AssignmentSchedulerTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    # Priorities by assignment resource id.
+    self._priorities = {}
+    self._scheduler = assignment_scheduler.AssignmentScheduler(
+        lambda a: self._priorities.get(a, 0.0), aging_per_second=0)
+
+  def _get_all(self):
+    """Gets all pending assignments."""
+    assignment_ids = []
+    while self._scheduler:
+      assignment_ids.append(self._scheduler.get(timeout=0))
+    return assignment_ids
+
+  def test_get_by_priority(self):
+    ids = [_assignment_id('p0', f'a{i}') for i in range(4)]
+    self._priorities = {ids[1]: 2.0, ids[2]: 1.0, ids[3]: 2.0}
+    for assignment_id in ids:
+      self._scheduler.put(assignment_id)
+    self.assertLen(self._scheduler, 4)
+    # Assignments with the same priority are served in order.
+    self.assertEqual(self._get_all(), [ids[1], ids[3], ids[2], ids[0]])
+
+  def test_get_empty(self):
+    with self.assertRaises(queue.Empty):
+      self._scheduler.get(timeout=0)
+    with self.assertRaises(queue.Empty):
+      self._scheduler.get(timeout=0.01)
+
+  def test_get_blocks_until_put(self):
+    assignment_id = _assignment_id('p0', 'a0')
+    thread = threading.Timer(0.05, self._scheduler.put, args=(assignment_id,))
+    thread.start()
+    self.assertEqual(self._scheduler.get(), assignment_id)
+    thread.join()
+
+  def test_projects_are_served_fairly(self):
+    noisy_ids = [_assignment_id('noisy', f'a{i}') for i in range(3)]
+    quiet_ids = [_assignment_id('quiet', f'a{i}') for i in range(2)]
+    for assignment_id in noisy_ids:
+      self._priorities[assignment_id] = 10.0
+      self._scheduler.put(assignment_id)
+    for assignment_id in quiet_ids:
+      self._scheduler.put(assignment_id)
+    self.assertEqual(
+        self._get_all(),
+        [noisy_ids[0], quiet_ids[0], noisy_ids[1], quiet_ids[1], noisy_ids[2]])
+
+  def test_update(self):
+    ids = [_assignment_id('p0', f'a{i}') for i in range(2)]
+    for assignment_id in ids:
+      self._scheduler.put(assignment_id)
+    self._priorities[ids[1]] = 1.0
+    self._scheduler.update(ids[1])
+    # Assignments that aren't pending aren't added.
+    self._scheduler.update(_assignment_id('p0', 'a2'))
+    self.assertLen(self._scheduler, 2)
+    self.assertEqual(self._get_all(), [ids[1], ids[0]])
+
+  @mock.patch.object(assignment_scheduler.time, 'monotonic')
+  def test_aging(self, monotonic_mock):
+    scheduler = assignment_scheduler.AssignmentScheduler(
+        lambda a: self._priorities.get(a, 0.0), aging_per_second=0.1)
+    ids = [_assignment_id('p0', f'a{i}') for i in range(3)]
+    self._priorities = {ids[1]: 1.0, ids[2]: 1.0}
+    monotonic_mock.return_value = 0
+    scheduler.put(ids[0])
+    # After waiting 20 seconds ids[0] has a higher priority than ids[1].
+    monotonic_mock.return_value = 20
+    scheduler.put(ids[1])
+    # Updating the priority of a pending assignment keeps its age.
+    scheduler.update(ids[0])
+    monotonic_mock.return_value = 5
+    scheduler.put(ids[2])
+    self.assertEqual([scheduler.get(timeout=0) for _ in range(3)],
+                     [ids[2], ids[0], ids[1]])
+
+  def test_priority_weights(self):
+    weights = assignment_scheduler.PriorityWeights(
+        interactive=1.0, new_demonstrations=2.0, untrained=3.0, idle=-4.0)
+    self.assertEqual(
+        weights.priority(assignment_scheduler.PrioritySignals(
+            interactive=1.0, new_demonstrations=0.0, untrained=0.5,
+            idle=0.25)),
+        1.5)
+
+  def test_parse_priority_weights(self):
+    self.assertEqual(assignment_scheduler.parse_priority_weights([]),
+                     assignment_scheduler.DEFAULT_PRIORITY_WEIGHTS)
+    self.assertEqual(
+        assignment_scheduler.parse_priority_weights(['idle=0', 'untrained=3']),
+        assignment_scheduler.DEFAULT_PRIORITY_WEIGHTS._replace(
+            idle=0.0, untrained=3.0))
+    with self.assertRaises(ValueError):
+      assignment_scheduler.parse_priority_weights(['unknown=1'])
+    with self.assertRaises(ValueError):
+      assignment_scheduler.parse_priority_weights(['idle=high'])
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -0,0 +1,350 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Lint as: python3
+"""Validates data protos against a brain spec compiled into a flat plan.
+
+ProtobufNode.data_to_proto_nest() walks the spec tree, checks the type of each
+spec proto and builds a nest of data protos every time data is validated.
+BrainSpecValidator walks the spec once and compiles it into a flat list of
+checks with fixed field paths, ranges, enum sizes and feeler counts, so
+validating a step only reads the data protos. Validation reports the same
+errors as data_to_proto_nest().
+"""
+
+import operator
+
+# pylint: disable=g-bad-import-order
+import common.generate_protos  # pylint: disable=unused-import
+import action_pb2
+import observation_pb2
+import primitives_pb2
+from learner.brains import specs
+
+
+def _has_field_message(has, name):
+  """Describes whether a proto has an optional field."""
+  return f'has "{name}"' if has else f'does not have "{name}"'
+
+
+def _compile_optional_fields_check(spec, optional_fields, path):
+  """Compiles a check of the optional fields set in a data proto.
+
+  Args:
+    spec: Spec proto that declares which optional fields are set.
+    optional_fields: List of optional field names.
+    path: Path of the spec to report in errors.
+
+  Returns:
+    Callable that takes a data proto and raises specs.TypingError if its
+    optional fields don't match the spec.
+  """
+  expected = [(field, spec.HasField(field)) for field in optional_fields]
+
+  def check(data):
+    for field, spec_has_field in expected:
+      data_has_field = data.HasField(field)
+      if data_has_field != spec_has_field:
+        raise specs.TypingError(
+            f'{path} entity {_has_field_message(data_has_field, field)} but '
+            f'spec {_has_field_message(spec_has_field, field)}.')
+  return check
+
+
+def _count_error(path, typename, count, fieldname, expected_count):
+  """Creates the error raised when a repeated field has an unexpected size."""
+  return specs.TypingError(
+      f'{path} {typename} contains {count} {fieldname} vs. expected '
+      f'{expected_count} {fieldname}.')
+
+
+def _compile_number_check(spec, path):
+  """Compiles a check of a Number proto against a NumberType spec."""
+  minimum = spec.minimum
+  maximum = spec.maximum
+
+  def check(data):
+    value = data.value
+    if value < minimum or value > maximum:
+      raise specs.TypingError(
+          f'{path} number has value {value} that is out of the specified '
+          f'range [{minimum}, {maximum}].')
+  return check
+
+
+def _compile_category_check(spec, path):
+  """Compiles a check of a Category proto against a CategoryType spec."""
+  maximum = len(spec.enum_values) - 1
+  enum_items = ', '.join(spec.enum_values)
+
+  def check(data):
+    value = data.value
+    if value < 0 or value > maximum:
+      raise specs.TypingError(
+          f'{path} category has value {value} that is out of the specified '
+          f'range [0, {maximum}] ({enum_items}).')
+  return check
+
+
+def _compile_feeler_check(spec, path):
+  """Compiles a check of a Feeler proto against a FeelerType spec."""
+  count = spec.count
+  # Ranges are checked inline as a feeler can have many measurements.
+  distance_range = (spec.distance.minimum, spec.distance.maximum)
+  experimental_data_ranges = [(s.minimum, s.maximum)
+                              for s in spec.experimental_data]
+  experimental_data_count = len(experimental_data_ranges)
+
+  def number_error(measurement_index, field, value, value_range):
+    return specs.TypingError(
+        f'{path}/measurements[{measurement_index}]/{field} number has value '
+        f'{value} that is out of the specified range '
+        f'[{value_range[0]}, {value_range[1]}].')
+
+  def check(data):
+    measurements = data.measurements
+    if len(measurements) != count:
+      raise specs.TypingError(
+          f'{path} feeler has an invalid number of measurements '
+          f'{len(measurements)} vs. expected {count}.')
+    minimum_distance, maximum_distance = distance_range
+    for i, measurement in enumerate(measurements):
+      distance = measurement.distance.value
+      if distance < minimum_distance or distance > maximum_distance:
+        raise number_error(i, 'distance', distance, distance_range)
+      experimental_data = measurement.experimental_data
+      if len(experimental_data) != experimental_data_count:
+        raise _count_error(f'{path}/measurements[{i}]', 'feeler',
+                           len(experimental_data), 'experimental_data',
+                           experimental_data_count)
+      for j, value_range in enumerate(experimental_data_ranges):
+        value = experimental_data[j].value
+        if value < value_range[0] or value > value_range[1]:
+          raise number_error(i, f'experimental_data[{j}]', value, value_range)
+  return check
+
+
+def _compile_joystick_check(unused_spec, path):
+  """Compiles a check of a Joystick proto against a JoystickType spec."""
+
+  def check(data):
+    for axis, value in (('x_axis', data.x_axis), ('y_axis', data.y_axis)):
+      if value < -1.0 or value > 1.0:
+        raise specs.TypingError(f'{path} joystick {axis} value {value} is out '
+                                'of range [-1.0, 1.0].')
+  return check
+
+
+def _compile_no_check(unused_spec, unused_path):
+  """Compiles a check of a data proto that is valid if present."""
+  return None
+
+
+_SPEC_PROTO_CLASS_TO_COMPILER = {
+    action_pb2.JoystickType: _compile_joystick_check,
+    observation_pb2.FeelerType: _compile_feeler_check,
+    primitives_pb2.CategoryType: _compile_category_check,
+    primitives_pb2.NumberType: _compile_number_check,
+    primitives_pb2.PositionType: _compile_no_check,
+    primitives_pb2.RotationType: _compile_no_check,
+}
+
+
+def _compile_leaf_check(node):
+  """Compiles a check of a data proto against a leaf spec.
+
+  Args:
+    node: specs.ProtobufNode of the leaf spec.
+
+  Returns:
+    Callable that takes a data proto and raises specs.TypingError if it
+    doesn't match the spec or None if any data proto matches the spec.
+  """
+  return _SPEC_PROTO_CLASS_TO_COMPILER[type(node.proto)](node.proto, node.path)
+
+
+def _compile_oneof_check(node, data_oneof, data_typename, spec_oneof,
+                         spec_type):
+  """Compiles a check of a data proto oneof that holds a leaf proto.
+
+  Args:
+    node: specs.ProtobufNode of the leaf spec held by the oneof.
+    data_oneof: Name of the oneof in the data proto.
+    data_typename: Name of the data type to report in errors.
+    spec_oneof: Name of the oneof in the spec proto.
+    spec_type: Name of the field set in the oneof of the spec proto.
+
+  Returns:
+    Callable that takes a data proto and raises specs.TypingError if the
+    oneof or the leaf proto it holds don't match the spec.
+  """
+  path = node.path
+  check_leaf = _compile_leaf_check(node)
+
+  def check(data):
+    data_type = data.WhichOneof(data_oneof)
+    if data_type != spec_type:
+      raise specs.TypingError(
+          f'{path}/{data_oneof} {data_typename} "{data_type}" does not match '
+          f'the spec {spec_oneof} "{spec_type}".')
+    if check_leaf:
+      check_leaf(getattr(data, spec_type))
+  return check
+
+
+def _compile_entity_check(node):
+  """Compiles a check of an Entity proto against an EntityType spec.
+
+  Args:
+    node: specs.ProtobufNode of the EntityType spec.
+
+  Returns:
+    Callable that takes an Entity proto and raises specs.TypingError if it
+    doesn't match the spec.
+  """
+  spec = node.proto
+  path = node.path
+  check_optional_fields = _compile_optional_fields_check(
+      spec, specs.ENTITY_OPTIONAL_FIELDS, path)
+  field_checks = [
+      _compile_oneof_check(
+          node.child_by_proto_field_name(f'entity_fields[{i}]'), 'value',
+          'entity field', 'type', field_spec.WhichOneof('type'))
+      for i, field_spec in enumerate(spec.entity_fields)]
+  field_count = len(field_checks)
+
+  def check(data):
+    check_optional_fields(data)
+    entity_fields = data.entity_fields
+    if len(entity_fields) != field_count:
+      raise _count_error(path, 'entity', len(entity_fields), 'entity_fields',
+                         field_count)
+    for i, check_field in enumerate(field_checks):
+      check_field(entity_fields[i])
+  return check
+
+
+class BrainSpecValidator:
+  """Validates action and observation data against a brain spec."""
+
+  def __init__(self, brain_spec_pb):
+    """Parses, validates and compiles the provided spec proto.
+
+    Args:
+      brain_spec_pb: BrainSpec protobuf to compile.
+
+    Raises:
+      specs.InvalidSpecError: If the spec is invalid.
+    """
+    brain_spec = specs.BrainSpec(brain_spec_pb)
+    self._action_checks = self._compile_action_spec(
+        brain_spec.action_spec.proto_node)
+    self._observation_checks = self._compile_observation_spec(
+        brain_spec.observation_spec.proto_node)
+
+  @staticmethod
+  def _compile_action_spec(node):
+    """Compiles the checks of an ActionData proto.
+
+    Args:
+      node: specs.ProtobufNode of the ActionSpec.
+
+    Returns:
+      List of callables that take an ActionData proto, to call in order.
+    """
+    spec = node.proto
+    path = node.path
+    action_checks = [
+        _compile_oneof_check(
+            node.child_by_proto_field_name(f'actions[{i}]'), 'action',
+            'action', 'action_types', action_spec.WhichOneof('action_types'))
+        for i, action_spec in enumerate(spec.actions)]
+    action_count = len(action_checks)
+
+    def check_action_data(data):
+      if data.source == action_pb2.ActionData.SOURCE_UNKNOWN:
+        raise specs.TypingError(f'{path} action data\'s source is unknown.')
+      if len(data.actions) != action_count:
+        raise _count_error(path, 'actions', len(data.actions), 'actions',
+                           action_count)
+
+    def check_action(index, check):
+      return lambda data: check(data.actions[index])
+
+    return [check_action_data] + [check_action(i, check)
+                                  for i, check in enumerate(action_checks)]
+
+  @staticmethod
+  def _compile_observation_spec(node):
+    """Compiles the checks of an ObservationData proto.
+
+    Args:
+      node: specs.ProtobufNode of the ObservationSpec.
+
+    Returns:
+      List of callables that take an ObservationData proto, to call in order.
+    """
+    spec = node.proto
+    path = node.path
+    check_optional_entities = _compile_optional_fields_check(
+        spec, specs.OBSERVATION_OPTIONAL_ENTITIES, path)
+    global_entity_count = len(spec.global_entities)
+
+    def check_observation_data(data):
+      check_optional_entities(data)
+      if len(data.global_entities) != global_entity_count:
+        raise _count_error(path, 'observations', len(data.global_entities),
+                           'global_entities', global_entity_count)
+
+    def check_entity(get_entity, check):
+      return lambda data: check(get_entity(data))
+
+    checks = [check_observation_data]
+    for field in specs.OBSERVATION_OPTIONAL_ENTITIES:
+      if spec.HasField(field):
+        checks.append(check_entity(
+            operator.attrgetter(field),
+            _compile_entity_check(node.child_by_proto_field_name(field))))
+    if global_entity_count:
+      global_entities_node = node.child_by_proto_field_name('global_entities')
+      for i in range(global_entity_count):
+        checks.append(check_entity(
+            lambda data, i=i: data.global_entities[i],
+            _compile_entity_check(global_entities_node.child_by_proto_field_name(
+                f'global_entities[{i}]'))))
+    return checks
+
+  def check_action_data(self, data):
+    """Checks that an ActionData proto conforms to the spec.
+
+    Args:
+      data: ActionData proto to check.
+
+    Raises:
+      specs.TypingError: If the data doesn't conform to the spec.
+    """
+    for check in self._action_checks:
+      check(data)
+
+  def check_observation_data(self, data):
+    """Checks that an ObservationData proto conforms to the spec.
+
+    Args:
+      data: ObservationData proto to check.
+
+    Raises:
+      specs.TypingError: If the data doesn't conform to the spec.
+    """
+    for check in self._observation_checks:
+      check(data)
@@ -0,0 +1,231 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Lint as: python3
+"""Tests for spec_validator."""
+
+# pylint: disable=g-bad-import-order
+from absl.testing import absltest
+from absl.testing import parameterized
+from google.protobuf import text_format
+
+import common.generate_protos  # pylint: disable=unused-import
+import action_pb2
+import brain_pb2
+import observation_pb2
+from learner.brains import spec_validator
+from learner.brains import specs
+
+_BRAIN_SPEC = """
+  observation_spec {
+    player {
+      position {}
+      rotation {}
+      entity_fields {
+        name: "panache"
+        number {
+          minimum: 0.0
+          maximum: 100.0
+        }
+      }
+      entity_fields {
+        name: "favorite_poison"
+        category {
+          enum_values: "GIN"
+          enum_values: "ABSINTH"
+        }
+      }
+      entity_fields {
+        name: "feeler"
+        feeler {
+          count: 2
+          distance {
+            minimum: 0.0
+            maximum: 100.0
+          }
+          yaw_angles: [-10.0, 10.0]
+          experimental_data: {
+            minimum: 0.0
+            maximum: 10.0
+          }
+        }
+      }
+    }
+    camera {
+      position {}
+      rotation {}
+    }
+    global_entities {
+      entity_fields {
+        name: "chutzpah"
+        number {
+          minimum: 0.0
+          maximum: 100.0
+        }
+      }
+    }
+  }
+  action_spec {
+    actions {
+      name: "what_do"
+      category {
+        enum_values: "STAY"
+        enum_values: "GO"
+      }
+    }
+    actions {
+      name: "trouble"
+      number {
+        minimum: 1000
+        maximum: 2000
+      }
+    }
+    actions {
+      name: "left_stick"
+      joystick {
+        axes_mode: DIRECTION_XZ
+        controlled_entity: "player"
+        control_frame: "player"
+      }
+    }
+  }
+"""
+
+_OBSERVATION_DATA = """
+  player {
+    position {}
+    rotation {}
+    entity_fields { number { value: 60.0 } }
+    entity_fields { category { value: 1 } }
+    entity_fields {
+      feeler {
+        measurements: {
+          distance { value: 1.0 }
+          experimental_data: { value: 1.1 }
+        }
+        measurements: {
+          distance { value: 2.0 }
+          experimental_data: { value: 2.1 }
+        }
+      }
+    }
+  }
+  camera {
+    position {}
+    rotation {}
+  }
+  global_entities {
+    entity_fields { number { value: 34 } }
+  }
+"""
+
+_ACTION_DATA = """
+  source: HUMAN_DEMONSTRATION
+  actions { category { value: 1 } }
+  actions { number { value: 1500 } }
+  actions { joystick { x_axis: 0 y_axis: 1 } }
+"""
+
+
+def _mutate_observation(mutation):
+  """Parses _OBSERVATION_DATA and applies a mutation to it."""
+  data = text_format.Parse(_OBSERVATION_DATA, observation_pb2.ObservationData())
+  mutation(data)
+  return data
+
+
+def _mutate_action(mutation):
+  """Parses _ACTION_DATA and applies a mutation to it."""
+  data = text_format.Parse(_ACTION_DATA, action_pb2.ActionData())
+  mutation(data)
+  return data
+
+
+def _player_field(data, index):
+  """Returns an entity field of the player entity."""
+  return data.player.entity_fields[index]
+
+
+class BrainSpecValidatorTest(parameterized.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self._brain_spec_pb = text_format.Parse(_BRAIN_SPEC, brain_pb2.BrainSpec())
+    self._brain_spec = specs.BrainSpec(self._brain_spec_pb)
+    self._validator = spec_validator.BrainSpecValidator(self._brain_spec_pb)
+
+  def test_invalid_spec(self):
+    self._brain_spec_pb.action_spec.actions[0].name = ''
+    with self.assertRaises(specs.InvalidSpecError):
+      spec_validator.BrainSpecValidator(self._brain_spec_pb)
+
+  def test_check_valid_data(self):
+    self._validator.check_action_data(_mutate_action(lambda d: None))
+    self._validator.check_observation_data(_mutate_observation(lambda d: None))
+
+  @parameterized.named_parameters(
+      ('unknown_source', lambda d: setattr(d, 'source', 0)),
+      ('missing_action', lambda d: d.actions.pop()),
+      ('extra_action', lambda d: d.actions.add().category.SetInParent()),
+      ('mismatched_type', lambda d: d.actions[0].number.SetInParent()),
+      ('unset_type', lambda d: d.actions[1].ClearField('number')),
+      ('category_out_of_range',
+       lambda d: setattr(d.actions[0].category, 'value', 2)),
+      ('number_out_of_range',
+       lambda d: setattr(d.actions[1].number, 'value', 999)),
+      ('joystick_out_of_range',
+       lambda d: setattr(d.actions[2].joystick, 'y_axis', 1.5)))
+  def test_check_invalid_action_data(self, mutation):
+    data = _mutate_action(mutation)
+    with self.assertRaises(specs.TypingError) as expected:
+      self._brain_spec.action_spec.proto_node.data_to_proto_nest(data)
+    with self.assertRaisesWithLiteralMatch(specs.TypingError,
+                                           str(expected.exception)):
+      self._validator.check_action_data(data)
+
+  @parameterized.named_parameters(
+      ('missing_entity', lambda d: d.ClearField('camera')),
+      ('missing_global_entity', lambda d: d.global_entities.pop()),
+      ('missing_position', lambda d: d.player.ClearField('position')),
+      ('missing_entity_field', lambda d: d.player.entity_fields.pop()),
+      ('mismatched_field_type',
+       lambda d: _player_field(d, 0).category.SetInParent()),
+      ('number_out_of_range',
+       lambda d: setattr(d.global_entities[0].entity_fields[0].number,
+                         'value', 101)),
+      ('category_out_of_range',
+       lambda d: setattr(_player_field(d, 1).category, 'value', -1)),
+      ('missing_measurement',
+       lambda d: _player_field(d, 2).feeler.measurements.pop()),
+      ('distance_out_of_range',
+       lambda d: setattr(_player_field(d, 2).feeler.measurements[1].distance,
+                         'value', 200)),
+      ('missing_experimental_data',
+       lambda d: _player_field(d, 2).feeler.measurements[0].experimental_data
+       .pop()),
+      ('experimental_data_out_of_range',
+       lambda d: setattr(
+           _player_field(d, 2).feeler.measurements[1].experimental_data[0],
+           'value', 11)))
+  def test_check_invalid_observation_data(self, mutation):
+    data = _mutate_observation(mutation)
+    with self.assertRaises(specs.TypingError) as expected:
+      self._brain_spec.observation_spec.proto_node.data_to_proto_nest(data)
+    with self.assertRaisesWithLiteralMatch(specs.TypingError,
+                                           str(expected.exception)):
+      self._validator.check_observation_data(data)
+
+
+if __name__ == '__main__':
+  absltest.main()
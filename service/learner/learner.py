@@ -103,7 +103,11 @@ class Learner:
     if assignment_proto:
       return assignment_proto
 
-    falken_logging.info('Waiting for assignment.')
+    polling_stats = self._storage.polling_stats
+    falken_logging.info(
+        'Waiting for assignment. Polling for notifications at '
+        f'{polling_stats.frequency:.2f}Hz taking '
+        f'{polling_stats.tick_seconds:.3f}s per poll.')
     assignment = self._storage.receive_assignment(timeout=timeout)
     if assignment is None:
       return None
@@ -18,6 +18,7 @@
 import os
 import signal
 import tempfile
+import threading
 import traceback
 from typing import Optional
 
@@ -25,13 +26,82 @@ from absl import app
 from absl import flags
 from absl import logging
 from data_store import data_store as data_store_module
-from data_store import file_system as data_store_file_system
+from data_store import file_system
+from data_store import file_watcher
+from data_store import manifest_store
+from data_store import segment_store
+from data_store import sqlite_file_system
+from learner import assignment_scheduler
 from learner import learner as learner_module
 from learner import storage
 from log import falken_logging
 
 flags.DEFINE_string('root_dir', '',
                     'Directory where the Falken service will store data.')
+flags.DEFINE_enum(
+    'storage_engine', 'file', sqlite_file_system.STORAGE_ENGINES,
+    'How data is stored in --root_dir: "file" stores each resource in its own '
+    'file, "sqlite" stores all resources in a single SQLite database.')
+flags.DEFINE_enum(
+    'write_durability', file_system.DURABILITY_NONE,
+    file_system.DURABILITY_LEVELS,
+    'How writes to --root_dir are flushed to disk: "none" replaces files '
+    'atomically without flushing them, "file" also flushes each file before it '
+    'is replaced and "directory" also flushes the directory containing each '
+    'file so that new files survive a crash.')
+flags.DEFINE_enum(
+    'lock_backend', file_system.LOCK_BACKEND_FLUFL, file_system.LOCK_BACKENDS,
+    'How the "file" storage engine locks files: "flufl" creates lock files '
+    'that expire unless they are refreshed, "fcntl" uses flock() which is '
+    'cheaper but only works on POSIX systems with a local --root_dir. The API '
+    'and learner services must use the same setting.')
+flags.DEFINE_float(
+    'listing_cache_seconds', 0,
+    'Number of seconds directory listings are reused while the directory is '
+    'not modified, which avoids listing the same directories when searching '
+    'the data store. 0 disables the cache. Only used by the "file" storage '
+    'engine.')
+flags.DEFINE_bool(
+    'episode_chunk_segments', False,
+    'Append episode chunks to per-session segment files rather than storing '
+    'each chunk in its own file. Only supported by the "file" storage engine, '
+    'the API and learner services must use the same setting.')
+flags.DEFINE_bool(
+    'episode_chunk_manifests', False,
+    'List the episode chunks of each session by creation time in a manifest '
+    'file so that new chunks are found without listing all chunks of a '
+    'session. Only supported by the "file" storage engine, the API and '
+    'learner services must use the same setting.')
+flags.DEFINE_enum(
+    'resource_compression', 'zlib', data_store_module.CODEC_NAMES,
+    'Codec used to compress episode chunks and serialized models. Resources '
+    'compressed with any codec can be read regardless of this setting.')
+flags.DEFINE_integer(
+    'max_concurrent_assignments', 1,
+    'Number of assignments the learner processes at the same time, each in '
+    'its own thread.', lower_bound=1)
+flags.DEFINE_float(
+    'min_assignment_poll_frequency', None,
+    'If set, polling for assignments backs off exponentially down to this '
+    'frequency in Hz while no changes are found, which reduces the load idle '
+    'learners put on file systems that can\'t report changes. Polling '
+    'returns to its maximum frequency as soon as changes are found.')
+flags.DEFINE_enum(
+    'file_watcher', file_watcher.AUTO, file_watcher.WATCHER_KINDS,
+    'How the learner detects new assignment notifications. "auto" uses '
+    'inotify where it\'s supported and polls otherwise, "inotify" fails if '
+    'inotify is not supported and "polling" always polls. inotify doesn\'t '
+    'report notifications written by other hosts, so use "polling" if '
+    '--root_dir is on a file system shared with the API services, e.g. NFS.')
+flags.DEFINE_list(
+    'assignment_priority_weights', [],
+    'Comma separated list of <signal>=<weight> pairs that override the '
+    'weights used to rank pending assignments. Signals are '
+    f'{", ".join(assignment_scheduler.PrioritySignals._fields)}, default '
+    'weights are ' + ','.join(
+        f'{name}={weight}' for name, weight in
+        assignment_scheduler.DEFAULT_PRIORITY_WEIGHTS._asdict().items()) +
+    '.')
 flags.DEFINE_string('tmp_models_dir', None,
                     'Temporary parent directory for models.')
 flags.DEFINE_string('models_dir', None,
@@ -68,14 +138,44 @@ class LearnerService:
         f'Creating Learner that uses data store {FLAGS.root_dir}')
     # TemporaryDirectory objects.
     self._temporary_directories = []
-    fs = data_store_file_system.FileSystem(FLAGS.root_dir)
-    self._learner = learner_module.Learner(
-        self._get_temporary_storage_dir('tmp_models_dir'),
-        _get_permanent_storage_dir('models_dir'),
-        _get_permanent_storage_dir('checkpoints_dir'),
-        _get_permanent_storage_dir('summaries_dir'),
-        storage.Storage(data_store_module.DataStore(fs), fs),
-        assignment_path=assignment_path)
+    fs = sqlite_file_system.create_file_system(
+        FLAGS.root_dir, FLAGS.storage_engine, FLAGS.write_durability,
+        FLAGS.listing_cache_seconds, FLAGS.lock_backend)
+    segments = None
+    if FLAGS.episode_chunk_segments:
+      if FLAGS.storage_engine != 'file':
+        raise ValueError(
+            '--episode_chunk_segments requires --storage_engine=file.')
+      segments = segment_store.SegmentStore(fs)
+    manifests = None
+    if FLAGS.episode_chunk_manifests:
+      if FLAGS.storage_engine != 'file':
+        raise ValueError(
+            '--episode_chunk_manifests requires --storage_engine=file.')
+      manifests = manifest_store.ManifestStore(fs)
+    learner_storage = storage.Storage(
+        data_store_module.DataStore(
+            fs, segments=segments,
+            codecs=data_store_module.create_codecs(
+                FLAGS.resource_compression),
+            manifests=manifests), fs,
+        max_assignments=FLAGS.max_concurrent_assignments,
+        priority_weights=assignment_scheduler.parse_priority_weights(
+            FLAGS.assignment_priority_weights),
+        min_notification_frequency=FLAGS.min_assignment_poll_frequency,
+        watcher_kind=FLAGS.file_watcher)
+    # Learners that share learner_storage, each processes assignments in its
+    # own thread.
+    self._learners = [
+        learner_module.Learner(
+            self._get_temporary_storage_dir('tmp_models_dir'),
+            _get_permanent_storage_dir('models_dir'),
+            _get_permanent_storage_dir('checkpoints_dir'),
+            _get_permanent_storage_dir('summaries_dir'),
+            learner_storage,
+            assignment_path=assignment_path)
+        for _ in range(FLAGS.max_concurrent_assignments)]
+    self._stopped = threading.Event()
 
   def _get_temporary_storage_dir(self, dir_property_name: str) -> str:
     """Get a path to a temporary directory to store models.
@@ -103,36 +203,77 @@ class LearnerService:
       temp_dir.cleanup()
     self._temporary_directories = []
 
-  def run(self, iterations: int):
-    """Process assignments.
-
-    Processes assignments until the number of iterations is reached or a
-    keyboard interrupt (sigint) occurs.
+  def _run_learner(self, learner, iterations: int) -> bool:
+    """Process assignments with a learner.
 
     Args:
+      learner: Learner used to process assignments.
       iterations: Number of attempts to process assignments.
+
+    Returns:
+      True if all iterations were completed, False if processing was
+      interrupted or stopped.
     """
-    falken_logging.info('Started Falken Learner service; '
-                        'waiting for assignments...')
     while iterations != 0:
+      if self._stopped.is_set():
+        return False
       if iterations > 0: iterations -= 1
       try:
-        self._learner.process_assignment()
+        learner.process_assignment()
       except KeyboardInterrupt as e:  # Handle SIGINT.
-        return
+        return False
       except Exception as e:  # pylint: disable=broad-except
         falken_logging.error(
             f'Exception found when processing assignment: {e}\n'
             f'{traceback.format_exc()}')
         raise e
+    return True
+
+  def run(self, iterations: int):
+    """Process assignments.
+
+    Processes assignments until the number of iterations is reached or a
+    keyboard interrupt (sigint) occurs. With --max_concurrent_assignments
+    greater than 1, additional learners process assignments in background
+    threads, each for the specified number of iterations.
+
+    Args:
+      iterations: Number of attempts to process assignments.
+    """
+    falken_logging.info('Started Falken Learner service; '
+                        'waiting for assignments...')
+    threads = [threading.Thread(target=self._run_learner,
+                                args=(learner, iterations), daemon=True)
+               for learner in self._learners[1:]]
+    for thread in threads:
+      thread.start()
+    try:
+      if not self._run_learner(self._learners[0], iterations):
+        self._stop_threads()
+    except Exception:
+      self._stop_threads()
+      raise
+    finally:
+      for thread in threads:
+        thread.join()
+
+  def _stop_threads(self):
+    """Stops the background threads started by run()."""
+    self._stopped.set()
+    self.stop()
 
   def stop(self):
     """Stop processing assignments. This can be called from another thread."""
-    self._learner.stop_process_assignment()
+    for learner in self._learners:
+      learner.stop_process_assignment()
 
   def shutdown(self):
     """Stop processing assignments and cleanup."""
-    self._learner.shutdown()
+    # All learners share the same storage which is shut down by the first
+    # learner.
+    for learner in self._learners[1:]:
+      learner.stop_process_assignment()
+    self._learners[0].shutdown()
     self._cleanup_temporary_dirs()
 
 
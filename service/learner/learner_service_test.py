@@ -38,6 +38,7 @@ class LearnerServiceTest(absltest.TestCase):
     learner_service.FLAGS.models_dir = None
     learner_service.FLAGS.checkpoints_dir = None
     learner_service.FLAGS.summaries_dir = None
+    learner_service.FLAGS.max_concurrent_assignments = 1
 
   def test_get_permanent_storage_dir_when_flag_set(self):
     """Get the permanent storage dir from its' flag."""
@@ -131,6 +132,23 @@ class LearnerServiceTest(absltest.TestCase):
     service.run(3)
     mock_learner.process_assignment.assert_has_calls([mock.call()] * 3)
 
+  @mock.patch.object(learner, 'Learner', autospec=True)
+  def test_run_concurrent_assignments(self, mock_learner_class):
+    """Test processing assignments with several learners sharing storage."""
+    learner_service.FLAGS.max_concurrent_assignments = 3
+    mock_learner = mock_learner_class.return_value
+    service = learner_service.LearnerService(None)
+    self.assertEqual(mock_learner_class.call_count, 3)
+    learner_storages = [c[0][4] for c in mock_learner_class.call_args_list]
+    self.assertTrue(all(s is learner_storages[0] for s in learner_storages))
+    service.run(2)
+    mock_learner.process_assignment.assert_has_calls([mock.call()] * 6)
+
+    with mock.patch.object(service, '_cleanup_temporary_dirs'):
+      service.shutdown()
+    # Storage is only shut down once.
+    mock_learner.shutdown.assert_called_once()
+
   @mock.patch.object(learner, 'Learner', autospec=True)
   def test_run_until_interrupt(self, mock_learner_class):
     """Test processing learner assignments until a keyboard interrupt."""
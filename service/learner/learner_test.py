@@ -305,16 +305,15 @@ class LearnerTest(parameterized.TestCase):
 
   def trigger_assignment_notifications(self, assignment_resource_id,
                                        episode_chunk_resource_ids):
-    """Trigger notifications for the assignment and each episode chunk.
+    """Trigger a notification for the assignment and its episode chunks.
 
     Args:
       assignment_resource_id: Assignment resource_id.ResourceId instance.
       episode_chunk_resource_ids: List of episode chunk resource_id.ResourceId
         instances.
     """
-    for episode_chunk_resource_id in episode_chunk_resource_ids:
-      self.assignment_notifier.trigger_assignment_notification(
-          assignment_resource_id, episode_chunk_resource_id)
+    self.assignment_notifier.trigger_assignment_notifications(
+        assignment_resource_id, episode_chunk_resource_ids)
 
   @parameterized.parameters('stale', 'ended')
   def test_learner_trains(self, end_condition):
@@ -25,14 +25,17 @@ import uuid
 from data_store import assignment_monitor
 from data_store import data_store as data_store_module
 from data_store import file_system as data_store_file_system
+from data_store import file_watcher
 from data_store import resource_id
 from data_store import resource_store
 from google.rpc import code_pb2
+from learner import assignment_scheduler
 from log import falken_logging
 
 # pylint: disable=g-bad-import-order
 import common.generate_protos  # pylint: disable=unused-import
 import data_store_pb2
+import session_pb2
 
 
 _DEFAULT_STALE_SECONDS = 3600
@@ -76,7 +79,11 @@ class Storage:
   def __init__(self,
                data_store: data_store_module.DataStore,
                file_system: data_store_file_system.FileSystem,
-               stale_seconds=_DEFAULT_STALE_SECONDS):
+               stale_seconds=_DEFAULT_STALE_SECONDS,
+               max_assignments=1,
+               priority_weights=assignment_scheduler.DEFAULT_PRIORITY_WEIGHTS,
+               min_notification_frequency=None,
+               watcher_kind=file_watcher.AUTO):
     """Create a new Storage instance.
 
     Args:
@@ -84,16 +91,36 @@ class Storage:
       file_system: FileSystem instance to use to monitor assignments.
       stale_seconds: How many seconds need to elapse for an event on a session
         before it is considered stale.
+      max_assignments: Maximum number of assignments that can be processed at
+        the same time. Each thread can process one assignment at a time so up
+        to this number of threads can receive assignments concurrently.
+      priority_weights: assignment_scheduler.PriorityWeights used to rank
+        pending assignments.
+      min_notification_frequency: Frequency the assignment monitor's polling
+        backs off to while no changes are found or None to always poll with
+        the maximum frequency.
+      watcher_kind: Kind of watcher the assignment monitor uses to detect
+        notifications, one of data_store.file_watcher.WATCHER_KINDS.
     """
     self._data_store = data_store
     self._assignment_monitor = assignment_monitor.AssignmentMonitor(
         file_system, self._enqueue_pending_assignment,
-        self._episode_chunk_notification)
-    self._pending_assignment_ids = queue.Queue()
+        self._episode_chunk_notification,
+        max_acquired_assignments=max_assignments,
+        min_notification_frequency=min_notification_frequency,
+        watcher_kind=watcher_kind)
+    self._priority_weights = priority_weights
+    self._pending_assignment_ids = assignment_scheduler.AssignmentScheduler(
+        self._get_assignment_priority)
     self._pending_assignment_ids_set = set()
     self._pending_assignment_ids_set_lock = threading.Lock()
-    self._in_progress_assignment = None
-    self._in_progress_assignment_id = None
+    # [AssignmentProgress, Session] used to compute the priority of pending
+    # assignments by resource id, the session is None once new data was
+    # received for the assignment.
+    self._priority_inputs = {}
+    # (assignment resource id, Assignment proto) pairs of the assignments in
+    # progress by thread identifier.
+    self._in_progress_assignments = {}
     self._stale_seconds = stale_seconds
 
   def shutdown(self):
@@ -349,7 +376,7 @@ class Storage:
     res_ids, _ = self._data_store.list(
         res_id_glob, min_timestamp_micros=min_timestamp_micros)
 
-    return [self._data_store.read(res_id) for res_id in res_ids]
+    return self._data_store.read_many(res_ids)
 
   def _enqueue_pending_assignment(
       self, assignment: resource_id.ResourceId):
@@ -362,6 +389,57 @@ class Storage:
       if assignment not in self._pending_assignment_ids_set:
         self._pending_assignment_ids_set.add(assignment)
         self._pending_assignment_ids.put(assignment)
+      else:
+        # New data may change the priority of an assignment that's waiting.
+        # Only the session changes when data is received, the progress of an
+        # assignment changes while it's processed.
+        inputs = self._priority_inputs.get(assignment)
+        if inputs:
+          inputs[1] = None
+        self._pending_assignment_ids.update(assignment)
+
+  def _get_assignment_priority(
+      self, assignment: resource_id.ResourceId) -> float:
+    """Computes the priority of a pending assignment.
+
+    Args:
+      assignment: ResourceId instance that references an assignment.
+
+    Returns:
+      The priority of the assignment, assignments with higher priorities are
+      received first.
+    """
+    # The inputs are read when the assignment is queued and the session is
+    # read again when it receives new data.
+    inputs = self._priority_inputs.get(assignment)
+    try:
+      if not inputs:
+        inputs = [self._data_store.read(assignment).progress, None]
+      if not inputs[1]:
+        inputs[1] = self._data_store.read(resource_id.FalkenResourceId(
+            project=assignment.project, brain=assignment.brain,
+            session=assignment.session))
+    except resource_store.NotFoundError:
+      return 0.0
+    self._priority_inputs[assignment] = inputs
+    progress, session = inputs
+    last_activity_micros = (
+        session.last_data_received_micros or session.created_micros)
+    idle_seconds = time.time() - last_activity_micros / 1e6
+    return self._priority_weights.priority(
+        assignment_scheduler.PrioritySignals(
+            interactive=float(
+                session.session_type == session_pb2.INTERACTIVE_TRAINING),
+            new_demonstrations=float(
+                session.last_demo_data_received_micros >
+                progress.most_recent_demo_time_micros),
+            untrained=1.0 - progress.training_progress,
+            idle=min(1.0, max(0.0, idle_seconds / self._stale_seconds))))
+
+  @property
+  def polling_stats(self) -> assignment_monitor.PollingStats:
+    """Returns how often the assignment monitor polls for notifications."""
+    return self._assignment_monitor.polling_stats
 
   @property
   def _number_of_pending_assignments(self) -> int:
@@ -383,7 +461,7 @@ class Storage:
   @wrap_data_store_exception
   def receive_assignment(self, timeout: float = None) -> (
       Optional[data_store_pb2.Assignment]):
-    """Retrieves the last unprocessed Assignment from the Assignments queue.
+    """Retrieves the highest priority unprocessed Assignment.
 
     Args:
       timeout: If a positive number, max amount of seconds to wait for an
@@ -393,8 +471,14 @@ class Storage:
     Returns:
       Assignment proto, or None if there are no unprocessed assignments.
       The returned assignment is locked by this process and should be released
-      when complete using record_assignment_done().
+      when complete using record_assignment_done() from the same thread. Until
+      then, the same assignment is returned to the calling thread.
     """
+    thread_id = threading.get_ident()
+    in_progress = self._in_progress_assignments.get(thread_id)
+    if in_progress:
+      return in_progress[1]
+
     deadline = time.time()
     if timeout is None:
       remaining = None
@@ -404,24 +488,25 @@ class Storage:
       deadline += timeout
       remaining = timeout
 
-    while (self._in_progress_assignment is None and
-           (remaining is None or remaining >= 0)):
+    while remaining is None or remaining >= 0:
       try:
         assignment_resource_id = self._pending_assignment_ids.get(
             timeout=remaining)
+        # The assignment's progress changes once it's processed.
+        self._priority_inputs.pop(assignment_resource_id, None)
       except queue.Empty:
         assignment_resource_id = None
 
       if (assignment_resource_id and
           self._assignment_monitor.acquire_assignment(assignment_resource_id)):
-        self._in_progress_assignment = self._data_store.read(
-            assignment_resource_id)
-        self._in_progress_assignment_id = assignment_resource_id
-        break
+        assignment = self._data_store.read(assignment_resource_id)
+        self._in_progress_assignments[thread_id] = (assignment_resource_id,
+                                                    assignment)
+        return assignment
       elif remaining is None:
         break
       remaining = deadline - time.time()
-    return self._in_progress_assignment
+    return None
 
   def handle_assignment_error(self, assignment: data_store_pb2.Assignment,
                               error: Exception):
@@ -442,14 +527,14 @@ class Storage:
 
   @wrap_data_store_exception
   def record_assignment_done(self):
-    """Mark the currently acquired assignment as done / complete."""
-    assert self._in_progress_assignment
+    """Mark the assignment acquired by the calling thread as done / complete."""
+    thread_id = threading.get_ident()
+    assert thread_id in self._in_progress_assignments
     falken_logging.info('Recording assignment done.')
     with self._pending_assignment_ids_set_lock:
-      self._pending_assignment_ids_set.remove(self._in_progress_assignment_id)
-      self._assignment_monitor.release_assignment()
-      self._in_progress_assignment_id = None
-      self._in_progress_assignment = None
+      assignment_resource_id, _ = self._in_progress_assignments.pop(thread_id)
+      self._pending_assignment_ids_set.remove(assignment_resource_id)
+      self._assignment_monitor.release_assignment(assignment_resource_id)
     falken_logging.info('Recorded assignment done.')
 
   def create_session_and_assignment(self, project_id: str, brain_id: str,
@@ -17,6 +17,7 @@
 
 import datetime
 import tempfile
+import threading
 import time
 from unittest import mock
 
@@ -25,12 +26,14 @@ from absl.testing import parameterized
 from data_store import assignment_monitor
 from data_store import data_store as data_store_module
 from data_store import file_system as data_store_file_system
+from data_store import file_watcher
 from learner import storage as storage_module
 from learner import test_data
 
 # pylint: disable=g-bad-import-order
 import common.generate_protos  # pylint: disable=unused-import
 import data_store_pb2
+import session_pb2
 
 
 class StorageTest(parameterized.TestCase):
@@ -48,7 +51,9 @@ class StorageTest(parameterized.TestCase):
       # Verify assignment monitor is constructed with the correct arguments.
       mock_assignment_monitor.assert_called_with(
           self.data_store_file_system, self.storage._enqueue_pending_assignment,
-          self.storage._episode_chunk_notification)
+          self.storage._episode_chunk_notification,
+          max_acquired_assignments=1, min_notification_frequency=None,
+          watcher_kind=file_watcher.AUTO)
 
     self.project = test_data.project()
     self.brain = test_data.brain()
@@ -390,6 +395,67 @@ class StorageTest(parameterized.TestCase):
     self.storage.record_assignment_done()
     self.assertEqual(self.storage._number_of_pending_assignments, 0)
 
+  def test_get_assignment_priority(self):
+    """Untrained assignments with new demonstrations are prioritized."""
+    now_micros = int(time.time() * 1e6)
+    self.session.session_type = session_pb2.INTERACTIVE_TRAINING
+    self.session.last_data_received_micros = now_micros
+    self.session.last_demo_data_received_micros = now_micros
+    self.assignment.progress.training_progress = 1.0
+    self.assignment.progress.most_recent_demo_time_micros = now_micros
+    self.populate_datastore()
+    untrained_assignment = test_data.assignment(
+        assignment_id=test_data.create_assignment_id(
+            {'another_param': True}))
+    self.data_store.write(untrained_assignment)
+
+    trained_priority = self.storage._get_assignment_priority(
+        self.data_store.to_resource_id(self.assignment))
+    untrained_priority = self.storage._get_assignment_priority(
+        self.data_store.to_resource_id(untrained_assignment))
+    self.assertAlmostEqual(trained_priority, 1.0, places=2)
+    self.assertAlmostEqual(untrained_priority, 4.0, places=2)
+    self.assertEqual(
+        self.storage._get_assignment_priority(
+            self.data_store.to_resource_id(test_data.assignment(
+                assignment_id='missing'))),
+        0.0)
+
+    # Pending assignments are received in priority order.
+    self.storage._assignment_monitor.acquire_assignment.return_value = True
+    self.storage._enqueue_pending_assignment(
+        self.data_store.to_resource_id(self.assignment))
+    self.storage._enqueue_pending_assignment(
+        self.data_store.to_resource_id(untrained_assignment))
+    self.assertEqual(self.storage.receive_assignment(timeout=0),
+                     untrained_assignment)
+
+  def test_get_assignment_priority_cached(self):
+    """Priority inputs are only read again when the session receives data."""
+    self.session.session_type = session_pb2.INTERACTIVE_TRAINING
+    self.populate_datastore()
+    assignment_id = self.data_store.to_resource_id(self.assignment)
+    with mock.patch.object(self.data_store, 'read',
+                           wraps=self.data_store.read) as read:
+      self.storage._enqueue_pending_assignment(assignment_id)
+      self.assertEqual(read.call_count, 2)
+      self.storage._get_assignment_priority(assignment_id)
+      self.assertEqual(read.call_count, 2)
+      # New data only requires the session to be read again.
+      self.storage._enqueue_pending_assignment(assignment_id)
+      self.assertEqual(read.call_count, 3)
+      read.assert_called_with(self.data_store.to_resource_id(self.session))
+    # Received assignments are read again once they're queued again.
+    self.storage._assignment_monitor.acquire_assignment.return_value = True
+    self.assertEqual(self.storage.receive_assignment(timeout=0),
+                     self.assignment)
+    self.assertNotIn(assignment_id, self.storage._priority_inputs)
+
+  def test_polling_stats(self):
+    """Polling stats are reported by the assignment monitor."""
+    self.assertEqual(self.storage.polling_stats,
+                     self.storage._assignment_monitor.polling_stats)
+
   def test_record_assignment_done_no_received_assignment(self):
     """Check for an when a non-pending assignment is marked complete."""
     with self.assertRaises(AssertionError):
@@ -403,7 +469,40 @@ class StorageTest(parameterized.TestCase):
         self.data_store.to_resource_id(self.assignment))
     self.storage.receive_assignment()
     self.storage.record_assignment_done()
-    mock_monitor.release_assignment.assert_called_once()
+    mock_monitor.release_assignment.assert_called_once_with(
+        self.data_store.to_resource_id(self.assignment))
+
+  def test_receive_assignments_from_multiple_threads(self):
+    """Each thread receives and completes its own assignment."""
+    mock_monitor = self.storage._assignment_monitor
+    mock_monitor.acquire_assignment.return_value = True
+    self.populate_datastore()
+    another_assignment = test_data.assignment(
+        assignment_id=test_data.create_assignment_id(
+            {'another_param': True}))
+    self.data_store.write(another_assignment)
+    self.storage._enqueue_pending_assignment(
+        self.data_store.to_resource_id(self.assignment))
+    self.storage._enqueue_pending_assignment(
+        self.data_store.to_resource_id(another_assignment))
+
+    self.assertEqual(self.storage.receive_assignment(timeout=0),
+                     self.assignment)
+    received = []
+    def receive_and_complete():
+      received.append(self.storage.receive_assignment(timeout=0))
+      self.storage.record_assignment_done()
+    thread = threading.Thread(target=receive_and_complete)
+    thread.start()
+    thread.join()
+    self.assertEqual(received, [another_assignment])
+    mock_monitor.release_assignment.assert_called_once_with(
+        self.data_store.to_resource_id(another_assignment))
+
+    # The assignment of this thread is still in progress.
+    self.assertEqual(self.storage.receive_assignment(timeout=0),
+                     self.assignment)
+    self.assertEqual(self.storage._number_of_pending_assignments, 1)
 
   def test_create_session_and_assignment(self):
     """Ensure a session and assignment proto are stored in the datastore."""
@@ -71,6 +71,7 @@ _DEFAULT_TEST_MODULES = [
     'api.create_brain_handler_test',
     'api.create_session_handler_test',
     'api.data_cache_test',
+    'api.episode_ingestion_test',
     'api.get_handler_test',
     'api.get_session_count_handler_test',
     'api.model_selector_test',
@@ -83,10 +84,15 @@ _DEFAULT_TEST_MODULES = [
     'api.sampling.online_eval_sampling_test',
     'api.unique_id_test',
     'data_store.assignment_monitor_test',
+    'data_store.benchmark_test',
     'data_store.data_store_test',
     'data_store.file_system_test',
+    'data_store.file_watcher_test',
+    'data_store.manifest_store_test',
     'data_store.resource_id_test',
     'data_store.resource_store_test',
+    'data_store.segment_store_test',
+    'data_store.sqlite_file_system_test',
     'learner.brains.action_postprocessor_test',
     'learner.brains.brain_cache_test',
     'learner.brains.continuous_imitation_brain_test',
@@ -103,10 +109,12 @@ _DEFAULT_TEST_MODULES = [
     'learner.brains.policies_test',
     'learner.brains.quaternion_test',
     'learner.brains.saved_model_to_tflite_model_test',
+    'learner.brains.spec_validator_test',
     'learner.brains.specs_test',
     'learner.brains.tensor_nest_test',
     'learner.brains.weights_initializer_test',
     'learner.assignment_processor_test',
+    'learner.assignment_scheduler_test',
     'learner.data_fetcher_test',
     'learner.file_system_test',
     'learner.learner_test',